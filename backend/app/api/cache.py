@@ -0,0 +1,81 @@
+"""
+Response cache API endpoints
+Per-character cache policies and hit-ratio dashboard
+"""
+import logging
+from fastapi import APIRouter, Path, Query
+from typing import Optional
+from app.models.cache import (
+    CachePolicy,
+    CachePolicyUpdate,
+    CacheStatsResponse,
+    CharacterCacheStats,
+)
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+async def get_cache_stats():
+    """
+    Get response cache dashboard
+
+    Returns per-character hit/miss counters, hit ratio and active policy
+    """
+    characters = {}
+    total_hits = 0
+    total_misses = 0
+    for character_id, stats in response_cache.stats().items():
+        total_hits += stats.hits
+        total_misses += stats.misses
+        characters[character_id] = CharacterCacheStats(
+            character_id=character_id,
+            policy=response_cache.get_policy(character_id),
+            hits=stats.hits,
+            semantic_hits=stats.semantic_hits,
+            misses=stats.misses,
+            stores=stats.stores,
+            entries=stats.entries,
+            hit_ratio=stats.hit_ratio,
+        )
+
+    lookups = total_hits + total_misses
+    return CacheStatsResponse(
+        total_hits=total_hits,
+        total_misses=total_misses,
+        hit_ratio=total_hits / lookups if lookups else 0.0,
+        characters=characters,
+    )
+
+
+@router.get("/cache/policies/{character_id}", response_model=CachePolicy)
+async def get_cache_policy(character_id: str = Path(..., description="Character ID")):
+    """Get the response cache policy for a character"""
+    return response_cache.get_policy(character_id)
+
+
+@router.put("/cache/policies/{character_id}", response_model=CachePolicy)
+async def update_cache_policy(
+    request: CachePolicyUpdate,
+    character_id: str = Path(..., description="Character ID"),
+):
+    """
+    Update the response cache policy for a character
+
+    Disabling the cache for a character also drops its cached replies
+    """
+    policy = response_cache.set_policy(character_id, request)
+    logger.info(f"Response cache policy updated for {character_id}: {policy.model_dump()}")
+    return policy
+
+
+@router.delete("/cache")
+async def clear_cache(
+    character_id: Optional[str] = Query(None, description="Only clear this character's entries")
+):
+    """Clear cached replies"""
+    response_cache.clear(character_id)
+    return {"status": "success"}
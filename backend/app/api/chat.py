@@ -18,9 +18,11 @@ from app.services.history_service import history_service
 from app.services.context_builder import ContextBuilder
 from app.services.session_service import SessionService
 from app.services.summarizer import summarizer
-from app.services.token_counter import TokenCounter
+from app.services.model_registry import model_registry
 from app.services.character_state import character_state_service
 from app.services.response_processor import ResponseProcessor
+from app.services.response_cache import response_cache
+from app.services.prosody import PROSODY_PROMPT, ProsodyTagParser, group_segments, tts_params_for_tag
 from app.config import settings
 from app.database import get_db
 
@@ -29,25 +31,30 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 _session_service = SessionService()
-_token_counter = TokenCounter(
-    provider=settings.llm_provider,
-    model=settings.openai_model,
-)
-_context_builder = ContextBuilder(
-    token_counter=_token_counter,
-    session_service=_session_service,
-    max_tokens=settings.context_max_tokens,
-    output_reserved=settings.context_output_reserved,
-    character_prompt_ceiling=settings.context_character_prompt_ceiling,
-    memory_ceiling=settings.context_memory_ceiling,
-    summary_ceiling=settings.context_summary_ceiling,
-)
+_context_builders: dict[tuple[str, str], ContextBuilder] = {}
 _response_processor = ResponseProcessor(
     session_service=_session_service,
     character_state_service=character_state_service,
 )
 
 
+def _get_context_builder() -> ContextBuilder:
+    """ContextBuilder sized and tokenized for the currently active model."""
+    key = (llm_service.current_provider, llm_service.current_model)
+    if key not in _context_builders:
+        max_tokens, output_reserved = model_registry.context_budget(*key)
+        _context_builders[key] = ContextBuilder(
+            token_counter=model_registry.token_counter(*key),
+            session_service=_session_service,
+            max_tokens=max_tokens,
+            output_reserved=output_reserved,
+            character_prompt_ceiling=settings.context_character_prompt_ceiling,
+            memory_ceiling=settings.context_memory_ceiling,
+            summary_ceiling=settings.context_summary_ceiling,
+        )
+    return _context_builders[key]
+
+
 def _apply_emotion_to_tts(
     speed_factor: float,
     fragment_interval: float,
@@ -71,6 +78,44 @@ def _apply_emotion_to_tts(
     return speed, interval
 
 
+async def _stream_audio(request: ChatRequest, parts: list[tuple[str, float, float]]):
+    """
+    Stream GPT-SoVITS audio as SSE events for (text, speed_factor, fragment_interval)
+    parts, one TTS call per part, with chunk indexes continuing across parts.
+    """
+    try:
+        yield f"data: {json.dumps({'type': 'audio_start'}, ensure_ascii=False)}\n\n"
+        
+        chunk_index = 0
+        for text, speed_factor, fragment_interval in parts:
+            async for audio_chunk in tts_service.stream_text_to_speech(
+                text=text,
+                text_lang=request.config.text_lang,
+                ref_audio_path=request.config.ref_audio_path,
+                prompt_text=request.config.prompt_text,
+                prompt_lang=request.config.prompt_lang,
+                streaming_mode=request.config.streaming_mode,
+                media_type=request.config.media_type,
+                text_split_method=request.config.text_split_method,
+                top_k=request.config.top_k,
+                top_p=request.config.top_p,
+                temperature=request.config.temperature,
+                speed_factor=speed_factor,
+                fragment_interval=fragment_interval,
+                aux_ref_audio_paths=request.config.aux_ref_audio_paths
+            ):
+                audio_chunk_base64 = base64.b64encode(audio_chunk).decode("utf-8")
+                yield f"data: {json.dumps({'type': 'audio_chunk', 'data': audio_chunk_base64, 'index': chunk_index, 'size': len(audio_chunk)}, ensure_ascii=False)}\n\n"
+                chunk_index += 1
+        
+        yield f"data: {json.dumps({'type': 'audio_complete', 'total_chunks': chunk_index}, ensure_ascii=False)}\n\n"
+    
+    except Exception as e:
+        logger.error(f"TTS streaming error: {str(e)}")
+        logger.error(f"TTS config: text_lang={request.config.text_lang}, prompt_lang={request.config.prompt_lang}, ref_audio_path={request.config.ref_audio_path}")
+        yield f"data: {json.dumps({'type': 'error', 'error': f'音频生成失败: {str(e)}'}, ensure_ascii=False)}\n\n"
+
+
 async def _cleanup_stale_sessions(db: Session, max_idle_seconds: int = 600) -> None:
     """Generate end-of-session summaries and cleanup stale in-memory sessions."""
     stale_ids = _session_service.get_stale_sessions(max_idle_seconds=max_idle_seconds)
@@ -99,6 +144,10 @@ async def _cleanup_stale_sessions(db: Session, max_idle_seconds: int = 600) -> N
             logger.warning(f"Failed stale session cleanup for {stale_id}: {str(e)}")
         finally:
             _session_service.remove_session(stale_id)
+        memory_service = get_memory_service()
+        if memory_service:
+            # Don't leave the tail of the conversation waiting in the memory buffer
+            memory_service.schedule_flush(stale_id)
 
 
 async def generate_chat_stream(request: ChatRequest, db: Session):
@@ -124,17 +173,27 @@ async def generate_chat_stream(request: ChatRequest, db: Session):
     try:
         current_character = character_service.get_current_character()
         system_prompt = current_character.system_prompt
+        prosody_enabled = (
+            request.config.prosody_tags
+            if request.config.prosody_tags is not None
+            else settings.tts_prosody_tags_enabled
+        )
+        if prosody_enabled:
+            system_prompt += PROSODY_PROMPT
         character_id = current_character.id if hasattr(current_character, 'id') else "epsilon"
         
         # Query memory context if memory service is available
         memory_context = ""
         memory_service = get_memory_service()
+        context_builder = _get_context_builder()
         if memory_service and user_id:
             try:
                 memory_context = await memory_service.query_related_context(
                     user_id=user_id,
                     query_text=request.message,
-                    limit=10
+                    limit=10,
+                    token_counter=context_builder.counter,
+                    token_budget=context_builder.memory_budget(),
                 )
                 if memory_context:
                     logger.info(f"Retrieved memory context for user {user_id}: {len(memory_context)} chars")
@@ -149,7 +208,7 @@ async def generate_chat_stream(request: ChatRequest, db: Session):
             state = character_state_service.get_or_create(db, user_id, character_id)
         character_state_context = character_state_service.build_prompt_context(state)
 
-        built = await _context_builder.build(
+        built = await context_builder.build(
             user_message=request.message,
             conversation_id=conversation_id,
             user_id=user_id,
@@ -182,10 +241,46 @@ async def generate_chat_stream(request: ChatRequest, db: Session):
                 _session_service.set_rolling_summary(conversation_id, new_summary)
                 logger.info("Rolling summary updated for %s", conversation_id)
 
-        # 1) Stream LLM response with built context
-        async for chunk in llm_service.astream_from_messages(built.messages):
-            full_text += chunk
-            yield f"data: {json.dumps({'type': 'text', 'content': chunk}, ensure_ascii=False)}\n\n"
+        # 1) Stream LLM response with built context (or replay a cached reply).
+        # Only opening turns are cached: with history the reply depends on the session.
+        cache_lookup = None
+        if not request.history:
+            cache_lookup = await response_cache.lookup(
+                character_id=character_id,
+                message=request.message,
+                fingerprint=response_cache.turn_fingerprint(
+                    user_id,
+                    llm_service.current_provider,
+                    llm_service.current_model,
+                    system_prompt,
+                    memory_context,
+                    character_state_service.build_prompt_context(state, include_count=False),
+                    prosody_enabled,
+                ),
+            )
+        if cache_lookup and cache_lookup.entry:
+            logger.info("Serving cached response for character %s", character_id)
+            text_stream = response_cache.replay(cache_lookup.entry)
+        else:
+            text_stream = llm_service.astream_from_messages(built.messages)
+
+        # Raw chunks (tags included) are what the cache stores and replays
+        text_chunks = []
+        prosody = ProsodyTagParser() if prosody_enabled else None
+        async for chunk in text_stream:
+            text_chunks.append(chunk)
+            display = prosody.feed(chunk) if prosody else chunk
+            if display:
+                full_text += display
+                yield f"data: {json.dumps({'type': 'text', 'content': display}, ensure_ascii=False)}\n\n"
+        if prosody:
+            display = prosody.finish()
+            if display:
+                full_text += display
+                yield f"data: {json.dumps({'type': 'text', 'content': display}, ensure_ascii=False)}\n\n"
+
+        if cache_lookup and cache_lookup.entry is None:
+            await response_cache.store(cache_lookup, text_chunks)
         
         # 2) Send completion message
         yield f"data: {json.dumps({'type': 'complete', 'text': full_text}, ensure_ascii=False)}\n\n"
@@ -196,52 +291,45 @@ async def generate_chat_stream(request: ChatRequest, db: Session):
         except Exception as e:
             logger.error(f"Failed to persist assistant message: {str(e)}")
 
-        processed = await _response_processor.process_turn(
-            db=db,
-            conversation_id=conversation_id,
-            user_id=user_id,
-            character_id=character_id,
-            user_message=request.message,
-            assistant_text=full_text,
-            history_messages=[{"role": m.role, "content": m.content} for m in request.history],
-        )
-        tts_speed, tts_interval = _apply_emotion_to_tts(
-            speed_factor=request.config.speed_factor,
-            fragment_interval=request.config.fragment_interval,
-            emotion=processed.emotion,
-        )
-        
-        # 3) Stream audio via GPT-SoVITS
-        try:
-            yield f"data: {json.dumps({'type': 'audio_start'}, ensure_ascii=False)}\n\n"
-            
-            chunk_index = 0
-            async for audio_chunk in tts_service.stream_text_to_speech(
-                text=full_text,
-                text_lang=request.config.text_lang,
-                ref_audio_path=request.config.ref_audio_path,
-                prompt_text=request.config.prompt_text,
-                prompt_lang=request.config.prompt_lang,
-                streaming_mode=request.config.streaming_mode,
-                media_type=request.config.media_type,
-                text_split_method=request.config.text_split_method,
-                top_k=request.config.top_k,
-                top_p=request.config.top_p,
-                temperature=request.config.temperature,
-                speed_factor=tts_speed,
-                fragment_interval=tts_interval,
-                aux_ref_audio_paths=request.config.aux_ref_audio_paths
-            ):
-                audio_chunk_base64 = base64.b64encode(audio_chunk).decode("utf-8")
-                yield f"data: {json.dumps({'type': 'audio_chunk', 'data': audio_chunk_base64, 'index': chunk_index, 'size': len(audio_chunk)}, ensure_ascii=False)}\n\n"
-                chunk_index += 1
+        history_messages = [{"role": m.role, "content": m.content} for m in request.history]
+        if prosody and prosody.tagged:
+            # 3a) Tags already carry the prosody: start audio first, post-process after
+            parts = [
+                (segment.text, *tts_params_for_tag(
+                    segment.tag, request.config.speed_factor, request.config.fragment_interval
+                ))
+                for segment in group_segments(prosody.segments)
+            ]
+            async for event in _stream_audio(request, parts):
+                yield event
+            await _response_processor.process_turn(
+                db=db,
+                conversation_id=conversation_id,
+                user_id=user_id,
+                character_id=character_id,
+                user_message=request.message,
+                assistant_text=full_text,
+                history_messages=history_messages,
+            )
+        else:
+            processed = await _response_processor.process_turn(
+                db=db,
+                conversation_id=conversation_id,
+                user_id=user_id,
+                character_id=character_id,
+                user_message=request.message,
+                assistant_text=full_text,
+                history_messages=history_messages,
+            )
+            tts_speed, tts_interval = _apply_emotion_to_tts(
+                speed_factor=request.config.speed_factor,
+                fragment_interval=request.config.fragment_interval,
+                emotion=processed.emotion,
+            )
             
-            yield f"data: {json.dumps({'type': 'audio_complete', 'total_chunks': chunk_index}, ensure_ascii=False)}\n\n"
-        
-        except Exception as e:
-            logger.error(f"TTS streaming error: {str(e)}")
-            logger.error(f"TTS config: text_lang={request.config.text_lang}, prompt_lang={request.config.prompt_lang}, ref_audio_path={request.config.ref_audio_path}")
-            yield f"data: {json.dumps({'type': 'error', 'error': f'音频生成失败: {str(e)}'}, ensure_ascii=False)}\n\n"
+            # 3b) Stream audio via GPT-SoVITS
+            async for event in _stream_audio(request, [(full_text, tts_speed, tts_interval)]):
+                yield event
     
     except Exception as e:
         logger.error(f"Chat stream error: {str(e)}")
@@ -0,0 +1,70 @@
+"""
+LLM runtime metrics API endpoints
+Exposes routing latency statistics
+"""
+import logging
+from fastapi import APIRouter
+from app.services.extraction_scheduler import extraction_scheduler
+from app.services.llm_service import llm_service
+from app.services.model_registry import model_registry
+from app.services.token_calibration import token_calibrator
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/llm/metrics")
+async def get_llm_metrics():
+    """
+    Get LLM routing metrics
+
+    Returns per-route time-to-first-token percentiles, failure counts, the
+    current hedge budget derived from them, per-task-class routing,
+    extraction batching counters and client-side rate limiter wait times
+    """
+    ttft = llm_service.router.tracker.snapshot()
+    routes = [f"{provider}:{model}" for provider, model in llm_service._routes()]
+    return {
+        "routes": routes,
+        "hedge_enabled": llm_service.router.hedge_enabled,
+        "hedge_budget_ms": {
+            route: round(llm_service.router.hedge_budget(route) * 1000, 1) for route in routes
+        },
+        "ttft": ttft,
+        "tasks": llm_service.task_metrics(),
+        "extraction_batching": extraction_scheduler.metrics(),
+        "rate_limits": llm_service.rate_limiter.metrics(),
+    }
+
+
+@router.get("/llm/token-calibration")
+async def get_token_calibration():
+    """
+    Get token estimator calibration
+
+    Returns per-model fitted tokens-per-character rates and the distribution
+    of prompt token estimate error against provider-reported usage
+    """
+    return {"models": token_calibrator.snapshot()}
+
+
+@router.get("/llm/models")
+async def get_llm_models():
+    """
+    Get available chat models
+
+    Returns each model's context window, output limit, tokenizer family and
+    pricing, plus the context budget currently applied to the active model
+    """
+    provider, model = llm_service.current_provider, llm_service.current_model
+    max_tokens, output_reserved = model_registry.context_budget(provider, model)
+    return {
+        "models": llm_service.get_available_models(),
+        "active": {
+            "provider": provider,
+            "model": model,
+            "context_max_tokens": max_tokens,
+            "output_reserved": output_reserved,
+        },
+    }
@@ -8,10 +8,13 @@ from typing import Optional, List
 from app.models.memory import (
     WriteMemoryRequest,
     WriteMemoryResponse,
+    MemoryJobResponse,
+    RestoreArchivedRequest,
     QueryContextRequest,
     QueryContextResponse,
     GraphQueryRequest,
     GraphQueryResponse,
+    GraphViewResponse,
     GraphStatsResponse,
     NodeDetailsResponse,
     GraphNode,
@@ -27,9 +30,11 @@ router = APIRouter()
 @router.post("/memory/write", response_model=WriteMemoryResponse)
 async def write_memory(request: WriteMemoryRequest):
     """
-    Write conversation memory to Neo4j
+    Write conversation memory to the graph store
     
-    Extracts entities and relations from conversation and stores them in graph database
+    Buffers the messages; once the conversation's buffer is full the segment
+    is queued on the write pipeline and the returned job_id can be polled at
+    /memory/jobs/{job_id}. Waits while the pipeline is at capacity.
     """
     memory_service = get_memory_service()
     if not memory_service:
@@ -37,10 +42,10 @@ async def write_memory(request: WriteMemoryRequest):
         reason = "Memory service not initialized. "
         if not settings.graph_memory_enabled:
             reason += "Please enable GRAPH_MEMORY_ENABLED in .env file."
-        elif not settings.neo4j_password:
-            reason += "Please configure NEO4J_PASSWORD in .env file."
+        elif settings.graph_memory_backend != "local" and not settings.neo4j_password:
+            reason += "Please configure NEO4J_PASSWORD in .env file, or set GRAPH_MEMORY_BACKEND=local."
         else:
-            reason += "Neo4j connection may have failed. Check server logs for details."
+            reason += "Graph store connection may have failed. Check server logs for details."
         raise HTTPException(
             status_code=503,
             detail=reason
@@ -56,6 +61,8 @@ async def write_memory(request: WriteMemoryRequest):
         
         return WriteMemoryResponse(
             success=True,
+            job_id=result.get("job_id"),
+            status=result.get("status", "buffered"),
             entities_count=result.get("entities_count", 0),
             relations_count=result.get("relations_count", 0)
         )
@@ -67,6 +74,51 @@ async def write_memory(request: WriteMemoryRequest):
         )
 
 
+@router.get("/memory/jobs/{job_id}", response_model=MemoryJobResponse)
+async def get_memory_job(job_id: str):
+    """
+    Get the status of a memory write job
+    
+    Recently finished jobs are kept for a while; unknown or expired ids return 404
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    job = memory_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Memory job not found: {job_id}")
+    return MemoryJobResponse(**job)
+
+
+@router.get("/memory/pipeline")
+async def get_memory_pipeline_metrics():
+    """
+    Get memory write pipeline metrics
+    
+    Returns jobs in flight, stage queue depths, conversations waiting behind
+    an in-flight job, completed/failed jobs, write retries, coalesced writes
+    and how often submitters waited on a full pipeline
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    return memory_service.pipeline.metrics()
+
+
+@router.get("/memory/buffer")
+async def get_memory_buffer_metrics():
+    """
+    Get memory write buffer metrics
+    
+    Returns buffered conversations, messages and bytes, and flush counts by
+    trigger (size, idle, age, evicted, session_end, shutdown)
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    return memory_service.buffer.metrics()
+
+
 @router.get("/memory/context", response_model=QueryContextResponse)
 async def query_context(
     user_id: str = Query(..., description="User ID"),
@@ -84,10 +136,10 @@ async def query_context(
         reason = "Memory service not initialized. "
         if not settings.graph_memory_enabled:
             reason += "Please enable GRAPH_MEMORY_ENABLED in .env file."
-        elif not settings.neo4j_password:
-            reason += "Please configure NEO4J_PASSWORD in .env file."
+        elif settings.graph_memory_backend != "local" and not settings.neo4j_password:
+            reason += "Please configure NEO4J_PASSWORD in .env file, or set GRAPH_MEMORY_BACKEND=local."
         else:
-            reason += "Neo4j connection may have failed. Check server logs for details."
+            reason += "Graph store connection may have failed. Check server logs for details."
         raise HTTPException(
             status_code=503,
             detail=reason
@@ -132,10 +184,10 @@ async def query_graph(
         reason = "Memory service not initialized. "
         if not settings.graph_memory_enabled:
             reason += "Please enable GRAPH_MEMORY_ENABLED in .env file."
-        elif not settings.neo4j_password:
-            reason += "Please configure NEO4J_PASSWORD in .env file."
+        elif settings.graph_memory_backend != "local" and not settings.neo4j_password:
+            reason += "Please configure NEO4J_PASSWORD in .env file, or set GRAPH_MEMORY_BACKEND=local."
         else:
-            reason += "Neo4j connection may have failed. Check server logs for details."
+            reason += "Graph store connection may have failed. Check server logs for details."
         raise HTTPException(
             status_code=503,
             detail=reason
@@ -163,6 +215,58 @@ async def query_graph(
         raise HTTPException(status_code=500, detail=f"Graph query failed: {str(e)}")
 
 
+@router.get("/graph/view", response_model=GraphViewResponse)
+async def graph_view(
+    user_id: str = Query(..., description="User ID"),
+    entity_types: Optional[str] = Query(None, description="Entity types filter, comma-separated"),
+    relation_types: Optional[str] = Query(None, description="Relation types filter, comma-separated"),
+    depth: int = Query(2, ge=1, le=4, description="Query depth"),
+    limit: int = Query(500, ge=1, le=5000, description="Nodes per page"),
+    order: str = Query("degree", description="Level-of-detail ranking: degree or score"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    properties: Optional[str] = Query(None, description="Node properties to include, comma-separated")
+):
+    """
+    Paged graph view for large graphs
+    
+    Returns the most connected (or highest scored) nodes first as parallel
+    arrays, with the relations to nodes already delivered; follow next_cursor
+    for more detail
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        from app.config import settings
+        reason = "Memory service not initialized. "
+        if not settings.graph_memory_enabled:
+            reason += "Please enable GRAPH_MEMORY_ENABLED in .env file."
+        elif settings.graph_memory_backend != "local" and not settings.neo4j_password:
+            reason += "Please configure NEO4J_PASSWORD in .env file, or set GRAPH_MEMORY_BACKEND=local."
+        else:
+            reason += "Graph store connection may have failed. Check server logs for details."
+        raise HTTPException(
+            status_code=503,
+            detail=reason
+        )
+    
+    try:
+        view = await memory_service.graph_view(
+            user_id=user_id,
+            entity_types=entity_types.split(',') if entity_types else None,
+            relation_types=relation_types.split(',') if relation_types else None,
+            depth=depth,
+            limit=limit,
+            order=order,
+            cursor=cursor,
+            properties=properties.split(',') if properties else None
+        )
+        return GraphViewResponse(**view)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Graph view error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Graph view failed: {str(e)}")
+
+
 @router.get("/graph/stats", response_model=GraphStatsResponse)
 async def get_graph_stats(
     user_id: str = Query(..., description="User ID")
@@ -178,10 +282,10 @@ async def get_graph_stats(
         reason = "Memory service not initialized. "
         if not settings.graph_memory_enabled:
             reason += "Please enable GRAPH_MEMORY_ENABLED in .env file."
-        elif not settings.neo4j_password:
-            reason += "Please configure NEO4J_PASSWORD in .env file."
+        elif settings.graph_memory_backend != "local" and not settings.neo4j_password:
+            reason += "Please configure NEO4J_PASSWORD in .env file, or set GRAPH_MEMORY_BACKEND=local."
         else:
-            reason += "Neo4j connection may have failed. Check server logs for details."
+            reason += "Graph store connection may have failed. Check server logs for details."
         raise HTTPException(
             status_code=503,
             detail=reason
@@ -195,6 +299,89 @@ async def get_graph_stats(
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
 
+@router.post("/graph/canonicalize")
+async def canonicalize_graph_entities(
+    user_id: str = Query(..., description="User ID")
+):
+    """
+    Merge the user's near-duplicate entities
+    
+    Entities with the same normalized name or near-identical embeddings are
+    folded into one canonical node that keeps the others as aliases. Also
+    runs for recently active users with the periodic stats reconciliation.
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    
+    try:
+        merged = await memory_service.merge_duplicate_entities(user_id)
+        return {"user_id": user_id, "merged": merged}
+    except Exception as e:
+        logger.error(f"Entity canonicalization error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to merge entities: {str(e)}")
+
+
+@router.post("/memory/compact")
+async def compact_memory(
+    user_id: Optional[str] = Query(None, description="User ID (default: the next scheduled batch of users)")
+):
+    """
+    Archive or prune decayed memory nodes now
+    
+    Runs the scheduled compaction for one user, or for the least recently
+    compacted users when user_id is omitted.
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    
+    try:
+        if user_id:
+            return await memory_service.compact_user(user_id)
+        return await memory_service.compact_memory()
+    except Exception as e:
+        logger.error(f"Memory compaction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Memory compaction failed: {str(e)}")
+
+
+@router.get("/memory/archive")
+async def list_archived_memory(
+    user_id: str = Query(..., description="User ID"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """List the user's archived memory nodes, most recently archived first"""
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    
+    try:
+        return memory_service.list_archived(user_id, limit, offset)
+    except Exception as e:
+        logger.error(f"Memory archive error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to list archived memory: {str(e)}")
+
+
+@router.post("/memory/archive/restore")
+async def restore_archived_memory(request: RestoreArchivedRequest):
+    """
+    Restore archived memory nodes
+    
+    Writes the nodes back with their relations to nodes that still exist.
+    """
+    memory_service = get_memory_service()
+    if not memory_service:
+        raise HTTPException(status_code=503, detail="Memory service not initialized.")
+    
+    try:
+        restored = await memory_service.restore_archived(request.user_id, request.node_ids)
+        return {"user_id": request.user_id, "restored": restored}
+    except Exception as e:
+        logger.error(f"Memory restore error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to restore archived memory: {str(e)}")
+
+
 @router.get("/graph/node/{node_id}", response_model=NodeDetailsResponse)
 async def get_node_details(node_id: str):
     """
@@ -208,10 +395,10 @@ async def get_node_details(node_id: str):
         reason = "Memory service not initialized. "
         if not settings.graph_memory_enabled:
             reason += "Please enable GRAPH_MEMORY_ENABLED in .env file."
-        elif not settings.neo4j_password:
-            reason += "Please configure NEO4J_PASSWORD in .env file."
+        elif settings.graph_memory_backend != "local" and not settings.neo4j_password:
+            reason += "Please configure NEO4J_PASSWORD in .env file, or set GRAPH_MEMORY_BACKEND=local."
         else:
-            reason += "Neo4j connection may have failed. Check server logs for details."
+            reason += "Graph store connection may have failed. Check server logs for details."
         raise HTTPException(
             status_code=503,
             detail=reason
@@ -16,6 +16,7 @@ class Settings(BaseSettings):
     
     # GPT-SoVITS API Configuration
     gpt_sovits_base_url: str = "http://127.0.0.1:9880"
+    tts_prosody_tags_enabled: bool = False  # Ask the LLM for inline [calm]/[soft] tags driving per-sentence TTS
     
     # LLM Configuration
     openai_api_key: Optional[str] = None
@@ -25,6 +26,35 @@ class Settings(BaseSettings):
     llm_model_path: Optional[str] = None
     llm_model_type: str = "openai" # Deprecated, use llm_provider
     
+    # LLM Routing Configuration
+    llm_fallback_models: str = ""  # Comma-separated "provider:model" list tried after the active model
+    llm_hedge_enabled: bool = False  # Fire a hedge request to the first fallback when TTFT exceeds budget
+    llm_hedge_budget_ms: int = 3000  # Hedge budget until enough TTFT samples are collected
+    llm_hedge_min_budget_ms: int = 500
+    llm_hedge_percentile: float = 0.9  # TTFT percentile used as the hedge budget
+    llm_hedge_min_samples: int = 20
+    
+    # LLM Rate Limits (client-side, per provider/model/API key)
+    llm_rate_limits: str = ""  # Comma-separated "provider[:model]=rpm/tpm", e.g. "openai=500/200000,gemini:gemini-2.5-flash=1000/1000000"
+    llm_rate_limit_output_tokens: int = 512  # Completion allowance added to the prompt estimate
+    
+    # LLM Task Tiering (empty provider/model = use the active chat model)
+    llm_interactive_concurrency: int = 16
+    llm_interactive_timeout: float = 120.0  # Seconds, non-streaming calls only
+    llm_extraction_provider: str = ""
+    llm_extraction_model: str = ""
+    llm_extraction_concurrency: int = 2
+    llm_extraction_timeout: float = 60.0
+    llm_summarization_provider: str = ""
+    llm_summarization_model: str = ""
+    llm_summarization_concurrency: int = 1
+    llm_summarization_timeout: float = 90.0
+    
+    # Upstream record/replay (offline benchmarking without network or GPU)
+    cassette_mode: str = "off"  # "off", "record" or "replay"
+    cassette_dir: str = "./cassettes"
+    cassette_replay_speed: float = 1.0  # 1.0 = recorded timing, 0 = as fast as possible
+    
     # Frontend Configuration
     frontend_url: str = "http://localhost:5173"
     
@@ -34,21 +64,60 @@ class Settings(BaseSettings):
     
     # Graph Memory Configuration (Phase 3B)
     graph_memory_enabled: bool = False  # Default disabled, enable via env var
+    graph_memory_backend: str = "neo4j"  # "neo4j" or "local" (embedded SQLite, no external service)
+    local_graph_path: str = "graph_memory.db"  # SQLite file for the local backend
     neo4j_uri: str = "neo4j+s://c9810bad.databases.neo4j.io"  # Neo4j Aura encrypted connection
     neo4j_username: str = "neo4j"  # Maps to NEO4J_USERNAME env var
     neo4j_password: str = ""  # Load from env var, do not hardcode
     neo4j_database: str = "neo4j"
     memory_threshold_score: int = 6  # Only remember facts with score >= 6
+    entity_canonicalization_enabled: bool = True  # Merge new entities into the user's existing ones by name / embedding
+    entity_canonical_min_score: float = 0.96  # Embedding match threshold on the vector index's (1 + cos) / 2 scale
     memory_buffer_size: int = 5      # Process memory every 5 messages
+    memory_buffer_idle_seconds: int = 120  # Also process a conversation's buffer once it is quiet this long
+    memory_buffer_max_age_seconds: int = 900  # ... or once its oldest buffered message is this old
+    memory_buffer_max_bytes: int = 4_000_000  # Process least recently active buffers early beyond this
+    memory_pipeline_capacity: int = 200  # Jobs admitted to the write pipeline before submitters wait
+    memory_pipeline_extract_workers: int = 2  # Concurrent extraction jobs
+    memory_pipeline_embed_workers: int = 2  # Concurrent embedding jobs
+    memory_pipeline_coalesce_max: int = 16  # Ready jobs drained into one write round (one transaction per user)
+    memory_pipeline_max_retries: int = 3  # Retries of a graph write on transient store errors (exponential backoff)
+    extraction_batch_window_ms: int = 500  # Collect extraction jobs across conversations for this long (0 = no batching)
+    extraction_batch_max_docs: int = 8     # Flush a batch early once it holds this many segments
+    extraction_tokens_per_minute: int = 0  # Global extraction token budget (0 = unlimited)
+    extraction_streaming_enabled: bool = False  # Stream graph-memory extraction and embed entities as they arrive (bypasses batching)
+    memory_snapshot_enabled: bool = False  # Load each user's memory subgraph in-process and retrieve locally
+    memory_snapshot_max_nodes: int = 5000  # Users with larger subgraphs keep querying Neo4j
+    memory_snapshot_idle_seconds: int = 1800  # Drop a snapshot after this long without a turn
+    memory_snapshot_max_users: int = 200  # Least recently used snapshots are dropped beyond this
+    graph_stats_reconcile_seconds: int = 3600  # Recount graph stats of recently active users this often (0 = never)
+    memory_compaction_seconds: int = 86400  # Archive or prune decayed memory nodes this often (0 = never)
+    memory_compaction_mode: str = "archive"  # "archive" (restorable cold table) or "prune" (delete)
+    memory_compaction_users_per_run: int = 100  # Least recently compacted users handled per run
+    memory_compaction_user_budget: int = 200  # Nodes removed per user per run
+    memory_compaction_batch_size: int = 50  # Nodes exported and deleted per store round trip
+    memory_decay_half_life_days: float = 30.0  # Decayed importance halves after this long without a write or recall
+    memory_decay_min_importance: float = 1.0  # Nodes whose decayed importance falls below this are cold
+    memory_decay_min_age_days: float = 14.0  # Never compact nodes written or recalled more recently
 
     # Context Builder Configuration (Phase A)
-    context_max_tokens: int = 16000
+    context_max_tokens: int = 16000  # Window assumed for models missing from the registry
     context_output_reserved: int = 4000
+    context_window_ceiling: int = 128000  # Cap on the window used for large-context models
     context_character_prompt_ceiling: int = 2000
     context_memory_ceiling: int = 1000
     context_summary_ceiling: int = 500
     context_rolling_threshold: int = 16
-    
+    token_calibration_enabled: bool = True  # Fit char-based token estimates to provider-reported usage
+    token_calibration_min_samples: int = 20  # Samples before fitted rates replace the defaults
+
+    # Response Cache Configuration (opt-in, per-character policies override these defaults)
+    response_cache_enabled: bool = False
+    response_cache_similarity_threshold: float = 0.95
+    response_cache_ttl_seconds: int = 24 * 3600
+    response_cache_max_entries: int = 200
+    response_cache_replay_chars_per_second: float = 80.0
+
     @property
     def neo4j_user(self) -> str:
         """Backward compatibility alias for neo4j_username"""
@@ -7,6 +7,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.services.memory_service import initialize_memory_service, get_memory_service
+from app.services.token_calibration import token_calibrator
 from app.database import engine, Base
 
 logger = logging.getLogger(__name__)
@@ -19,10 +20,11 @@ async def lifespan(app: FastAPI):
     logger.info("Initializing database tables...")
     import app.models.db_session  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    token_calibrator.load()
 
     # Startup: Initialize memory service
     logger.info("Initializing services...")
-    memory_service = initialize_memory_service()
+    memory_service = await initialize_memory_service()
     if memory_service:
         logger.info("Memory service initialized successfully")
     else:
@@ -30,11 +32,15 @@ async def lifespan(app: FastAPI):
     
     yield
     
-    # Shutdown: Close memory service
+    # Shutdown: Extract buffered messages, then close memory service
     memory_service = get_memory_service()
     if memory_service:
-        memory_service.close()
+        flushed = await memory_service.flush_all()
+        if flushed:
+            logger.info(f"Flushed {flushed} buffered memory segments")
+        await memory_service.close()
         logger.info("Memory service closed")
+    await token_calibrator.flush()
 
 # Create FastAPI application instance
 app = FastAPI(
@@ -67,13 +73,15 @@ async def health_check():
 
 
 # Import API routers
-from app.api import chat, config, upload, characters, memory, history
+from app.api import chat, config, upload, characters, memory, history, cache, llm
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(config.router, prefix="/api", tags=["config"])
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(characters.router, prefix="/api", tags=["characters"])
 app.include_router(memory.router, prefix="/api", tags=["memory"])
 app.include_router(history.router, prefix="/api", tags=["history"])
+app.include_router(cache.router, prefix="/api", tags=["cache"])
+app.include_router(llm.router, prefix="/api", tags=["llm"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,79 @@
+"""
+Response cache data models
+"""
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class CachePolicy(BaseModel):
+    """Per-character response cache policy"""
+    enabled: bool = False
+    similarity_threshold: float = Field(0.95, ge=0.0, le=1.0)  # 1.0 = exact normalized match only
+    ttl_seconds: int = Field(24 * 3600, ge=0)
+    max_entries: int = Field(200, ge=1)
+
+
+class CachePolicyUpdate(BaseModel):
+    """Partial update for a character's cache policy"""
+    enabled: Optional[bool] = None
+    similarity_threshold: Optional[float] = Field(None, ge=0.0, le=1.0)
+    ttl_seconds: Optional[int] = Field(None, ge=0)
+    max_entries: Optional[int] = Field(None, ge=1)
+
+
+class CachedResponse(BaseModel):
+    """A cached assistant reply, stored as the original stream chunks"""
+    character_id: str
+    fingerprint: str
+    normalized_message: str
+    chunks: List[str] = Field(default_factory=list)
+    embedding: List[float] = Field(default_factory=list)
+    created_at: float
+    hit_count: int = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+class CacheLookup(BaseModel):
+    """Result of a cache lookup; carries what is needed to store the reply on a miss"""
+    character_id: str
+    fingerprint: str
+    normalized_message: str
+    embedding: List[float] = Field(default_factory=list)
+    entry: Optional[CachedResponse] = None
+
+
+class CacheStats(BaseModel):
+    """Hit/miss counters for one character"""
+    hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    entries: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CharacterCacheStats(BaseModel):
+    """Dashboard row for one character"""
+    character_id: str
+    policy: CachePolicy
+    hits: int
+    semantic_hits: int
+    misses: int
+    stores: int
+    entries: int
+    hit_ratio: float
+
+
+class CacheStatsResponse(BaseModel):
+    """Response cache dashboard payload"""
+    total_hits: int
+    total_misses: int
+    hit_ratio: float
+    characters: Dict[str, CharacterCacheStats]
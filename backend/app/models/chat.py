@@ -26,6 +26,7 @@ class ChatConfig(BaseModel):
     streaming_mode: int = 2  # Streaming mode: 0=non-streaming, 1=return_fragment, 2=true streaming (recommended), 3=fixed length chunk
     media_type: str = "ogg"  # Audio format: "wav" (for compatibility), "ogg" (recommended for streaming), "aac", "raw", "fmp4"
     aux_ref_audio_paths: List[str] = []  # Auxiliary reference audio paths
+    prosody_tags: Optional[bool] = None  # Inline [tag] prosody protocol; None = server default
 
 
 class ChatRequest(BaseModel):
@@ -37,6 +38,12 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[str] = None  # Conversation ID for memory system (optional)
 
 
+class ProsodySegment(BaseModel):
+    """A sentence of displayed reply text with the prosody tag in effect"""
+    text: str
+    tag: str = "neutral"
+
+
 class ChatResponse(BaseModel):
     """Chat API response model"""
     type: str  # "text", "complete", "audio", "error"
@@ -1,8 +1,10 @@
 """
-SQLAlchemy ORM models for conversation summaries and character states.
+SQLAlchemy ORM models for conversation summaries, character states, token
+estimator calibration, the memory write buffer journal and archived
+(compacted) graph memory nodes.
 """
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Text, Integer
+from sqlalchemy import Column, String, DateTime, Text, Integer, Float
 from app.database import Base
 
 
@@ -41,3 +43,41 @@ class CharacterStateDB(Base):
     familiarity_phase = Column(String, default="new")
     preferences = Column(Text, default="{}")
     observations = Column(Text, default="[]")
+
+
+class TokenCalibrationDB(Base):
+    __tablename__ = "token_calibrations"
+
+    id = Column(String, primary_key=True)  # "provider:model"
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    cjk_rate = Column(Float, nullable=False)
+    latin_rate = Column(Float, nullable=False)
+    samples = Column(Integer, default=0)
+    stats = Column(Text, default="{}")  # decayed regression sums
+
+
+class MemoryBufferDB(Base):
+    __tablename__ = "memory_buffer"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)
+    character_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, default="")
+    buffered_at = Column(Float, nullable=False)  # epoch seconds, for age/idle triggers after a restart
+
+
+class ArchivedMemoryDB(Base):
+    __tablename__ = "memory_archive"
+
+    id = Column(String, primary_key=True)  # graph node id
+    user_id = Column(String, nullable=False, index=True)
+    label = Column(String, nullable=False)
+    name = Column(String, default="")
+    decayed_importance = Column(Float, default=0.0)
+    archived_at = Column(Float, nullable=False)  # epoch seconds
+    payload = Column(Text, default="{}")  # node and its relations, as exported by the graph store
@@ -0,0 +1,25 @@
+"""
+LLM routing data models
+"""
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class LLMTaskPolicy(BaseModel):
+    """Model routing, concurrency limit and timeout for one class of LLM work"""
+    provider: Optional[str] = None  # None = use the active chat model
+    model: Optional[str] = None
+    concurrency: int = Field(4, ge=1)
+    timeout: float = Field(60.0, gt=0)  # Seconds, applied to non-streaming calls
+
+
+class ModelCapability(BaseModel):
+    """Context window, output limit, tokenizer and pricing for one chat model"""
+    id: str
+    name: str
+    provider: str
+    context_window: int = Field(..., gt=0)  # Prompt + completion tokens
+    max_output_tokens: int = Field(..., gt=0)
+    tokenizer: str = "chars"  # tiktoken encoding name, or "chars" for the char-based estimate
+    input_price_per_mtok: Optional[float] = None  # USD per 1M input tokens
+    output_price_per_mtok: Optional[float] = None  # USD per 1M output tokens
@@ -10,6 +10,7 @@ class Entity(BaseModel):
     id: str
     type: str  # Topic, Project, Skill, Resource, etc.
     name: str
+    score: int = 0  # Importance 1-10 assigned at extraction
     properties: Dict[str, Any] = {}
 
 
@@ -21,6 +22,15 @@ class Relation(BaseModel):
     properties: Dict[str, Any] = {}
 
 
+class TurnExtraction(BaseModel):
+    """Everything the unified extractor produces for a conversation segment"""
+    entities: List[Entity] = []
+    relations: List[Relation] = []
+    preferences: Dict[str, str] = {}
+    observation: str = ""
+    tone: str = "neutral"  # energetic, empathetic, focused or neutral
+
+
 class WriteMemoryRequest(BaseModel):
     """Request to write conversation memory"""
     user_id: str
@@ -32,9 +42,31 @@ class WriteMemoryRequest(BaseModel):
 class WriteMemoryResponse(BaseModel):
     """Response from memory write operation"""
     success: bool
+    job_id: Optional[str] = None  # Poll /memory/jobs/{job_id}; None while messages are only buffered
+    status: str = "buffered"
+    entities_count: int = 0
+    relations_count: int = 0
+    error: Optional[str] = None
+
+
+class MemoryJobResponse(BaseModel):
+    """Status of a memory write pipeline job"""
+    job_id: str
+    status: str  # queued, extracting, embedding, writing, done, failed
+    user_id: str
+    conversation_id: str
     entities_count: int = 0
     relations_count: int = 0
+    attempts: int = 0
     error: Optional[str] = None
+    submitted_at: float
+    finished_at: Optional[float] = None
+
+
+class RestoreArchivedRequest(BaseModel):
+    """Request to restore archived memory nodes"""
+    user_id: str
+    node_ids: Optional[List[str]] = None  # None restores all of the user's archived nodes
 
 
 class QueryContextRequest(BaseModel):
@@ -81,6 +113,32 @@ class GraphQueryResponse(BaseModel):
     links: List[GraphLink]
 
 
+class GraphNodeColumns(BaseModel):
+    """Graph view nodes as parallel arrays"""
+    id: List[str]
+    label: List[str]
+    type: List[str]
+    degree: List[int]
+    score: List[float]
+    properties: Dict[str, List[Any]] = {}
+
+
+class GraphLinkColumns(BaseModel):
+    """Graph view links as parallel arrays"""
+    source: List[str]
+    target: List[str]
+    type: List[Optional[str]]
+    count: List[int]
+
+
+class GraphViewResponse(BaseModel):
+    """One page of the level-of-detail graph view"""
+    nodes: GraphNodeColumns
+    links: GraphLinkColumns
+    total_nodes: int
+    next_cursor: Optional[str] = None
+
+
 class GraphStatsResponse(BaseModel):
     """Graph statistics response"""
     total_nodes: int
@@ -0,0 +1,163 @@
+"""
+Record/replay of upstream calls (LLM, embeddings, GPT-SoVITS).
+In record mode, live responses are saved to cassette files together with
+inter-chunk timing; in replay mode they are served back without touching the
+network, either at recorded speed or as fast as possible.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "record", "replay")
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when no recording matches a request."""
+
+
+class CassetteRecorder:
+    """
+    Stores one JSON file per distinct request under <directory>/<kind>/<hash>.json.
+
+    Each file keeps a list of recordings; identical requests replay them in
+    recorded order (wrapping around), so repeated calls stay deterministic.
+    """
+
+    def __init__(self, mode: str = "off", directory: str = "./cassettes", replay_speed: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {MODES}")
+        self.mode = mode
+        self.directory = Path(directory)
+        self.replay_speed = replay_speed
+        self._replay_index: Dict[str, int] = {}
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def request_key(request: Dict[str, Any]) -> str:
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    async def stream(
+        self,
+        kind: str,
+        request: Dict[str, Any],
+        factory: Callable[[], AsyncIterator[Any]],
+    ) -> AsyncIterator[Any]:
+        """Pass through, record or replay a chunk stream (str or bytes chunks)."""
+        if self.replaying:
+            recording = self._next_recording(kind, request)
+            for chunk in recording.get("chunks", []):
+                await self._sleep(chunk["delay"])
+                yield self._decode(chunk)
+            if recording.get("error"):
+                raise RuntimeError(recording["error"])
+            return
+
+        if not self.recording:
+            async for chunk in factory():
+                yield chunk
+            return
+
+        chunks = []
+        error = None
+        last = time.monotonic()
+        try:
+            async for chunk in factory():
+                now = time.monotonic()
+                chunks.append({"delay": round(now - last, 4), **self._encode(chunk)})
+                last = now
+                yield chunk
+        except BaseException as e:
+            # Includes cancellation of a hedged loser, so replay fails it the same way
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            self._append(kind, request, {"chunks": chunks, "error": error})
+
+    async def call(
+        self,
+        kind: str,
+        request: Dict[str, Any],
+        factory: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Pass through, record or replay a single JSON-serializable result."""
+        if self.replaying:
+            recording = self._next_recording(kind, request)
+            await self._sleep(recording.get("delay", 0.0))
+            if recording.get("error"):
+                raise RuntimeError(recording["error"])
+            return recording.get("result")
+
+        if not self.recording:
+            return await factory()
+
+        started = time.monotonic()
+        try:
+            result = await factory()
+        except Exception as e:
+            self._append(kind, request, {"delay": round(time.monotonic() - started, 4), "error": str(e)})
+            raise
+        self._append(kind, request, {"delay": round(time.monotonic() - started, 4), "result": result})
+        return result
+
+    def _path(self, kind: str, request: Dict[str, Any]) -> Path:
+        return self.directory / kind / f"{self.request_key(request)}.json"
+
+    def _append(self, kind: str, request: Dict[str, Any], recording: Dict[str, Any]) -> None:
+        path = self._path(kind, request)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"kind": kind, "request": request, "recordings": []}
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+        data["recordings"].append(recording)
+        path.write_text(json.dumps(data, ensure_ascii=False, default=str), encoding="utf-8")
+
+    def _next_recording(self, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        path = self._path(kind, request)
+        if not path.exists():
+            raise CassetteMissError(f"No {kind} recording for request {path.stem}")
+        recordings = json.loads(path.read_text(encoding="utf-8"))["recordings"]
+        if not recordings:
+            raise CassetteMissError(f"Empty {kind} cassette {path.stem}")
+        index = self._replay_index.get(str(path), 0)
+        self._replay_index[str(path)] = index + 1
+        return recordings[index % len(recordings)]
+
+    async def _sleep(self, delay: float) -> None:
+        if self.replay_speed > 0 and delay > 0:
+            await asyncio.sleep(delay / self.replay_speed)
+
+    @staticmethod
+    def _encode(chunk: Any) -> Dict[str, Any]:
+        if isinstance(chunk, bytes):
+            return {"data": base64.b64encode(chunk).decode("ascii"), "encoding": "base64"}
+        return {"data": chunk, "encoding": "text"}
+
+    @staticmethod
+    def _decode(chunk: Dict[str, Any]) -> Any:
+        if chunk.get("encoding") == "base64":
+            return base64.b64decode(chunk["data"])
+        return chunk["data"]
+
+
+cassette = CassetteRecorder(
+    mode=settings.cassette_mode,
+    directory=settings.cassette_dir,
+    replay_speed=settings.cassette_replay_speed,
+)
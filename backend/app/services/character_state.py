@@ -102,11 +102,15 @@ class CharacterStateService:
         self.save(db, state)
         return state
 
-    def build_prompt_context(self, state: CharacterStateRecord) -> str:
-        parts = [
-            f"You have spoken with this user {state.total_conversations} times before.",
-            f"Relationship phase: {state.familiarity_phase}.",
-        ]
+    def build_prompt_context(self, state: CharacterStateRecord, include_count: bool = True) -> str:
+        """
+        Prompt text for the state. include_count=False leaves out the
+        conversation count, which changes every session, so the text can key
+        cached replies.
+        """
+        parts = [f"Relationship phase: {state.familiarity_phase}."]
+        if include_count:
+            parts.insert(0, f"You have spoken with this user {state.total_conversations} times before.")
         if state.preferences:
             parts.append("Known preferences:")
             for key, value in state.preferences.items():
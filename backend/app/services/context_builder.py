@@ -12,6 +12,12 @@ from app.services.token_counter import TokenCounter
 
 logger = logging.getLogger(__name__)
 
+MEMORY_SECTION = (
+    "\n\n[Relevant memory about this user]\n{memory}\n"
+    "Weave this knowledge naturally into conversation. "
+    "Do not explicitly say 'I remember that...'."
+)
+
 
 class ContextBuilder:
     """
@@ -41,6 +47,10 @@ class ContextBuilder:
         self.memory_ceiling = memory_ceiling
         self.summary_ceiling = summary_ceiling
 
+    def memory_budget(self) -> int:
+        """Tokens left for memory lines within the memory ceiling, after the section framing."""
+        return max(0, self.memory_ceiling - self.counter.count_text(MEMORY_SECTION.format(memory="")))
+
     async def build(
         self,
         user_message: str,
@@ -141,11 +151,7 @@ class ContextBuilder:
                 summary_tokens_used = summary_tokens
 
         if memory_context:
-            memory_section = (
-                f"\n\n[Relevant memory about this user]\n{memory_context}\n"
-                "Weave this knowledge naturally into conversation. "
-                "Do not explicitly say 'I remember that...'."
-            )
+            memory_section = MEMORY_SECTION.format(memory=memory_context)
             mem_tokens = self.counter.count_text(memory_section)
             if mem_tokens <= self.memory_ceiling:
                 parts.append(memory_section)
@@ -0,0 +1,159 @@
+"""
+Entity canonicalization.
+Entity ids come straight from the LLM, so one concept tends to arrive under
+several ids (topic_python, topic_python3, skill_python). Before a write each
+new entity is matched against the user's existing entities, first by
+normalized name and then by embedding similarity, and a match is written
+onto the canonical node, whose `aliases` property keeps the other names and
+ids. find_duplicates applies the same matching to entities already in the
+graph for the offline merge.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Case-, width- and punctuation-insensitive key: "Python 3" and "python3" collide"""
+    text = unicodedata.normalize("NFKC", name or "").casefold()
+    return re.sub(r"[\W_]+", "", text)
+
+
+def similarity(a: List[float], b: List[float]) -> float:
+    """Cosine similarity on the vector index's (1 + cos) / 2 scale"""
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if a.shape != b.shape or norm == 0:
+        return 0.0
+    return (1 + float(a @ b) / norm) / 2
+
+
+def _aliases(row: dict) -> List[str]:
+    return list(row.get("aliases") or (row.get("properties") or {}).get("aliases") or [])
+
+
+def _match(entity: dict, key: str, pool: List[dict], min_score: float) -> Optional[dict]:
+    """Pool row with the same name key (same type first), else the most similar embedding"""
+    if key:
+        same_name = [row for row in pool if row["name_key"] == key]
+        same_name.sort(key=lambda row: row.get("type") != entity.get("type"))
+        if same_name:
+            return same_name[0]
+    embedding = entity.get("embedding")
+    best, best_score = None, min_score
+    if embedding:
+        for row in pool:
+            if row.get("embedding"):
+                score = similarity(embedding, row["embedding"])
+                if score >= best_score:
+                    best, best_score = row, score
+    return best
+
+
+def _pool_row(entity: dict, key: str) -> dict:
+    return {
+        "id": entity.get("id"),
+        "name": entity.get("name", ""),
+        "type": entity.get("type", "Entity"),
+        "importance": entity.get("score", entity.get("importance", 0)) or 0,
+        "embedding": entity.get("embedding"),
+        "aliases": _aliases(entity),
+        "name_key": key,
+    }
+
+
+def _add_alias(row: dict, *names: str) -> None:
+    """Record names and ids that differ from the canonical one beyond normalization"""
+    for name in names:
+        if name and name != row["id"] and normalize_name(name) != row["name_key"] and name not in row["aliases"]:
+            row["aliases"].append(name)
+
+
+def canonicalize(
+    entities: List[dict],
+    relations: List[dict],
+    candidates: List[dict],
+    min_score: float,
+) -> Tuple[List[dict], List[dict], Dict[str, str]]:
+    """
+    Rewrite an extraction onto canonical entities.
+    `candidates` are the user's existing entities (id, name, type, importance,
+    embedding, aliases). Returns the entities to write, the relations with
+    merged endpoints (self-loops created by a merge dropped) and the
+    {extracted id: canonical id} mapping.
+    """
+    pool = [dict(row, aliases=_aliases(row), name_key=normalize_name(row.get("name"))) for row in candidates]
+    mapping: Dict[str, str] = {}
+    out: Dict[str, dict] = {}
+    for entity in entities:
+        key = normalize_name(entity.get("name"))
+        match = _match(entity, key, pool, min_score)
+        if match is None or match["id"] == entity.get("id"):
+            written = out.get(entity.get("id"))
+            if written is None:
+                written = out[entity.get("id")] = dict(entity, properties=dict(entity.get("properties") or {}))
+                if match is None:
+                    pool.append(_pool_row(entity, key))
+            written["properties"]["name_key"] = key
+            continue
+
+        mapping[entity.get("id")] = match["id"]
+        _add_alias(match, entity.get("name", ""), entity.get("id"))
+        merged = out.get(match["id"])
+        if merged is None:
+            # An existing node: only name, type, importance and aliases are rewritten, its embedding is kept
+            merged = out[match["id"]] = {
+                "id": match["id"],
+                "name": match["name"],
+                "type": match["type"],
+                "score": match.get("importance") or 0,
+                "properties": {},
+            }
+        merged["score"] = max(merged.get("score") or 0, entity.get("score") or 0)
+        merged["properties"]["name_key"] = match["name_key"]
+        merged["properties"]["aliases"] = list(match["aliases"])
+
+    remapped = []
+    for relation in relations:
+        source = relation.get("source_id") or relation.get("source")
+        target = relation.get("target_id") or relation.get("target")
+        new_source, new_target = mapping.get(source, source), mapping.get(target, target)
+        if new_source == new_target and source != target:
+            continue
+        if (new_source, new_target) != (source, target):
+            relation = dict(relation, source=new_source, target=new_target)
+            relation.pop("source_id", None)
+            relation.pop("target_id", None)
+        remapped.append(relation)
+    return list(out.values()), remapped, mapping
+
+
+def find_duplicates(entities: List[dict], min_score: float) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Cluster existing entities for the offline merge. The most important
+    entity of a cluster (then the shortest id) is kept.
+    Returns merges [{"dup", "keep", "aliases", "name_key"}] and the name keys
+    of kept entities that lack one, for backfilling nodes written before
+    canonicalization.
+    """
+    ordered = sorted(entities, key=lambda row: (-(row.get("importance") or 0), len(row["id"]), row["id"]))
+    kept: List[dict] = []
+    stored_keys: Dict[str, Optional[str]] = {}
+    merged_into: Dict[str, dict] = {}
+    for row in ordered:
+        key = normalize_name(row.get("name"))
+        match = _match(row, key, kept, min_score)
+        if match is None:
+            stored_keys[row["id"]] = row.get("name_key")
+            kept.append(dict(row, aliases=_aliases(row), name_key=key))
+            continue
+        _add_alias(match, row.get("name", ""), row["id"], *_aliases(row))
+        merged_into[row["id"]] = match
+    merges = [
+        {"dup": dup, "keep": keep["id"], "aliases": keep["aliases"], "name_key": keep["name_key"]}
+        for dup, keep in merged_into.items()
+    ]
+    missing_keys = {row["id"]: row["name_key"] for row in kept if stored_keys[row["id"]] != row["name_key"]}
+    return merges, missing_keys
@@ -0,0 +1,171 @@
+"""
+Cross-conversation micro-batching of memory extraction jobs.
+
+Segments submitted within a short window are packed into one multi-document
+extraction call and the per-document results are routed back to each caller.
+Documents the batch reply leaves out are retried one by one; a segment whose
+extraction fails raises ExtractionError for its caller instead of resolving
+empty, so it is not acknowledged as processed.
+A global tokens-per-minute budget is applied before every upstream call, so
+bursts queue up here instead of hitting provider 429s.
+"""
+import asyncio
+import logging
+from typing import List, Optional, Set
+
+from app.config import settings
+from app.models.memory import TurnExtraction
+from app.services.rate_limiter import TokenBucket
+from app.services.model_registry import model_registry
+from app.services.token_counter import TokenCounter
+from app.services.turn_extractor import ExtractionError, turn_extractor
+
+logger = logging.getLogger(__name__)
+
+# Rough allowance for the JSON each document produces, counted against the budget.
+OUTPUT_TOKENS_PER_DOC = 400
+
+
+class _Job:
+    __slots__ = ("doc_id", "user_id", "conversation_id", "text", "future")
+
+    def __init__(self, doc_id: str, user_id: str, conversation_id: str, text: str, future: asyncio.Future):
+        self.doc_id = doc_id
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.text = text
+        self.future = future
+
+
+class ExtractionScheduler:
+    """Collects extraction jobs and flushes them as batched LLM calls."""
+
+    def __init__(
+        self,
+        window_ms: int = 500,
+        max_docs: int = 8,
+        tokens_per_minute: int = 0,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        self.window = window_ms / 1000.0
+        self.max_docs = max(1, max_docs)
+        self.budget = TokenBucket(tokens_per_minute)
+        self._token_counter = token_counter
+        self._pending: List[_Job] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._seq = 0
+        self.batches = 0
+        self.documents = 0
+        self.retried_documents = 0
+        self.failed_documents = 0
+        self.budget_wait_seconds = 0.0
+
+    async def submit(self, conversation_text: str, user_id: str, conversation_id: str) -> TurnExtraction:
+        """Queue a segment and wait for its extraction; raises ExtractionError on failure."""
+        self._seq += 1
+        job = _Job(
+            doc_id=f"d{self._seq}",
+            user_id=user_id,
+            conversation_id=conversation_id,
+            text=conversation_text,
+            future=asyncio.get_running_loop().create_future(),
+        )
+
+        if self.window <= 0 or self.max_docs == 1:
+            await self._run([job])
+            return job.future.result()
+
+        self._pending.append(job)
+        while len(self._pending) >= self.max_docs:
+            batch, self._pending = self._pending[:self.max_docs], self._pending[self.max_docs:]
+            self._spawn(batch)
+        if self._pending and self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_after_window())
+        return await asyncio.shield(job.future)
+
+    def metrics(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "in_flight_batches": len(self._running),
+            "batches": self.batches,
+            "documents": self.documents,
+            "retried_documents": self.retried_documents,
+            "failed_documents": self.failed_documents,
+            "budget_wait_seconds": round(self.budget_wait_seconds, 3),
+            "tokens_per_minute": self.budget.rate_per_minute,
+        }
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.window)
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            await self._run(batch)
+
+    def _spawn(self, batch: List[_Job]) -> None:
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[_Job]) -> None:
+        results = {}
+        error: Optional[BaseException] = None
+        try:
+            if len(batch) == 1:
+                await self._run_single(batch[0], results)
+            else:
+                self.budget_wait_seconds += await self.budget.acquire(self._estimate_tokens(batch))
+                results = await turn_extractor.extract_batch(
+                    [(job.doc_id, job.text, job.user_id) for job in batch]
+                )
+                missing = [job for job in batch if job.doc_id not in results]
+                if missing:
+                    logger.info(
+                        f"Extraction batch: {len(results)}/{len(batch)} documents from "
+                        f"{len({job.conversation_id for job in batch})} conversations, retrying {len(missing)}"
+                    )
+                    self.retried_documents += len(missing)
+                    await asyncio.gather(*[self._run_single(job, results) for job in missing])
+            self.batches += 1
+            self.documents += len(batch)
+        except Exception as e:
+            logger.error(f"Extraction batch of {len(batch)} failed: {str(e)}")
+            error = e if isinstance(e, ExtractionError) else ExtractionError(str(e))
+        finally:
+            for job in batch:
+                if job.future.done():
+                    continue
+                if job.doc_id in results:
+                    job.future.set_result(results[job.doc_id])
+                else:
+                    self.failed_documents += 1
+                    job.future.set_exception(error or ExtractionError(f"Extraction of {job.doc_id} failed"))
+
+    async def _run_single(self, job: _Job, results: dict) -> None:
+        """Extract one document on its own; leaves it out of results on failure."""
+        self.budget_wait_seconds += await self.budget.acquire(self._estimate_tokens([job]))
+        extraction = await turn_extractor.extract(job.text, job.user_id)
+        if extraction is not None:
+            results[job.doc_id] = extraction
+
+    def _estimate_tokens(self, batch: List[_Job]) -> int:
+        if not self.budget.enabled:
+            return 0
+        if self._token_counter is None:
+            self._token_counter = model_registry.token_counter(
+                settings.llm_extraction_provider or settings.llm_provider,
+                settings.llm_extraction_model or settings.openai_model,
+            )
+        prompt = turn_extractor.system_prompt() if len(batch) == 1 else turn_extractor.batch_system_prompt()
+        tokens = self._token_counter.count_text(prompt)
+        for job in batch:
+            tokens += self._token_counter.count_text(job.text) + OUTPUT_TOKENS_PER_DOC
+        return tokens
+
+
+extraction_scheduler = ExtractionScheduler(
+    window_ms=settings.extraction_batch_window_ms,
+    max_docs=settings.extraction_batch_max_docs,
+    tokens_per_minute=settings.extraction_tokens_per_minute,
+)
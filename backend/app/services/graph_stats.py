@@ -0,0 +1,54 @@
+"""
+Per-user graph statistics counters.
+Write paths add deltas for the nodes and relationships they create, keyed
+"node:<label>" / "rel:<type>", so /graph/stats reads counters instead of
+traversing the graph. Counters only see creations (an existing entity newly
+linked to a user is not counted until then), so MemoryService periodically
+recounts users that were active since their last reconciliation.
+"""
+from typing import Any, Dict, List
+
+NODE_PREFIX = "node:"
+REL_PREFIX = "rel:"
+
+
+def node_key(label: str) -> str:
+    return f"{NODE_PREFIX}{label}"
+
+
+def rel_key(rel_type: str) -> str:
+    return f"{REL_PREFIX}{rel_type}"
+
+
+def add_delta(deltas: Dict[str, int], key: str, count: int = 1) -> None:
+    if count:
+        deltas[key] = deltas.get(key, 0) + count
+
+
+def delta_rows(deltas: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Deltas as query parameters"""
+    return [{"key": key, "count": count} for key, count in deltas.items() if count]
+
+
+def counters_from_stats(node_types: Dict[str, int], relation_types: Dict[str, int]) -> Dict[str, int]:
+    counters = {node_key(label): count for label, count in node_types.items()}
+    counters.update({rel_key(rel_type): count for rel_type, count in relation_types.items()})
+    return counters
+
+
+def stats_from_counters(counters: Dict[str, int]) -> Dict[str, Any]:
+    """GraphStatsResponse payload from counters; zero counts are dropped"""
+    node_types = {
+        key[len(NODE_PREFIX):]: count for key, count in counters.items()
+        if key.startswith(NODE_PREFIX) and count > 0
+    }
+    relation_types = {
+        key[len(REL_PREFIX):]: count for key, count in counters.items()
+        if key.startswith(REL_PREFIX) and count > 0
+    }
+    return {
+        "total_nodes": sum(node_types.values()),
+        "total_relations": sum(relation_types.values()),
+        "node_types": node_types,
+        "relation_types": relation_types,
+    }
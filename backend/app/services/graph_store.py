@@ -0,0 +1,199 @@
+"""
+Storage backend interface for graph memory.
+MemoryService handles buffering, extraction, embeddings and session snapshots,
+and delegates persistence and graph queries to a GraphStore: Neo4j
+(Neo4jGraphStore) or the embedded SQLite store (LocalGraphStore).
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.graph_view import ViewKey
+from app.services.memory_snapshot import MemorySnapshot
+
+
+class GraphStore:
+    """Graph memory persistence and queries; implemented per backend."""
+
+    name = "base"
+
+    # Errors worth retrying (the backend was briefly unavailable or contended)
+    transient_errors: Tuple[type, ...] = ()
+
+    async def initialize(self) -> None:
+        """Connect / open storage and make sure the schema exists."""
+        raise NotImplementedError
+
+    async def verify_connectivity(self) -> bool:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        raise NotImplementedError
+
+    async def write_graph(
+        self,
+        user_id: str,
+        conversation_id: str,
+        character_id: str,
+        message_count: int,
+        entities: List[dict],
+        relations: List[dict],
+    ) -> Tuple[int, int]:
+        """Upsert user, conversation, entities and relations; returns (entities_count, relations_count)."""
+        return await self.write_graph_batch(
+            user_id,
+            [{"id": conversation_id, "character_id": character_id, "message_count": message_count}],
+            entities,
+            relations,
+        )
+
+    async def write_graph_batch(
+        self,
+        user_id: str,
+        conversations: List[dict],
+        entities: List[dict],
+        relations: List[dict],
+    ) -> Tuple[int, int]:
+        """
+        write_graph for several of a user's conversations in one transaction;
+        `conversations` rows carry id, character_id and message_count.
+        """
+        raise NotImplementedError
+
+    async def entity_candidates(
+        self,
+        user_id: str,
+        name_keys: List[str],
+        embeddings: List[List[float]],
+        min_score: float,
+    ) -> List[Dict[str, Any]]:
+        """
+        Entities within two hops of the user whose name key is in `name_keys`
+        or whose embedding scores at least min_score against one of
+        `embeddings`: rows of id, name, type, importance, embedding, aliases.
+        """
+        raise NotImplementedError
+
+    async def user_entities(self, user_id: str) -> List[Dict[str, Any]]:
+        """All entities within two hops of the user, as entity_candidates rows"""
+        raise NotImplementedError
+
+    async def merge_entities(self, user_id: str, merges: List[dict], name_keys: Dict[str, str]) -> int:
+        """
+        Fold each merge's `dup` entity into `keep` (relations moved, counts
+        summed, self-loops dropped), set the kept node's aliases and name
+        key, and backfill `name_keys` ({id: key}); returns entities removed.
+        """
+        raise NotImplementedError
+
+    async def write_relational_signals(
+        self,
+        user_id: str,
+        character_id: str,
+        conversation_id: str,
+        preferences: Dict[str, str],
+        observation: str,
+        now: str,
+    ) -> None:
+        raise NotImplementedError
+
+    async def related_context(
+        self,
+        user_id: str,
+        query_embedding: Optional[List[float]],
+        keywords: List[str],
+        limit: int,
+        include_relational: bool,
+        on_recall: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[str]:
+        """
+        Context lines from vector/keyword recall reranked by
+        memory_rerank.rank, 1-hop expansion and relational signals;
+        on_recall gets the ids of the expanded entities.
+        """
+        raise NotImplementedError
+
+    async def record_access(self, rows: List[dict]) -> None:
+        """Add recall counts to entities: rows of id, count and last_accessed_at"""
+        raise NotImplementedError
+
+    async def decay_candidates(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Up to `limit` of the user's compactable nodes, least recently seen
+        first: entities within two hops that no other user reaches, plus the
+        user's preferences and observations. Rows of id, label, name,
+        importance, updated_at, last_accessed_at, access_count.
+        """
+        raise NotImplementedError
+
+    async def compaction_users(self, limit: int) -> List[str]:
+        """Up to `limit` users, least recently compacted (never compacted first)"""
+        raise NotImplementedError
+
+    async def mark_compacted(self, user_id: str, now: str) -> None:
+        raise NotImplementedError
+
+    async def export_nodes(self, node_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Nodes with their relations in store-neutral form, for the archive:
+        id, label, type, name, user_id, importance, embedding, properties,
+        created_at, updated_at and relations (source, source_label, kind,
+        type, target, target_label, count, properties, created_at, updated_at).
+        """
+        raise NotImplementedError
+
+    async def delete_nodes(self, node_ids: List[str]) -> int:
+        """Remove nodes and their relations; returns nodes deleted"""
+        raise NotImplementedError
+
+    async def import_nodes(self, nodes: List[Dict[str, Any]]) -> int:
+        """
+        Write back export_nodes rows; relations whose other endpoint no
+        longer exists are skipped. Returns nodes written.
+        """
+        raise NotImplementedError
+
+    async def load_snapshot(self, user_id: str, max_nodes: int) -> Optional[MemorySnapshot]:
+        """The user's subgraph for in-process retrieval, or None if it exceeds max_nodes."""
+        raise NotImplementedError
+
+    async def query_graph(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]],
+        relation_types: Optional[List[str]],
+        depth: int,
+        limit: int,
+    ) -> Dict[str, List]:
+        raise NotImplementedError
+
+    async def graph_view(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]],
+        relation_types: Optional[List[str]],
+        depth: int,
+        limit: int,
+        order: str,
+        after: Optional[ViewKey],
+        properties: List[str],
+    ) -> Dict[str, Any]:
+        """
+        One page of the level-of-detail view: {"nodes": up to limit + 1 ranked
+        rows after the cursor key, "links": relations of the first `limit` rows
+        to nodes ranked up to the last of them, "total": reachable node count}.
+        """
+        raise NotImplementedError
+
+    async def get_node_details(self, node_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def get_graph_stats(self, user_id: str) -> Dict[str, Any]:
+        """Per-user counters maintained by the write paths"""
+        raise NotImplementedError
+
+    async def stale_stats_users(self) -> List[str]:
+        """Users active since their counters were last reconciled"""
+        raise NotImplementedError
+
+    async def reconcile_graph_stats(self, user_id: str) -> Dict[str, Any]:
+        """Recount the user's graph, overwrite the counters and return the stats"""
+        raise NotImplementedError
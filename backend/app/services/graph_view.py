@@ -0,0 +1,85 @@
+"""
+Paged, level-of-detail graph views for visualization.
+Nodes reachable from the user are ranked by degree (or importance score) so
+the first page is the most connected part of the graph; further pages follow
+a keyset cursor over the same ranking. Payloads are columnar (parallel arrays)
+and only carry explicitly requested properties, never embeddings.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+VIEW_ORDERS = ("degree", "score")
+
+# Never shipped to the viewer, even when requested
+HIDDEN_PROPERTIES = {"embedding"}
+
+NODE_COLUMNS = ("id", "label", "type", "degree", "score")
+LINK_COLUMNS = ("source", "target", "type", "count")
+
+# (primary, secondary, id); ranked by primary desc, secondary desc, id asc
+ViewKey = Tuple[float, float, str]
+
+
+def view_key(order: str, node_id: str, degree: int, score: float) -> ViewKey:
+    if order == "score":
+        return (score, degree, node_id)
+    return (degree, score, node_id)
+
+
+def ranks_before(key: ViewKey, other: ViewKey) -> bool:
+    """Whether `key` comes strictly before `other` in view order"""
+    return (-key[0], -key[1], key[2]) < (-other[0], -other[1], other[2])
+
+
+def encode_cursor(key: ViewKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[ViewKey]:
+    """Key of the last node already delivered; ValueError for a malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        primary, secondary, node_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float(primary), float(secondary), str(node_id))
+    except Exception:
+        raise ValueError("Invalid graph cursor")
+
+
+def visible_properties(names: Optional[List[str]]) -> List[str]:
+    return [name for name in names or [] if name not in HIDDEN_PROPERTIES]
+
+
+def columnar(rows: List[Dict[str, Any]], columns: Tuple[str, ...]) -> Dict[str, List[Any]]:
+    return {column: [row.get(column) for row in rows] for column in columns}
+
+
+def build_view(
+    nodes: List[Dict[str, Any]],
+    links: List[Dict[str, Any]],
+    total: int,
+    order: str,
+    limit: int,
+    properties: List[str],
+) -> Dict[str, Any]:
+    """
+    Columnar response from a store page: `nodes` are ranked rows (up to
+    limit + 1, the extra row only signals another page), `links` the
+    relations between page nodes and nodes ranked up to the page's last node.
+    """
+    page = nodes[:limit]
+    next_cursor = None
+    if len(nodes) > limit and page:
+        last = page[-1]
+        next_cursor = encode_cursor(view_key(order, last["id"], last["degree"], last["score"]))
+    node_columns = columnar(page, NODE_COLUMNS)
+    node_columns["properties"] = {
+        name: [(row.get("properties") or {}).get(name) for row in page] for name in properties
+    }
+    return {
+        "nodes": node_columns,
+        "links": columnar(links, LINK_COLUMNS),
+        "total_nodes": total,
+        "next_cursor": next_cursor,
+    }
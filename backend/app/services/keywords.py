@@ -0,0 +1,60 @@
+r"""
+Search terms for lexical entity recall.
+
+`\w+` keeps a whole Chinese clause as one word, so keyword recall never
+matched Chinese names. Text is NFKC-normalized and casefolded; Latin and
+digit words are kept whole (stop words dropped), and CJK runs are split at
+stop characters and cut into overlapping character bigrams, a lone character
+kept as is, like Lucene's CJK analyzer behind the Neo4j full-text index.
+Entity names and aliases are indexed with the same function, so a query
+finds an entity when they share a term.
+"""
+import re
+import unicodedata
+from typing import Iterable, List, Optional, Set
+
+# Han, kana and hangul
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+
+CJK_STOP_CHARS = "的了是在我你他她它这那吗呢吧啊呀哦嗯和与也都就还很又们个把被给让着过"
+
+STOP_WORDS = frozenset("""
+a an the is are was were be been being am have has had do does did will would should could may might
+can must shall i me my we our you your he him his she her it its they them their this that these those
+to of in on at for with about from by as into and or but not no so if then than there here what which
+who whom how why when where just also very too
+""".split())
+
+KEYWORD_LIMIT = 10
+
+_RUNS = re.compile(rf"[{CJK}]+|[^\W_{CJK}]+")
+_CJK_RUN = re.compile(rf"[{CJK}]")
+_CJK_STOPS = re.compile(f"[{CJK_STOP_CHARS}]+")
+
+
+def terms(text: Optional[str]) -> List[str]:
+    """Search terms of `text` in order of appearance, repeats included"""
+    out: List[str] = []
+    for run in _RUNS.findall(unicodedata.normalize("NFKC", text or "").casefold()):
+        if _CJK_RUN.match(run):
+            for segment in _CJK_STOPS.split(run):
+                if len(segment) == 1:
+                    out.append(segment)
+                else:
+                    out.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        elif len(run) > 1 and run not in STOP_WORDS:
+            out.append(run)
+    return out
+
+
+def extract_keywords(text: str, limit: int = KEYWORD_LIMIT) -> List[str]:
+    """Distinct query terms, first `limit` in order of appearance"""
+    return list(dict.fromkeys(terms(text)))[:limit]
+
+
+def name_terms(name: Optional[str], aliases: Optional[Iterable[str]] = None) -> Set[str]:
+    """Terms an entity is found by: those of its name and aliases"""
+    found = set(terms(name))
+    for alias in aliases or ():
+        found.update(terms(alias))
+    return found
@@ -0,0 +1,261 @@
+"""
+Latency-aware routing for streamed LLM calls.
+Races a hedge request against a slow primary, fails over across providers,
+and tracks per-route time-to-first-token (TTFT) to size the hedge budget.
+Time spent queued for admission (the client-side rate limiter) is tracked
+separately and never counts as TTFT.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (route name, factory returning a fresh chunk stream)
+StreamRoute = Tuple[str, Callable[[], AsyncIterator[str]]]
+
+# Waits until the named route may call upstream; returns seconds queued
+Admission = Callable[[str], Awaitable[float]]
+
+
+class LLMError(Exception):
+    """Raised when no LLM route could produce a response."""
+
+
+class TTFTTracker:
+    """
+    Sliding window of time-to-first-token samples per route.
+
+    An attempt cancelled before its first token (it lost a hedge race, or the
+    caller gave up) is recorded as censored: its elapsed time is a lower bound
+    on its TTFT. Keeping those samples stops a route that keeps losing from
+    being judged on its fast wins alone, which would shrink its hedge budget.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._queue_waits: Dict[str, Deque[float]] = {}
+        self._failures: Dict[str, int] = {}
+        self._censored: Dict[str, int] = {}
+
+    def record(self, route: str, seconds: float, censored: bool = False) -> None:
+        self._samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+        if censored:
+            self._censored[route] = self._censored.get(route, 0) + 1
+
+    def record_queue_wait(self, route: str, seconds: float) -> None:
+        self._queue_waits.setdefault(route, deque(maxlen=self.window)).append(seconds)
+
+    def record_failure(self, route: str) -> None:
+        self._failures[route] = self._failures.get(route, 0) + 1
+
+    def percentile(self, route: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """Nearest-rank percentile in seconds, or None with too few samples."""
+        return self._percentile(self._samples.get(route), q, min_samples)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for route in set(self._samples) | set(self._failures) | set(self._queue_waits):
+            samples = self._samples.get(route, ())
+            queue_waits = self._queue_waits.get(route)
+            result[route] = {
+                "samples": len(samples),
+                "censored": self._censored.get(route, 0),
+                "failures": self._failures.get(route, 0),
+                "p50_ms": self._ms(self.percentile(route, 0.5)),
+                "p90_ms": self._ms(self.percentile(route, 0.9)),
+                "p99_ms": self._ms(self.percentile(route, 0.99)),
+                "queue_p50_ms": self._ms(self._percentile(queue_waits, 0.5)),
+                "queue_p90_ms": self._ms(self._percentile(queue_waits, 0.9)),
+            }
+        return result
+
+    @staticmethod
+    def _percentile(samples: Optional[Deque[float]], q: float, min_samples: int = 1) -> Optional[float]:
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        rank = max(1, math.ceil(q * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    @staticmethod
+    def _ms(seconds: Optional[float]) -> Optional[float]:
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class _Attempt:
+    """
+    One in-flight route: its stream and the task awaiting its first chunk.
+    With an admission step, the TTFT clock starts once it is admitted.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stream: AsyncIterator[str],
+        admit: Optional[Callable[[], Awaitable[float]]] = None,
+    ):
+        self.name = name
+        self.stream = stream
+        self.launched_at = time.monotonic()
+        self.started_at: Optional[float] = None if admit else self.launched_at
+        self._admit = admit
+
+    def waited(self) -> float:
+        """Seconds since launch, queueing included."""
+        return time.monotonic() - self.launched_at
+
+    def elapsed(self) -> Optional[float]:
+        """Seconds since admission, or None while still queued."""
+        return time.monotonic() - self.started_at if self.started_at is not None else None
+
+    async def first_chunk(self) -> Optional[str]:
+        if self._admit is not None:
+            await self._admit()
+            self.started_at = time.monotonic()
+        async for chunk in self.stream:
+            if chunk:
+                return chunk
+        return None
+
+    async def close(self) -> None:
+        try:
+            await self.stream.aclose()
+        except Exception:
+            pass
+
+
+class LLMRouter:
+    """
+    Streams from an ordered list of routes.
+
+    - The first route is the primary; later routes are failover targets.
+    - With hedging enabled, if the primary has not produced a first token within
+      the hedge budget, the next route is started in parallel. Whichever yields a
+      first token first wins; the other is cancelled.
+    - Failures before the first token fail over to the next route. Failures after
+      the first token are raised, since partial output has already been sent.
+    - An optional admission step (rate limiting) runs before each attempt's
+      TTFT clock starts; its wait is recorded separately. The hedge timer
+      counts from launch, so a primary stuck in the queue is hedged as well.
+    """
+
+    def __init__(
+        self,
+        hedge_enabled: bool = False,
+        hedge_budget_ms: int = 3000,
+        hedge_min_budget_ms: int = 500,
+        hedge_percentile: float = 0.9,
+        hedge_min_samples: int = 20,
+        tracker: Optional[TTFTTracker] = None,
+    ):
+        self.hedge_enabled = hedge_enabled
+        self.hedge_budget_ms = hedge_budget_ms
+        self.hedge_min_budget_ms = hedge_min_budget_ms
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.tracker = tracker or TTFTTracker()
+
+    def hedge_budget(self, route: str) -> float:
+        """Seconds to wait for a first token before hedging."""
+        observed = self.tracker.percentile(route, self.hedge_percentile, self.hedge_min_samples)
+        budget_ms = observed * 1000 if observed is not None else self.hedge_budget_ms
+        return max(self.hedge_min_budget_ms, budget_ms) / 1000
+
+    async def stream(self, routes: List[StreamRoute], admit: Optional[Admission] = None) -> AsyncIterator[str]:
+        if not routes:
+            raise LLMError("No LLM routes configured")
+
+        pending = list(routes)
+        running: Dict[asyncio.Task, _Attempt] = {}
+        errors: List[str] = []
+        winner: Optional[_Attempt] = None
+        first: Optional[str] = None
+
+        def launch() -> None:
+            name, factory = pending.pop(0)
+
+            async def admit_route(name: str = name) -> float:
+                waited = await admit(name)
+                self.tracker.record_queue_wait(name, waited)
+                return waited
+
+            try:
+                attempt = _Attempt(name, factory(), admit_route if admit is not None else None)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                self.tracker.record_failure(name)
+                return
+            running[asyncio.ensure_future(attempt.first_chunk())] = attempt
+
+        try:
+            while winner is None:
+                if not running:
+                    if not pending:
+                        raise LLMError("All LLM routes failed: " + "; ".join(errors))
+                    launch()
+                    continue
+
+                timeout = None
+                if self.hedge_enabled and pending and len(running) == 1:
+                    primary = next(iter(running.values()))
+                    timeout = max(0.0, self.hedge_budget(primary.name) - primary.waited())
+
+                done, _ = await asyncio.wait(
+                    running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(
+                        "No first token from %s within hedge budget, hedging to %s",
+                        next(iter(running.values())).name,
+                        pending[0][0],
+                    )
+                    launch()
+                    continue
+
+                for task in done:
+                    attempt = running.pop(task)
+                    error = task.exception()
+                    if error is None and task.result() is None:
+                        error = LLMError("empty response")
+                    if error is not None:
+                        logger.warning(f"LLM route {attempt.name} failed: {error}")
+                        errors.append(f"{attempt.name}: {error}")
+                        self.tracker.record_failure(attempt.name)
+                        await attempt.close()
+                        continue
+                    self.tracker.record(attempt.name, attempt.elapsed())
+                    if winner is None:
+                        winner, first = attempt, task.result()
+                    else:
+                        await attempt.close()
+
+            await self._cancel(running)
+            yield first
+            try:
+                async for chunk in winner.stream:
+                    if chunk:
+                        yield chunk
+            except Exception as e:
+                raise LLMError(f"{winner.name} failed mid-stream: {e}") from e
+        finally:
+            await self._cancel(running)
+            if winner is not None:
+                await winner.close()
+
+    async def _cancel(self, running: Dict[asyncio.Task, _Attempt]) -> None:
+        """Cancel attempts still waiting for a first token, recording their wait as censored TTFT."""
+        for task, attempt in running.items():
+            elapsed = attempt.elapsed()
+            if not task.done() and elapsed is not None:
+                self.tracker.record(attempt.name, elapsed, censored=True)
+            task.cancel()
+        if running:
+            await asyncio.gather(*running.keys(), return_exceptions=True)
+        for attempt in running.values():
+            await attempt.close()
+        running.clear()
@@ -2,8 +2,10 @@
 LLM service wrapper using LangChain
 Handles OpenAI API integration via LangChain
 """
+import asyncio
 import logging
-from typing import AsyncIterator, List, Optional, Dict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional, Dict, Tuple
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 try:
     from langchain_google_genai import ChatGoogleGenerativeAI
@@ -12,29 +14,62 @@ except ImportError:
 
 from app.config import settings
 from app.models.chat import Message
+from app.models.llm import LLMTaskPolicy
+from app.services.cassette import cassette
+from app.services.llm_router import LLMError, LLMRouter, StreamRoute
+from app.services.rate_limiter import RateLimitScheduler, parse_rate_limits
+from app.services.token_calibration import token_calibrator, usage_from_message
+from app.services.model_registry import model_registry
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Task classes: interactive turns keep the user's model; background work can be
+# routed to a cheaper model with its own concurrency limit and timeout.
+TASK_INTERACTIVE = "interactive"
+TASK_EXTRACTION = "extraction"
+TASK_SUMMARIZATION = "summarization"
+
+# Rate limiter queue priority (lower is served first)
+TASK_PRIORITY = {TASK_INTERACTIVE: 0, TASK_SUMMARIZATION: 1, TASK_EXTRACTION: 2}
+
+
+def _policy_from_settings(task: str) -> LLMTaskPolicy:
+    return LLMTaskPolicy(
+        provider=getattr(settings, f"llm_{task}_provider", "") or None,
+        model=getattr(settings, f"llm_{task}_model", "") or None,
+        concurrency=getattr(settings, f"llm_{task}_concurrency"),
+        timeout=getattr(settings, f"llm_{task}_timeout"),
+    )
+
 
 class LLMService:
     """Service for LLM integration using LangChain with OpenAI and Gemini support"""
     
-    # Available models configuration
-    AVAILABLE_MODELS = [
-        {"id": "gpt-3.5-turbo", "name": "GPT-3.5 Turbo", "provider": "openai"},
-        {"id": "gpt-4o", "name": "GPT-4o", "provider": "openai"},
-        {"id": "gemini-3-pro", "name": "Gemini 3 Pro", "provider": "gemini"},
-        {"id": "gemini-2.5-flash", "name": "Gemini 2.5 Flash", "provider": "gemini"},
-        {"id": "gemini-2.5-flash-tts", "name": "Gemini 2.5 Flash TTS", "provider": "gemini"},
-        {"id": "gemini-1.5-pro", "name": "Gemini 1.5 Pro", "provider": "gemini"},
-    ]
-
     def __init__(self):
         self.llm = None
         self.embeddings: Optional[OpenAIEmbeddings] = None
         self._initialized = False
         self.current_provider = settings.llm_provider
         self.current_model = settings.openai_model
+        self._clients: Dict[Tuple[str, str], Any] = {}
+        self.router = LLMRouter(
+            hedge_enabled=settings.llm_hedge_enabled,
+            hedge_budget_ms=settings.llm_hedge_budget_ms,
+            hedge_min_budget_ms=settings.llm_hedge_min_budget_ms,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_min_samples=settings.llm_hedge_min_samples,
+        )
+        self.task_policies: Dict[str, LLMTaskPolicy] = {
+            task: _policy_from_settings(task)
+            for task in (TASK_INTERACTIVE, TASK_EXTRACTION, TASK_SUMMARIZATION)
+        }
+        self._task_semaphores: Dict[str, asyncio.Semaphore] = {
+            task: asyncio.Semaphore(policy.concurrency) for task, policy in self.task_policies.items()
+        }
+        self._task_in_flight: Dict[str, int] = {task: 0 for task in self.task_policies}
+        self.rate_limiter = RateLimitScheduler(parse_rate_limits(settings.llm_rate_limits))
     
     def _initialize_llm(self):
         """Initialize LLM model based on configuration"""
@@ -43,38 +78,11 @@ class LLMService:
             if settings.openai_api_key:
                 self.embeddings = OpenAIEmbeddings(
                     openai_api_key=settings.openai_api_key,
-                    model="text-embedding-3-small"
+                    model=EMBEDDING_MODEL
                 )
             
             # Initialize Chat Model
-            if self.current_provider == "gemini":
-                if not settings.gemini_api_key:
-                    raise ValueError("GEMINI_API_KEY is required for Gemini models")
-                
-                if ChatGoogleGenerativeAI is None:
-                    raise ImportError("langchain-google-genai is not installed")
-                
-                self.llm = ChatGoogleGenerativeAI(
-                    google_api_key=settings.gemini_api_key,
-                    model=self.current_model,
-                    temperature=0.7,
-                    convert_system_message_to_human=True # Gemini sometimes needs this
-                )
-                logger.info(f"Gemini LLM initialized: {self.current_model}")
-                
-            else: # Default to OpenAI
-                if not settings.openai_api_key:
-                    raise ValueError("OPENAI_API_KEY is required for OpenAI models")
-                
-                self.llm = ChatOpenAI(
-                    openai_api_key=settings.openai_api_key,
-                    model=self.current_model,
-                    temperature=0.7,
-                    streaming=True,
-                    verbose=True
-                )
-                logger.info(f"OpenAI LLM initialized: {self.current_model}")
-            
+            self.llm = self._get_client(self.current_provider, self.current_model)
             self._initialized = True
             
         except Exception as e:
@@ -82,9 +90,151 @@ class LLMService:
             # Don't raise here to allow re-configuration
             self._initialized = False
 
-    def get_available_models(self) -> List[Dict[str, str]]:
-        """Return list of available models"""
-        return self.AVAILABLE_MODELS
+    def _get_client(self, provider: str, model: str):
+        """Return a cached chat model client for provider/model, creating it on first use"""
+        key = (provider, model)
+        if key in self._clients:
+            return self._clients[key]
+
+        if provider == "gemini":
+            if not settings.gemini_api_key:
+                raise ValueError("GEMINI_API_KEY is required for Gemini models")
+            
+            if ChatGoogleGenerativeAI is None:
+                raise ImportError("langchain-google-genai is not installed")
+            
+            client = ChatGoogleGenerativeAI(
+                google_api_key=settings.gemini_api_key,
+                model=model,
+                temperature=0.7,
+                convert_system_message_to_human=True # Gemini sometimes needs this
+            )
+            logger.info(f"Gemini LLM initialized: {model}")
+            
+        else: # Default to OpenAI
+            if not settings.openai_api_key:
+                raise ValueError("OPENAI_API_KEY is required for OpenAI models")
+            
+            kwargs = {}
+            if "stream_usage" in getattr(ChatOpenAI, "__fields__", {}):
+                # Report token usage on streamed responses (newer langchain-openai only)
+                kwargs["stream_usage"] = True
+            client = ChatOpenAI(
+                openai_api_key=settings.openai_api_key,
+                model=model,
+                temperature=0.7,
+                streaming=True,
+                verbose=True,
+                **kwargs
+            )
+            logger.info(f"OpenAI LLM initialized: {model}")
+
+        self._clients[key] = client
+        return client
+
+    def _routes(self, task: str = TASK_INTERACTIVE) -> List[Tuple[str, str]]:
+        """Task model (if tiered), then the active model, then configured fallbacks (deduplicated)"""
+        routes = []
+        policy = self.task_policies.get(task)
+        if policy and policy.model:
+            routes.append((policy.provider or self.current_provider, policy.model))
+        if (self.current_provider, self.current_model) not in routes:
+            routes.append((self.current_provider, self.current_model))
+        for item in settings.llm_fallback_models.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            provider, _, model = item.partition(":")
+            if not model:
+                logger.warning(f"Ignoring malformed fallback model '{item}', expected provider:model")
+                continue
+            if (provider, model) not in routes:
+                routes.append((provider, model))
+        return routes
+
+    async def _stream_route(
+        self, provider: str, model: str, messages: List[dict], task: str = TASK_INTERACTIVE
+    ) -> AsyncIterator[str]:
+        """Stream text chunks from one provider/model; raises on failure"""
+        request = {"provider": provider, "model": model, "messages": messages}
+        async for chunk in cassette.stream(
+            "llm_stream", request, lambda: self._stream_live(provider, model, messages, task)
+        ):
+            yield chunk
+
+    async def _stream_live(
+        self, provider: str, model: str, messages: List[dict], task: str = TASK_INTERACTIVE
+    ) -> AsyncIterator[str]:
+        client = self._get_client(provider, model)
+        parts = []
+        input_tokens = output_tokens = 0
+        async for chunk in client.astream(messages):
+            usage = usage_from_message(chunk)
+            if usage:
+                input_tokens += usage[0]
+                output_tokens += usage[1]
+            # Handle different chunk types
+            if hasattr(chunk, "content"):
+                content = chunk.content
+                if content:
+                    parts.append(content)
+                    yield content
+            elif isinstance(chunk, str):
+                parts.append(chunk)
+                yield chunk
+            elif hasattr(chunk, "text"):
+                parts.append(chunk.text)
+                yield chunk.text
+        self._record_usage(provider, model, messages, "".join(parts), input_tokens, output_tokens)
+
+    async def _invoke_live(
+        self, provider: str, model: str, messages: List[dict], json_mode: bool = False
+    ) -> str:
+        client = self._get_client(provider, model)
+        if json_mode and provider == "openai":
+            # Native JSON mode; other providers rely on the prompt and lenient parsing
+            client = client.bind(response_format={"type": "json_object"})
+        response = await client.ainvoke(messages)
+        text = response.content if hasattr(response, 'content') else str(response)
+        usage = usage_from_message(response)
+        if usage:
+            self._record_usage(provider, model, messages, text, *usage)
+        return text
+
+    def _record_usage(
+        self, provider: str, model: str, messages: List[dict], completion: str,
+        input_tokens: int, output_tokens: int
+    ):
+        """Feed provider-reported usage to the token estimator calibration"""
+        if not settings.token_calibration_enabled or (input_tokens <= 0 and output_tokens <= 0):
+            return
+        try:
+            token_calibrator.record(provider, model, messages, completion, input_tokens, output_tokens)
+        except Exception as e:
+            logger.warning(f"Token calibration update failed: {str(e)}")
+
+    async def _wait_for_rate_limit(self, provider: str, model: str, messages: List[dict], task: str) -> float:
+        """
+        Queue on the client-side rate limiter for provider/model, if limits are
+        configured (replayed calls never reach upstream). Returns seconds waited.
+        """
+        if cassette.replaying or not self.rate_limiter.is_limited(provider, model):
+            return 0.0
+        tokens = 0
+        if self.rate_limiter.counts_tokens(provider, model):
+            tokens = model_registry.token_counter(provider, model).count_messages(messages)
+            tokens += settings.llm_rate_limit_output_tokens
+        api_key = settings.gemini_api_key if provider == "gemini" else settings.openai_api_key
+        waited = await self.rate_limiter.acquire(
+            provider, model, api_key, tokens, priority=TASK_PRIORITY.get(task, 0), label=task
+        )
+        if waited > 0.1:
+            logger.info(f"Rate limiter held {task} call to {provider}:{model} for {waited:.2f}s")
+        return waited
+
+    def get_available_models(self) -> List[Dict[str, Any]]:
+        """Return list of available models with their capabilities"""
+        return [m.model_dump() for m in model_registry.list()]
 
     def set_model(self, provider: str, model_id: str):
         """Switch model at runtime"""
@@ -95,18 +245,22 @@ class LLMService:
 
     async def get_embedding(self, text: str) -> List[float]:
         """Get embedding for text"""
+        try:
+            return await cassette.call(
+                "embedding", {"model": EMBEDDING_MODEL, "text": text}, lambda: self._embed_live(text)
+            )
+        except Exception as e:
+            logger.error(f"Failed to get embedding: {str(e)}")
+            return []
+
+    async def _embed_live(self, text: str) -> List[float]:
         if not self.embeddings:
             # Try to init if not ready
             self._initialize_llm()
             if not self.embeddings:
                 logger.warning("Embeddings not initialized (missing OpenAI Key)")
                 return []
-            
-        try:
-            return await self.embeddings.aembed_query(text)
-        except Exception as e:
-            logger.error(f"Failed to get embedding: {str(e)}")
-            return []
+        return await self.embeddings.aembed_query(text)
     
     def _build_messages_from_history(
         self, 
@@ -174,65 +328,58 @@ class LLMService:
         Yields:
             Text chunks as they are generated
         """
-        if not self._initialized:
-            self._initialize_llm()
-        
-        try:
-            # Build messages list for OpenAI API with system prompt and memory context
-            messages = self._build_messages_from_history(
-                history or [], 
-                message,
-                system_prompt=system_prompt,
-                memory_context=memory_context
-            )
-            
-            # Stream response from OpenAI
-            async for chunk in self.llm.astream(messages):
-                # Handle different chunk types
-                if hasattr(chunk, 'content'):
-                    content = chunk.content
-                    if content:
-                        yield content
-                elif isinstance(chunk, str):
-                    yield chunk
-                elif hasattr(chunk, 'text'):
-                    yield chunk.text
-        
-        except Exception as e:
-            logger.error(f"Error in stream_chat: {str(e)}")
-            yield f"抱歉，生成回复时出现错误: {str(e)}"
+        # Build messages list for OpenAI API with system prompt and memory context
+        messages = self._build_messages_from_history(
+            history or [], 
+            message,
+            system_prompt=system_prompt,
+            memory_context=memory_context
+        )
+        async for chunk in self.astream_from_messages(messages):
+            yield chunk
 
     async def astream_from_messages(
         self,
         messages: List[dict],
+        task: str = TASK_INTERACTIVE,
     ) -> AsyncIterator[str]:
         """
         Stream chat response from a pre-assembled messages list.
         Used by ContextBuilder integration.
+
+        Routed through LLMRouter: hedges to the first fallback model when the
+        active model is slow to respond, and fails over on errors. Holds one
+        slot of the task's concurrency limit for the duration of the stream
+        and queues on the client-side rate limiter before each upstream call,
+        outside the route's TTFT measurement.
+
+        Raises:
+            LLMError: if no route produced a response
         """
         if not self._initialized:
             self._initialize_llm()
 
-        try:
-            async for chunk in self.llm.astream(messages):
-                if hasattr(chunk, "content"):
-                    content = chunk.content
-                    if content:
-                        yield content
-                elif isinstance(chunk, str):
-                    yield chunk
-                elif hasattr(chunk, "text"):
-                    yield chunk.text
-        except Exception as e:
-            logger.error(f"Error in astream_from_messages: {str(e)}")
-            yield f"Error generating response: {str(e)}"
+        targets = {f"{provider}:{model}": (provider, model) for provider, model in self._routes(task)}
+        routes: List[StreamRoute] = [
+            (name, lambda p=provider, m=model: self._stream_route(p, m, messages, task))
+            for name, (provider, model) in targets.items()
+        ]
+
+        async def admit(name: str) -> float:
+            return await self._wait_for_rate_limit(*targets[name], messages, task)
+
+        async with self._task_slot(task):
+            async for chunk in self.router.stream(routes, admit=admit):
+                yield chunk
     
     async def chat(
         self,
         message: str,
         history: List[Message] = None,
         system_prompt: Optional[str] = None,
-        memory_context: Optional[str] = None
+        memory_context: Optional[str] = None,
+        task: str = TASK_INTERACTIVE,
+        json_mode: bool = False
     ) -> str:
         """
         Get complete chat response from OpenAI API (non-streaming)
@@ -242,32 +389,82 @@ class LLMService:
             history: Conversation history
             system_prompt: System prompt from current character
             memory_context: Memory context from graph database (optional)
+            task: Task class selecting model tier, concurrency limit and timeout;
+                the timeout applies to each upstream call, not to time queued
+                on the rate limiter
+            json_mode: Request a JSON object response where the provider supports it
             
         Returns:
             Complete response text
+
+        Raises:
+            LLMError: if every configured model failed or the task timed out
         """
         if not self._initialized:
             self._initialize_llm()
         
-        try:
-            # Build messages list for OpenAI API with system prompt and memory context
-            messages = self._build_messages_from_history(
-                history or [], 
-                message,
-                system_prompt=system_prompt,
-                memory_context=memory_context
-            )
-            
-            # Get response from OpenAI
-            response = await self.llm.ainvoke(messages)
-            
-            if hasattr(response, 'content'):
-                return response.content
-            return str(response)
+        # Build messages list for OpenAI API with system prompt and memory context
+        messages = self._build_messages_from_history(
+            history or [], 
+            message,
+            system_prompt=system_prompt,
+            memory_context=memory_context
+        )
         
-        except Exception as e:
-            logger.error(f"Error in chat: {str(e)}")
-            return f"抱歉，生成回复时出现错误: {str(e)}"
+        policy = self.task_policies.get(task, self.task_policies[TASK_INTERACTIVE])
+        async with self._task_slot(task):
+            return await self._invoke_with_failover(messages, task, json_mode, policy.timeout)
+
+    async def _invoke_with_failover(
+        self, messages: List[dict], task: str, json_mode: bool = False, timeout: Optional[float] = None
+    ) -> str:
+        errors = []
+        for provider, model in self._routes(task):
+            request = {"provider": provider, "model": model, "messages": messages}
+            if json_mode:
+                request["json_mode"] = True
+            try:
+                await self._wait_for_rate_limit(provider, model, messages, task)
+                return await asyncio.wait_for(
+                    cassette.call(
+                        "llm_chat",
+                        request,
+                        lambda p=provider, m=model: self._invoke_live(p, m, messages, json_mode),
+                    ),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"{task} LLM call to {provider}:{model} timed out after {timeout}s")
+                errors.append(f"{provider}:{model}: timed out after {timeout}s")
+            except Exception as e:
+                logger.error(f"Error in chat ({provider}:{model}): {str(e)}")
+                errors.append(f"{provider}:{model}: {e}")
+
+        raise LLMError("All LLM routes failed: " + "; ".join(errors))
+
+    @asynccontextmanager
+    async def _task_slot(self, task: str):
+        """Hold one concurrency slot for the task class"""
+        if task not in self._task_semaphores:
+            task = TASK_INTERACTIVE
+        async with self._task_semaphores[task]:
+            self._task_in_flight[task] += 1
+            try:
+                yield
+            finally:
+                self._task_in_flight[task] -= 1
+
+    def task_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Routing and in-flight counts per task class"""
+        return {
+            task: {
+                "routes": [f"{p}:{m}" for p, m in self._routes(task)],
+                "concurrency": policy.concurrency,
+                "in_flight": self._task_in_flight[task],
+                "timeout": policy.timeout,
+            }
+            for task, policy in self.task_policies.items()
+        }
 
 
 # Global LLM service instance
@@ -0,0 +1,1239 @@
+"""
+Embedded graph memory store.
+Nodes and edges live in a SQLite file and entity embeddings in an in-memory
+NumPy index (brute force, or IVF once it grows large), so single-node
+deployments, tests and benchmarks get graph memory without a Neo4j service.
+Queries mirror the Neo4j store: same labels and relationship types, same
+vector threshold and the same expansion ranking.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.graph_stats import (
+    add_delta,
+    counters_from_stats,
+    delta_rows,
+    node_key,
+    rel_key,
+    stats_from_counters,
+)
+from app.services.graph_store import GraphStore
+from app.services.graph_view import ViewKey, ranks_before, view_key
+from app.services.keywords import name_terms
+from app.services.memory_decay import last_seen
+from app.services.memory_schema import entity_label
+from app.services.memory_rerank import CANDIDATES, MIN_SIMILARITY, rank
+from app.services.memory_snapshot import (
+    NEIGHBORS_PER_NODE,
+    VECTOR_TOP_K,
+    MemorySnapshot,
+    context_lines,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    type TEXT,
+    name TEXT,
+    user_id TEXT,
+    importance REAL,
+    properties TEXT NOT NULL DEFAULT '{}',
+    embedding BLOB,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS nodes_label_user ON nodes (label, user_id);
+CREATE TABLE IF NOT EXISTS edges (
+    source TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT '',
+    target TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 1,
+    properties TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (source, kind, type, target)
+);
+CREATE INDEX IF NOT EXISTS edges_target ON edges (target);
+CREATE INDEX IF NOT EXISTS nodes_name_key ON nodes (json_extract(properties, '$.name_key'));
+CREATE TABLE IF NOT EXISTS entity_terms (
+    term TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (term, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entity_terms_id ON entity_terms (id);
+CREATE TRIGGER IF NOT EXISTS nodes_terms_insert AFTER INSERT ON nodes WHEN new.label = 'Entity' BEGIN
+    INSERT OR IGNORE INTO entity_terms (term, id)
+    SELECT value, new.id FROM json_each(search_terms(new.name, json_extract(new.properties, '$.aliases')));
+END;
+CREATE TRIGGER IF NOT EXISTS nodes_terms_update AFTER UPDATE OF label, name, properties ON nodes
+WHEN old.label IS NOT new.label OR old.name IS NOT new.name
+  OR json_extract(old.properties, '$.aliases') IS NOT json_extract(new.properties, '$.aliases') BEGIN
+    DELETE FROM entity_terms WHERE id = old.id;
+    INSERT OR IGNORE INTO entity_terms (term, id)
+    SELECT value, new.id FROM json_each(search_terms(new.name, json_extract(new.properties, '$.aliases')))
+    WHERE new.label = 'Entity';
+END;
+CREATE TRIGGER IF NOT EXISTS nodes_terms_delete AFTER DELETE ON nodes BEGIN
+    DELETE FROM entity_terms WHERE id = old.id;
+END;
+CREATE TABLE IF NOT EXISTS graph_stats (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, key)
+);
+"""
+
+# kind is the relationship type (RELATION, HAS_CONVERSATION, ...); RELATION
+# edges also carry the extracted relation type, like r.type in Neo4j
+UPSERT_NODE = """
+INSERT INTO nodes (id, label, type, name, user_id, importance, properties, embedding, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    label = excluded.label,
+    type = COALESCE(excluded.type, type),
+    name = COALESCE(excluded.name, name),
+    user_id = COALESCE(excluded.user_id, user_id),
+    importance = COALESCE(excluded.importance, importance),
+    properties = json_patch(properties, excluded.properties),
+    embedding = COALESCE(excluded.embedding, embedding),
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_EDGE = """
+INSERT INTO edges (source, kind, type, target, count, properties, created_at, updated_at)
+VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (source, kind, type, target) DO UPDATE SET
+    count = CASE WHEN kind = 'RELATION' THEN count + 1 ELSE count END,
+    properties = json_patch(properties, excluded.properties),
+    updated_at = excluded.updated_at
+"""
+
+UPSERT_STAT = """
+INSERT INTO graph_stats (user_id, key, count) VALUES (?, ?, ?)
+ON CONFLICT (user_id, key) DO UPDATE SET count = count + excluded.count
+"""
+
+# Re-point a merged entity's edges at the kept node, summing repeat counts;
+# edges between the two would become self-loops and are left to be deleted
+MOVE_OUTGOING_EDGES = """
+INSERT INTO edges (source, kind, type, target, count, properties, created_at, updated_at)
+SELECT ?, kind, type, target, count, properties, created_at, updated_at
+FROM edges WHERE source = ? AND target NOT IN (?, ?)
+ON CONFLICT (source, kind, type, target) DO UPDATE SET
+    count = CASE WHEN edges.kind = 'RELATION' THEN edges.count + excluded.count ELSE edges.count END,
+    updated_at = max(edges.updated_at, excluded.updated_at)
+"""
+
+MOVE_INCOMING_EDGES = """
+INSERT INTO edges (source, kind, type, target, count, properties, created_at, updated_at)
+SELECT source, kind, type, ?, count, properties, created_at, updated_at
+FROM edges WHERE target = ? AND source NOT IN (?, ?)
+ON CONFLICT (source, kind, type, target) DO UPDATE SET
+    count = CASE WHEN edges.kind = 'RELATION' THEN edges.count + excluded.count ELSE edges.count END,
+    updated_at = max(edges.updated_at, excluded.updated_at)
+"""
+
+# entity_terms is the inverted index behind keyword recall, kept in sync with
+# nodes by the triggers above; user_version 1 marks it as backfilled
+SCHEMA_VERSION = 1
+
+BACKFILL_TERMS = """
+INSERT OR IGNORE INTO entity_terms (term, id)
+SELECT t.value, n.id
+FROM nodes n, json_each(search_terms(n.name, json_extract(n.properties, '$.aliases'))) t
+WHERE n.label = 'Entity'
+"""
+
+
+def _search_terms(name: Optional[str], aliases: Optional[str]) -> str:
+    """SQL function for the entity_terms triggers: name and alias terms as a JSON array"""
+    return json.dumps(sorted(name_terms(name, json.loads(aliases) if aliases else None)), ensure_ascii=False)
+
+
+# An extracted relation type, or the relationship type for structural edges
+EDGE_TYPE = "COALESCE(NULLIF(e.type, ''), e.kind)"
+
+RECORD_ACCESS = """
+UPDATE nodes SET properties = json_set(
+    properties,
+    '$.access_count', COALESCE(json_extract(properties, '$.access_count'), 0) + ?,
+    '$.last_accessed_at', max(COALESCE(json_extract(properties, '$.last_accessed_at'), ''), ?)
+)
+WHERE id = ? AND label = 'Entity'
+"""
+
+DECAY_COLUMNS = """
+id, label, name, importance, updated_at,
+json_extract(properties, '$.last_accessed_at') AS last_accessed_at,
+COALESCE(json_extract(properties, '$.access_count'), 0) AS access_count
+"""
+
+# Restored nodes and edges never overwrite ones written since they were archived
+IMPORT_NODE = """
+INSERT INTO nodes (id, label, type, name, user_id, importance, properties, embedding, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO NOTHING
+"""
+
+IMPORT_EDGE = """
+INSERT INTO edges (source, kind, type, target, count, properties, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, kind, type, target) DO NOTHING
+"""
+
+
+def _placeholders(values: Iterable) -> str:
+    return ", ".join("?" for _ in values)
+
+
+class VectorIndex:
+    """
+    Cosine index over unit-normalised float32 rows.
+    Searches brute force until it holds ivf_threshold vectors, then trains
+    IVF centroids (k-means, sqrt(n) lists) and probes the nprobe nearest
+    lists; it retrains whenever the index has doubled since the last training.
+    """
+
+    def __init__(self, ivf_threshold: int = 20000, nprobe: int = 8):
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.ids: List[str] = []
+        self._pos: Dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, node_id: str, vector: List[float]) -> None:
+        row = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(row)
+        if norm == 0:
+            return
+        row = row / norm
+        if self._vectors.shape[1] != row.shape[0]:
+            if len(self.ids):
+                logger.warning(f"Embedding dimension {row.shape[0]} does not match index, skipping {node_id}")
+                return
+            self._vectors = np.zeros((0, row.shape[0]), dtype=np.float32)
+
+        pos = self._pos.get(node_id)
+        if pos is None:
+            pos = len(self.ids)
+            if pos == self._vectors.shape[0]:
+                grown = np.zeros((max(64, pos * 2), row.shape[0]), dtype=np.float32)
+                grown[:pos] = self._vectors[:pos]
+                self._vectors = grown
+            self.ids.append(node_id)
+            self._pos[node_id] = pos
+            if self._assignments is not None:
+                self._assignments = np.append(self._assignments, 0)
+        self._vectors[pos] = row
+        if self._centroids is not None:
+            self._assignments[pos] = int(np.argmax(self._centroids @ row))
+
+    def remove(self, node_id: str) -> None:
+        """Drop a vector, moving the last row into its slot"""
+        pos = self._pos.pop(node_id, None)
+        if pos is None:
+            return
+        last = len(self.ids) - 1
+        if pos != last:
+            moved = self.ids[last]
+            self.ids[pos] = moved
+            self._pos[moved] = pos
+            self._vectors[pos] = self._vectors[last]
+            if self._assignments is not None:
+                self._assignments[pos] = self._assignments[last]
+        self.ids.pop()
+        if self._assignments is not None:
+            self._assignments = self._assignments[:last]
+
+    def vector(self, node_id: str) -> Optional[List[float]]:
+        pos = self._pos.get(node_id)
+        return None if pos is None else self._vectors[pos].tolist()
+
+    def search(self, query: List[float], k: int) -> List[Tuple[str, float]]:
+        """Top k (id, score) with Neo4j's cosine score scale (1 + cos) / 2."""
+        n = len(self.ids)
+        q = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if not n or norm == 0 or q.shape[0] != self._vectors.shape[1]:
+            return []
+        q = q / norm
+
+        if n >= self.ivf_threshold and n >= 2 * self._trained_size:
+            self._train()
+        if self._centroids is not None:
+            probes = np.argsort(-(self._centroids @ q))[:self.nprobe]
+            candidates = np.flatnonzero(np.isin(self._assignments[:n], probes))
+        else:
+            candidates = np.arange(n)
+        if not len(candidates):
+            return []
+
+        scores = (1 + self._vectors[candidates] @ q) / 2
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    def _train(self, iterations: int = 10) -> None:
+        n = len(self.ids)
+        vectors = self._vectors[:n]
+        lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(n, lists, replace=False)].copy()
+        sample = vectors[rng.choice(n, min(n, lists * 64), replace=False)]
+        for _ in range(iterations):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(lists):
+                members = sample[nearest == c]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    centroids[c] = mean / (np.linalg.norm(mean) or 1.0)
+        self._centroids = centroids
+        self._assignments = np.argmax(vectors @ centroids.T, axis=1)
+        self._trained_size = n
+        logger.info(f"Trained IVF vector index: {n} vectors, {lists} lists")
+
+
+class LocalGraphStore(GraphStore):
+    """GraphStore on an embedded SQLite file plus an in-memory vector index"""
+
+    name = "local"
+    transient_errors = (sqlite3.OperationalError,)  # "database is locked" under contention
+
+    def __init__(self, path: str, ivf_threshold: int = 20000):
+        self.path = path
+        self.index = VectorIndex(ivf_threshold=ivf_threshold)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    # --- lifecycle ---------------------------------------------------------
+
+    async def initialize(self) -> None:
+        await asyncio.to_thread(self._open)
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.create_function("search_terms", 2, _search_terms, deterministic=True)
+        self._conn.executescript(SCHEMA)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with self._conn:
+                self._conn.execute(BACKFILL_TERMS)
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        started = time.perf_counter()
+        for row in self._conn.execute("SELECT id, embedding FROM nodes WHERE label = 'Entity' AND embedding IS NOT NULL"):
+            self.index.upsert(row["id"], np.frombuffer(row["embedding"], dtype=np.float32))
+        logger.info(
+            f"Local graph store opened: {self.path} ({len(self.index)} embeddings loaded "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms)"
+        )
+
+    async def verify_connectivity(self) -> bool:
+        if self._conn is None:
+            return False
+        try:
+            await self._run(lambda conn: conn.execute("SELECT 1").fetchone())
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(lambda conn: conn.close())
+            self._conn = None
+
+    async def _run(self, fn, *args):
+        """Run fn(conn, *args) on a worker thread, serialised on the single connection"""
+        def call():
+            with self._lock:
+                return fn(self._conn, *args)
+        return await asyncio.to_thread(call)
+
+    # --- writes ------------------------------------------------------------
+
+    @staticmethod
+    def _upsert_node(conn, node_id: str, label: str, now: str, *, node_type=None, name=None,
+                     user_id=None, importance=None, properties=None, embedding=None) -> None:
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding else None
+        conn.execute(UPSERT_NODE, (
+            node_id, label, node_type, name, user_id, importance,
+            json.dumps(properties or {}, ensure_ascii=False), blob, now, now,
+        ))
+
+    @staticmethod
+    def _upsert_edge(conn, source: str, kind: str, target: str, now: str, rel_type: str = "", properties=None) -> None:
+        conn.execute(UPSERT_EDGE, (
+            source, kind, rel_type, target, json.dumps(properties or {}, ensure_ascii=False), now, now,
+        ))
+
+    @staticmethod
+    def _exists(conn, sql: str, args) -> bool:
+        return conn.execute(sql, args).fetchone() is not None
+
+    @staticmethod
+    def _add_stats(conn, user_id: str, deltas: Dict[str, int]) -> None:
+        conn.executemany(UPSERT_STAT, [(user_id, row["key"], row["count"]) for row in delta_rows(deltas)])
+
+    async def write_graph_batch(
+        self,
+        user_id: str,
+        conversations: List[dict],
+        entities: List[dict],
+        relations: List[dict],
+    ) -> Tuple[int, int]:
+        now = datetime.now().isoformat()
+
+        def write(conn):
+            deltas: Dict[str, int] = {}
+            edge_sql = "SELECT 1 FROM edges WHERE source = ? AND kind = ? AND type = ? AND target = ?"
+            with conn:
+                self._upsert_node(conn, user_id, "User", now, properties={"last_active": now})
+                for conversation in conversations:
+                    conversation_id = conversation["id"]
+                    if not self._exists(conn, edge_sql, (user_id, "HAS_CONVERSATION", "", conversation_id)):
+                        add_delta(deltas, node_key("Conversation"))
+                        add_delta(deltas, rel_key("HAS_CONVERSATION"))
+                    self._upsert_node(conn, conversation_id, "Conversation", now, properties={
+                        "message_count": conversation.get("message_count", 0),
+                        "character_id": conversation.get("character_id"),
+                    })
+                    self._upsert_edge(conn, user_id, "HAS_CONVERSATION", conversation_id, now)
+
+                for entity in entities:
+                    if not self._exists(conn, "SELECT 1 FROM nodes WHERE id = ?", (entity.get("id"),)):
+                        add_delta(deltas, node_key(entity_label(entity.get("type", "Entity"))))
+                    self._upsert_node(
+                        conn, entity.get("id"), "Entity", now,
+                        node_type=entity.get("type", "Entity"),
+                        name=entity.get("name", ""),
+                        importance=entity.get("score", 0),
+                        properties=entity.get("properties") or {},
+                        embedding=entity.get("embedding"),
+                    )
+
+                for relation in relations:
+                    source = relation.get("source_id") or relation.get("source")
+                    target = relation.get("target_id") or relation.get("target")
+                    found = conn.execute(
+                        "SELECT count(*) FROM nodes WHERE id IN (?, ?) AND label IN ('User', 'Entity')",
+                        (source, target),
+                    ).fetchone()[0]
+                    if found == (1 if source == target else 2):
+                        rel_type = relation.get("type", "RELATED_TO")
+                        if not self._exists(conn, edge_sql, (source, "RELATION", rel_type, target)):
+                            add_delta(deltas, rel_key("RELATION"))
+                        self._upsert_edge(
+                            conn, source, "RELATION", target, now,
+                            rel_type=rel_type,
+                            properties=relation.get("properties") or {},
+                        )
+                self._add_stats(conn, user_id, deltas)
+
+            for entity in entities:
+                if entity.get("embedding"):
+                    self.index.upsert(entity.get("id"), entity["embedding"])
+            return len(entities), len(relations)
+
+        return await self._run(write)
+
+    async def write_relational_signals(
+        self,
+        user_id: str,
+        character_id: str,
+        conversation_id: str,
+        preferences: Dict[str, str],
+        observation: str,
+        now: str,
+    ) -> None:
+        def write(conn):
+            with conn:
+                user_exists = conn.execute(
+                    "SELECT 1 FROM nodes WHERE id = ? AND label = 'User'", (user_id,)
+                ).fetchone()
+                for key, value in preferences.items():
+                    pref_id = f"pref_{user_id}_{character_id}_{key}"
+                    self._upsert_node(conn, pref_id, "UserPreference", now, user_id=user_id, properties={
+                        "character_id": character_id,
+                        "preference_key": key,
+                        "preference_value": str(value),
+                        "confidence": 0.8,
+                        "observed_at": now,
+                        "source_conversation": conversation_id,
+                    })
+                    if user_exists:
+                        if not self._exists(
+                            conn, "SELECT 1 FROM edges WHERE source = ? AND kind = 'HAS_PREFERENCE' AND target = ?",
+                            (user_id, pref_id),
+                        ):
+                            self._add_stats(conn, user_id, {
+                                node_key("UserPreference"): 1, rel_key("HAS_PREFERENCE"): 1,
+                            })
+                        self._upsert_edge(conn, user_id, "HAS_PREFERENCE", pref_id, now)
+
+                if observation:
+                    obs_id = f"obs_{user_id}_{character_id}_{int(time.time())}"
+                    self._upsert_node(conn, obs_id, "CharacterObservation", now, user_id=user_id, properties={
+                        "character_id": character_id,
+                        "content": observation,
+                        "observed_at": now,
+                        "source_conversation": conversation_id,
+                    })
+                    self._upsert_node(conn, character_id, "Character", now)
+                    self._upsert_node(conn, user_id, "User", now)
+                    self._upsert_edge(conn, character_id, "OBSERVED", obs_id, now)
+                    self._upsert_edge(conn, obs_id, "ABOUT", user_id, now)
+
+        await self._run(write)
+
+    async def merge_entities(self, user_id: str, merges: List[dict], name_keys: Dict[str, str]) -> int:
+        def write(conn):
+            merged = []
+            with conn:
+                for merge in merges:
+                    dup, keep = merge["dup"], merge["keep"]
+                    if not self._exists(conn, "SELECT 1 FROM nodes WHERE id = ?", (keep,)):
+                        continue
+                    merged.append(dup)
+                    conn.execute(MOVE_OUTGOING_EDGES, (keep, dup, keep, dup))
+                    conn.execute(MOVE_INCOMING_EDGES, (keep, dup, keep, dup))
+                    conn.execute("DELETE FROM edges WHERE source = ? OR target = ?", (dup, dup))
+                    conn.execute("DELETE FROM nodes WHERE id = ?", (dup,))
+                    conn.execute(
+                        "UPDATE nodes SET properties = json_patch(properties, ?) WHERE id = ?",
+                        (json.dumps({"aliases": merge["aliases"], "name_key": merge["name_key"]}, ensure_ascii=False), keep),
+                    )
+                conn.executemany(
+                    "UPDATE nodes SET properties = json_set(properties, '$.name_key', ?) WHERE id = ?",
+                    [(key, node_id) for node_id, key in name_keys.items()],
+                )
+            for dup in merged:
+                self.index.remove(dup)
+            return len(merged)
+
+        return await self._run(write)
+
+    # --- retrieval ---------------------------------------------------------
+
+    @staticmethod
+    def _reachable(conn, user_id: str) -> set:
+        """Ids within two hops of the user"""
+        hop1 = [row["target"] for row in conn.execute("SELECT target FROM edges WHERE source = ?", (user_id,))]
+        reached = set(hop1)
+        for chunk in _chunks(hop1):
+            reached.update(
+                row["target"] for row in conn.execute(
+                    f"SELECT target FROM edges WHERE source IN ({_placeholders(chunk)})", chunk
+                )
+            )
+        return reached
+
+    def _entity_rows(self, conn, ids: Iterable[str]) -> List[Dict[str, Any]]:
+        rows = []
+        for chunk in _chunks(list(ids)):
+            for row in conn.execute(
+                f"""
+                SELECT id, name, type, importance,
+                       json_extract(properties, '$.aliases') AS aliases, json_extract(properties, '$.name_key') AS name_key
+                FROM nodes WHERE label = 'Entity' AND id IN ({_placeholders(chunk)})
+                """,
+                chunk,
+            ):
+                rows.append({
+                    "id": row["id"],
+                    "name": row["name"],
+                    "type": row["type"],
+                    "importance": row["importance"],
+                    "embedding": self.index.vector(row["id"]),
+                    "aliases": json.loads(row["aliases"]) if row["aliases"] else [],
+                    "name_key": row["name_key"],
+                })
+        return rows
+
+    async def entity_candidates(
+        self,
+        user_id: str,
+        name_keys: List[str],
+        embeddings: List[List[float]],
+        min_score: float,
+    ) -> List[Dict[str, Any]]:
+        def read(conn):
+            matched = set()
+            if name_keys:
+                matched.update(
+                    row["id"] for row in conn.execute(
+                        f"""
+                        SELECT id FROM nodes
+                        WHERE json_extract(properties, '$.name_key') IN ({_placeholders(name_keys)})
+                        """,
+                        name_keys,
+                    )
+                )
+            for embedding in embeddings:
+                matched.update(
+                    node_id for node_id, score in self.index.search(embedding, VECTOR_TOP_K) if score >= min_score
+                )
+            if not matched:
+                return []
+            return self._entity_rows(conn, matched & self._reachable(conn, user_id))
+
+        return await self._run(read)
+
+    async def user_entities(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self._run(lambda conn: self._entity_rows(conn, self._reachable(conn, user_id)))
+
+
+    @staticmethod
+    def _expand(conn, user_id: str, node_ids: List[str]) -> List[str]:
+        """Same lines and neighbor ranking as the Neo4j expansion query"""
+        if not node_ids:
+            return []
+        marks = _placeholders(node_ids)
+        nodes = {
+            row["id"]: row for row in conn.execute(
+                f"SELECT id, name, type FROM nodes WHERE label = 'Entity' AND id IN ({marks})", node_ids
+            )
+        }
+        user_rels: Dict[str, List[str]] = {}
+        for row in conn.execute(
+            f"SELECT DISTINCT e.target, {EDGE_TYPE} AS rel FROM edges e WHERE e.source = ? AND e.target IN ({marks})",
+            [user_id, *node_ids],
+        ):
+            user_rels.setdefault(row["target"], []).append(row["rel"])
+        neighbors: Dict[str, List[dict]] = {}
+        for row in conn.execute(
+            f"""
+            SELECT e.source, {EDGE_TYPE} AS rel, n.name
+            FROM edges e JOIN nodes n ON n.id = e.target
+            WHERE e.source IN ({marks}) AND n.name IS NOT NULL
+            ORDER BY e.count DESC, COALESCE(n.importance, 0) DESC, n.id
+            """,
+            node_ids,
+        ):
+            rows = neighbors.setdefault(row["source"], [])
+            if len(rows) < NEIGHBORS_PER_NODE:
+                rows.append({"rel": row["rel"], "name": row["name"]})
+
+        lines = []
+        for node_id in node_ids:
+            node = nodes.get(node_id)
+            if node is not None:
+                lines.extend(context_lines(
+                    node["name"], node["type"], user_rels.get(node_id, []), neighbors.get(node_id, [])
+                ))
+        return lines
+
+    @staticmethod
+    def _candidates(conn, node_ids: List[str]) -> List[dict]:
+        """Reranking features of the recalled entities"""
+        if not node_ids:
+            return []
+        candidates = []
+        for row in conn.execute(
+            f"""
+            SELECT n.id, n.name, n.importance, n.updated_at, n.embedding,
+                   json_extract(n.properties, '$.aliases') AS aliases,
+                   json_extract(n.properties, '$.last_accessed_at') AS last_accessed_at,
+                   (SELECT count(*) FROM edges e
+                    WHERE e.kind = 'RELATION' AND (e.source = n.id OR e.target = n.id)) AS degree
+            FROM nodes n WHERE n.label = 'Entity' AND n.id IN ({_placeholders(node_ids)})
+            """,
+            node_ids,
+        ):
+            candidate = dict(row)
+            candidate["aliases"] = json.loads(row["aliases"]) if row["aliases"] else None
+            candidate["embedding"] = np.frombuffer(row["embedding"], dtype=np.float32) if row["embedding"] else None
+            candidates.append(candidate)
+        return candidates
+
+    async def related_context(
+        self,
+        user_id: str,
+        query_embedding: Optional[List[float]],
+        keywords: List[str],
+        limit: int,
+        include_relational: bool,
+        on_recall: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[str]:
+        def read(conn):
+            pool: List[str] = []
+            if query_embedding:
+                pool.extend(
+                    node_id for node_id, score in self.index.search(query_embedding, CANDIDATES)
+                    if score > MIN_SIMILARITY
+                )
+            if keywords:
+                terms = list(set(keywords))
+                rows = conn.execute(
+                    f"""
+                    SELECT t.id, count(*) AS hits FROM entity_terms t JOIN nodes n ON n.id = t.id
+                    WHERE t.term IN ({_placeholders(terms)})
+                    GROUP BY t.id
+                    ORDER BY hits DESC, COALESCE(n.importance, 0) DESC, t.id
+                    LIMIT ?
+                    """,
+                    terms + [CANDIDATES],
+                )
+                pool.extend(row["id"] for row in rows)
+
+            recalled = rank(query_embedding, keywords, self._candidates(conn, list(dict.fromkeys(pool))), limit)
+            lines = self._expand(conn, user_id, recalled)
+            if include_relational:
+                for row in conn.execute(
+                    """
+                    SELECT properties FROM nodes WHERE label = 'UserPreference' AND user_id = ?
+                    ORDER BY json_extract(properties, '$.observed_at') DESC LIMIT 5
+                    """,
+                    (user_id,),
+                ):
+                    props = json.loads(row["properties"])
+                    lines.append(f"user preference: {props.get('preference_key')} = {props.get('preference_value')}")
+                for row in conn.execute(
+                    """
+                    SELECT json_extract(properties, '$.content') AS content FROM nodes
+                    WHERE label = 'CharacterObservation' AND user_id = ?
+                    ORDER BY json_extract(properties, '$.observed_at') DESC LIMIT 3
+                    """,
+                    (user_id,),
+                ):
+                    lines.append(f"character observation: {row['content']}")
+            return list(dict.fromkeys(lines)), recalled
+
+        lines, recalled = await self._run(read)
+        if on_recall is not None:
+            on_recall(recalled)
+        return lines
+
+    # --- decay and compaction ----------------------------------------------
+
+    async def record_access(self, rows: List[dict]) -> None:
+        def write(conn):
+            with conn:
+                conn.executemany(
+                    RECORD_ACCESS, [(row["count"], row["last_accessed_at"], row["id"]) for row in rows]
+                )
+
+        await self._run(write)
+
+    @staticmethod
+    def _shared(conn, user_id: str, node_ids: List[str]) -> set:
+        """Those of node_ids within two hops of a user other than user_id"""
+        shared = set()
+        for chunk in _chunks(node_ids):
+            marks = _placeholders(chunk)
+            shared.update(
+                row["id"] for row in conn.execute(
+                    f"""
+                    SELECT e1.target AS id FROM edges e1
+                    JOIN nodes u ON u.id = e1.source AND u.label = 'User'
+                    WHERE e1.target IN ({marks}) AND e1.source <> ?
+                    UNION
+                    SELECT e1.target AS id FROM edges e1
+                    JOIN edges e2 ON e2.target = e1.source
+                    JOIN nodes u ON u.id = e2.source AND u.label = 'User'
+                    WHERE e1.target IN ({marks}) AND e2.source <> ?
+                    """,
+                    [*chunk, user_id, *chunk, user_id],
+                )
+            )
+        return shared
+
+    async def decay_candidates(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        def read(conn):
+            entities = []
+            for chunk in _chunks(list(self._reachable(conn, user_id))):
+                entities.extend(
+                    dict(row) for row in conn.execute(
+                        f"SELECT {DECAY_COLUMNS} FROM nodes WHERE label = 'Entity' AND id IN ({_placeholders(chunk)})",
+                        chunk,
+                    )
+                )
+            shared = self._shared(conn, user_id, [row["id"] for row in entities])
+            rows = [row for row in entities if row["id"] not in shared]
+            rows.extend(
+                dict(row) for row in conn.execute(
+                    f"""
+                    SELECT {DECAY_COLUMNS} FROM nodes
+                    WHERE label IN ('UserPreference', 'CharacterObservation') AND user_id = ?
+                    """,
+                    (user_id,),
+                )
+            )
+            rows.sort(key=lambda row: (max(row["updated_at"] or "", row["last_accessed_at"] or ""), row["id"]))
+            return rows[:limit]
+
+        return await self._run(read)
+
+    async def compaction_users(self, limit: int) -> List[str]:
+        def read(conn):
+            return [
+                row["id"] for row in conn.execute(
+                    """
+                    SELECT id FROM nodes WHERE label = 'User'
+                    ORDER BY COALESCE(json_extract(properties, '$.compacted_at'), ''), id
+                    LIMIT ?
+                    """,
+                    (limit,),
+                )
+            ]
+
+        return await self._run(read)
+
+    async def mark_compacted(self, user_id: str, now: str) -> None:
+        def write(conn):
+            with conn:
+                conn.execute(
+                    "UPDATE nodes SET properties = json_set(properties, '$.compacted_at', ?) WHERE id = ?",
+                    (now, user_id),
+                )
+
+        await self._run(write)
+
+    async def export_nodes(self, node_ids: List[str]) -> List[Dict[str, Any]]:
+        def read(conn):
+            nodes: Dict[str, Dict[str, Any]] = {}
+            for chunk in _chunks(node_ids):
+                for row in conn.execute(f"SELECT * FROM nodes WHERE id IN ({_placeholders(chunk)})", chunk):
+                    nodes[row["id"]] = {
+                        "id": row["id"],
+                        "label": row["label"],
+                        "type": row["type"],
+                        "name": row["name"],
+                        "user_id": row["user_id"],
+                        "importance": row["importance"],
+                        "embedding": np.frombuffer(row["embedding"], dtype=np.float32).tolist() if row["embedding"] else None,
+                        "properties": json.loads(row["properties"] or "{}"),
+                        "created_at": row["created_at"],
+                        "updated_at": row["updated_at"],
+                        "relations": [],
+                    }
+            for chunk in _chunks(list(nodes)):
+                marks = _placeholders(chunk)
+                for row in conn.execute(
+                    f"""
+                    SELECT e.*, s.label AS source_label, t.label AS target_label FROM edges e
+                    JOIN nodes s ON s.id = e.source JOIN nodes t ON t.id = e.target
+                    WHERE e.source IN ({marks}) OR e.target IN ({marks})
+                    """,
+                    chunk * 2,
+                ):
+                    relation = {
+                        "source": row["source"], "source_label": row["source_label"],
+                        "kind": row["kind"], "type": row["type"],
+                        "target": row["target"], "target_label": row["target_label"],
+                        "count": row["count"],
+                        "properties": json.loads(row["properties"] or "{}"),
+                        "created_at": row["created_at"], "updated_at": row["updated_at"],
+                    }
+                    # Kept with both endpoints, so either can be restored first
+                    for end in {row["source"], row["target"]}:
+                        if end in nodes:
+                            nodes[end]["relations"].append(relation)
+            return list(nodes.values())
+
+        return await self._run(read)
+
+    async def delete_nodes(self, node_ids: List[str]) -> int:
+        def write(conn):
+            deleted = 0
+            with conn:
+                for chunk in _chunks(node_ids):
+                    marks = _placeholders(chunk)
+                    conn.execute(f"DELETE FROM edges WHERE source IN ({marks}) OR target IN ({marks})", chunk * 2)
+                    deleted += conn.execute(f"DELETE FROM nodes WHERE id IN ({marks})", chunk).rowcount
+            for node_id in node_ids:
+                self.index.remove(node_id)
+            return deleted
+
+        return await self._run(write)
+
+    async def import_nodes(self, nodes: List[Dict[str, Any]]) -> int:
+        def write(conn):
+            restored = []
+            with conn:
+                for node in nodes:
+                    embedding = node.get("embedding")
+                    inserted = conn.execute(IMPORT_NODE, (
+                        node["id"], node["label"], node.get("type"), node.get("name"), node.get("user_id"),
+                        node.get("importance"), json.dumps(node.get("properties") or {}, ensure_ascii=False),
+                        np.asarray(embedding, dtype=np.float32).tobytes() if embedding else None,
+                        node.get("created_at"), node.get("updated_at"),
+                    )).rowcount
+                    if inserted:
+                        restored.append(node)
+                for node in nodes:
+                    for relation in node.get("relations", []):
+                        ends = {relation["source"], relation["target"]}
+                        found = conn.execute(
+                            f"SELECT count(*) FROM nodes WHERE id IN ({_placeholders(ends)})", list(ends)
+                        ).fetchone()[0]
+                        if found == len(ends):
+                            conn.execute(IMPORT_EDGE, (
+                                relation["source"], relation["kind"], relation.get("type") or "", relation["target"],
+                                relation.get("count", 1),
+                                json.dumps(relation.get("properties") or {}, ensure_ascii=False),
+                                relation.get("created_at"), relation.get("updated_at"),
+                            ))
+            for node in restored:
+                if node["label"] == "Entity" and node.get("embedding"):
+                    self.index.upsert(node["id"], node["embedding"])
+            return len(restored)
+
+        return await self._run(write)
+
+    async def load_snapshot(self, user_id: str, max_nodes: int) -> Optional[MemorySnapshot]:
+        def read(conn):
+            reached = self._reachable(conn, user_id)
+            snapshot = MemorySnapshot(user_id)
+            for chunk in _chunks(list(reached)):
+                for row in conn.execute(
+                    f"""
+                    SELECT id, name, type, importance, embedding, updated_at,
+                           json_extract(properties, '$.aliases') AS aliases,
+                           json_extract(properties, '$.last_accessed_at') AS last_accessed_at
+                    FROM nodes WHERE label = 'Entity' AND id IN ({_placeholders(chunk)})
+                    """,
+                    chunk,
+                ):
+                    embedding = np.frombuffer(row["embedding"], dtype=np.float32).tolist() if row["embedding"] else None
+                    aliases = json.loads(row["aliases"]) if row["aliases"] else None
+                    snapshot.add_node(
+                        row["id"], row["name"], row["type"], row["importance"], embedding, aliases, last_seen(dict(row))
+                    )
+            if len(snapshot.nodes) > max_nodes:
+                return None
+
+            for chunk in _chunks(list(snapshot.nodes)):
+                for row in conn.execute(
+                    f"""
+                    SELECT e.source, {EDGE_TYPE} AS rel, e.count, n.id, n.name, n.type, n.importance
+                    FROM edges e JOIN nodes n ON n.id = e.target AND n.label = 'Entity'
+                    WHERE e.source IN ({_placeholders(chunk)})
+                    """,
+                    chunk,
+                ):
+                    if row["id"] not in snapshot.nodes:
+                        snapshot.add_node(row["id"], row["name"], row["type"], row["importance"])
+                    snapshot.add_edge(row["source"], row["rel"], row["id"], row["count"])
+            for row in conn.execute(
+                f"""
+                SELECT e.target, {EDGE_TYPE} AS rel FROM edges e
+                JOIN nodes n ON n.id = e.target AND n.label = 'Entity'
+                WHERE e.source = ?
+                """,
+                (user_id,),
+            ):
+                snapshot.add_edge(user_id, row["rel"], row["target"])
+            for row in conn.execute(
+                "SELECT id, properties FROM nodes WHERE label = 'UserPreference' AND user_id = ?", (user_id,)
+            ):
+                props = json.loads(row["properties"])
+                snapshot.preferences[row["id"]] = (
+                    props.get("preference_key"), props.get("preference_value"), props.get("observed_at"),
+                )
+            snapshot.observations = [
+                (row["observed_at"], row["content"]) for row in conn.execute(
+                    """
+                    SELECT json_extract(properties, '$.observed_at') AS observed_at,
+                           json_extract(properties, '$.content') AS content
+                    FROM nodes WHERE label = 'CharacterObservation' AND user_id = ?
+                    ORDER BY observed_at DESC LIMIT 3
+                    """,
+                    (user_id,),
+                )
+            ]
+            return snapshot
+
+        return await self._run(read)
+
+    # --- graph views -------------------------------------------------------
+
+    @staticmethod
+    def _node_dict(row) -> Dict[str, Any]:
+        properties = json.loads(row["properties"] or "{}")
+        properties.update({
+            key: row[key] for key in ("id", "name", "type", "user_id", "importance", "created_at", "updated_at")
+            if row[key] is not None
+        })
+        return properties
+
+    @staticmethod
+    def _node_type(row) -> str:
+        return row["type"] or row["label"]
+
+    @staticmethod
+    def _reach(conn, user_id: str, depth: Optional[int], directed: bool) -> List[str]:
+        """Node ids reachable from the user in BFS order, excluding the user"""
+        seen = {user_id}
+        order: List[str] = []
+        frontier = deque([user_id])
+        level = 0
+        while frontier and (depth is None or level < depth):
+            current = list(frontier)
+            frontier.clear()
+            for chunk in _chunks(current):
+                marks = _placeholders(chunk)
+                query = f"SELECT target AS other FROM edges WHERE source IN ({marks})"
+                args = list(chunk)
+                if not directed:
+                    query += f" UNION ALL SELECT source AS other FROM edges WHERE target IN ({marks})"
+                    args += chunk
+                for row in conn.execute(query, args):
+                    if row["other"] not in seen:
+                        seen.add(row["other"])
+                        order.append(row["other"])
+                        frontier.append(row["other"])
+            level += 1
+        return order
+
+    async def query_graph(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]],
+        relation_types: Optional[List[str]],
+        depth: int,
+        limit: int,
+    ) -> Dict[str, List]:
+        def read(conn):
+            reached = self._reach(conn, user_id, depth, directed=False)
+            rows = {}
+            for chunk in _chunks(reached):
+                for row in conn.execute(f"SELECT * FROM nodes WHERE id IN ({_placeholders(chunk)})", chunk):
+                    rows[row["id"]] = row
+            nodes = []
+            for node_id in reached:
+                row = rows.get(node_id)
+                if row is None or (entity_types and row["type"] not in entity_types):
+                    continue
+                nodes.append({
+                    "id": node_id,
+                    "label": row["name"] or node_id,
+                    "type": self._node_type(row),
+                    "properties": self._node_dict(row),
+                })
+                if len(nodes) >= limit:
+                    break
+
+            node_ids = [n["id"] for n in nodes]
+            id_set = set(node_ids)
+            links = []
+            for chunk in _chunks(node_ids):
+                for row in conn.execute(
+                    f"SELECT source, target, type FROM edges WHERE kind = 'RELATION' AND source IN ({_placeholders(chunk)})",
+                    chunk,
+                ):
+                    if row["target"] not in id_set or (relation_types and row["type"] not in relation_types):
+                        continue
+                    links.append({"source": row["source"], "target": row["target"], "type": row["type"]})
+            return {"nodes": nodes, "links": links[:limit]}
+
+        return await self._run(read)
+
+    async def graph_view(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]],
+        relation_types: Optional[List[str]],
+        depth: int,
+        limit: int,
+        order: str,
+        after: Optional[ViewKey],
+        properties: List[str],
+    ) -> Dict[str, Any]:
+        def read(conn):
+            reached = self._reach(conn, user_id, depth, directed=False)
+            degrees: Dict[str, int] = {}
+            rows = []
+            for chunk in _chunks(reached):
+                marks = _placeholders(chunk)
+                for row in conn.execute(
+                    f"""
+                    SELECT id, count(*) AS n FROM (
+                        SELECT source AS id FROM edges WHERE source IN ({marks})
+                        UNION ALL SELECT target AS id FROM edges WHERE target IN ({marks})
+                    ) GROUP BY id
+                    """,
+                    chunk * 2,
+                ):
+                    degrees[row["id"]] = row["n"]
+                rows.extend(conn.execute(f"SELECT * FROM nodes WHERE id IN ({marks})", chunk))
+
+            keys: Dict[str, ViewKey] = {}
+            ranked = []
+            for row in rows:
+                node_type = self._node_type(row)
+                if entity_types and node_type not in entity_types:
+                    continue
+                key = view_key(order, row["id"], degrees.get(row["id"], 0), row["importance"] or 0)
+                keys[row["id"]] = key
+                ranked.append((key, row, node_type))
+            ranked.sort(key=lambda item: (-item[0][0], -item[0][1], item[0][2]))
+            if after is not None:
+                ranked = [item for item in ranked if ranks_before(after, item[0])]
+
+            nodes = []
+            for key, row, node_type in ranked[:limit + 1]:
+                props = self._node_dict(row)
+                nodes.append({
+                    "id": row["id"],
+                    "label": row["name"] or row["id"],
+                    "type": node_type,
+                    "degree": degrees.get(row["id"], 0),
+                    "score": row["importance"] or 0,
+                    "properties": {name: props.get(name) for name in properties},
+                })
+
+            links = []
+            page = [row["id"] for _, row, _ in ranked[:limit]]
+            if page:
+                last = ranked[:limit][-1][0]
+                seen = set()
+                for chunk in _chunks(page):
+                    marks = _placeholders(chunk)
+                    for row in conn.execute(
+                        f"""
+                        SELECT source, target, type, count FROM edges
+                        WHERE kind = 'RELATION' AND (source IN ({marks}) OR target IN ({marks}))
+                        """,
+                        chunk * 2,
+                    ):
+                        edge = (row["source"], row["target"], row["type"])
+                        if edge in seen or (relation_types and row["type"] not in relation_types):
+                            continue
+                        ends = [keys.get(row["source"]), keys.get(row["target"])]
+                        if any(k is None or ranks_before(last, k) for k in ends):
+                            continue
+                        seen.add(edge)
+                        links.append({
+                            "source": row["source"], "target": row["target"],
+                            "type": row["type"], "count": row["count"],
+                        })
+            return {"nodes": nodes, "links": links, "total": len(keys)}
+
+        return await self._run(read)
+
+    async def get_node_details(self, node_id: str) -> Optional[Dict]:
+        def read(conn):
+            row = conn.execute("SELECT * FROM nodes WHERE id = ?", (node_id,)).fetchone()
+            if row is None:
+                return None
+
+            def relation(edge, other_key: str, other_name_key: str) -> dict:
+                properties = json.loads(edge["properties"] or "{}")
+                properties.update({"count": edge["count"], "created_at": edge["created_at"], "updated_at": edge["updated_at"]})
+                if edge["type"]:
+                    properties["type"] = edge["type"]
+                return {other_key: edge["other"], other_name_key: edge["other_name"], "type": edge["kind"], "properties": properties}
+
+            incoming = conn.execute(
+                "SELECT e.*, e.source AS other, n.name AS other_name FROM edges e "
+                "LEFT JOIN nodes n ON n.id = e.source WHERE e.target = ?",
+                (node_id,),
+            ).fetchall()
+            outgoing = conn.execute(
+                "SELECT e.*, e.target AS other, n.name AS other_name FROM edges e "
+                "LEFT JOIN nodes n ON n.id = e.target WHERE e.source = ?",
+                (node_id,),
+            ).fetchall()
+            return {
+                "id": row["id"],
+                "type": self._node_type(row),
+                "name": row["name"] or "",
+                "properties": self._node_dict(row),
+                "incoming_relations": [relation(e, "source", "source_name") for e in incoming],
+                "outgoing_relations": [relation(e, "target", "target_name") for e in outgoing],
+            }
+
+        return await self._run(read)
+
+    async def get_graph_stats(self, user_id: str) -> Dict[str, Any]:
+        def read(conn):
+            return {
+                row["key"]: row["count"] for row in conn.execute(
+                    "SELECT key, count FROM graph_stats WHERE user_id = ?", (user_id,)
+                )
+            }
+
+        counters = await self._run(read)
+        if not counters:
+            # Written before the counters existed (or empty): count once now
+            return await self.reconcile_graph_stats(user_id)
+        return stats_from_counters(counters)
+
+    async def stale_stats_users(self) -> List[str]:
+        def read(conn):
+            return [
+                row["id"] for row in conn.execute(
+                    """
+                    SELECT id FROM nodes
+                    WHERE label = 'User' AND (
+                        json_extract(properties, '$.stats_reconciled_at') IS NULL
+                        OR json_extract(properties, '$.last_active') > json_extract(properties, '$.stats_reconciled_at')
+                    )
+                    """
+                )
+            ]
+
+        return await self._run(read)
+
+    async def reconcile_graph_stats(self, user_id: str) -> Dict[str, Any]:
+        def recount(conn):
+            reached = self._reach(conn, user_id, None, directed=True)
+            node_types: Dict[str, int] = {}
+            for chunk in _chunks(reached):
+                for row in conn.execute(
+                    f"SELECT label, type, count(*) AS n FROM nodes WHERE id IN ({_placeholders(chunk)}) GROUP BY label, type",
+                    chunk,
+                ):
+                    label = entity_label(row["type"]) if row["label"] == "Entity" else row["label"]
+                    node_types[label] = node_types.get(label, 0) + row["n"]
+
+            members = set(reached) | {user_id}
+            relation_types: Dict[str, int] = {}
+            for chunk in _chunks(list(members)):
+                for row in conn.execute(
+                    f"SELECT source, target, kind FROM edges WHERE source IN ({_placeholders(chunk)})", chunk
+                ):
+                    if row["target"] in members:
+                        relation_types[row["kind"]] = relation_types.get(row["kind"], 0) + 1
+
+            counters = counters_from_stats(node_types, relation_types)
+            with conn:
+                conn.execute("DELETE FROM graph_stats WHERE user_id = ?", (user_id,))
+                conn.executemany(
+                    "INSERT INTO graph_stats (user_id, key, count) VALUES (?, ?, ?)",
+                    [(user_id, key, count) for key, count in counters.items()],
+                )
+                conn.execute(
+                    "UPDATE nodes SET properties = json_set(properties, '$.stats_reconciled_at', ?) WHERE id = ?",
+                    (datetime.now().isoformat(), user_id),
+                )
+            return stats_from_counters(counters)
+
+        return await self._run(recount)
+
+
+def _chunks(values: List[str], size: int = 500) -> Iterable[List[str]]:
+    """Split IN lists below SQLite's bound-parameter limit"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
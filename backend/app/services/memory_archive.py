@@ -0,0 +1,92 @@
+"""
+Cold storage for compacted graph memory.
+
+Nodes removed from the graph by compaction are kept here with their
+relations, in the store-neutral form GraphStore.export_nodes produces, so
+they can be written back with GraphStore.import_nodes.
+"""
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from app.database import SessionLocal
+from app.models.db_session import ArchivedMemoryDB
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryArchive:
+    """Archived nodes in the application database, keyed by node id."""
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    def store(self, user_id: str, nodes: List[dict], decayed: Dict[str, float]) -> int:
+        """Archive exported nodes; returns the number written"""
+        now = time.time()
+        db = self._session_factory()
+        try:
+            for node in nodes:
+                db.merge(ArchivedMemoryDB(
+                    id=node["id"],
+                    user_id=user_id,
+                    label=node["label"],
+                    name=node.get("name") or "",
+                    decayed_importance=decayed.get(node["id"], 0.0),
+                    archived_at=now,
+                    payload=json.dumps(node, ensure_ascii=False),
+                ))
+            db.commit()
+            return len(nodes)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def list_nodes(self, user_id: str, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """The user's archived nodes, most recently archived first, without payloads"""
+        db = self._session_factory()
+        try:
+            query = db.query(ArchivedMemoryDB).filter(ArchivedMemoryDB.user_id == user_id)
+            rows = query.order_by(ArchivedMemoryDB.archived_at.desc(), ArchivedMemoryDB.id).offset(offset).limit(limit).all()
+            return {
+                "total": query.count(),
+                "nodes": [
+                    {
+                        "id": row.id,
+                        "label": row.label,
+                        "name": row.name,
+                        "decayed_importance": row.decayed_importance,
+                        "archived_at": row.archived_at,
+                    }
+                    for row in rows
+                ],
+            }
+        finally:
+            db.close()
+
+    def load(self, user_id: str, node_ids: Optional[List[str]] = None) -> List[dict]:
+        """Payloads of the user's archived nodes (all of them without node_ids)"""
+        db = self._session_factory()
+        try:
+            query = db.query(ArchivedMemoryDB).filter(ArchivedMemoryDB.user_id == user_id)
+            if node_ids is not None:
+                query = query.filter(ArchivedMemoryDB.id.in_(node_ids))
+            return [json.loads(row.payload) for row in query.all()]
+        finally:
+            db.close()
+
+    def delete(self, user_id: str, node_ids: List[str]) -> None:
+        db = self._session_factory()
+        try:
+            db.query(ArchivedMemoryDB).filter(
+                ArchivedMemoryDB.user_id == user_id, ArchivedMemoryDB.id.in_(node_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
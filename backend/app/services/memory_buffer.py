@@ -0,0 +1,258 @@
+"""
+Durable per-conversation buffer of messages awaiting memory extraction.
+
+Every buffered message is journaled to SQLite before it is counted, so a
+restart reloads what was not yet extracted. A conversation's segment is
+taken for extraction when it reaches the size limit, when it has been quiet
+for the idle timeout, when its oldest message exceeds the maximum age, when
+its session ends, at shutdown, or when it is the least recently active
+conversation while the buffer is over its memory cap. Journal rows are
+deleted once the segment has been processed (ack), so a crash mid-extraction
+replays the segment on the next start. A segment that could not be processed
+yet is requeued in front of its conversation's newer messages and handed out
+again by ready().
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.database import SessionLocal
+from app.models.db_session import MemoryBufferDB
+
+logger = logging.getLogger(__name__)
+
+FLUSH_REASONS = ("size", "idle", "age", "evicted", "session_end", "shutdown")
+
+
+def _message_bytes(message: Dict[str, str]) -> int:
+    return len(message.get("role", "").encode()) + len(message.get("content", "").encode())
+
+
+class BufferedSegment:
+    """Messages taken from the buffer for one extraction, plus their journal rows"""
+
+    __slots__ = ("conversation_id", "user_id", "character_id", "messages", "row_ids", "reason")
+
+    def __init__(self, conversation_id: str, user_id: str, character_id: str,
+                 messages: List[Dict[str, str]], row_ids: List[int], reason: str):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.character_id = character_id
+        self.messages = messages
+        self.row_ids = row_ids
+        self.reason = reason
+
+
+class _Pending:
+    __slots__ = ("user_id", "character_id", "messages", "row_ids", "bytes", "first_at", "last_at")
+
+    def __init__(self, user_id: str, character_id: str, at: float):
+        self.user_id = user_id
+        self.character_id = character_id
+        self.messages: List[Dict[str, str]] = []
+        self.row_ids: List[int] = []
+        self.bytes = 0
+        self.first_at = at
+        self.last_at = at
+
+
+class MemoryBuffer:
+    """Journaled message buffer keyed by conversation, in LRU order."""
+
+    def __init__(
+        self,
+        max_messages: int = 5,
+        idle_seconds: float = 120,
+        max_age_seconds: float = 900,
+        max_bytes: int = 4_000_000,
+        session_factory=SessionLocal,
+    ):
+        self.max_messages = max(1, max_messages)
+        self.idle_seconds = idle_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._session_factory = session_factory
+        self._pending: "OrderedDict[str, _Pending]" = OrderedDict()
+        self.bytes = 0
+        self.flushes: Dict[str, int] = {reason: 0 for reason in FLUSH_REASONS}
+        self.journal_errors = 0
+        # Requeued conversations (in order) and the reason they were first taken
+        self._ready: Dict[str, str] = {}
+        self.requeued = 0
+
+    def load(self) -> int:
+        """Reload journaled messages left by a previous process; returns the message count."""
+        db = self._session_factory()
+        try:
+            rows = db.query(MemoryBufferDB).order_by(MemoryBufferDB.id).all()
+            for row in rows:
+                self._add(
+                    row.conversation_id, row.user_id, row.character_id,
+                    {"role": row.role, "content": row.content}, row.id, row.buffered_at,
+                )
+            if rows:
+                logger.info(f"Recovered {len(rows)} buffered memory messages for {len(self._pending)} conversations")
+            return len(rows)
+        except Exception as e:
+            logger.warning(f"Could not load memory buffer journal: {str(e)}")
+            return 0
+        finally:
+            db.close()
+
+    def append(
+        self,
+        conversation_id: str,
+        user_id: str,
+        character_id: str,
+        messages: List[Dict[str, str]],
+    ) -> Optional[BufferedSegment]:
+        """Journal and buffer messages; returns the segment once the size limit is reached."""
+        now = time.time()
+        row_ids = self._journal(conversation_id, user_id, character_id, messages, now)
+        for message, row_id in zip(messages, row_ids):
+            self._add(conversation_id, user_id, character_id, message, row_id, now)
+        pending = self._pending.get(conversation_id)
+        if pending is None or conversation_id in self._ready:
+            return None
+        if len(pending.messages) < self.max_messages:
+            logger.info(f"Buffered messages for conversation {conversation_id}. Current size: {len(pending.messages)}")
+            return None
+        return self.take(conversation_id, "size")
+
+    def take(self, conversation_id: str, reason: str) -> Optional[BufferedSegment]:
+        """Remove a conversation's messages from memory for extraction; the journal keeps them until ack."""
+        segment = self._pop(conversation_id, reason)
+        if segment is not None:
+            self.flushes[reason] += 1
+            logger.info(f"Processing {len(segment.messages)} buffered messages for conversation {conversation_id} ({reason})")
+        return segment
+
+    def take_all(self, reason: str) -> List[BufferedSegment]:
+        return [self.take(conversation_id, reason) for conversation_id in list(self._pending)]
+
+    def due(self, now: Optional[float] = None) -> List[BufferedSegment]:
+        """Segments of conversations that went quiet or whose oldest message is too old."""
+        now = time.time() if now is None else now
+        segments = []
+        for conversation_id, pending in list(self._pending.items()):
+            if conversation_id in self._ready:
+                continue
+            if now - pending.last_at >= self.idle_seconds:
+                segments.append(self.take(conversation_id, "idle"))
+            elif now - pending.first_at >= self.max_age_seconds:
+                segments.append(self.take(conversation_id, "age"))
+        return segments
+
+    def evict(self) -> List[BufferedSegment]:
+        """Least recently active segments beyond the memory cap, for early extraction."""
+        segments = []
+        for conversation_id in [c for c in self._pending if c not in self._ready]:
+            if self.bytes <= self.max_bytes or len(self._pending) <= 1:
+                break
+            segments.append(self.take(conversation_id, "evicted"))
+        return segments
+
+    def requeue(self, segment: BufferedSegment) -> None:
+        """Put back a taken segment that could not be processed yet, ahead of newer messages; it stays journaled."""
+        newer = self._pending.pop(segment.conversation_id, None)
+        now = time.time()
+        pending = _Pending(segment.user_id, segment.character_id, now)
+        pending.messages = segment.messages + (newer.messages if newer else [])
+        pending.row_ids = segment.row_ids + (newer.row_ids if newer else [])
+        size = sum(_message_bytes(message) for message in segment.messages)
+        pending.bytes = size + (newer.bytes if newer else 0)
+        if newer:
+            pending.first_at = min(now, newer.first_at)
+        self._pending[segment.conversation_id] = pending
+        self._ready[segment.conversation_id] = segment.reason
+        self.bytes += size
+        self.requeued += 1
+
+    def has_ready(self) -> bool:
+        return bool(self._ready)
+
+    def ready(self, limit: int) -> List[BufferedSegment]:
+        """Up to `limit` requeued segments, oldest first, including messages buffered since."""
+        segments = []
+        for conversation_id, reason in list(self._ready.items())[:max(0, limit)]:
+            segments.append(self._pop(conversation_id, reason))
+        return segments
+
+    def ack(self, segment: BufferedSegment) -> None:
+        """Drop a processed segment from the journal."""
+        if not segment.row_ids:
+            return
+        db = self._session_factory()
+        try:
+            db.query(MemoryBufferDB).filter(MemoryBufferDB.id.in_(segment.row_ids)).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.journal_errors += 1
+            logger.warning(f"Could not clear memory buffer journal for {segment.conversation_id}: {str(e)}")
+        finally:
+            db.close()
+
+    def metrics(self) -> dict:
+        return {
+            "conversations": len(self._pending),
+            "messages": sum(len(p.messages) for p in self._pending.values()),
+            "buffered_bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "flushes": dict(self.flushes),
+            "requeued": self.requeued,
+            "ready": len(self._ready),
+            "journal_errors": self.journal_errors,
+        }
+
+    def _pop(self, conversation_id: str, reason: str) -> Optional[BufferedSegment]:
+        pending = self._pending.pop(conversation_id, None)
+        self._ready.pop(conversation_id, None)
+        if pending is None:
+            return None
+        self.bytes -= pending.bytes
+        return BufferedSegment(
+            conversation_id, pending.user_id, pending.character_id, pending.messages, pending.row_ids, reason
+        )
+
+    def _add(self, conversation_id: str, user_id: str, character_id: str,
+             message: Dict[str, str], row_id: Optional[int], at: float) -> None:
+        pending = self._pending.get(conversation_id)
+        if pending is None:
+            pending = self._pending[conversation_id] = _Pending(user_id, character_id, at)
+        self._pending.move_to_end(conversation_id)
+        size = _message_bytes(message)
+        pending.messages.append(message)
+        if row_id is not None:
+            pending.row_ids.append(row_id)
+        pending.bytes += size
+        pending.last_at = at
+        self.bytes += size
+
+    def _journal(self, conversation_id: str, user_id: str, character_id: str,
+                 messages: List[Dict[str, str]], at: float) -> List[Optional[int]]:
+        """Persist messages; on failure they are still buffered in memory, just not durable."""
+        db = self._session_factory()
+        try:
+            rows = [
+                MemoryBufferDB(
+                    conversation_id=conversation_id,
+                    user_id=user_id,
+                    character_id=character_id,
+                    role=message.get("role", "unknown"),
+                    content=message.get("content", ""),
+                    buffered_at=at,
+                )
+                for message in messages
+            ]
+            db.add_all(rows)
+            db.commit()
+            return [row.id for row in rows]
+        except Exception as e:
+            db.rollback()
+            self.journal_errors += 1
+            logger.warning(f"Could not journal buffered messages for {conversation_id}: {str(e)}")
+            return [None] * len(messages)
+        finally:
+            db.close()
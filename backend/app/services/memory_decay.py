@@ -0,0 +1,113 @@
+"""
+Memory decay for graph compaction.
+
+A node's decayed importance is its score plus a bonus for how often
+retrieval recalled it, halved every half-life since it was last written or
+recalled. Compaction archives (or prunes) the coldest nodes of a user below
+the threshold, a budget at a time. Retrieval hits are counted in an
+AccessLog and flushed to the store in batches rather than written per turn.
+"""
+import math
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# Score (0-10, like Entity.score) assumed for nodes the extractor does not score
+BASE_IMPORTANCE = {"CharacterObservation": 5.0, "UserPreference": 8.0}
+
+# Importance added per doubling of the access count
+ACCESS_WEIGHT = 1.0
+
+DAY_SECONDS = 86400
+
+
+def epoch(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of a stored ISO timestamp, None if missing or malformed"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def last_seen(row: dict) -> Optional[float]:
+    """Latest of the node's write and recall times"""
+    seen = [t for t in (epoch(row.get("updated_at")), epoch(row.get("last_accessed_at"))) if t is not None]
+    return max(seen) if seen else None
+
+
+def decayed_importance(
+    importance: float,
+    seen_at: Optional[float],
+    access_count: int,
+    now: float,
+    half_life_days: float,
+) -> float:
+    """(importance + ACCESS_WEIGHT * log2(1 + accesses)) * 0.5 ** (age / half-life)"""
+    base = (importance or 0) + ACCESS_WEIGHT * math.log2(1 + max(0, access_count or 0))
+    if seen_at is None or half_life_days <= 0:
+        return base
+    age_days = max(0.0, now - seen_at) / DAY_SECONDS
+    return base * 0.5 ** (age_days / half_life_days)
+
+
+def select_cold(
+    rows: Iterable[dict],
+    now: float,
+    half_life_days: float,
+    min_importance: float,
+    min_age_days: float,
+    budget: int,
+) -> List[dict]:
+    """
+    Candidate rows (id, label, importance, updated_at, last_accessed_at,
+    access_count) that decayed below min_importance and were not seen for
+    min_age_days, coldest first, at most `budget`. Each row gains `decayed`.
+    """
+    cold = []
+    for row in rows:
+        seen_at = last_seen(row)
+        if seen_at is not None and now - seen_at < min_age_days * DAY_SECONDS:
+            continue
+        importance = row.get("importance")
+        if importance is None:
+            importance = BASE_IMPORTANCE.get(row.get("label"), 0)
+        score = decayed_importance(importance, seen_at, row.get("access_count") or 0, now, half_life_days)
+        if score < min_importance:
+            cold.append(dict(row, decayed=round(score, 4)))
+    cold.sort(key=lambda row: (row["decayed"], row["id"]))
+    return cold[:max(0, budget)]
+
+
+class AccessLog:
+    """Entity recalls counted in memory until the next flush to the store"""
+
+    def __init__(self):
+        self._hits: Dict[str, List] = {}  # id -> [count, last access epoch]
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    def record(self, node_ids: Iterable[str], at: Optional[float] = None) -> None:
+        at = time.time() if at is None else at
+        for node_id in node_ids:
+            hit = self._hits.setdefault(node_id, [0, at])
+            hit[0] += 1
+            hit[1] = max(hit[1], at)
+
+    def drain(self) -> List[dict]:
+        """Pending hits as store rows {id, count, last_accessed_at}, clearing the log"""
+        hits, self._hits = self._hits, {}
+        return [
+            {"id": node_id, "count": count, "last_accessed_at": datetime.fromtimestamp(at).isoformat()}
+            for node_id, (count, at) in hits.items()
+        ]
+
+    def restore(self, rows: List[dict]) -> None:
+        """Put drained rows back after a failed flush"""
+        for row in rows:
+            at = epoch(row["last_accessed_at"]) or time.time()
+            hit = self._hits.setdefault(row["id"], [0, at])
+            hit[0] += row["count"]
+            hit[1] = max(hit[1], at)
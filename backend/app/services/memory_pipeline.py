@@ -0,0 +1,312 @@
+"""
+Staged ingestion pipeline for graph memory writes.
+
+Jobs move through extraction, embedding and graph-write stages joined by
+bounded queues, so a slow stage holds the earlier ones back instead of
+letting work pile up, and submit() waits once `capacity` jobs are in the
+pipeline (try_submit() declines instead of waiting). A conversation has at most one job in flight; its later segments
+wait behind it and run in order. The single writer drains whatever jobs are
+ready (up to coalesce_max) and writes each user's jobs in one transaction,
+retrying the store's transient errors with exponential backoff. Finished
+jobs are kept for status lookups.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "extracting", "embedding", "writing", "done", "failed")
+
+
+class MemoryJob:
+    """One buffered segment on its way into the graph"""
+
+    __slots__ = (
+        "id", "segment", "extraction", "embeddings", "entities", "relations", "written", "signals_written",
+        "status", "error", "attempts", "submitted_at", "finished_at", "done",
+    )
+
+    def __init__(self, segment, extraction=None, embeddings=None):
+        self.id = uuid.uuid4().hex
+        self.segment = segment
+        self.extraction = extraction
+        self.embeddings = embeddings
+        self.entities: List[dict] = []
+        self.relations: List[dict] = []
+        self.written = False
+        self.signals_written = False
+        self.status = "queued"
+        self.error: Optional[BaseException] = None
+        self.attempts = 0
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done: Optional[asyncio.Future] = None
+
+    @property
+    def user_id(self) -> str:
+        return self.segment.user_id
+
+    @property
+    def conversation_id(self) -> str:
+        return self.segment.conversation_id
+
+    @property
+    def character_id(self) -> str:
+        return self.segment.character_id
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "user_id": self.user_id,
+            "conversation_id": self.conversation_id,
+            "entities_count": len(self.entities) if self.status == "done" else 0,
+            "relations_count": len(self.relations) if self.status == "done" else 0,
+            "attempts": self.attempts,
+            "error": str(self.error) if self.error else None,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class MemoryPipeline:
+    """
+    Runs MemoryJobs through the stage callables:
+    extract(job) -> (extraction, embeddings), embed(job) fills job.entities
+    and job.relations, write(user_id, jobs) persists a user's jobs, and
+    finish(job) runs once per job after it is done or failed.
+    """
+
+    def __init__(
+        self,
+        extract: Callable[[MemoryJob], Awaitable[Tuple[Any, Any]]],
+        embed: Callable[[MemoryJob], Awaitable[None]],
+        write: Callable[[str, List[MemoryJob]], Awaitable[None]],
+        finish: Callable[[MemoryJob], None],
+        capacity: int = 200,
+        extract_workers: int = 2,
+        embed_workers: int = 2,
+        coalesce_max: int = 16,
+        max_retries: int = 3,
+        retry_base_seconds: float = 0.5,
+        transient_errors: Tuple[type, ...] = (),
+        history: int = 1000,
+    ):
+        self._extract = extract
+        self._embed = embed
+        self._write = write
+        self._finish = finish
+        self.capacity = max(1, capacity)
+        self.extract_workers = max(1, extract_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.coalesce_max = max(1, coalesce_max)
+        self.max_retries = max(0, max_retries)
+        self.retry_base_seconds = retry_base_seconds
+        self.transient_errors = transient_errors
+        self.history = history
+        self._slots = asyncio.Semaphore(self.capacity)
+        self._extract_queue: asyncio.Queue = asyncio.Queue(maxsize=self.capacity)
+        self._embed_queue: asyncio.Queue = asyncio.Queue(maxsize=2 * self.embed_workers)
+        self._write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.coalesce_max)
+        self._active: Dict[str, MemoryJob] = {}
+        self._waiting: Dict[str, Deque[MemoryJob]] = {}
+        self._jobs: "OrderedDict[str, MemoryJob]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.write_batches = 0
+        self.coalesced_jobs = 0
+        self.backpressure_waits = 0
+        self.deferred = 0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = (
+            [asyncio.ensure_future(self._extract_worker()) for _ in range(self.extract_workers)]
+            + [asyncio.ensure_future(self._embed_worker()) for _ in range(self.embed_workers)]
+            + [asyncio.ensure_future(self._write_worker())]
+        )
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, job: MemoryJob) -> MemoryJob:
+        """Admit a job, waiting while the pipeline is at capacity"""
+        if self._slots.locked():
+            self.backpressure_waits += 1
+        await self._slots.acquire()
+        self._admit(job)
+        return job
+
+    async def try_submit(self, job: MemoryJob) -> bool:
+        """Admit a job only if a slot is free right now; never waits"""
+        if self._slots.locked():
+            self.deferred += 1
+            return False
+        # Acquiring an unlocked semaphore does not suspend
+        await self._slots.acquire()
+        self._admit(job)
+        return True
+
+    @property
+    def free_slots(self) -> int:
+        return self.capacity - self.in_flight
+
+    def get(self, job_id: str) -> Optional[MemoryJob]:
+        return self._jobs.get(job_id)
+
+    async def join(self) -> None:
+        """Wait until every admitted job has finished"""
+        while True:
+            pending = [job.done for job in self._jobs.values() if not job.done.done()]
+            if not pending:
+                return
+            await asyncio.gather(*pending)
+
+    def metrics(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": {
+                "extract": self._extract_queue.qsize(),
+                "embed": self._embed_queue.qsize(),
+                "write": self._write_queue.qsize(),
+            },
+            "waiting_conversations": len(self._waiting),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "write_batches": self.write_batches,
+            "coalesced_jobs": self.coalesced_jobs,
+            "backpressure_waits": self.backpressure_waits,
+            "deferred": self.deferred,
+        }
+
+    def _admit(self, job: MemoryJob) -> None:
+        self.in_flight += 1
+        job.done = asyncio.get_running_loop().create_future()
+        self._jobs[job.id] = job
+        self._trim_history()
+        if job.conversation_id in self._active:
+            self._waiting.setdefault(job.conversation_id, deque()).append(job)
+        else:
+            self._start(job)
+
+    def _start(self, job: MemoryJob) -> None:
+        self._active[job.conversation_id] = job
+        # Never blocks: admitted jobs are bounded by capacity, the queue's maxsize
+        self._extract_queue.put_nowait(job)
+
+    async def _extract_worker(self) -> None:
+        while True:
+            job = await self._extract_queue.get()
+            try:
+                if job.extraction is None:
+                    job.status = "extracting"
+                    job.extraction, job.embeddings = await self._extract(job)
+                if job.extraction is None:
+                    self._complete(job)
+                else:
+                    await self._embed_queue.put(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._complete(job, e)
+
+    async def _embed_worker(self) -> None:
+        while True:
+            job = await self._embed_queue.get()
+            try:
+                job.status = "embedding"
+                await self._embed(job)
+                await self._write_queue.put(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._complete(job, e)
+
+    async def _write_worker(self) -> None:
+        while True:
+            batch = [await self._write_queue.get()]
+            while len(batch) < self.coalesce_max and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            by_user: Dict[str, List[MemoryJob]] = {}
+            for job in batch:
+                job.status = "writing"
+                by_user.setdefault(job.user_id, []).append(job)
+            for user_id, jobs in by_user.items():
+                try:
+                    await self._write_with_retries(user_id, jobs)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    for job in jobs:
+                        self._complete(job, e)
+                else:
+                    for job in jobs:
+                        self._complete(job)
+                self.write_batches += 1
+                self.coalesced_jobs += len(jobs) - 1
+
+    async def _write_with_retries(self, user_id: str, jobs: List[MemoryJob]) -> None:
+        attempt = 0
+        while True:
+            for job in jobs:
+                job.attempts += 1
+            try:
+                await self._write(user_id, jobs)
+                return
+            except self.transient_errors as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_base_seconds * 2 ** attempt
+                attempt += 1
+                self.retries += 1
+                logger.warning(
+                    f"Transient graph write error for user {user_id} ({len(jobs)} jobs), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s: {str(e)}"
+                )
+                await asyncio.sleep(delay)
+
+    def _complete(self, job: MemoryJob, error: Optional[BaseException] = None) -> None:
+        job.status = "failed" if error else "done"
+        job.error = error
+        job.finished_at = time.time()
+        if error:
+            self.failed += 1
+            logger.error(f"Memory job {job.id} for conversation {job.conversation_id} failed: {str(error)}")
+        else:
+            self.completed += 1
+        try:
+            self._finish(job)
+        except Exception as e:
+            logger.warning(f"Memory job {job.id} finish hook failed: {str(e)}")
+        if not job.done.done():
+            job.done.set_result(job)
+        self.in_flight -= 1
+        self._slots.release()
+
+        self._active.pop(job.conversation_id, None)
+        waiting = self._waiting.get(job.conversation_id)
+        if waiting:
+            self._start(waiting.popleft())
+            if not waiting:
+                del self._waiting[job.conversation_id]
+
+    def _trim_history(self) -> None:
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
@@ -0,0 +1,169 @@
+"""
+Reranking of recalled memory entities.
+
+Retrieval recalls a candidate pool (vector neighbors above a similarity floor
+plus keyword matches) and scores each candidate on four features in [0, 1]:
+relevance to the query, importance, recency of the last write or recall, and
+degree in the graph. Maximal marginal relevance then picks candidates one at
+a time, trading their score against their similarity to those already
+picked, so near-duplicate entities do not crowd out the rest. The pool is
+ordered by id first, so ties always resolve the same way. pack_lines keeps
+the resulting context lines that fit a token budget.
+"""
+import time
+from typing import Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+from app.services.keywords import terms
+from app.services.memory_decay import DAY_SECONDS, last_seen
+from app.services.token_counter import TokenCounter
+
+# Candidates recalled per channel (vector, keyword) before reranking
+CANDIDATES = 20
+
+# Neo4j's cosine vector index scores (1 + cos) / 2; the recall floor is on that scale
+MIN_SIMILARITY = 0.7
+
+# Feature weights: relevance, importance, recency, degree
+WEIGHTS = (0.6, 0.2, 0.1, 0.1)
+
+RECENCY_HALF_LIFE_DAYS = 30.0
+
+# Weight of the score against novelty when picking the next candidate
+MMR_LAMBDA = 0.7
+
+
+def term_sets(name: Optional[str], aliases: Optional[Iterable[str]] = None) -> List[Set[str]]:
+    """The terms of the name and of each alias, kept apart for lexical relevance"""
+    return [found for found in (set(terms(text)) for text in [name, *(aliases or ())]) if found]
+
+
+def lexical_relevance(keywords: Iterable[str], candidate_terms: Sequence[List[Set[str]]]) -> np.ndarray:
+    """Per candidate, the largest share of one of its names' terms found among the keywords"""
+    query = set(keywords)
+    relevance = np.zeros(len(candidate_terms), dtype=np.float32)
+    if query:
+        for i, sets in enumerate(candidate_terms):
+            relevance[i] = max((len(found & query) / len(found) for found in sets), default=0.0)
+    return relevance
+
+
+def vector_relevance(similarity: np.ndarray) -> np.ndarray:
+    """Similarity rescaled from the recall floor (0) to an identical vector (1)"""
+    return np.clip((similarity - MIN_SIMILARITY) / (1 - MIN_SIMILARITY), 0, 1).astype(np.float32)
+
+
+def scores(
+    relevance: np.ndarray,
+    importance: np.ndarray,
+    seen_at: np.ndarray,
+    degree: np.ndarray,
+    now: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Weighted feature sum. importance is the 0-10 entity score, seen_at epoch
+    seconds (NaN when unknown, which counts as stale), degree the relation
+    count, log-scaled against the largest in the pool.
+    """
+    now = time.time() if now is None else now
+    recency = np.exp2(np.minimum(0.0, seen_at - now) / (DAY_SECONDS * RECENCY_HALF_LIFE_DAYS))
+    recency[np.isnan(recency)] = 0.0
+    connected = np.log1p(np.maximum(degree, 0))
+    top = connected.max(initial=0)
+    if top > 0:
+        connected /= top
+    relevance_w, importance_w, recency_w, degree_w = WEIGHTS
+    return (
+        relevance_w * relevance + importance_w * np.clip(importance / 10, 0, 1)
+        + recency_w * recency + degree_w * connected
+    ).astype(np.float32)
+
+
+def mmr(score: np.ndarray, vectors: np.ndarray, limit: int, mmr_lambda: float = MMR_LAMBDA) -> List[int]:
+    """
+    Indices picked greedily by mmr_lambda * score - (1 - mmr_lambda) * the
+    largest cosine to an already picked candidate. vectors are unit rows, zero
+    for candidates without an embedding; the first index wins ties.
+    """
+    value = (mmr_lambda * score).astype(np.float32)
+    # Running value of every candidate against the picks so far; picks drop to -inf.
+    # Row i of against is each candidate's value were i its most similar pick.
+    current = value.copy()
+    against = value - (1 - mmr_lambda) * (vectors @ vectors.T) if vectors.shape[1] else None
+    picked: List[int] = []
+    for _ in range(min(limit, len(score))):
+        i = int(current.argmax())
+        picked.append(i)
+        current[i] = -np.inf
+        if against is not None:
+            np.minimum(current, against[i], out=current)
+    return picked
+
+
+def unit_rows(embeddings: Sequence[Optional[Sequence[float]]], dim: int) -> np.ndarray:
+    """Row-normalized matrix of the embeddings; rows of another dimension stay zero"""
+    vectors = np.zeros((len(embeddings), dim), dtype=np.float32)
+    for i, embedding in enumerate(embeddings):
+        if embedding is not None and len(embedding) == dim:
+            vectors[i] = embedding
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def rank(
+    query_embedding: Optional[List[float]],
+    keywords: List[str],
+    candidates: List[dict],
+    limit: int,
+    now: Optional[float] = None,
+) -> List[str]:
+    """
+    Ids of the candidates to expand, best first, at most `limit`. Candidates
+    are store rows with id, name, aliases, importance, updated_at,
+    last_accessed_at, degree and embedding; repeated ids are merged.
+    """
+    pool = sorted({c["id"]: c for c in candidates}.values(), key=lambda c: c["id"])
+    if not pool or limit <= 0:
+        return []
+
+    embeddings = [c.get("embedding") for c in pool]
+    if query_embedding:
+        dim = len(query_embedding)
+    else:
+        dim = max((len(e) for e in embeddings if e is not None), default=0)
+    vectors = unit_rows(embeddings, dim)
+
+    relevance = lexical_relevance(keywords, [term_sets(c.get("name"), c.get("aliases")) for c in pool])
+    if query_embedding:
+        query = unit_rows([query_embedding], dim)[0]
+        has_vector = vectors.any(axis=1)
+        relevance = np.maximum(relevance, np.where(has_vector, vector_relevance((1 + vectors @ query) / 2), 0))
+
+    seen = [last_seen(c) for c in pool]
+    score = scores(
+        relevance,
+        np.array([c.get("importance") or 0 for c in pool], dtype=np.float32),
+        np.array([np.nan if t is None else t for t in seen], dtype=np.float64),
+        np.array([c.get("degree") or 0 for c in pool], dtype=np.float32),
+        now,
+    )
+    return [pool[i]["id"] for i in mmr(score, vectors, limit)]
+
+
+def pack_lines(lines: List[str], counter: TokenCounter, budget: int) -> List[str]:
+    """
+    The lines, in order, that fit `budget` tokens once joined by newlines; a
+    line too long for the space left is skipped so shorter ones after it can
+    still use it.
+    """
+    kept: List[str] = []
+    used = 0
+    separator = counter.count_text("\n")
+    for line in lines:
+        cost = counter.count_text(line) + (separator if kept else 0)
+        if used + cost <= budget:
+            kept.append(line)
+            used += cost
+    return kept
@@ -0,0 +1,172 @@
+"""
+Neo4j schema for the memory graph.
+Uniqueness constraints on node ids (each one also backs the id lookups), the
+secondary and vector indexes, and the one-off migration that brings existing
+data in line with the constraints before they are created.
+"""
+import logging
+import re
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Labels whose id is unique; every lookup by id is anchored on one of these
+CONSTRAINED_LABELS = ["User", "Conversation", "Entity", "UserPreference", "CharacterObservation", "Character"]
+
+CONSTRAINTS = {
+    f"{label.lower()}_id_unique": f"CREATE CONSTRAINT {label.lower()}_id_unique IF NOT EXISTS "
+                                  f"FOR (n:{label}) REQUIRE n.id IS UNIQUE"
+    for label in CONSTRAINED_LABELS
+}
+
+INDEXES = [
+    "CREATE INDEX pref_user_index IF NOT EXISTS FOR (p:UserPreference) ON (p.user_id)",
+    "CREATE INDEX obs_user_index IF NOT EXISTS FOR (o:CharacterObservation) ON (o.user_id)",
+    # Normalized entity names, looked up by canonicalization before each write
+    "CREATE INDEX entity_name_key_index IF NOT EXISTS FOR (e:Entity) ON (e.name_key)",
+    # Lexical recall; the CJK analyzer cuts Chinese names into character bigrams
+    """
+    CREATE FULLTEXT INDEX entity_name_fulltext IF NOT EXISTS
+    FOR (e:Entity) ON EACH [e.name, e.alias_text]
+    OPTIONS {indexConfig: {`fulltext.analyzer`: 'cjk'}}
+    """,
+    # Dimension 1536 for OpenAI text-embedding-3-small
+    """
+    CREATE VECTOR INDEX entity_embedding_index IF NOT EXISTS
+    FOR (e:Entity) ON (e.embedding)
+    OPTIONS {indexConfig: {
+        `vector.dimensions`: 1536,
+        `vector.similarity_function`: 'cosine'
+    }}
+    """,
+]
+
+# Plain id indexes from before the constraints; a constraint cannot be created
+# while an index on the same label/property exists
+LEGACY_INDEXES = ["user_id_index", "entity_id_index"]
+
+# Relationship types the memory service writes, moved onto the surviving node
+# when duplicates are merged
+RELATIONSHIP_TYPES = ["RELATION", "HAS_CONVERSATION", "HAS_PREFERENCE", "OBSERVED", "ABOUT"]
+
+# Entities used to be created with only their type as label (Topic, Skill, ...)
+ENTITY_LABEL_BACKFILL = """
+MATCH (n)
+WHERE n.id IS NOT NULL AND n.type IS NOT NULL AND NOT n:Entity
+  AND NOT (n:User OR n:Conversation OR n:UserPreference OR n:CharacterObservation OR n:Character)
+SET n:Entity
+RETURN count(n) AS count
+"""
+
+# Aliases merged before the full-text index existed, flattened into the string it indexes
+ALIAS_TEXT_BACKFILL = """
+MATCH (e:Entity)
+WHERE e.aliases IS NOT NULL AND e.alias_text IS NULL
+SET e.alias_text = reduce(text = '', alias IN e.aliases | text + ' ' + alias)
+RETURN count(e) AS count
+"""
+
+
+def entity_label(entity_type: str) -> str:
+    """Entity type as a Cypher label; anything that is not a plain identifier becomes Entity"""
+    return entity_type if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", entity_type or "") else "Entity"
+
+
+def node_lookup(var: str, param: str) -> str:
+    """
+    CALL subquery binding `var` to the node with id `$param` under any
+    constrained label, for lookups where the caller does not know the label.
+    """
+    branches = "\n        UNION\n        ".join(
+        f"MATCH ({var}:{label} {{id: ${param}}}) RETURN {var}" for label in CONSTRAINED_LABELS
+    )
+    return f"CALL {{\n        {branches}\n    }}"
+
+
+def _duplicates(label: str) -> str:
+    # Newest node last; it survives and keeps its properties
+    return f"""
+    MATCH (n:`{label}`) WHERE n.id IS NOT NULL
+    WITH n ORDER BY COALESCE(n.updated_at, n.created_at, ''), elementId(n)
+    WITH n.id AS id, collect(n) AS nodes
+    WHERE size(nodes) > 1
+    WITH last(nodes) AS keep, nodes[..-1] AS dups
+    """
+
+
+def migration_queries(label: str) -> List[str]:
+    """Statements that merge nodes of `label` sharing an id, relationships first."""
+    queries = []
+    for rel_type in RELATIONSHIP_TYPES:
+        key = " {type: r.type}" if rel_type == "RELATION" else ""
+        on_match = "ON MATCH SET moved.count = COALESCE(moved.count, 1) + COALESCE(r.count, 1)" if rel_type == "RELATION" else ""
+        for pattern, merged in (
+            (f"(dup)-[r:{rel_type}]->(other)", f"(keep)-[moved:{rel_type}{key}]->(other)"),
+            (f"(other)-[r:{rel_type}]->(dup)", f"(other)-[moved:{rel_type}{key}]->(keep)"),
+        ):
+            queries.append(_duplicates(label) + f"""
+    UNWIND dups AS dup
+    MATCH {pattern}
+    WHERE other <> keep AND NOT other IN dups
+    MERGE {merged}
+    ON CREATE SET moved += properties(r)
+    {on_match}
+    """)
+    queries.append(_duplicates(label) + """
+    WITH keep, dups, properties(keep) AS own,
+         reduce(c = keep.created_at, d IN dups |
+             CASE WHEN c IS NULL OR d.created_at < c THEN COALESCE(d.created_at, c) ELSE c END) AS created_at
+    FOREACH (d IN dups | SET keep += properties(d))
+    SET keep += own
+    SET keep.created_at = created_at
+    FOREACH (d IN dups | DETACH DELETE d)
+    RETURN sum(size(dups)) AS count
+    """)
+    return queries
+
+
+async def _run(session, query: str):
+    result = await session.run(query)
+    return await result.single()
+
+
+async def migrate(session) -> None:
+    """Backfill the Entity label and merge duplicate ids so the constraints can be created."""
+    record = await _run(session, ENTITY_LABEL_BACKFILL)
+    if record and record["count"]:
+        logger.info(f"Added Entity label to {record['count']} nodes")
+    for label in CONSTRAINED_LABELS:
+        for query in migration_queries(label):
+            record = await _run(session, query)
+        if record and record["count"]:
+            logger.info(f"Merged {record['count']} duplicate {label} nodes")
+    for name in LEGACY_INDEXES:
+        await _run(session, f"DROP INDEX {name} IF EXISTS")
+
+
+async def ensure_schema(driver, database: str) -> None:
+    """
+    Create constraints and indexes, running the migration first when any
+    constraint is missing. Schema statements run as auto-commit queries since
+    Neo4j does not allow them in a transaction that also writes data.
+    """
+    async with driver.session(database=database) as session:
+        result = await session.run("SHOW CONSTRAINTS YIELD name")
+        existing = {record["name"] async for record in result}
+        missing = [name for name in CONSTRAINTS if name not in existing]
+
+        if missing:
+            logger.info(f"Creating memory graph constraints: {', '.join(missing)}")
+            await migrate(session)
+            for name in missing:
+                await _run(session, CONSTRAINTS[name])
+
+        for index_query in INDEXES:
+            try:
+                await _run(session, index_query)
+            except Exception as e:
+                logger.warning(f"Index creation warning: {str(e)}")
+
+        record = await _run(session, ALIAS_TEXT_BACKFILL)
+        if record and record["count"]:
+            logger.info(f"Indexed aliases of {record['count']} entities for full-text search")
@@ -1,121 +1,139 @@
 """
-Memory/GRAG service for Neo4j graph database integration
-Implements GraphRAG memory system for long-term memory storage
+Memory/GRAG service for graph memory
+Implements GraphRAG memory system for long-term memory storage on a pluggable
+GraphStore backend (Neo4j or the embedded SQLite store)
 """
+import asyncio
 import logging
 import json
-import re
-from typing import Optional, List, Dict, Any, Tuple
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, List, Dict, Any, Tuple
 from datetime import datetime
-from neo4j import GraphDatabase
 from app.config import settings
+from app.models.memory import Entity, TurnExtraction
+from app.services.entity_canonicalizer import canonicalize, find_duplicates, normalize_name
+from app.services.graph_store import GraphStore
+from app.services.graph_view import VIEW_ORDERS, build_view, decode_cursor, visible_properties
+from app.services.keywords import extract_keywords
 from app.services.llm_service import llm_service
+from app.services.local_graph_store import LocalGraphStore
+from app.services.memory_archive import MemoryArchive
+from app.services.memory_buffer import BufferedSegment, MemoryBuffer
+from app.services.memory_decay import AccessLog, select_cold
+from app.services.memory_pipeline import MemoryJob, MemoryPipeline
+from app.services.memory_rerank import pack_lines
+from app.services.memory_snapshot import MemorySnapshot
+from app.services.neo4j_graph_store import Neo4jGraphStore
+from app.services.extraction_scheduler import extraction_scheduler
+from app.services.token_counter import TokenCounter
+from app.services.turn_extractor import ExtractionError, turn_extractor
 
 logger = logging.getLogger(__name__)
 
+# How often quiet or aged conversation buffers are checked
+BUFFER_SWEEP_SECONDS = 5
+
+# How often entity recalls counted in memory are written to the store
+ACCESS_FLUSH_SECONDS = 60
+
+# Candidates read per user, as a multiple of the compaction budget
+COMPACTION_SCAN_FACTOR = 4
+
+
+def _entity_embedding_text(entity: dict) -> str:
+    return f"{entity.get('name', '')} {entity.get('type', '')} {json.dumps(entity.get('properties', {}), ensure_ascii=False)}"
+
+
+class EntityEmbeddings:
+    """
+    Entity embeddings started while extraction is still streaming.
+    submit() is used as the TurnExtractor on_entity callback; write_extraction
+    then awaits the already-running request instead of starting a new one.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, entity: Entity) -> None:
+        if entity.id not in self._tasks:
+            self._tasks[entity.id] = asyncio.ensure_future(
+                llm_service.get_embedding(_entity_embedding_text(entity.model_dump()))
+            )
+
+    async def get(self, entity: dict) -> List[float]:
+        task = self._tasks.get(entity.get("id"))
+        if task is None:
+            return await llm_service.get_embedding(_entity_embedding_text(entity))
+        return await task
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
 
 class MemoryService:
     """
     Memory/GRAG service (inspired by NagaAgent design)
     
-    Uses Neo4j Python driver 5.0+ best practices:
-    - Uses execute_write/execute_read for transaction management
-    - Supports sync operations (async can be added later)
-    - Properly handles connection pool and session lifecycle
+    Buffers conversation segments, feeds them through the ingestion pipeline
+    (extraction, embeddings, coalesced graph writes), keeps per-session
+    subgraph snapshots, archives decayed memory, and persists/queries the
+    graph through a GraphStore.
     """
     
-    def __init__(self, uri: str, user: str, password: str, database: str = "neo4j"):
-        self.uri = uri
-        self.user = user
-        self.password = password
-        self.database = database
-        self.driver: Optional[GraphDatabase] = None
+    def __init__(self, store: GraphStore):
+        self.store = store
         self._initialized = False
-        self._message_buffer: Dict[str, List[Dict[str, str]]] = {}
+        self.buffer = MemoryBuffer(
+            max_messages=settings.memory_buffer_size,
+            idle_seconds=settings.memory_buffer_idle_seconds,
+            max_age_seconds=settings.memory_buffer_max_age_seconds,
+            max_bytes=settings.memory_buffer_max_bytes,
+        )
+        self._buffer_task: Optional[asyncio.Task] = None
+        self._flushing: set = set()
+        self._job_listeners: List[Callable[[MemoryJob], None]] = []
+        self.pipeline = MemoryPipeline(
+            extract=self._extract_job,
+            embed=self._embed_job,
+            write=self._write_jobs,
+            finish=self._finish_job,
+            capacity=settings.memory_pipeline_capacity,
+            extract_workers=settings.memory_pipeline_extract_workers,
+            embed_workers=settings.memory_pipeline_embed_workers,
+            coalesce_max=settings.memory_pipeline_coalesce_max,
+            max_retries=settings.memory_pipeline_max_retries,
+            transient_errors=store.transient_errors,
+        )
+        self._snapshots: "OrderedDict[str, MemorySnapshot]" = OrderedDict()
+        self._snapshot_locks: Dict[str, asyncio.Lock] = {}
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self.access = AccessLog()
+        self._access_flushed_at = time.monotonic()
+        self.archive = MemoryArchive()
+        self._compaction_task: Optional[asyncio.Task] = None
     
-    def initialize(self):
-        """Initialize Neo4j connection (sync)"""
+    async def initialize(self):
+        """Open the graph store and start the write pipeline and background jobs"""
         if self._initialized:
             return
-        
-        try:
-            # Neo4j Aura uses neo4j+s:// (encrypted connection)
-            self.driver = GraphDatabase.driver(
-                self.uri,
-                auth=(self.user, self.password),
-                max_connection_lifetime=30 * 60,  # 30 minutes
-                max_connection_pool_size=50,
-                connection_acquisition_timeout=2 * 60  # 2 minutes
-            )
-            
-            # Test connection
-            with self.driver.session(database=self.database) as session:
-                result = session.execute_read(lambda tx: tx.run("RETURN 1 AS test").single())
-                if result["test"] != 1:
-                    raise Exception("Connection test failed")
-            
-            self._initialized = True
-            logger.info(f"Neo4j connected successfully: {self.uri}")
-            
-            # Create indexes (including vector index)
-            self.create_indexes()
-            
-        except Exception as e:
-            logger.error(f"Failed to connect to Neo4j: {str(e)}")
-            raise
-    
-    def create_indexes(self):
-        """Create necessary indexes for performance optimization"""
-        if not self.driver:
-            return
-        
-        try:
-            with self.driver.session(database=self.database) as session:
-                def write_tx(tx):
-                    """Transaction function: create indexes"""
-                    # Use Neo4j 5.x compatible syntax
-                    indexes = [
-                        "CREATE INDEX user_id_index IF NOT EXISTS FOR (u:User) ON (u.id)",
-                        "CREATE INDEX entity_id_index IF NOT EXISTS FOR (e:Entity) ON (e.id)",
-                        "CREATE INDEX pref_user_index IF NOT EXISTS FOR (p:UserPreference) ON (p.user_id)",
-                        "CREATE INDEX obs_user_index IF NOT EXISTS FOR (o:CharacterObservation) ON (o.user_id)",
-                    ]
-                    for index_query in indexes:
-                        try:
-                            tx.run(index_query)
-                        except Exception as e:
-                            logger.warning(f"Index creation warning: {str(e)}")
-                    
-                    # Create Vector Index for Entity embeddings
-                    # Dimension 1536 for OpenAI text-embedding-3-small
-                    try:
-                        tx.run("""
-                            CREATE VECTOR INDEX entity_embedding_index IF NOT EXISTS
-                            FOR (e:Entity) ON (e.embedding)
-                            OPTIONS {indexConfig: {
-                                `vector.dimensions`: 1536,
-                                `vector.similarity_function`: 'cosine'
-                            }}
-                        """)
-                    except Exception as e:
-                         # Ignore if already exists or not supported (though 5.x supports it)
-                        logger.warning(f"Vector index creation warning: {str(e)}")
-                
-                session.execute_write(write_tx)
-                logger.info("Neo4j indexes created/verified")
-        except Exception as e:
-            logger.warning(f"Failed to create indexes: {str(e)}")
+        await self.store.initialize()
+        self._initialized = True
+        self.pipeline.start()
+        self.buffer.load()
+        self._buffer_task = asyncio.ensure_future(self._buffer_loop())
+        if settings.graph_stats_reconcile_seconds > 0:
+            self._reconcile_task = asyncio.ensure_future(self._reconcile_loop())
+        if settings.memory_compaction_seconds > 0:
+            self._compaction_task = asyncio.ensure_future(self._compaction_loop())
     
-    def verify_connectivity(self) -> bool:
+    async def verify_connectivity(self) -> bool:
         """Verify connection is healthy"""
-        if not self.driver:
-            return False
-        try:
-            with self.driver.session(database=self.database) as session:
-                session.execute_read(lambda tx: tx.run("RETURN 1").single())
-            return True
-        except Exception:
-            return False
+        return await self.store.verify_connectivity()
     
     async def extract_entities(
         self,
@@ -128,364 +146,459 @@ class MemoryService:
         Returns:
             (entities, relations)
         """
-        extraction_prompt = f"""
-请从以下对话中抽取实体和关系，以JSON格式返回。
-
-对话内容：
-{conversation_text}
-
-请识别以下类型的实体：
-1. Topic（话题/领域）：如"Python"、"图像识别"、"机器学习"
-2. Project（项目）：用户提到的项目名称
-3. Skill（技能）：技术技能、软技能等
-4. Resource（资源）：文档、课程、论文、工具等
-
-对于每个实体，请评估其"重要性评分"（score）：
-- 1-10分：10分代表核心事实（如职业、长期项目），1分代表琐事。
-- 仅提取评分 >= {settings.memory_threshold_score} 的实体。
-
-关系类型：
-- INTERESTED_IN: 用户对话题感兴趣
-- WORKING_ON: 用户正在做的项目
-- HAS_SKILL: 用户拥有的技能
-- LEARNED_FROM: 用户从资源中学习
-- USES: 项目使用的技能
-- RELATED_TO: 实体之间的关联
-
-返回格式（必须是有效的JSON）：
-{{
-    "entities": [
-        {{"id": "topic_python", "type": "Topic", "name": "Python", "score": 8, "properties": {{}}}},
-        {{"id": "project_epsilon", "type": "Project", "name": "异界声律·Epsilon", "score": 9, "properties": {{"status": "in_progress"}}}}
-    ],
-    "relations": [
-        {{"source": "{user_id}", "target": "topic_python", "type": "INTERESTED_IN", "properties": {{"confidence": 0.8}}}},
-        {{"source": "{user_id}", "target": "project_epsilon", "type": "WORKING_ON", "properties": {{"role": "developer"}}}}
-    ]
-}}
-
-只返回JSON，不要其他文字说明。
-"""
-        
-        try:
-            # Call LLM for extraction
-            response = await llm_service.chat(
-                message=extraction_prompt,
-                history=[],
-                system_prompt="你是一个专业的实体抽取助手，能够从对话中准确提取实体和关系。"
-            )
-            
-            # Parse JSON response
-            # Try to extract JSON from response (in case LLM adds extra text)
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                response = json_match.group(0)
-            
-            data = json.loads(response)
-            entities = data.get("entities", [])
-            relations = data.get("relations", [])
-            
-            logger.info(f"Extracted {len(entities)} entities and {len(relations)} relations")
-            return entities, relations
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse extraction result as JSON: {str(e)}")
-            logger.error(f"LLM response: {response[:500]}")
-            return [], []
-        except Exception as e:
-            logger.error(f"Failed to extract entities: {str(e)}")
+        extraction = await turn_extractor.extract(conversation_text, user_id)
+        if extraction is None:
             return [], []
+        return (
+            [e.model_dump() for e in extraction.entities],
+            [r.model_dump() for r in extraction.relations],
+        )
+    
+    def buffer_messages(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, str]],
+        user_id: str = "default_user",
+        character_id: str = "epsilon"
+    ) -> Optional[BufferedSegment]:
+        """
+        Add messages to the durable conversation buffer.
+        
+        Returns:
+            The conversation's segment once it reaches settings.memory_buffer_size,
+            otherwise None. The caller processes it and then calls ack_segment.
+        """
+        segment = self.buffer.append(conversation_id, user_id, character_id, messages)
+        for evicted in self.buffer.evict():
+            self._spawn_flush(evicted)
+        return segment
+    
+    def ack_segment(self, segment: BufferedSegment) -> None:
+        """Mark a taken segment as processed so it is not replayed after a restart"""
+        self.buffer.ack(segment)
+    
+    async def submit_segment(
+        self,
+        segment: BufferedSegment,
+        extraction: Optional[TurnExtraction] = None,
+        embeddings: Optional[EntityEmbeddings] = None
+    ) -> MemoryJob:
+        """
+        Queue a taken segment on the write pipeline, waiting while it is at
+        capacity. A segment that was already extracted skips the extraction
+        stage. The pipeline acknowledges the segment once the job finishes.
+        """
+        return await self.pipeline.submit(MemoryJob(segment, extraction, embeddings))
+    
+    async def schedule_segment(self, segment: BufferedSegment) -> bool:
+        """
+        Queue a taken segment if the pipeline has a free slot, without waiting.
+        Otherwise the segment goes back to the buffer, still journaled, and is
+        resubmitted once a slot frees up. Returns whether it was admitted.
+        """
+        if await self.pipeline.try_submit(MemoryJob(segment)):
+            return True
+        self.buffer.requeue(segment)
+        return False
+    
+    def add_job_listener(self, listener: Callable[[MemoryJob], None]) -> None:
+        """Call listener(job) for every segment written to the graph"""
+        self._job_listeners.append(listener)
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.pipeline.get(job_id)
+        return job.result() if job else None
+    
+    async def flush_conversation(self, conversation_id: str, reason: str = "session_end") -> Dict[str, Any]:
+        """Extract and write whatever is buffered for a conversation (e.g. when its session ends)"""
+        segment = self.buffer.take(conversation_id, reason)
+        if segment is None:
+            return {"entities_count": 0, "relations_count": 0}
+        return await self.flush_segment(segment)
+    
+    def schedule_flush(self, conversation_id: str, reason: str = "session_end") -> None:
+        """Queue a conversation's buffered messages without waiting for admission"""
+        segment = self.buffer.take(conversation_id, reason)
+        if segment is not None:
+            self._spawn_flush(segment)
+    
+    async def flush_all(self, reason: str = "shutdown") -> int:
+        """Flush every buffered conversation and wait for the pipeline to drain; returns segments flushed"""
+        segments = self.buffer.take_all(reason)
+        await asyncio.gather(
+            *[self.submit_segment(segment) for segment in segments],
+            *list(self._flushing),
+            return_exceptions=True,
+        )
+        await self.pipeline.join()
+        return len(segments)
+    
+    async def join(self) -> None:
+        """Wait until scheduled and requeued segments are admitted and the pipeline is idle"""
+        while True:
+            await asyncio.gather(*list(self._flushing), return_exceptions=True)
+            await self.pipeline.join()
+            if not self.buffer.has_ready():
+                return
+            await self._resubmit_ready()
+    
+    async def flush_segment(self, segment: BufferedSegment) -> Dict[str, Any]:
+        """Run a taken segment through the pipeline and wait for it; failures are in the result, not raised"""
+        job = await self.submit_segment(segment)
+        await job.done
+        return job.result()
+    
+    def _spawn_flush(self, segment: BufferedSegment) -> None:
+        self._spawn(self.schedule_segment(segment))
+    
+    def _spawn(self, coro) -> None:
+        # Scheduling never waits for admission, so these tasks finish right away
+        task = asyncio.ensure_future(coro)
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+    
+    async def _resubmit_ready(self) -> None:
+        for segment in self.buffer.ready(self.pipeline.free_slots):
+            await self.schedule_segment(segment)
+    
+    async def _buffer_loop(self) -> None:
+        """Resubmit requeued segments, flush conversations that went quiet or buffered too long, and recorded recalls"""
+        while True:
+            await asyncio.sleep(BUFFER_SWEEP_SECONDS)
+            await self._resubmit_ready()
+            for segment in self.buffer.due():
+                await self.schedule_segment(segment)
+            if time.monotonic() - self._access_flushed_at >= ACCESS_FLUSH_SECONDS:
+                await self.flush_access()
+    
+    @staticmethod
+    def messages_to_text(messages: List[Dict[str, str]]) -> str:
+        return "\n".join([
+            f"{msg.get('role', 'unknown')}: {msg.get('content', '')}" for msg in messages
+        ])
     
     async def write_conversation(
         self,
         user_id: str,
         conversation_id: str,
         messages: List[Dict[str, str]],
-        character_id: str = "epsilon"
-    ) -> Dict[str, int]:
+        character_id: str = "epsilon",
+        wait: bool = False
+    ) -> Dict[str, Any]:
         """
-        Write conversation memory to Neo4j (inspired by NagaAgent design)
+        Write conversation memory to the graph store (inspired by NagaAgent design)
+        
+        Buffers messages and, once the buffer is full, queues the segment on
+        the write pipeline (unified extraction, embeddings, graph write).
         
         Returns:
-            Dict with entities_count and relations_count
+            The job status (see MemoryJob.result); job_id is None while the
+            messages are only buffered. With wait=True, once the job finished.
         """
         if not self._initialized:
             raise RuntimeError("MemoryService not initialized")
         
-        # Buffer messages
-        if conversation_id not in self._message_buffer:
-            self._message_buffer[conversation_id] = []
-        
-        self._message_buffer[conversation_id].extend(messages)
-        
-        # Check buffer size (process if buffer has enough messages)
-        # settings.memory_buffer_size defaults to 5
-        if len(self._message_buffer[conversation_id]) < settings.memory_buffer_size:
-            logger.info(f"Buffered messages for conversation {conversation_id}. Current size: {len(self._message_buffer[conversation_id])}")
-            return {"entities_count": 0, "relations_count": 0}
-        
-        # Process buffered messages
-        messages_to_process = self._message_buffer[conversation_id]
-        # Clear buffer immediately to avoid race conditions (simple approach)
-        self._message_buffer[conversation_id] = []
+        segment = self.buffer_messages(conversation_id, messages, user_id, character_id)
+        if segment is None:
+            return {"job_id": None, "status": "buffered", "entities_count": 0, "relations_count": 0}
+        job = await self.submit_segment(segment)
+        if wait:
+            await job.done
+        return job.result()
+    
+    # --- pipeline stages ----------------------------------------------------
+    
+    async def _extract_job(self, job: MemoryJob) -> Tuple[Optional[TurnExtraction], Optional[EntityEmbeddings]]:
+        return await self.extract_segment(
+            self.messages_to_text(job.segment.messages), job.user_id, job.conversation_id
+        )
+    
+    async def _embed_job(self, job: MemoryJob) -> None:
+        entities, relations = await self.embed_extraction(job.extraction, job.embeddings)
+        job.entities, job.relations = await self.canonicalize(job.user_id, entities, relations)
+    
+    async def _write_jobs(self, user_id: str, jobs: List[MemoryJob]) -> None:
+        """
+        One graph transaction for the user's jobs, then their relational
+        signals. On a retry, jobs whose graph write or signals already
+        committed skip that step.
+        """
+        pending = [job for job in jobs if not job.written and (job.entities or job.relations)]
+        if pending:
+            await self.write_graph_batch(
+                user_id,
+                [
+                    {
+                        "id": job.conversation_id,
+                        "character_id": job.character_id,
+                        "message_count": len(job.segment.messages),
+                    }
+                    for job in pending
+                ],
+                [entity for job in pending for entity in job.entities],
+                [relation for job in pending for relation in job.relations],
+            )
+            logger.info(
+                f"Written {sum(len(job.entities) for job in pending)} entities and "
+                f"{sum(len(job.relations) for job in pending)} relations from {len(pending)} jobs to graph memory"
+            )
+        for job in jobs:
+            job.written = True
+        for job in jobs:
+            if job.signals_written:
+                continue
+            if job.extraction.preferences or job.extraction.observation:
+                await self.write_relational_signals(
+                    user_id=user_id,
+                    character_id=job.character_id,
+                    conversation_id=job.conversation_id,
+                    preferences=job.extraction.preferences,
+                    observation=job.extraction.observation,
+                )
+            job.signals_written = True
+    
+    def _finish_job(self, job: MemoryJob) -> None:
+        if job.embeddings is not None and job.status == "failed":
+            job.embeddings.cancel()
+        # A job whose extraction failed, or that ran out of retries on an unavailable
+        # store, stays journaled for replay
+        if job.status == "done" or not isinstance(job.error, (ExtractionError, *self.store.transient_errors)):
+            self.ack_segment(job.segment)
+        # The slot is released right after this hook; hand it to a requeued segment
+        if self.buffer.has_ready():
+            self._spawn(self._resubmit_ready())
+        if job.status == "done":
+            for listener in self._job_listeners:
+                listener(job)
+    
+    async def extract_segment(
+        self,
+        conversation_text: str,
+        user_id: str,
+        conversation_id: str
+    ) -> Tuple[TurnExtraction, Optional[EntityEmbeddings]]:
+        """
+        Run extraction for a buffered segment.
         
-        logger.info(f"Processing {len(messages_to_process)} buffered messages for conversation {conversation_id}")
+        With streaming extraction enabled, entity embeddings start as each
+        entity arrives and are returned for write_extraction to reuse;
+        otherwise the segment goes through the cross-conversation batch.
+        Raises ExtractionError when the extraction fails.
+        """
+        if not settings.extraction_streaming_enabled:
+            extraction = await extraction_scheduler.submit(conversation_text, user_id, conversation_id)
+            return extraction, None
         
-        # 1. Merge conversation text
-        conversation_text = "\n".join([
-            f"{msg.get('role', 'unknown')}: {msg.get('content', '')}" for msg in messages_to_process
-        ])
+        embeddings = EntityEmbeddings()
+        extraction = await turn_extractor.extract_streaming(conversation_text, user_id, embeddings.submit)
+        if extraction is None:
+            embeddings.cancel()
+            raise ExtractionError(f"Streaming extraction failed for conversation {conversation_id}")
+        return extraction, embeddings
+    
+    async def embed_extraction(
+        self,
+        extraction: TurnExtraction,
+        embeddings: Optional[EntityEmbeddings] = None
+    ) -> Tuple[List[dict], List[dict]]:
+        """
+        Entities above the score threshold with their embeddings, and the
+        relations, ready for write_graph.
         
-        # 2. Extract entities and relations
-        entities, relations = await self.extract_entities(conversation_text, user_id)
+        Args:
+            embeddings: Embeddings already started during streaming extraction
+        """
+        entities = [e.model_dump() for e in extraction.entities]
+        relations = [r.model_dump() for r in extraction.relations]
         
         # Filter by score (Double check, though prompt asks to filter)
         entities = [e for e in entities if e.get('score', 0) >= settings.memory_threshold_score]
         
         if not entities and not relations:
             logger.warning("No entities or relations extracted (or filtered by score)")
-            return {"entities_count": 0, "relations_count": 0}
+            return [], []
 
-        # 2.5 Generate Embeddings for Entities (Parallelized)
-        import asyncio
+        # 2.5 Generate Embeddings for Entities (Parallelized, reusing streamed ones)
+        embeddings = embeddings or EntityEmbeddings()
         
         async def compute_entity_embedding(entity):
-            text_to_embed = f"{entity.get('name', '')} {entity.get('type', '')} {json.dumps(entity.get('properties', {}), ensure_ascii=False)}"
-            embedding = await llm_service.get_embedding(text_to_embed)
-            entity['embedding'] = embedding
+            entity['embedding'] = await embeddings.get(entity)
             return entity
 
         # Batch process embeddings
         if entities:
             entities = await asyncio.gather(*[compute_entity_embedding(e) for e in entities])
+        return entities, relations
+    
+    async def write_extraction(
+        self,
+        user_id: str,
+        conversation_id: str,
+        extraction: TurnExtraction,
+        character_id: str = "epsilon",
+        message_count: int = 0,
+        embeddings: Optional[EntityEmbeddings] = None
+    ) -> Dict[str, int]:
+        """
+        Write extracted entities and relations to the graph store directly,
+        bypassing the pipeline
         
-        # 3. Write to Neo4j (using execute_write for transaction management)
-        with self.driver.session(database=self.database) as session:
-            def write_tx(tx):
-                """Transaction function: write all nodes and relations"""
-                now = datetime.now().isoformat()
-                
-                # Create/update user node
-                # Check if user exists first, then set properties accordingly
-                result = tx.run("""
-                    MATCH (u:User {id: $user_id})
-                    RETURN u
-                    LIMIT 1
-                """, user_id=user_id)
-                
-                if result.single():
-                    # User exists, update
-                    tx.run("""
-                        MATCH (u:User {id: $user_id})
-                        SET u.last_active = $now,
-                            u.updated_at = $now
-                    """, user_id=user_id, now=now)
-                else:
-                    # User doesn't exist, create with all properties
-                    tx.run("""
-                        CREATE (u:User {id: $user_id, created_at: $now, last_active: $now, updated_at: $now})
-                    """, user_id=user_id, now=now)
-                
-                # Create conversation node
-                # Check if conversation exists first
-                conv_result = tx.run("""
-                    MATCH (c:Conversation {id: $conversation_id})
-                    RETURN c
-                    LIMIT 1
-                """, conversation_id=conversation_id)
-                
-                if conv_result.single():
-                    # Conversation exists, update
-                    tx.run("""
-                        MATCH (c:Conversation {id: $conversation_id})
-                        SET c.message_count = $message_count,
-                            c.character_id = $character_id,
-                            c.updated_at = $now
-                    """, 
-                        conversation_id=conversation_id,
-                        message_count=len(messages),
-                        character_id=character_id,
-                        now=now
-                    )
-                else:
-                    # Conversation doesn't exist, create
-                    tx.run("""
-                        CREATE (c:Conversation {
-                            id: $conversation_id,
-                            created_at: $now,
-                            message_count: $message_count,
-                            character_id: $character_id,
-                            updated_at: $now
-                        })
-                    """, 
-                        conversation_id=conversation_id,
-                        message_count=len(messages),
-                        character_id=character_id,
-                        now=now
-                    )
-                
-                # Create relationship
-                rel_result = tx.run("""
-                    MATCH (u:User {id: $user_id})-[r:HAS_CONVERSATION]->(c:Conversation {id: $conversation_id})
-                    RETURN r
-                    LIMIT 1
-                """, user_id=user_id, conversation_id=conversation_id)
-                
-                if rel_result.single():
-                    # Relationship exists, update
-                    tx.run("""
-                        MATCH (u:User {id: $user_id})-[r:HAS_CONVERSATION]->(c:Conversation {id: $conversation_id})
-                        SET r.created_at = $now
-                    """, user_id=user_id, conversation_id=conversation_id, now=now)
-                else:
-                    # Relationship doesn't exist, create
-                    tx.run("""
-                        MATCH (u:User {id: $user_id})
-                        MATCH (c:Conversation {id: $conversation_id})
-                        CREATE (u)-[r:HAS_CONVERSATION {created_at: $now}]->(c)
-                    """, 
-                        user_id=user_id,
-                        conversation_id=conversation_id,
-                        now=now
-                    )
-                
-                # Create entity nodes (deduplicate, use Entity type+id as unique identifier)
-                for entity in entities:
-                    entity_id = entity.get('id')
-                    entity_type = entity.get('type', 'Entity')
-                    entity_name = entity.get('name', '')
-                    entity_props = entity.get('properties', {})
-                    
-                    # Entity properties preparation
-                    props_dict = {k: v for k, v in entity_props.items()}
-                    props_dict['id'] = entity_id
-                    props_dict['name'] = entity_name
-                    props_dict['type'] = entity_type
-                    props_dict['importance'] = entity.get('score', 0)  # Save score as importance
-                    props_dict['created_at'] = now
-                    props_dict['updated_at'] = now
-                    if entity.get('embedding'):
-                        props_dict['embedding'] = entity['embedding']
-
-                    # Check if entity exists first
-                    entity_result = tx.run(f"""
-                        MATCH (e:{entity_type} {{id: $id}})
-                        RETURN e
-                        LIMIT 1
-                    """, id=entity_id)
-                    
-                    if entity_result.single():
-                        # Entity exists, update
-                        set_clauses = [
-                            "e.name = $name",
-                            "e.type = $type",
-                            "e.importance = $importance",
-                            "e.updated_at = $updated_at"
-                        ]
-                        # Add property updates
-                        for k in entity_props.keys():
-                            set_clauses.append(f"e.{k} = ${k}")
-                        
-                        # Update embedding if new one exists
-                        if 'embedding' in props_dict:
-                            set_clauses.append("e.embedding = $embedding")
-                            
-                        set_clause_str = ", ".join(set_clauses)
-                        
-                        tx.run(f"""
-                            MATCH (e:{entity_type} {{id: $id}})
-                            SET {set_clause_str}
-                        """, **props_dict)
-                    else:
-                        # Entity doesn't exist, create
-                        # Build CREATE statement dynamically
-                        # Note: We need to handle embedding separately or ensure it's in props_dict
-                        
-                        # Prepare fields string
-                        fields = [f"{k}: ${k}" for k in props_dict.keys()]
-                        fields_str = ", ".join(fields)
-                        
-                        tx.run(f"""
-                            CREATE (e:{entity_type} {{{fields_str}}})
-                        """, **props_dict)
-                
-                # Create relations (deduplicate and merge)
-                for relation in relations:
-                    source_id = relation.get('source_id') or relation.get('source')
-                    target_id = relation.get('target_id') or relation.get('target')
-                    rel_type = relation.get('type', 'RELATED_TO')
-                    rel_props = relation.get('properties', {})
-                    
-                    # Check if relation exists
-                    rel_check = tx.run("""
-                        MATCH (a {id: $source_id})-[r:RELATION]->(b {id: $target_id})
-                        WHERE r.type = $rel_type
-                        RETURN r
-                        LIMIT 1
-                    """, 
-                        source_id=source_id,
-                        target_id=target_id,
-                        rel_type=rel_type
-                    )
-                    
-                    if rel_check.single():
-                        # Relation exists, update count and properties
-                        update_params = {
-                            'source_id': source_id,
-                            'target_id': target_id,
-                            'rel_type': rel_type,
-                            'now': now,
-                            **rel_props
-                        }
-                        
-                        # Get current count
-                        count_result = tx.run("""
-                            MATCH (a {id: $source_id})-[r:RELATION]->(b {id: $target_id})
-                            WHERE r.type = $rel_type
-                            RETURN COALESCE(r.count, 0) as current_count
-                        """, source_id=source_id, target_id=target_id, rel_type=rel_type)
-                        current_count = count_result.single()['current_count'] if count_result.single() else 0
-                        
-                        props_updates = []
-                        if rel_props:
-                            props_updates = [f"r.{k} = ${k}" for k in rel_props.keys()]
-                        props_updates.append("r.updated_at = $now")
-                        props_updates.append(f"r.count = {current_count + 1}")
-                        
-                        props_str = ', '.join(props_updates)
-                        tx.run(f"""
-                            MATCH (a {{id: $source_id}})-[r:RELATION]->(b {{id: $target_id}})
-                            WHERE r.type = $rel_type
-                            SET {props_str}
-                        """, **update_params)
-                    else:
-                        # Relation doesn't exist, create
-                        rel_props_dict = {
-                            'type': rel_type,
-                            'created_at': now,
-                            'updated_at': now,
-                            'count': 1,
-                            **rel_props
-                        }
-                        
-                        rel_props_str = ', '.join([f"{k}: ${k}" for k in rel_props_dict.keys()])
-                        params = {
-                            'source_id': source_id,
-                            'target_id': target_id,
-                            **rel_props_dict
-                        }
-                        tx.run(f"""
-                            MATCH (a {{id: $source_id}})
-                            MATCH (b {{id: $target_id}})
-                            CREATE (a)-[r:RELATION {{{rel_props_str}}}]->(b)
-                        """, **params)
-                
-                return len(entities), len(relations)
-            
-            # Execute transaction
-            entities_count, relations_count = session.execute_write(write_tx)
-            logger.info(f"Written {entities_count} entities and {relations_count} relations to Neo4j")
-            return {"entities_count": entities_count, "relations_count": relations_count}
+        Args:
+            embeddings: Embeddings already started during streaming extraction
+        
+        Returns:
+            Dict with entities_count and relations_count
+        """
+        if not self._initialized:
+            raise RuntimeError("MemoryService not initialized")
+        
+        entities, relations = await self.embed_extraction(extraction, embeddings)
+        if not entities and not relations:
+            return {"entities_count": 0, "relations_count": 0}
+        entities, relations = await self.canonicalize(user_id, entities, relations)
+        
+        # 3. Write to the graph store in one transaction
+        entities_count, relations_count = await self.write_graph(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            character_id=character_id,
+            message_count=message_count,
+            entities=entities,
+            relations=relations
+        )
+        logger.info(f"Written {entities_count} entities and {relations_count} relations to graph memory")
+        return {"entities_count": entities_count, "relations_count": relations_count}
+    
+    async def canonicalize(
+        self,
+        user_id: str,
+        entities: List[dict],
+        relations: List[dict]
+    ) -> Tuple[List[dict], List[dict]]:
+        """
+        Rewrite extracted entities onto the user's existing entities with the
+        same normalized name or a near-identical embedding, keeping the
+        extracted names and ids as aliases. On lookup failure the extraction
+        is written as is.
+        """
+        if not settings.entity_canonicalization_enabled or not entities:
+            return entities, relations
+        try:
+            candidates = await self.store.entity_candidates(
+                user_id,
+                list({normalize_name(e.get('name')) for e in entities} - {""}),
+                [e['embedding'] for e in entities if e.get('embedding')],
+                settings.entity_canonical_min_score,
+            )
+        except Exception as e:
+            logger.warning(f"Entity canonicalization lookup failed for {user_id}: {str(e)}")
+            return entities, relations
+        entities, relations, mapping = canonicalize(
+            entities, relations, candidates, settings.entity_canonical_min_score
+        )
+        if mapping:
+            logger.info(f"Canonicalized entities for {user_id}: {mapping}")
+        return entities, relations
+    
+    async def merge_duplicate_entities(self, user_id: str) -> int:
+        """
+        Offline pass over entities written before canonicalization (or that
+        slipped past it): merge the user's near-duplicate entities, backfill
+        name keys and recount the user's stats. Returns entities merged.
+        """
+        if not self._initialized:
+            return 0
+        merges, name_keys = find_duplicates(
+            await self.store.user_entities(user_id), settings.entity_canonical_min_score
+        )
+        if not merges and not name_keys:
+            return 0
+        merged = await self.store.merge_entities(user_id, merges, name_keys)
+        if merged:
+            await self.store.reconcile_graph_stats(user_id)
+            self.invalidate_snapshot(user_id)
+            logger.info(f"Merged {merged} duplicate entities for {user_id}")
+        return merged
+    
+    async def write_graph(
+        self,
+        user_id: str,
+        conversation_id: str,
+        character_id: str,
+        message_count: int,
+        entities: List[dict],
+        relations: List[dict]
+    ) -> Tuple[int, int]:
+        """
+        Upsert user, conversation, entities and relations, then patch the
+        user's snapshot with the committed write.
+        
+        Returns:
+            (entities_count, relations_count)
+        """
+        return await self.write_graph_batch(
+            user_id,
+            [{"id": conversation_id, "character_id": character_id, "message_count": message_count}],
+            entities,
+            relations,
+        )
+    
+    async def write_graph_batch(
+        self,
+        user_id: str,
+        conversations: List[dict],
+        entities: List[dict],
+        relations: List[dict]
+    ) -> Tuple[int, int]:
+        """write_graph for several of a user's conversations in one transaction"""
+        counts = await self.store.write_graph_batch(user_id, conversations, entities, relations)
+        
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None and not snapshot.apply_write(entities, relations):
+            self.invalidate_snapshot(user_id)
+        return counts
+    
+    async def get_snapshot(self, user_id: str) -> Optional[MemorySnapshot]:
+        """
+        The user's materialized memory subgraph, loading it on the first turn
+        of a session. None when snapshots are disabled or the subgraph is too
+        large, in which case retrieval queries the store.
+        """
+        if not settings.memory_snapshot_enabled or not self._initialized:
+            return None
+        
+        now = time.monotonic()
+        for stale_id in [
+            uid for uid, snap in self._snapshots.items()
+            if now - snap.last_used > settings.memory_snapshot_idle_seconds
+        ]:
+            self.invalidate_snapshot(stale_id)
+        
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            self._snapshots.move_to_end(user_id)
+            return snapshot
+        
+        lock = self._snapshot_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            if user_id in self._snapshots:
+                return self._snapshots[user_id]
+            try:
+                snapshot = await self.store.load_snapshot(user_id, settings.memory_snapshot_max_nodes)
+            except Exception as e:
+                logger.warning(f"Failed to load memory snapshot for {user_id}: {str(e)}")
+                return None
+            if snapshot is None:
+                return None
+            self._snapshots[user_id] = snapshot
+            while len(self._snapshots) > settings.memory_snapshot_max_users:
+                self.invalidate_snapshot(next(iter(self._snapshots)))
+            return snapshot
+    
+    def invalidate_snapshot(self, user_id: str) -> None:
+        """Drop a user's snapshot; the next turn reloads it from the store"""
+        self._snapshots.pop(user_id, None)
+        self._snapshot_locks.pop(user_id, None)
     
     async def query_related_context(
         self,
@@ -493,9 +606,13 @@ class MemoryService:
         query_text: str,
         limit: int = 10,
         include_relational: bool = True,
+        token_counter: Optional[TokenCounter] = None,
+        token_budget: Optional[int] = None,
     ) -> str:
         """
-        Query related context using Hybrid Search (Vector + Graph)
+        Query related context using Hybrid Search (Vector + Graph).
+        With a token_counter, only the lines that fit token_budget (default
+        the context memory ceiling) are kept, best ranked first.
         """
         if not self._initialized:
             return ""
@@ -504,121 +621,25 @@ class MemoryService:
         query_embedding = await llm_service.get_embedding(query_text)
         
         # 2. Extract keywords as fallback/filter
-        keywords = self._extract_keywords(query_text)
+        keywords = extract_keywords(query_text)
         
-        # 3. Hybrid Retrieval Strategy
-        with self.driver.session(database=self.database) as session:
-            def read_tx(tx):
-                context_nodes = []
-                
-                # A. Vector Search (Semantic Recall)
-                if query_embedding:
-                    try:
-                        # Query vector index
-                        # Find top similar entities
-                        vector_query = """
-                        CALL db.index.vector.queryNodes('entity_embedding_index', $k, $embedding)
-                        YIELD node, score
-                        WHERE score > 0.7  // Similarity threshold
-                        RETURN node.id as id, node.name as name, node.type as type, score
-                        """
-                        vector_result = tx.run(vector_query, k=5, embedding=query_embedding)
-                        vector_nodes = [record.data() for record in vector_result]
-                        context_nodes.extend(vector_nodes)
-                    except Exception as e:
-                        logger.warning(f"Vector search failed: {e}")
-                
-                # B. Keyword Search (Lexical Recall) - if vector search returns few results
-                if len(context_nodes) < 3:
-                     keyword_query = """
-                     MATCH (e:Entity)
-                     WHERE (
-                         ANY(keyword IN $keywords WHERE 
-                             e.name CONTAINS keyword OR 
-                             e.type CONTAINS keyword
-                         )
-                         OR e.name IN $keywords
-                     )
-                     RETURN e.id as id, e.name as name, e.type as type, 1.0 as score
-                     LIMIT $limit
-                     """
-                     keyword_result = tx.run(keyword_query, keywords=keywords, limit=limit)
-                     keyword_nodes = [record.data() for record in keyword_result]
-                     context_nodes.extend(keyword_nodes)
-                
-                # Deduplicate nodes by ID
-                seen_ids = set()
-                unique_nodes = []
-                for n in context_nodes:
-                    if n['id'] not in seen_ids:
-                        unique_nodes.append(n)
-                        seen_ids.add(n['id'])
-                
-                # C. Graph Traversal (Context Expansion)
-                # For each relevant node, find 1-hop related information
-                expanded_context = []
-                
-                for node in unique_nodes[:limit]: # Process top nodes
-                    node_id = node['id']
-                    
-                    # Find related entities (1-hop)
-                    # We look for relationships from User to this node, OR this node to others
-                    traversal_query = """
-                    MATCH (e {id: $node_id})
-                    // Incoming from User (Direct relevance)
-                    OPTIONAL MATCH (u:User {id: $user_id})-[r1]->(e)
-                    
-                    // Outgoing to others (Context)
-                    OPTIONAL MATCH (e)-[r2]->(related)
-                    
-                    RETURN 
-                        e.name as entity_name, 
-                        e.type as entity_type,
-                        type(r1) as user_rel,
-                        type(r2) as out_rel,
-                        related.name as related_name,
-                        related.type as related_type
-                    LIMIT 5
-                    """
-                    t_result = tx.run(traversal_query, node_id=node_id, user_id=user_id)
-                    
-                    for rec in t_result:
-                        e_name = rec['entity_name']
-                        e_type = rec['entity_type']
-                        user_rel = rec['user_rel']
-                        out_rel = rec['out_rel']
-                        rel_name = rec['related_name']
-                        
-                        if user_rel:
-                            expanded_context.append(f"用户与 {e_type} '{e_name}' 的关系: {user_rel}")
-                        if out_rel and rel_name:
-                            expanded_context.append(f"{e_type} '{e_name}' {out_rel} {rel_name}")
-
-                if include_relational:
-                    relational_query = """
-                    MATCH (p:UserPreference {user_id: $user_id})
-                    RETURN p.preference_key as key, p.preference_value as value
-                    ORDER BY p.observed_at DESC
-                    LIMIT 5
-                    """
-                    for rec in tx.run(relational_query, user_id=user_id):
-                        expanded_context.append(
-                            f"user preference: {rec['key']} = {rec['value']}"
-                        )
-
-                    obs_query = """
-                    MATCH (o:CharacterObservation {user_id: $user_id})
-                    RETURN o.content as content
-                    ORDER BY o.observed_at DESC
-                    LIMIT 3
-                    """
-                    for rec in tx.run(obs_query, user_id=user_id):
-                        expanded_context.append(f"character observation: {rec['content']}")
-
-                return list(set(expanded_context)) # Remove duplicates
-
-            context_list = session.execute_read(read_tx)
-            return "\n".join(context_list) if context_list else ""
+        # Local retrieval when the user's subgraph is materialized in-process
+        snapshot = await self.get_snapshot(user_id)
+        if snapshot is not None:
+            context_list = snapshot.context(
+                query_embedding, keywords, limit, include_relational, on_recall=self.access.record
+            )
+        else:
+            # 3. Hybrid Retrieval Strategy
+            context_list = await self.store.related_context(
+                user_id, query_embedding, keywords, limit, include_relational, on_recall=self.access.record
+            )
+        
+        # 4. Fit the memory ceiling
+        if token_counter is not None and context_list:
+            budget = settings.context_memory_ceiling if token_budget is None else token_budget
+            context_list = pack_lines(context_list, token_counter, budget)
+        return "\n".join(context_list) if context_list else ""
 
     async def write_relational_signals(
         self,
@@ -628,72 +649,19 @@ class MemoryService:
         preferences: Optional[Dict[str, str]] = None,
         observation: str = "",
     ) -> None:
-        """Write preference/observation relational signals into Neo4j."""
-        if not self._initialized or not self.driver:
+        """Write preference/observation relational signals into the graph."""
+        if not self._initialized:
             return
 
         preferences = preferences or {}
         now = datetime.now().isoformat()
-        with self.driver.session(database=self.database) as session:
-            def write_tx(tx):
-                for key, value in preferences.items():
-                    pref_id = f"pref_{user_id}_{character_id}_{key}"
-                    tx.run(
-                        """
-                        MERGE (p:UserPreference {id: $pref_id})
-                        SET p.user_id = $user_id,
-                            p.character_id = $character_id,
-                            p.preference_key = $key,
-                            p.preference_value = $value,
-                            p.confidence = 0.8,
-                            p.observed_at = $now,
-                            p.source_conversation = $conversation_id
-                        WITH p
-                        MATCH (u:User {id: $user_id})
-                        MERGE (u)-[:HAS_PREFERENCE]->(p)
-                        """,
-                        pref_id=pref_id,
-                        user_id=user_id,
-                        character_id=character_id,
-                        key=key,
-                        value=str(value),
-                        now=now,
-                        conversation_id=conversation_id,
-                    )
+        await self.store.write_relational_signals(
+            user_id, character_id, conversation_id, preferences, observation, now
+        )
 
-                if observation:
-                    obs_id = f"obs_{user_id}_{character_id}_{int(datetime.now().timestamp())}"
-                    tx.run(
-                        """
-                        MERGE (o:CharacterObservation {id: $obs_id})
-                        SET o.user_id = $user_id,
-                            o.character_id = $character_id,
-                            o.content = $content,
-                            o.observed_at = $now,
-                            o.source_conversation = $conversation_id
-                        WITH o
-                        MERGE (c:Character {id: $character_id})
-                        MERGE (u:User {id: $user_id})
-                        MERGE (c)-[:OBSERVED]->(o)
-                        MERGE (o)-[:ABOUT]->(u)
-                        """,
-                        obs_id=obs_id,
-                        user_id=user_id,
-                        character_id=character_id,
-                        content=observation,
-                        now=now,
-                        conversation_id=conversation_id,
-                    )
-            session.execute_write(write_tx)
-    
-    def _extract_keywords(self, text: str) -> List[str]:
-        """Simple keyword extraction (can be optimized with LLM)"""
-        # Remove punctuation, tokenize
-        words = re.findall(r'\w+', text.lower())
-        # Filter stop words
-        stop_words = {'的', '了', '是', '在', '我', '你', '他', '她', '它', '这', '那', 'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'should', 'could', 'may', 'might', 'can', 'must'}
-        keywords = [w for w in words if w not in stop_words and len(w) > 1]
-        return keywords[:5]  # Return top 5 keywords
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            snapshot.apply_signals(preferences, observation, character_id, now)
     
     async def query_graph(
         self,
@@ -706,130 +674,39 @@ class MemoryService:
         """Query graph data (for visualization)"""
         if not self._initialized:
             return {"nodes": [], "links": []}
-        
-        with self.driver.session(database=self.database) as session:
-            def read_tx(tx):
-                nodes = []
-                node_ids = set()
-                links = []
-                
-                # Build entity type filter
-                entity_type_filter = ""
-                if entity_types:
-                    entity_type_list = "', '".join(entity_types)
-                    entity_type_filter = f"AND e.type IN ['{entity_type_list}']"
-                
-                # Query nodes (using dynamic label matching)
-                node_query = f"""
-                MATCH (u:User {{id: $user_id}})
-                MATCH path = (u)-[*1..{depth}]-(e)
-                WHERE e.id IS NOT NULL {entity_type_filter}
-                WITH DISTINCT e
-                LIMIT $limit
-                RETURN e.id as id, 
-                       labels(e) as labels,
-                       COALESCE(e.name, '') as name, 
-                       COALESCE(e.type, labels(e)[0], 'Entity') as type,
-                       properties(e) as properties
-                """
-                
-                node_result = tx.run(node_query, user_id=user_id, limit=limit)
-                
-                for record in node_result:
-                    node_id = record['id']
-                    if node_id and node_id not in node_ids:
-                        node_labels = record['labels']
-                        node_type = record.get('type') or (node_labels[0] if node_labels else 'Entity')
-                        nodes.append({
-                            "id": node_id,
-                            "label": record.get('name') or node_id,
-                            "type": node_type,
-                            "properties": record.get('properties') or {}
-                        })
-                        node_ids.add(node_id)
-                
-                # Query relations (using RELATION type with type property)
-                rel_type_filter = ""
-                if relation_types:
-                    rel_type_list = "', '".join(relation_types)
-                    rel_type_filter = f"AND r.type IN ['{rel_type_list}']"
-                
-                rel_query = f"""
-                MATCH (u:User {{id: $user_id}})
-                MATCH path = (u)-[*1..{depth}]-(e)
-                WHERE e.id IS NOT NULL
-                UNWIND relationships(path) as r
-                WITH r
-                WHERE r IS NOT NULL AND type(r) = 'RELATION' {rel_type_filter}
-                WITH DISTINCT startNode(r) as source, endNode(r) as target, r.type as rel_type
-                WHERE source.id IS NOT NULL AND target.id IS NOT NULL
-                LIMIT $limit
-                RETURN source.id as source_id, 
-                       target.id as target_id, 
-                       rel_type as type
-                """
-                
-                rel_result = tx.run(rel_query, user_id=user_id, limit=limit)
-                
-                for record in rel_result:
-                    source_id = record['source_id']
-                    target_id = record['target_id']
-                    if source_id in node_ids and target_id in node_ids:
-                        links.append({
-                            "source": source_id,
-                            "target": target_id,
-                            "type": record['type']
-                        })
-                
-                return {"nodes": nodes, "links": links}
-            
-            return session.execute_read(read_tx)
+        return await self.store.query_graph(user_id, entity_types, relation_types, depth, limit)
+
+    async def graph_view(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]] = None,
+        relation_types: Optional[List[str]] = None,
+        depth: int = 2,
+        limit: int = 500,
+        order: str = "degree",
+        cursor: Optional[str] = None,
+        properties: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Paged columnar graph view, most connected (or most important) nodes
+        first. Raises ValueError for an unknown order or a malformed cursor.
+        """
+        if order not in VIEW_ORDERS:
+            raise ValueError(f"Unknown graph view order: {order}")
+        after = decode_cursor(cursor)
+        properties = visible_properties(properties)
+        if not self._initialized:
+            return build_view([], [], 0, order, limit, properties)
+        page = await self.store.graph_view(
+            user_id, entity_types, relation_types, depth, limit, order, after, properties
+        )
+        return build_view(page["nodes"], page["links"], page["total"], order, limit, properties)
     
     async def get_node_details(self, node_id: str) -> Optional[Dict]:
         """Get node details"""
         if not self._initialized:
             return None
-        
-        with self.driver.session(database=self.database) as session:
-            def read_tx(tx):
-                result = tx.run("""
-                    MATCH (n {id: $node_id})
-                    OPTIONAL MATCH (n)<-[r1]-(source)
-                    OPTIONAL MATCH (n)-[r2]->(target)
-                    RETURN n, 
-                           labels(n) as labels,
-                           collect(DISTINCT {
-                               source: source.id, 
-                               source_name: source.name,
-                               type: type(r1), 
-                               properties: properties(r1)
-                           }) as incoming,
-                           collect(DISTINCT {
-                               target: target.id,
-                               target_name: target.name,
-                               type: type(r2), 
-                               properties: properties(r2)
-                           }) as outgoing
-                """, node_id=node_id)
-                
-                record = result.single()
-                if not record:
-                    return None
-                
-                node = record['n']
-                labels = record['labels']
-                node_type = node.get('type') or (labels[0] if labels else 'Entity')
-                
-                return {
-                    "id": node['id'],
-                    "type": node_type,
-                    "name": node.get('name', ''),
-                    "properties": dict(node),
-                    "incoming_relations": [r for r in record['incoming'] if r.get('source')],
-                    "outgoing_relations": [r for r in record['outgoing'] if r.get('target')]
-                }
-            
-            return session.execute_read(read_tx)
+        return await self.store.get_node_details(node_id)
     
     async def get_graph_stats(self, user_id: str) -> Dict[str, Any]:
         """Get graph statistics"""
@@ -840,63 +717,178 @@ class MemoryService:
                 "node_types": {},
                 "relation_types": {}
             }
-        
-        with self.driver.session(database=self.database) as session:
-            def read_tx(tx):
-                # Node statistics (by label)
-                node_stats_query = """
-                MATCH (u:User {id: $user_id})
-                MATCH (u)-[*]->(e)
-                WHERE e.id IS NOT NULL
-                UNWIND labels(e) as label
-                RETURN label as type, count(DISTINCT e) as count
-                """
-                node_result = tx.run(node_stats_query, user_id=user_id)
-                
-                node_types = {}
-                total_nodes = 0
-                for record in node_result:
-                    node_type = record['type']
-                    count = record['count']
-                    node_types[node_type] = count
-                    total_nodes += count
-                
-                # Relation statistics
-                rel_stats_query = """
-                MATCH (u:User {id: $user_id})
-                MATCH (u)-[*]->(e)
-                WHERE e.id IS NOT NULL
-                MATCH path = (u)-[*]-(e)
-                UNWIND relationships(path) as r
-                WITH r
-                WHERE r IS NOT NULL
-                RETURN type(r) as type, count(DISTINCT r) as count
-                """
-                rel_result = tx.run(rel_stats_query, user_id=user_id)
-                
-                relation_types = {}
-                total_relations = 0
-                for record in rel_result:
-                    rel_type = record['type']
-                    count = record['count']
-                    relation_types[rel_type] = count
-                    total_relations += count
-                
-                return {
-                    "total_nodes": total_nodes,
-                    "total_relations": total_relations,
-                    "node_types": node_types,
-                    "relation_types": relation_types
-                }
-            
-            return session.execute_read(read_tx)
-    
-    def close(self):
+        return await self.store.get_graph_stats(user_id)
+    
+    async def reconcile_graph_stats(self) -> int:
+        """
+        Merge duplicate entities of users active since their last
+        reconciliation and recount their graph stats, correcting counter
+        drift. Returns the number of users.
+        """
+        if not self._initialized:
+            return 0
+        users = await self.store.stale_stats_users()
+        for user_id in users:
+            try:
+                merged = 0
+                if settings.entity_canonicalization_enabled:
+                    merged = await self.merge_duplicate_entities(user_id)
+                if not merged:
+                    await self.store.reconcile_graph_stats(user_id)
+            except Exception as e:
+                logger.warning(f"Graph stats reconciliation failed for {user_id}: {str(e)}")
+        return len(users)
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.graph_stats_reconcile_seconds)
+            try:
+                started = time.perf_counter()
+                count = await self.reconcile_graph_stats()
+                if count:
+                    logger.info(
+                        f"Reconciled graph stats for {count} users in {time.perf_counter() - started:.1f}s"
+                    )
+            except Exception as e:
+                logger.error(f"Graph stats reconciliation error: {str(e)}")
+
+    async def flush_access(self) -> int:
+        """Write recalls counted since the last flush to the store; returns entities updated"""
+        self._access_flushed_at = time.monotonic()
+        rows = self.access.drain()
+        if not rows or not self._initialized:
+            return 0
+        try:
+            await self.store.record_access(rows)
+        except Exception as e:
+            self.access.restore(rows)
+            logger.warning(f"Failed to record memory access for {len(rows)} entities: {str(e)}")
+            return 0
+        return len(rows)
+    
+    async def compact_user(self, user_id: str) -> Dict[str, Any]:
+        """
+        Archive (or prune) the user's coldest memory nodes: entities only the
+        user reaches, preferences and observations whose decayed importance
+        fell below the threshold, up to the per-user budget, in batches.
+        Archived nodes are exported with their relations before deletion.
+        """
+        result = {"user_id": user_id, "scanned": 0, "archived": 0, "pruned": 0}
+        if not self._initialized:
+            return result
+        await self.flush_access()
+        budget = settings.memory_compaction_user_budget
+        rows = await self.store.decay_candidates(user_id, budget * COMPACTION_SCAN_FACTOR)
+        cold = select_cold(
+            rows,
+            time.time(),
+            settings.memory_decay_half_life_days,
+            settings.memory_decay_min_importance,
+            settings.memory_decay_min_age_days,
+            budget,
+        )
+        result["scanned"] = len(rows)
+        archive = settings.memory_compaction_mode != "prune"
+        batch_size = max(1, settings.memory_compaction_batch_size)
+        try:
+            for start in range(0, len(cold), batch_size):
+                batch = cold[start:start + batch_size]
+                node_ids = [row["id"] for row in batch]
+                if not archive:
+                    result["pruned"] += await self.store.delete_nodes(node_ids)
+                    continue
+                self.archive.store(
+                    user_id, await self.store.export_nodes(node_ids), {row["id"]: row["decayed"] for row in batch}
+                )
+                try:
+                    result["archived"] += await self.store.delete_nodes(node_ids)
+                except Exception:
+                    self.archive.delete(user_id, node_ids)
+                    raise
+        finally:
+            if result["archived"] or result["pruned"]:
+                await self.store.reconcile_graph_stats(user_id)
+                self.invalidate_snapshot(user_id)
+        await self.store.mark_compacted(user_id, datetime.now().isoformat())
+        if cold:
+            logger.info(
+                f"Compacted memory for {user_id}: {result['archived']} archived, "
+                f"{result['pruned']} pruned of {len(rows)} candidates"
+            )
+        return result
+    
+    async def compact_memory(self) -> Dict[str, int]:
+        """One compaction run over the least recently compacted users"""
+        totals = {"users": 0, "archived": 0, "pruned": 0}
+        if not self._initialized:
+            return totals
+        for user_id in await self.store.compaction_users(settings.memory_compaction_users_per_run):
+            try:
+                result = await self.compact_user(user_id)
+            except Exception as e:
+                logger.warning(f"Memory compaction failed for {user_id}: {str(e)}")
+                continue
+            totals["users"] += 1
+            totals["archived"] += result["archived"]
+            totals["pruned"] += result["pruned"]
+        return totals
+    
+    def list_archived(self, user_id: str, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        return self.archive.list_nodes(user_id, limit, offset)
+    
+    async def restore_archived(self, user_id: str, node_ids: Optional[List[str]] = None) -> int:
+        """
+        Write archived nodes (all of the user's without node_ids) back with
+        their relations to nodes that still exist. Restoring counts as a
+        recall, so the next run does not archive them again straight away.
+        Returns nodes restored; ones re-created since the archive are kept.
+        """
+        if not self._initialized:
+            return 0
+        nodes = self.archive.load(user_id, node_ids)
+        if not nodes:
+            return 0
+        now = datetime.now().isoformat()
+        for node in nodes:
+            node.setdefault("properties", {})["last_accessed_at"] = now
+        restored = await self.store.import_nodes(nodes)
+        self.archive.delete(user_id, [node["id"] for node in nodes])
+        await self.store.reconcile_graph_stats(user_id)
+        self.invalidate_snapshot(user_id)
+        logger.info(f"Restored {restored} archived memory nodes for {user_id}")
+        return restored
+    
+    async def _compaction_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.memory_compaction_seconds)
+            try:
+                started = time.perf_counter()
+                totals = await self.compact_memory()
+                if totals["archived"] or totals["pruned"]:
+                    logger.info(
+                        f"Memory compaction: {totals['archived']} archived, {totals['pruned']} pruned "
+                        f"across {totals['users']} users in {time.perf_counter() - started:.1f}s"
+                    )
+            except Exception as e:
+                logger.error(f"Memory compaction error: {str(e)}")
+    
+    async def close(self):
         """Close connection"""
-        if self.driver:
-            self.driver.close()
+        if self._buffer_task is not None:
+            self._buffer_task.cancel()
+            self._buffer_task = None
+        await self.pipeline.stop()
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+            self._compaction_task = None
+        if self._initialized:
+            await self.flush_access()
+            await self.store.close()
             self._initialized = False
-            logger.info("Neo4j connection closed")
+            logger.info(f"Graph memory store closed ({self.store.name})")
 
 
 # Global Memory Service instance
@@ -908,7 +900,7 @@ def get_memory_service() -> Optional[MemoryService]:
     return memory_service
 
 
-def initialize_memory_service():
+async def initialize_memory_service():
     """Initialize Memory Service"""
     global memory_service
     
@@ -916,20 +908,27 @@ def initialize_memory_service():
         logger.info("Graph memory is disabled, skipping initialization")
         return None
     
-    if not settings.neo4j_password:
+    if settings.graph_memory_backend != "local" and not settings.neo4j_password:
         logger.warning("NEO4J_PASSWORD not configured, skipping memory service initialization")
         return None
     
     try:
-        memory_service = MemoryService(
-            uri=settings.neo4j_uri,
-            user=settings.neo4j_user,
-            password=settings.neo4j_password,
-            database=settings.neo4j_database
-        )
-        memory_service.initialize()
+        memory_service = MemoryService(create_graph_store())
+        await memory_service.initialize()
+        logger.info(f"Graph memory backend: {memory_service.store.name}")
         return memory_service
     except Exception as e:
         logger.error(f"Failed to initialize memory service: {str(e)}")
         return None
 
+
+def create_graph_store() -> GraphStore:
+    """GraphStore for settings.graph_memory_backend"""
+    if settings.graph_memory_backend == "local":
+        return LocalGraphStore(settings.local_graph_path)
+    return Neo4jGraphStore(
+        uri=settings.neo4j_uri,
+        user=settings.neo4j_user,
+        password=settings.neo4j_password,
+        database=settings.neo4j_database
+    )
@@ -0,0 +1,241 @@
+"""
+In-process snapshot of one user's memory subgraph.
+
+Loaded from Neo4j once per session, then queried locally: entities are held
+as parallel id/name/type/importance arrays, outgoing relations as a CSR
+adjacency pre-sorted by the expansion ranking, and embeddings as a
+row-normalised matrix, so recall, reranking and 1-hop expansion are NumPy
+operations instead of network round trips. Committed writes are patched in;
+patches only touch the dict-backed store and the arrays are rebuilt on the
+next read.
+"""
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.keywords import name_terms
+from app.services.memory_rerank import (
+    CANDIDATES,
+    MIN_SIMILARITY,
+    lexical_relevance,
+    mmr,
+    scores,
+    term_sets,
+    vector_relevance,
+)
+
+# Nearest entities looked up per embedding (canonicalization candidates)
+VECTOR_TOP_K = 5
+NEIGHBORS_PER_NODE = 5
+
+
+def context_lines(e_name: str, e_type: str, user_rels: List[str], neighbors: List[dict]) -> List[str]:
+    """Context lines for one recalled entity; shared with the Neo4j expansion query."""
+    lines = [f"用户与 {e_type} '{e_name}' 的关系: {user_rel}" for user_rel in user_rels]
+    lines.extend(f"{e_type} '{e_name}' {n['rel']} {n['name']}" for n in neighbors)
+    return lines
+
+
+class MemorySnapshot:
+    """A user's entities, relations, preferences and observations, queried in-process."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.loaded_at = time.monotonic()
+        self.last_used = self.loaded_at
+        self.nodes: Dict[str, dict] = {}                           # id -> {name, type, importance, embedding, aliases, seen_at, ...}
+        self.edges: Dict[Tuple[str, str, str], int] = {}           # (source, rel type, target) -> count
+        self.user_rels: Dict[str, List[str]] = {}                  # entity id -> user relation types
+        self.preferences: Dict[str, Tuple[str, str, str]] = {}     # id -> (key, value, observed_at)
+        self.observations: List[Tuple[str, str]] = []              # (observed_at, content)
+        self._compiled = False
+
+    # --- store -------------------------------------------------------------
+
+    def add_node(self, node_id: str, name: Optional[str], node_type: Optional[str],
+                 importance: Optional[float] = None, embedding: Optional[List[float]] = None,
+                 aliases: Optional[List[str]] = None, seen_at: Optional[float] = None) -> None:
+        """seen_at: epoch seconds of the node's last write or recall"""
+        node = self.nodes.setdefault(node_id, {
+            "name": None, "type": None, "importance": 0, "embedding": None, "aliases": [], "seen_at": None,
+        })
+        if name is not None:
+            node["name"] = name
+        if node_type is not None:
+            node["type"] = node_type
+        if importance is not None:
+            node["importance"] = importance
+        if embedding:
+            node["embedding"] = embedding
+        if aliases is not None:
+            node["aliases"] = list(aliases)
+        if seen_at is not None:
+            node["seen_at"] = max(seen_at, node["seen_at"] or seen_at)
+        node["terms"] = name_terms(node["name"], node["aliases"])
+        node["term_sets"] = term_sets(node["name"], node["aliases"])
+        self._compiled = False
+
+    def add_edge(self, source_id: str, rel_type: str, target_id: str, count: int = 1) -> None:
+        if source_id == self.user_id:
+            rels = self.user_rels.setdefault(target_id, [])
+            if rel_type not in rels:
+                rels.append(rel_type)
+        else:
+            key = (source_id, rel_type, target_id)
+            self.edges[key] = self.edges.get(key, 0) + count
+        self._compiled = False
+
+    def knows(self, node_id: str) -> bool:
+        return node_id == self.user_id or node_id in self.nodes
+
+    def apply_write(self, entities: List[dict], relations: List[dict]) -> bool:
+        """
+        Patch in a committed write_graph call.
+        Returns False when a relation touches a node outside the snapshot, in
+        which case the caller should drop the snapshot and reload it.
+        """
+        now = time.time()
+        for entity in entities:
+            self.add_node(
+                entity.get("id"), entity.get("name", ""), entity.get("type", "Entity"),
+                entity.get("score", 0), entity.get("embedding"),
+                (entity.get("properties") or {}).get("aliases"), now,
+            )
+        for relation in relations:
+            source = relation.get("source_id") or relation.get("source")
+            target = relation.get("target_id") or relation.get("target")
+            if not (self.knows(source) and self.knows(target)):
+                return False
+            self.add_edge(source, relation.get("type", "RELATED_TO"), target)
+        return True
+
+    def apply_signals(self, preferences: Dict[str, str], observation: str, character_id: str, observed_at: str) -> None:
+        for key, value in preferences.items():
+            self.preferences[f"pref_{self.user_id}_{character_id}_{key}"] = (key, str(value), observed_at)
+        if observation:
+            self.observations.append((observed_at, observation))
+
+    # --- compiled arrays ---------------------------------------------------
+
+    def _compile(self) -> None:
+        self.ids = list(self.nodes)
+        self.index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.names = [self.nodes[i]["name"] for i in self.ids]
+        self.types = [self.nodes[i]["type"] for i in self.ids]
+        self.importance = np.array([self.nodes[i]["importance"] or 0 for i in self.ids], dtype=np.float32)
+        self.seen_at = np.array([
+            np.nan if self.nodes[i]["seen_at"] is None else self.nodes[i]["seen_at"] for i in self.ids
+        ], dtype=np.float64)
+        postings: Dict[str, List[int]] = {}
+        for i, node_id in enumerate(self.ids):
+            for term in self.nodes[node_id]["terms"]:
+                postings.setdefault(term, []).append(i)
+        self.term_index = {term: np.array(rows, dtype=np.int32) for term, rows in postings.items()}
+        self.id_rank = np.empty(len(self.ids), dtype=np.int32)
+        self.id_rank[sorted(range(len(self.ids)), key=self.ids.__getitem__)] = np.arange(len(self.ids))
+
+        dims = {len(n["embedding"]) for n in self.nodes.values() if n["embedding"]}
+        dim = max(dims) if dims else 0
+        self.embeddings = np.zeros((len(self.ids), dim), dtype=np.float32)
+        for i, node_id in enumerate(self.ids):
+            vector = self.nodes[node_id]["embedding"]
+            if vector and len(vector) == dim:
+                self.embeddings[i] = vector
+        norms = np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        np.divide(self.embeddings, norms, out=self.embeddings, where=norms > 0)
+
+        # CSR over outgoing relations, each row ordered like the Neo4j expansion:
+        # relation count desc, neighbor importance desc, neighbor id
+        rows: List[List[Tuple[int, int, str]]] = [[] for _ in self.ids]
+        for (source, rel_type, target), count in self.edges.items():
+            s, t = self.index.get(source), self.index.get(target)
+            if s is None or t is None or self.names[t] is None:
+                continue
+            rows[s].append((count, t, rel_type))
+        self.indptr = np.zeros(len(self.ids) + 1, dtype=np.int32)
+        indices: List[int] = []
+        self.edge_types: List[str] = []
+        for s, row in enumerate(rows):
+            row.sort(key=lambda e: (-e[0], -self.importance[e[1]], self.ids[e[1]]))
+            indices.extend(t for _, t, _ in row)
+            self.edge_types.extend(rel_type for _, _, rel_type in row)
+            self.indptr[s + 1] = len(indices)
+        self.indices = np.array(indices, dtype=np.int32)
+        # Relations within the snapshot, both directions, plus those from the user
+        self.degree = (
+            np.diff(self.indptr) + np.bincount(self.indices, minlength=len(self.ids))
+            + np.array([len(self.user_rels.get(i, ())) for i in self.ids], dtype=np.int64)
+        ).astype(np.float32)
+        self._compiled = True
+
+    # --- retrieval ---------------------------------------------------------
+
+    def recall(self, query_embedding: Optional[List[float]], keywords: List[str], limit: int) -> List[int]:
+        """
+        Node indices to expand, best first: the vector neighbors above the
+        similarity floor and the nodes sharing most terms with the keywords
+        (then importance, id), reranked like GraphStore.related_context.
+        """
+        if not self._compiled:
+            self._compile()
+        pool: List[int] = []
+        similarity = None
+        if query_embedding and self.embeddings.shape[1] == len(query_embedding) and len(self.ids):
+            query = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                similarity = (1 + self.embeddings @ (query / norm)) / 2
+                k = min(CANDIDATES, len(similarity))
+                top = np.argpartition(-similarity, k - 1)[:k]
+                pool.extend(top[similarity[top] > MIN_SIMILARITY].tolist())
+
+        counts = np.zeros(len(self.ids), dtype=np.int32)
+        for term in set(keywords):
+            rows = self.term_index.get(term)
+            if rows is not None:
+                counts[rows] += 1
+        matched = np.flatnonzero(counts)
+        ranked = matched[np.lexsort((self.id_rank[matched], -self.importance[matched], -counts[matched]))]
+        pool.extend(ranked[:CANDIDATES].tolist())
+
+        # Ordered by id so ties break as in the stores
+        pool = np.unique(np.array(pool, dtype=np.int64))
+        pool = pool[np.argsort(self.id_rank[pool])]
+        if not len(pool):
+            return []
+        relevance = lexical_relevance(keywords, [self.nodes[self.ids[i]]["term_sets"] for i in pool])
+        vectors = self.embeddings[pool]
+        if similarity is not None:
+            has_vector = vectors.any(axis=1)
+            relevance = np.maximum(relevance, np.where(has_vector, vector_relevance(similarity[pool]), 0))
+        score = scores(relevance, self.importance[pool], self.seen_at[pool], self.degree[pool])
+        return [int(pool[i]) for i in mmr(score, vectors, limit)]
+
+    def expand(self, indices: List[int]) -> List[str]:
+        lines: List[str] = []
+        for i in indices:
+            start, end = self.indptr[i], min(self.indptr[i + 1], self.indptr[i] + NEIGHBORS_PER_NODE)
+            neighbors = [
+                {"rel": self.edge_types[e], "name": self.names[self.indices[e]]} for e in range(start, end)
+            ]
+            lines.extend(context_lines(
+                self.names[i], self.types[i], self.user_rels.get(self.ids[i], []), neighbors
+            ))
+        return lines
+
+    def context(self, query_embedding: Optional[List[float]], keywords: List[str],
+                limit: int, include_relational: bool = True,
+                on_recall: Optional[Callable[[List[str]], None]] = None) -> List[str]:
+        """The same context lines query_related_context builds from Neo4j."""
+        self.last_used = time.monotonic()
+        recalled = self.recall(query_embedding, keywords, limit)[:limit]
+        if on_recall is not None:
+            on_recall([self.ids[i] for i in recalled])
+        lines = self.expand(recalled)
+        if include_relational:
+            for key, value, _ in sorted(self.preferences.values(), key=lambda p: p[2] or "", reverse=True)[:5]:
+                lines.append(f"user preference: {key} = {value}")
+            for _, content in sorted(self.observations, key=lambda o: o[0] or "", reverse=True)[:3]:
+                lines.append(f"character observation: {content}")
+        return list(dict.fromkeys(lines))
@@ -0,0 +1,108 @@
+"""
+Model capability registry.
+Context window, output limit, tokenizer family and pricing per chat model,
+used to size context budgets and pick the token counter for the active model.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.llm import ModelCapability
+from app.services.token_counter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+MODELS = [
+    ModelCapability(
+        id="gpt-3.5-turbo", name="GPT-3.5 Turbo", provider="openai",
+        context_window=16385, max_output_tokens=4096, tokenizer="cl100k_base",
+        input_price_per_mtok=0.5, output_price_per_mtok=1.5,
+    ),
+    ModelCapability(
+        id="gpt-4o", name="GPT-4o", provider="openai",
+        context_window=128000, max_output_tokens=16384, tokenizer="o200k_base",
+        input_price_per_mtok=2.5, output_price_per_mtok=10.0,
+    ),
+    ModelCapability(
+        id="gemini-3-pro", name="Gemini 3 Pro", provider="gemini",
+        context_window=1048576, max_output_tokens=65536,
+        input_price_per_mtok=2.0, output_price_per_mtok=12.0,
+    ),
+    ModelCapability(
+        id="gemini-2.5-flash", name="Gemini 2.5 Flash", provider="gemini",
+        context_window=1048576, max_output_tokens=65536,
+        input_price_per_mtok=0.3, output_price_per_mtok=2.5,
+    ),
+    ModelCapability(
+        id="gemini-2.5-flash-tts", name="Gemini 2.5 Flash TTS", provider="gemini",
+        context_window=8192, max_output_tokens=16384,
+        input_price_per_mtok=0.5, output_price_per_mtok=10.0,
+    ),
+    ModelCapability(
+        id="gemini-1.5-pro", name="Gemini 1.5 Pro", provider="gemini",
+        context_window=2097152, max_output_tokens=8192,
+        input_price_per_mtok=1.25, output_price_per_mtok=5.0,
+    ),
+]
+
+
+class ModelRegistry:
+    """Looks up model capabilities and derives per-model context budgets."""
+
+    def __init__(self, models: List[ModelCapability]):
+        self._models: Dict[Tuple[str, str], ModelCapability] = {(m.provider, m.id): m for m in models}
+        self._counters: Dict[Tuple[str, str], TokenCounter] = {}
+
+    def list(self) -> List[ModelCapability]:
+        return list(self._models.values())
+
+    def get(self, provider: str, model: str) -> ModelCapability:
+        """Capability for provider/model; unknown models get the configured defaults."""
+        capability = self._models.get((provider, model))
+        if capability is None:
+            capability = ModelCapability(
+                id=model,
+                name=model,
+                provider=provider,
+                context_window=settings.context_max_tokens,
+                max_output_tokens=settings.context_output_reserved,
+                tokenizer="cl100k_base" if provider == "openai" else "chars",
+            )
+        return capability
+
+    def context_budget(self, provider: str, model: str) -> Tuple[int, int]:
+        """
+        (max_tokens, output_reserved) for ContextBuilder.
+        The window is capped by context_window_ceiling to bound per-turn cost, and the
+        output reserve never exceeds what the model can generate or half the window.
+        """
+        capability = self.get(provider, model)
+        max_tokens = min(capability.context_window, settings.context_window_ceiling)
+        output_reserved = min(
+            settings.context_output_reserved, capability.max_output_tokens, max_tokens // 2
+        )
+        return max_tokens, output_reserved
+
+    def token_counter(self, provider: str, model: str) -> TokenCounter:
+        """Cached TokenCounter using the model's tokenizer family."""
+        key = (provider, model)
+        if key not in self._counters:
+            self._counters[key] = TokenCounter(
+                provider=provider, model=model, tokenizer=self.get(provider, model).tokenizer
+            )
+        return self._counters[key]
+
+    def estimate_cost(
+        self, provider: str, model: str, input_tokens: int, output_tokens: int
+    ) -> Optional[float]:
+        """USD cost of a call, or None when pricing is unknown."""
+        capability = self.get(provider, model)
+        if capability.input_price_per_mtok is None or capability.output_price_per_mtok is None:
+            return None
+        return (
+            input_tokens * capability.input_price_per_mtok
+            + output_tokens * capability.output_price_per_mtok
+        ) / 1_000_000
+
+
+model_registry = ModelRegistry(MODELS)
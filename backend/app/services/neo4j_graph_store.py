@@ -0,0 +1,1099 @@
+"""
+Neo4j graph memory store.
+Uses Neo4j Python driver 5.0+ best practices:
+- execute_write/execute_read for transaction management
+- the async driver, so graph round trips never block the event loop
+- a pooled driver for the lifetime of the store
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from neo4j import AsyncDriver, AsyncGraphDatabase
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+from app.services.graph_stats import (
+    add_delta,
+    counters_from_stats,
+    delta_rows,
+    node_key,
+    rel_key,
+    stats_from_counters,
+)
+from app.services.graph_store import GraphStore
+from app.services.graph_view import ViewKey, view_key
+from app.services.memory_decay import last_seen
+from app.services.memory_rerank import CANDIDATES, MIN_SIMILARITY, rank
+from app.services.memory_schema import CONSTRAINED_LABELS, ensure_schema, entity_label, node_lookup
+from app.services.memory_snapshot import NEIGHBORS_PER_NODE, VECTOR_TOP_K, MemorySnapshot, context_lines
+
+logger = logging.getLogger(__name__)
+
+
+async def _single(tx, query: str):
+    """Transaction function: run a query and return its single record"""
+    result = await tx.run(query)
+    return await result.single()
+
+
+# 1-hop expansion of recalled entities: the user's relations to each node and
+# its top outgoing neighbors, ranked by relation count, neighbor importance and id
+CONTEXT_EXPANSION_QUERY = """
+UNWIND range(0, size($ids) - 1) AS rank
+MATCH (e:Entity {id: $ids[rank]})
+CALL {
+    WITH e
+    MATCH (:User {id: $user_id})-[r1]->(e)
+    RETURN collect(DISTINCT COALESCE(r1.type, type(r1))) AS user_rels
+}
+CALL {
+    WITH e
+    MATCH (e)-[r2]->(related)
+    WHERE related.name IS NOT NULL
+    WITH r2, related
+    ORDER BY COALESCE(r2.count, 0) DESC, COALESCE(related.importance, 0) DESC, related.id
+    RETURN collect({rel: COALESCE(r2.type, type(r2)), name: related.name})[..$per_node] AS neighbors
+}
+RETURN e.name AS entity_name, e.type AS entity_type, user_rels, neighbors
+ORDER BY rank
+"""
+
+
+async def _created(result) -> int:
+    """The `created` column of a write statement's single record"""
+    record = await result.single()
+    return (record["created"] or 0) if record else 0
+
+
+# Adds $deltas to the user's counters, kept as parallel key/count lists on the
+# User node. The first SET takes the node's write lock, so concurrent writers
+# cannot lose each other's increments
+STATS_UPDATE_QUERY = """
+MATCH (u:User {id: $user_id})
+SET u.stats_updated_at = $now
+WITH u, COALESCE(u.stats_keys, []) AS keys, COALESCE(u.stats_counts, []) AS counts
+WITH u, keys, counts, keys + [d IN $deltas WHERE NOT d.key IN keys | d.key] AS merged
+SET u.stats_keys = merged,
+    u.stats_counts = [k IN merged |
+        COALESCE(counts[[i IN range(0, size(keys) - 1) WHERE keys[i] = k][0]], 0)
+        + reduce(n = 0, d IN $deltas | n + CASE WHEN d.key = k THEN d.count ELSE 0 END)]
+"""
+
+
+async def _add_stats(tx, user_id: str, deltas: Dict[str, int], now: str) -> None:
+    rows = delta_rows(deltas)
+    if rows:
+        await tx.run(STATS_UPDATE_QUERY, user_id=user_id, deltas=rows, now=now)
+
+
+# Exact recount for reconciliation: nodes reachable from the user counted by
+# label (entities under their type label), relationships among those nodes by
+# type. DISTINCT on the endpoint lets the planner prune instead of enumerating paths
+RECOUNT_NODES_QUERY = """
+MATCH (u:User {id: $user_id})-[*]->(e)
+WHERE e.id IS NOT NULL
+WITH DISTINCT e
+UNWIND [l IN labels(e) WHERE l <> 'Entity' OR size(labels(e)) = 1] AS label
+RETURN label, count(e) AS count
+"""
+
+RECOUNT_RELATIONS_QUERY = """
+MATCH (u:User {id: $user_id})-[*]->(e)
+WHERE e.id IS NOT NULL
+WITH u, collect(DISTINCT e) AS reached
+UNWIND CASE WHEN u IN reached THEN reached ELSE reached + [u] END AS a
+MATCH (a)-[r]->(b)
+WHERE b = u OR b IN reached
+RETURN type(r) AS type, count(r) AS count
+"""
+
+
+# Level-of-detail view: nodes reachable from the user ranked by (k1, k2, id)
+# where k1/k2 are degree and importance score in the requested order, keyset
+# paged by $after; one row with the total and the page
+VIEW_NODES_QUERY = """
+MATCH (u:User {{id: $user_id}})
+MATCH (u)-[*1..{depth}]-(e)
+WHERE e <> u AND e.id IS NOT NULL
+WITH DISTINCT e
+WITH e, COALESCE(e.type, labels(e)[0], 'Entity') AS type
+WHERE $entity_types IS NULL OR type IN $entity_types
+WITH e, type, COUNT {{ (e)--() }} AS degree, COALESCE(e.importance, 0) AS score
+WITH collect({{
+    e: e, type: type, degree: degree, score: score,
+    k1: CASE WHEN $by_score THEN score ELSE degree END,
+    k2: CASE WHEN $by_score THEN degree ELSE score END
+}}) AS rows
+CALL {{
+    WITH rows
+    UNWIND rows AS row
+    WITH row
+    WHERE $after IS NULL OR row.k1 < $after[0]
+       OR (row.k1 = $after[0] AND (row.k2 < $after[1] OR (row.k2 = $after[1] AND row.e.id > $after[2])))
+    WITH row ORDER BY row.k1 DESC, row.k2 DESC, row.e.id
+    LIMIT $limit
+    RETURN collect({{
+        eid: elementId(row.e), id: row.e.id, label: COALESCE(row.e.name, row.e.id), type: row.type,
+        degree: row.degree, score: row.score, props: [k IN $properties | row.e[k]]
+    }}) AS page
+}}
+RETURN size(rows) AS total, page
+"""
+
+# Relations of the page nodes whose other endpoint ranks at or before the
+# page's last node, so each relation is delivered once, with its later endpoint
+VIEW_LINKS_QUERY = """
+UNWIND $eids AS eid
+MATCH (s) WHERE elementId(s) = eid
+MATCH (s)-[r:RELATION]-(t)
+WHERE t.id IS NOT NULL AND ($relation_types IS NULL OR r.type IN $relation_types)
+WITH DISTINCT r, t, COUNT { (t)--() } AS degree, COALESCE(t.importance, 0) AS score
+WITH r, t,
+     CASE WHEN $by_score THEN score ELSE degree END AS k1,
+     CASE WHEN $by_score THEN degree ELSE score END AS k2
+WHERE k1 > $last[0] OR (k1 = $last[0] AND (k2 > $last[1] OR (k2 = $last[1] AND t.id <= $last[2])))
+RETURN DISTINCT startNode(r).id AS source, endNode(r).id AS target, r.type AS type, COALESCE(r.count, 1) AS count
+"""
+
+
+# Entity canonicalization: the user's entities matching a name key or close to
+# one of the new embeddings, restricted to two hops like the snapshot
+USER_ENTITY = """
+WHERE EXISTS { MATCH (:User {id: $user_id})-->(e) }
+   OR EXISTS { MATCH (:User {id: $user_id})-->(:Entity)-->(e) }
+"""
+
+ENTITY_ROW = """
+RETURN DISTINCT e.id AS id, e.name AS name, e.type AS type, e.importance AS importance,
+       e.embedding AS embedding, e.aliases AS aliases, e.name_key AS name_key
+"""
+
+ENTITY_CANDIDATES_QUERY = """
+CALL {
+    MATCH (e:Entity) WHERE e.name_key IN $name_keys
+    RETURN e
+    UNION
+    UNWIND $embeddings AS embedding
+    CALL db.index.vector.queryNodes('entity_embedding_index', $k, embedding)
+    YIELD node AS e, score
+    WHERE score >= $min_score
+    RETURN e
+}
+WITH e
+""" + USER_ENTITY + ENTITY_ROW
+
+USER_ENTITIES_QUERY = """
+MATCH (:User {id: $user_id})-[*1..2]->(e:Entity)
+""" + ENTITY_ROW
+
+# Moves the duplicate's relations onto the kept node, summing repeat counts;
+# relations between the two would become self-loops and are dropped with it
+MERGE_ENTITIES_QUERY = """
+UNWIND $merges AS m
+MATCH (dup:Entity {id: m.dup})
+MATCH (keep:Entity {id: m.keep})
+CALL {
+    WITH dup, keep
+    MATCH (dup)-[r:RELATION]->(other)
+    WHERE other <> keep
+    MERGE (keep)-[moved:RELATION {type: r.type}]->(other)
+    ON CREATE SET moved += properties(r)
+    ON MATCH SET moved.count = COALESCE(moved.count, 1) + COALESCE(r.count, 1)
+    RETURN count(*) AS outgoing
+}
+CALL {
+    WITH dup, keep
+    MATCH (other)-[r:RELATION]->(dup)
+    WHERE other <> keep
+    MERGE (other)-[moved:RELATION {type: r.type}]->(keep)
+    ON CREATE SET moved += properties(r)
+    ON MATCH SET moved.count = COALESCE(moved.count, 1) + COALESCE(r.count, 1)
+    RETURN count(*) AS incoming
+}
+SET keep.aliases = m.aliases,
+    keep.alias_text = m.alias_text,
+    keep.name_key = m.name_key
+DETACH DELETE dup
+RETURN count(*) AS merged
+"""
+
+
+# Decay and compaction: nodes a user's compaction may remove are the entities
+# within two hops that no other user reaches, and the user's relational signals
+COMPACTABLE_LABELS = ["Entity", "UserPreference", "CharacterObservation"]
+
+RECORD_ACCESS_QUERY = """
+UNWIND $rows AS row
+MATCH (e:Entity {id: row.id})
+SET e.access_count = COALESCE(e.access_count, 0) + row.count,
+    e.last_accessed_at = CASE
+        WHEN e.last_accessed_at IS NULL OR e.last_accessed_at < row.last_accessed_at THEN row.last_accessed_at
+        ELSE e.last_accessed_at END
+"""
+
+DECAY_CANDIDATES_QUERY = """
+CALL {
+    MATCH (:User {id: $user_id})-[*1..2]->(n:Entity)
+    WITH DISTINCT n
+    WHERE NOT EXISTS { MATCH (other:User)-->(n) WHERE other.id <> $user_id }
+      AND NOT EXISTS { MATCH (other:User)-->(:Entity)-->(n) WHERE other.id <> $user_id }
+    RETURN n, 'Entity' AS label
+    UNION
+    MATCH (n:UserPreference {user_id: $user_id})
+    RETURN n, 'UserPreference' AS label
+    UNION
+    MATCH (n:CharacterObservation {user_id: $user_id})
+    RETURN n, 'CharacterObservation' AS label
+}
+WITH n, label, COALESCE(n.updated_at, n.observed_at) AS updated_at
+WITH n, label, updated_at,
+     CASE WHEN n.last_accessed_at > updated_at THEN n.last_accessed_at ELSE updated_at END AS seen
+RETURN n.id AS id, label, n.name AS name, n.importance AS importance, updated_at,
+       n.last_accessed_at AS last_accessed_at, COALESCE(n.access_count, 0) AS access_count
+ORDER BY seen, id
+LIMIT $limit
+"""
+
+# Binds n to the compactable node with id `id` (an UNWIND variable)
+COMPACTABLE_NODE = "CALL {\n    " + "\n    UNION\n    ".join(
+    f"WITH id MATCH (n:{label} {{id: id}}) RETURN n" for label in COMPACTABLE_LABELS
+) + "\n}"
+
+EXPORT_NODES_QUERY = """
+UNWIND $ids AS id
+""" + COMPACTABLE_NODE + """
+OPTIONAL MATCH (n)-[r]-(m)
+WHERE m.id IS NOT NULL
+WITH n, collect(CASE WHEN r IS NULL THEN NULL ELSE {
+    source: startNode(r).id, source_labels: labels(startNode(r)),
+    target: endNode(r).id, target_labels: labels(endNode(r)),
+    kind: type(r), properties: properties(r)
+} END) AS relations
+RETURN labels(n) AS labels, properties(n) AS properties, relations
+"""
+
+DELETE_NODES_QUERY = """
+UNWIND $ids AS id
+""" + COMPACTABLE_NODE + """
+DETACH DELETE n
+RETURN count(*) AS deleted
+"""
+
+
+def _base_label(labels: List[str]) -> str:
+    return next((label for label in CONSTRAINED_LABELS if label in labels), labels[0] if labels else "Entity")
+
+
+def _exported_relation(rel: dict) -> Dict[str, Any]:
+    props = dict(rel["properties"] or {})
+    return {
+        "source": rel["source"], "source_label": _base_label(rel["source_labels"]),
+        "kind": rel["kind"], "type": props.pop("type", "") or "",
+        "target": rel["target"], "target_label": _base_label(rel["target_labels"]),
+        "count": props.pop("count", 1),
+        "created_at": props.pop("created_at", None), "updated_at": props.pop("updated_at", None),
+        "properties": props,
+    }
+
+
+def _exported_node(record) -> Dict[str, Any]:
+    """Store-neutral archive row (see GraphStore.export_nodes)"""
+    props = dict(record["properties"])
+    node = {"id": props.pop("id"), "label": _base_label(record["labels"])}
+    for key in ("type", "name", "user_id", "importance", "embedding", "created_at", "updated_at"):
+        node[key] = props.pop(key, None)
+    node["properties"] = props
+    node["relations"] = [_exported_relation(rel) for rel in record["relations"]]
+    return node
+
+
+def _import_props(node: Dict[str, Any]) -> Dict[str, Any]:
+    props = dict(node.get("properties") or {})
+    props.update({
+        key: node[key] for key in ("id", "type", "name", "user_id", "importance", "embedding", "created_at", "updated_at")
+        if node.get(key) is not None
+    })
+    return props
+
+
+# Reranking features of a recalled entity (see memory_rerank.rank)
+CANDIDATE_COLUMNS = """
+node.id AS id, node.name AS name, node.aliases AS aliases, node.importance AS importance,
+node.updated_at AS updated_at, node.last_accessed_at AS last_accessed_at, node.embedding AS embedding,
+COUNT { (node)-[:RELATION]-() } AS degree
+"""
+
+
+def _fulltext_query(keywords: List[str]) -> str:
+    """Lucene query matching any of the terms, each quoted so it is taken literally"""
+    return " OR ".join('"' + k.replace("\\", "\\\\").replace('"', '\\"') + '"' for k in keywords)
+
+
+async def _expand_context(tx, user_id: str, node_ids: List[str]) -> List[str]:
+    """Context lines for the recalled entities, in recall order"""
+    if not node_ids:
+        return []
+    lines = []
+    result = await tx.run(CONTEXT_EXPANSION_QUERY, ids=node_ids, user_id=user_id, per_node=NEIGHBORS_PER_NODE)
+    async for rec in result:
+        lines.extend(context_lines(rec['entity_name'], rec['entity_type'], rec['user_rels'], rec['neighbors']))
+    return lines
+
+
+class Neo4jGraphStore(GraphStore):
+    """GraphStore backed by Neo4j (Aura or self-hosted)"""
+    
+    name = "neo4j"
+    transient_errors = (TransientError, ServiceUnavailable, SessionExpired)
+    
+    def __init__(self, uri: str, user: str, password: str, database: str = "neo4j"):
+        self.uri = uri
+        self.user = user
+        self.password = password
+        self.database = database
+        self.driver: Optional[AsyncDriver] = None
+    
+    async def initialize(self):
+        """Initialize Neo4j connection"""
+        try:
+            # Neo4j Aura uses neo4j+s:// (encrypted connection)
+            self.driver = AsyncGraphDatabase.driver(
+                self.uri,
+                auth=(self.user, self.password),
+                max_connection_lifetime=30 * 60,  # 30 minutes
+                max_connection_pool_size=50,
+                connection_acquisition_timeout=2 * 60  # 2 minutes
+            )
+            
+            # Test connection
+            async with self.driver.session(database=self.database) as session:
+                result = await session.execute_read(_single, "RETURN 1 AS test")
+                if result["test"] != 1:
+                    raise Exception("Connection test failed")
+            
+            logger.info(f"Neo4j connected successfully: {self.uri}")
+            
+            # Create constraints and indexes (including vector index)
+            await self.ensure_schema()
+            
+        except Exception as e:
+            logger.error(f"Failed to connect to Neo4j: {str(e)}")
+            raise
+    
+    async def ensure_schema(self):
+        """Create uniqueness constraints and indexes, migrating existing data if needed"""
+        if not self.driver:
+            return
+        
+        try:
+            await ensure_schema(self.driver, self.database)
+            logger.info("Neo4j constraints and indexes created/verified")
+        except Exception as e:
+            logger.warning(f"Failed to create constraints/indexes: {str(e)}")
+    
+    async def verify_connectivity(self) -> bool:
+        """Verify connection is healthy"""
+        if not self.driver:
+            return False
+        try:
+            async with self.driver.session(database=self.database) as session:
+                await session.execute_read(_single, "RETURN 1")
+            return True
+        except Exception:
+            return False
+    
+    async def write_graph_batch(
+        self,
+        user_id: str,
+        conversations: List[dict],
+        entities: List[dict],
+        relations: List[dict]
+    ) -> Tuple[int, int]:
+        """
+        Upsert user, conversations, entities and relations in one transaction.
+        
+        Conversations go through one UNWIND, entities are sent as parameter lists through one UNWIND ... MERGE per
+        label, and all relations through a single UNWIND, so the number of
+        round trips no longer grows with the size of the extraction. Entities
+        MERGE on the constrained Entity label and carry their type as a
+        second label; relation endpoints are looked up as User or Entity.
+
+        Returns:
+            (entities_count, relations_count)
+        """
+        now = datetime.now().isoformat()
+        
+        entity_rows: Dict[str, List[dict]] = {}
+        for entity in entities:
+            props = dict(entity.get('properties') or {})
+            props['name'] = entity.get('name', '')
+            props['type'] = entity.get('type', 'Entity')
+            props['importance'] = entity.get('score', 0)  # Save score as importance
+            props['updated_at'] = now
+            if props.get('aliases'):
+                props['alias_text'] = " ".join(props['aliases'])  # full-text indexes take strings, not lists
+            if entity.get('embedding'):
+                props['embedding'] = entity['embedding']
+            label = entity_label(entity.get('type', 'Entity'))
+            entity_rows.setdefault(label, []).append({'id': entity.get('id'), 'props': props})
+        
+        relation_rows = [
+            {
+                'source_id': relation.get('source_id') or relation.get('source'),
+                'target_id': relation.get('target_id') or relation.get('target'),
+                'type': relation.get('type', 'RELATED_TO'),
+                'props': dict(relation.get('properties') or {}),
+            }
+            for relation in relations
+        ]
+        
+        async def write_tx(tx):
+            """Transaction function: user/conversations, then entities per label, then relations"""
+            deltas: Dict[str, int] = {}
+            result = await tx.run("""
+                MERGE (u:User {id: $user_id})
+                ON CREATE SET u.created_at = $now
+                SET u.last_active = $now,
+                    u.updated_at = $now
+                WITH u
+                UNWIND $conversations AS conv
+                MERGE (c:Conversation {id: conv.id})
+                ON CREATE SET c.created_at = $now
+                SET c.message_count = conv.message_count,
+                    c.character_id = conv.character_id,
+                    c.updated_at = $now
+                MERGE (u)-[r:HAS_CONVERSATION]->(c)
+                ON CREATE SET r.created_at = $now
+                SET r.updated_at = $now
+                RETURN count(DISTINCT CASE WHEN r.created_at = $now THEN r END) AS created
+            """,
+                user_id=user_id,
+                conversations=conversations,
+                now=now
+            )
+            created = await _created(result)
+            add_delta(deltas, node_key("Conversation"), created)
+            add_delta(deltas, rel_key("HAS_CONVERSATION"), created)
+            
+            for label, rows in entity_rows.items():
+                result = await tx.run(f"""
+                    UNWIND $rows AS row
+                    MERGE (e:Entity {{id: row.id}})
+                    ON CREATE SET e.created_at = $now
+                    SET e:`{label}`, e += row.props
+                    RETURN count(DISTINCT CASE WHEN e.created_at = $now THEN e END) AS created
+                """, rows=rows, now=now)
+                add_delta(deltas, node_key(label), await _created(result))
+            
+            if relation_rows:
+                result = await tx.run("""
+                    UNWIND $rows AS row
+                    OPTIONAL MATCH (su:User {id: row.source_id})
+                    OPTIONAL MATCH (se:Entity {id: row.source_id})
+                    OPTIONAL MATCH (tu:User {id: row.target_id})
+                    OPTIONAL MATCH (te:Entity {id: row.target_id})
+                    WITH row, COALESCE(su, se) AS a, COALESCE(te, tu) AS b
+                    WHERE a IS NOT NULL AND b IS NOT NULL
+                    MERGE (a)-[r:RELATION {type: row.type}]->(b)
+                    ON CREATE SET r.created_at = $now, r.count = 1
+                    ON MATCH SET r.count = COALESCE(r.count, 0) + 1
+                    SET r += row.props,
+                        r.updated_at = $now
+                    RETURN count(DISTINCT CASE WHEN r.created_at = $now THEN r END) AS created
+                """, rows=relation_rows, now=now)
+                add_delta(deltas, rel_key("RELATION"), await _created(result))
+            
+            await _add_stats(tx, user_id, deltas, now)
+            return sum(len(rows) for rows in entity_rows.values()), len(relation_rows)
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_write(write_tx)
+    
+    async def entity_candidates(
+        self,
+        user_id: str,
+        name_keys: List[str],
+        embeddings: List[List[float]],
+        min_score: float,
+    ) -> List[Dict[str, Any]]:
+        async def read_tx(tx):
+            result = await tx.run(
+                ENTITY_CANDIDATES_QUERY,
+                user_id=user_id, name_keys=name_keys, embeddings=embeddings, k=VECTOR_TOP_K, min_score=min_score,
+            )
+            return [record.data() async for record in result]
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_read(read_tx)
+    
+    async def user_entities(self, user_id: str) -> List[Dict[str, Any]]:
+        async def read_tx(tx):
+            result = await tx.run(USER_ENTITIES_QUERY, user_id=user_id)
+            return [record.data() async for record in result]
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_read(read_tx)
+    
+    async def merge_entities(self, user_id: str, merges: List[dict], name_keys: Dict[str, str]) -> int:
+        async def write_tx(tx):
+            merged = 0
+            if merges:
+                rows = [dict(merge, alias_text=" ".join(merge["aliases"])) for merge in merges]
+                record = await (await tx.run(MERGE_ENTITIES_QUERY, merges=rows)).single()
+                merged = record["merged"] if record else 0
+            if name_keys:
+                await tx.run("""
+                    UNWIND $rows AS row
+                    MATCH (e:Entity {id: row.id})
+                    SET e.name_key = row.key
+                """, rows=[{"id": node_id, "key": key} for node_id, key in name_keys.items()])
+            return merged
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_write(write_tx)
+    
+    async def load_snapshot(self, user_id: str, max_nodes: int) -> Optional[MemorySnapshot]:
+        """Read the entities within two hops of the user plus their relations and signals"""
+        started = time.perf_counter()
+        
+        async def read_tx(tx):
+            snapshot = MemorySnapshot(user_id)
+            result = await tx.run("""
+                MATCH (:User {id: $user_id})-[*1..2]->(e:Entity)
+                WITH DISTINCT e
+                LIMIT $max_nodes + 1
+                RETURN e.id AS id, e.name AS name, e.type AS type,
+                       e.importance AS importance, e.embedding AS embedding, e.aliases AS aliases,
+                       e.updated_at AS updated_at, e.last_accessed_at AS last_accessed_at
+            """, user_id=user_id, max_nodes=max_nodes)
+            async for rec in result:
+                snapshot.add_node(
+                    rec['id'], rec['name'], rec['type'], rec['importance'], rec['embedding'], rec['aliases'],
+                    last_seen(rec),
+                )
+            if len(snapshot.nodes) > max_nodes:
+                return None
+            
+            result = await tx.run("""
+                UNWIND $ids AS id
+                MATCH (e:Entity {id: id})-[r]->(t:Entity)
+                RETURN e.id AS source, COALESCE(r.type, type(r)) AS type, COALESCE(r.count, 0) AS count,
+                       t.id AS target, t.name AS name, t.type AS target_type, t.importance AS importance
+            """, ids=list(snapshot.nodes))
+            async for rec in result:
+                if rec['target'] not in snapshot.nodes:
+                    snapshot.add_node(rec['target'], rec['name'], rec['target_type'], rec['importance'])
+                snapshot.add_edge(rec['source'], rec['type'], rec['target'], rec['count'])
+            
+            result = await tx.run("""
+                MATCH (:User {id: $user_id})-[r]->(e:Entity)
+                RETURN e.id AS target, COALESCE(r.type, type(r)) AS type
+            """, user_id=user_id)
+            async for rec in result:
+                snapshot.add_edge(user_id, rec['type'], rec['target'])
+            
+            result = await tx.run("""
+                MATCH (p:UserPreference {user_id: $user_id})
+                RETURN p.id AS id, p.preference_key AS key, p.preference_value AS value, p.observed_at AS observed_at
+            """, user_id=user_id)
+            async for rec in result:
+                snapshot.preferences[rec['id']] = (rec['key'], rec['value'], rec['observed_at'])
+            
+            result = await tx.run("""
+                MATCH (o:CharacterObservation {user_id: $user_id})
+                RETURN o.observed_at AS observed_at, o.content AS content
+                ORDER BY o.observed_at DESC
+                LIMIT 3
+            """, user_id=user_id)
+            snapshot.observations = [(rec['observed_at'], rec['content']) async for rec in result]
+            return snapshot
+        
+        async with self.driver.session(database=self.database) as session:
+            snapshot = await session.execute_read(read_tx)
+        if snapshot is None:
+            logger.info(f"Memory subgraph for {user_id} exceeds {max_nodes} nodes, using Neo4j retrieval")
+        else:
+            logger.info(
+                f"Loaded memory snapshot for {user_id}: {len(snapshot.nodes)} nodes, "
+                f"{len(snapshot.edges)} relations in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+        return snapshot
+    
+    async def related_context(
+        self,
+        user_id: str,
+        query_embedding: Optional[List[float]],
+        keywords: List[str],
+        limit: int,
+        include_relational: bool,
+        on_recall: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[str]:
+        """Hybrid Search (Vector + Graph) context lines"""
+        async with self.driver.session(database=self.database) as session:
+            async def read_tx(tx):
+                context_nodes = []
+                
+                # A. Vector Search (Semantic Recall)
+                if query_embedding:
+                    try:
+                        # Query vector index
+                        # Find top similar entities above the recall floor
+                        vector_query = f"""
+                        CALL db.index.vector.queryNodes('entity_embedding_index', $k, $embedding)
+                        YIELD node, score
+                        WHERE score > $min_score
+                        RETURN {CANDIDATE_COLUMNS}
+                        """
+                        vector_result = await tx.run(
+                            vector_query, k=CANDIDATES, embedding=query_embedding, min_score=MIN_SIMILARITY
+                        )
+                        vector_nodes = [record.data() async for record in vector_result]
+                        context_nodes.extend(vector_nodes)
+                    except Exception as e:
+                        logger.warning(f"Vector search failed: {e}")
+                
+                # B. Keyword Search (Lexical Recall)
+                if keywords:
+                    try:
+                        keyword_query = f"""
+                        CALL db.index.fulltext.queryNodes('entity_name_fulltext', $terms, {{limit: $limit}})
+                        YIELD node, score
+                        RETURN {CANDIDATE_COLUMNS}
+                        """
+                        keyword_result = await tx.run(keyword_query, terms=_fulltext_query(keywords), limit=CANDIDATES)
+                        keyword_nodes = [record.data() async for record in keyword_result]
+                        context_nodes.extend(keyword_nodes)
+                    except Exception as e:
+                        logger.warning(f"Full-text search failed: {e}")
+                
+                # C. Rerank on relevance, importance, recency and degree, diversified by MMR
+                recalled = rank(query_embedding, keywords, context_nodes, limit)
+                
+                # D. Graph Traversal (Context Expansion), one round trip for all nodes
+                expanded_context = await _expand_context(tx, user_id, recalled)
+
+                if include_relational:
+                    relational_query = """
+                    MATCH (p:UserPreference {user_id: $user_id})
+                    RETURN p.preference_key as key, p.preference_value as value
+                    ORDER BY p.observed_at DESC
+                    LIMIT 5
+                    """
+                    async for rec in await tx.run(relational_query, user_id=user_id):
+                        expanded_context.append(
+                            f"user preference: {rec['key']} = {rec['value']}"
+                        )
+
+                    obs_query = """
+                    MATCH (o:CharacterObservation {user_id: $user_id})
+                    RETURN o.content as content
+                    ORDER BY o.observed_at DESC
+                    LIMIT 3
+                    """
+                    async for rec in await tx.run(obs_query, user_id=user_id):
+                        expanded_context.append(f"character observation: {rec['content']}")
+
+                return list(dict.fromkeys(expanded_context)), recalled  # Remove duplicates, keep ranking order
+
+            lines, recalled = await session.execute_read(read_tx)
+        if on_recall is not None:
+            on_recall(recalled)
+        return lines
+    
+    async def record_access(self, rows: List[dict]) -> None:
+        async def write_tx(tx):
+            await tx.run(RECORD_ACCESS_QUERY, rows=rows)
+        
+        async with self.driver.session(database=self.database) as session:
+            await session.execute_write(write_tx)
+    
+    async def decay_candidates(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        async def read_tx(tx):
+            result = await tx.run(DECAY_CANDIDATES_QUERY, user_id=user_id, limit=limit)
+            return [record.data() async for record in result]
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_read(read_tx)
+    
+    async def compaction_users(self, limit: int) -> List[str]:
+        async def read_tx(tx):
+            result = await tx.run("""
+                MATCH (u:User)
+                RETURN u.id AS id
+                ORDER BY COALESCE(u.compacted_at, ''), u.id
+                LIMIT $limit
+            """, limit=limit)
+            return [record["id"] async for record in result]
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_read(read_tx)
+    
+    async def mark_compacted(self, user_id: str, now: str) -> None:
+        async def write_tx(tx):
+            await tx.run("MATCH (u:User {id: $user_id}) SET u.compacted_at = $now", user_id=user_id, now=now)
+        
+        async with self.driver.session(database=self.database) as session:
+            await session.execute_write(write_tx)
+    
+    async def export_nodes(self, node_ids: List[str]) -> List[Dict[str, Any]]:
+        async def read_tx(tx):
+            result = await tx.run(EXPORT_NODES_QUERY, ids=node_ids)
+            return [_exported_node(record) async for record in result]
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_read(read_tx)
+    
+    async def delete_nodes(self, node_ids: List[str]) -> int:
+        async def write_tx(tx):
+            record = await (await tx.run(DELETE_NODES_QUERY, ids=node_ids)).single()
+            return record["deleted"] if record else 0
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_write(write_tx)
+    
+    async def import_nodes(self, nodes: List[Dict[str, Any]]) -> int:
+        """
+        MERGE archived nodes under their labels (entities also under their
+        type label), then their relations per endpoint labels and type.
+        Nodes and relations written since the archive keep their properties.
+        """
+        node_rows: Dict[Tuple[str, str], List[dict]] = {}
+        for node in nodes:
+            type_label = entity_label(node.get("type") or "Entity") if node["label"] == "Entity" else ""
+            node_rows.setdefault((node["label"], type_label), []).append({"id": node["id"], "props": _import_props(node)})
+        
+        relation_rows: Dict[Tuple[str, str, str], Dict[tuple, dict]] = {}
+        for node in nodes:
+            for rel in node.get("relations", []):
+                # Labels and the type are interpolated, so only plain identifiers pass
+                if not all(entity_label(name) == name for name in (rel["source_label"], rel["kind"], rel["target_label"])):
+                    continue
+                props = dict(rel.get("properties") or {})
+                props.update({
+                    key: rel[key] for key in ("count", "created_at", "updated_at") if rel.get(key) is not None
+                })
+                group = relation_rows.setdefault((rel["source_label"], rel["kind"], rel["target_label"]), {})
+                group[(rel["source"], rel.get("type") or "", rel["target"])] = {
+                    "source": rel["source"], "target": rel["target"], "type": rel.get("type") or "", "props": props,
+                }
+        
+        async def write_tx(tx):
+            restored = 0
+            for (label, type_label), rows in node_rows.items():
+                extra = f", n:`{type_label}`" if type_label else ""
+                result = await tx.run(f"""
+                    UNWIND $rows AS row
+                    OPTIONAL MATCH (live:`{label}` {{id: row.id}})
+                    WITH row WHERE live IS NULL
+                    CREATE (n:`{label}` {{id: row.id}})
+                    SET n += row.props{extra}
+                    RETURN count(n) AS created
+                """, rows=rows)
+                restored += await _created(result)
+            for (source_label, kind, target_label), rows in relation_rows.items():
+                key = " {type: row.type}" if kind == "RELATION" else ""
+                await tx.run(f"""
+                    UNWIND $rows AS row
+                    MATCH (a:`{source_label}` {{id: row.source}})
+                    MATCH (b:`{target_label}` {{id: row.target}})
+                    MERGE (a)-[r:`{kind}`{key}]->(b)
+                    ON CREATE SET r += row.props
+                """, rows=list(rows.values()))
+            return restored
+        
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_write(write_tx)
+
+    async def write_relational_signals(
+        self,
+        user_id: str,
+        character_id: str,
+        conversation_id: str,
+        preferences: Dict[str, str],
+        observation: str,
+        now: str,
+    ) -> None:
+        """Write preference/observation relational signals into Neo4j."""
+        async with self.driver.session(database=self.database) as session:
+            async def write_tx(tx):
+                if preferences:
+                    result = await tx.run(
+                        """
+                        UNWIND $rows AS row
+                        MERGE (p:UserPreference {id: row.pref_id})
+                        SET p.user_id = $user_id,
+                            p.character_id = $character_id,
+                            p.preference_key = row.key,
+                            p.preference_value = row.value,
+                            p.confidence = 0.8,
+                            p.observed_at = $now,
+                            p.source_conversation = $conversation_id
+                        WITH p
+                        MATCH (u:User {id: $user_id})
+                        MERGE (u)-[hp:HAS_PREFERENCE]->(p)
+                        ON CREATE SET hp.created_at = $now
+                        RETURN count(DISTINCT CASE WHEN hp.created_at = $now THEN hp END) AS created
+                        """,
+                        rows=[
+                            {
+                                "pref_id": f"pref_{user_id}_{character_id}_{key}",
+                                "key": key,
+                                "value": str(value),
+                            }
+                            for key, value in preferences.items()
+                        ],
+                        user_id=user_id,
+                        character_id=character_id,
+                        now=now,
+                        conversation_id=conversation_id,
+                    )
+                    created = await _created(result)
+                    await _add_stats(tx, user_id, {
+                        node_key("UserPreference"): created, rel_key("HAS_PREFERENCE"): created,
+                    }, now)
+
+                if observation:
+                    obs_id = f"obs_{user_id}_{character_id}_{int(datetime.now().timestamp())}"
+                    await tx.run(
+                        """
+                        MERGE (o:CharacterObservation {id: $obs_id})
+                        SET o.user_id = $user_id,
+                            o.character_id = $character_id,
+                            o.content = $content,
+                            o.observed_at = $now,
+                            o.source_conversation = $conversation_id
+                        WITH o
+                        MERGE (c:Character {id: $character_id})
+                        MERGE (u:User {id: $user_id})
+                        MERGE (c)-[:OBSERVED]->(o)
+                        MERGE (o)-[:ABOUT]->(u)
+                        """,
+                        obs_id=obs_id,
+                        user_id=user_id,
+                        character_id=character_id,
+                        content=observation,
+                        now=now,
+                        conversation_id=conversation_id,
+                    )
+            await session.execute_write(write_tx)
+    
+    async def query_graph(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]],
+        relation_types: Optional[List[str]],
+        depth: int,
+        limit: int
+    ) -> Dict[str, List]:
+        """Query graph data (for visualization)"""
+        async with self.driver.session(database=self.database) as session:
+            async def read_tx(tx):
+                # DISTINCT on the endpoint lets the planner prune the
+                # variable-length expansion instead of enumerating paths
+                node_result = await tx.run(f"""
+                MATCH (u:User {{id: $user_id}})
+                MATCH (u)-[*1..{int(depth)}]-(e)
+                WHERE e.id IS NOT NULL AND ($entity_types IS NULL OR e.type IN $entity_types)
+                WITH DISTINCT e
+                LIMIT $limit
+                RETURN elementId(e) as eid,
+                       e.id as id,
+                       COALESCE(e.name, '') as name,
+                       COALESCE(e.type, labels(e)[0], 'Entity') as type,
+                       e {{.*, embedding: null}} as properties
+                """, user_id=user_id, entity_types=entity_types, limit=limit)
+
+                nodes = []
+                element_ids = []
+                async for record in node_result:
+                    properties = dict(record['properties'] or {})
+                    properties.pop('embedding', None)
+                    nodes.append({
+                        "id": record['id'],
+                        "label": record['name'] or record['id'],
+                        "type": record['type'],
+                        "properties": properties
+                    })
+                    element_ids.append(record['eid'])
+
+                # Relations among the returned nodes only
+                rel_result = await tx.run("""
+                MATCH (source)-[r:RELATION]->(target)
+                WHERE elementId(source) IN $eids AND elementId(target) IN $eids
+                  AND ($relation_types IS NULL OR r.type IN $relation_types)
+                RETURN DISTINCT source.id as source_id, target.id as target_id, r.type as type
+                LIMIT $limit
+                """, eids=element_ids, relation_types=relation_types, limit=limit)
+
+                links = [
+                    {"source": record['source_id'], "target": record['target_id'], "type": record['type']}
+                    async for record in rel_result
+                ]
+                return {"nodes": nodes, "links": links}
+            
+            return await session.execute_read(read_tx)
+
+    async def graph_view(
+        self,
+        user_id: str,
+        entity_types: Optional[List[str]],
+        relation_types: Optional[List[str]],
+        depth: int,
+        limit: int,
+        order: str,
+        after: Optional[ViewKey],
+        properties: List[str],
+    ) -> Dict[str, Any]:
+        async with self.driver.session(database=self.database) as session:
+            async def read_tx(tx):
+                by_score = order == "score"
+                result = await tx.run(
+                    VIEW_NODES_QUERY.format(depth=int(depth)),
+                    user_id=user_id,
+                    entity_types=entity_types,
+                    after=list(after) if after else None,
+                    limit=limit + 1,
+                    properties=properties,
+                    by_score=by_score,
+                )
+                record = await result.single()
+                rows = record["page"] if record else []
+                total = record["total"] if record else 0
+                nodes = [
+                    {
+                        "id": row["id"],
+                        "label": row["label"],
+                        "type": row["type"],
+                        "degree": row["degree"],
+                        "score": row["score"],
+                        "properties": dict(zip(properties, row["props"])),
+                    }
+                    for row in rows
+                ]
+
+                page = rows[:limit]
+                links = []
+                if page:
+                    last = page[-1]
+                    result = await tx.run(
+                        VIEW_LINKS_QUERY,
+                        eids=[row["eid"] for row in page],
+                        relation_types=relation_types,
+                        last=list(view_key(order, last["id"], last["degree"], last["score"])),
+                        by_score=by_score,
+                    )
+                    links = [dict(record) async for record in result]
+                return {"nodes": nodes, "links": links, "total": total}
+
+            return await session.execute_read(read_tx)
+    
+    async def get_node_details(self, node_id: str) -> Optional[Dict]:
+        """Get node details"""
+        async with self.driver.session(database=self.database) as session:
+            async def read_tx(tx):
+                result = await tx.run(f"""
+                    {node_lookup("n", "node_id")}
+                    WITH n LIMIT 1
+                    OPTIONAL MATCH (n)<-[r1]-(source)
+                    OPTIONAL MATCH (n)-[r2]->(target)
+                    RETURN n, 
+                           labels(n) as labels,
+                           collect(DISTINCT {{
+                               source: source.id, 
+                               source_name: source.name,
+                               type: type(r1), 
+                               properties: properties(r1)
+                           }}) as incoming,
+                           collect(DISTINCT {{
+                               target: target.id,
+                               target_name: target.name,
+                               type: type(r2), 
+                               properties: properties(r2)
+                           }}) as outgoing
+                """, node_id=node_id)
+                
+                record = await result.single()
+                if not record:
+                    return None
+                
+                node = record['n']
+                labels = record['labels']
+                node_type = node.get('type') or (labels[0] if labels else 'Entity')
+                
+                return {
+                    "id": node['id'],
+                    "type": node_type,
+                    "name": node.get('name', ''),
+                    "properties": dict(node),
+                    "incoming_relations": [r for r in record['incoming'] if r.get('source')],
+                    "outgoing_relations": [r for r in record['outgoing'] if r.get('target')]
+                }
+            
+            return await session.execute_read(read_tx)
+    
+    async def get_graph_stats(self, user_id: str) -> Dict[str, Any]:
+        """Get graph statistics from the counters on the User node"""
+        async with self.driver.session(database=self.database) as session:
+            async def read_tx(tx):
+                result = await tx.run(
+                    "MATCH (u:User {id: $user_id}) RETURN u.stats_keys AS keys, u.stats_counts AS counts",
+                    user_id=user_id,
+                )
+                return await result.single()
+
+            record = await session.execute_read(read_tx)
+        if record is not None and record["keys"] is None:
+            # Written before the counters existed: count once now
+            return await self.reconcile_graph_stats(user_id)
+        counters = dict(zip(record["keys"], record["counts"])) if record else {}
+        return stats_from_counters(counters)
+
+    async def stale_stats_users(self) -> List[str]:
+        """Users active since their counters were last reconciled"""
+        async with self.driver.session(database=self.database) as session:
+            async def read_tx(tx):
+                result = await tx.run("""
+                    MATCH (u:User)
+                    WHERE u.stats_reconciled_at IS NULL OR u.last_active > u.stats_reconciled_at
+                    RETURN u.id AS id
+                """)
+                return [record["id"] async for record in result]
+
+            return await session.execute_read(read_tx)
+
+    async def reconcile_graph_stats(self, user_id: str) -> Dict[str, Any]:
+        """Recount the user's graph and overwrite the counters"""
+        async with self.driver.session(database=self.database) as session:
+            async def write_tx(tx):
+                now = datetime.now().isoformat()
+                # Lock the user first so no counter increments land mid-recount
+                result = await tx.run(
+                    "MATCH (u:User {id: $user_id}) SET u.stats_reconciled_at = $now RETURN u.id AS id",
+                    user_id=user_id, now=now,
+                )
+                if await result.single() is None:
+                    return stats_from_counters({})
+                result = await tx.run(RECOUNT_NODES_QUERY, user_id=user_id)
+                node_types = {record["label"]: record["count"] async for record in result}
+                result = await tx.run(RECOUNT_RELATIONS_QUERY, user_id=user_id)
+                relation_types = {record["type"]: record["count"] async for record in result}
+                counters = counters_from_stats(node_types, relation_types)
+                await tx.run(
+                    """
+                    MATCH (u:User {id: $user_id})
+                    SET u.stats_keys = $keys, u.stats_counts = $counts
+                    """,
+                    user_id=user_id, keys=list(counters), counts=list(counters.values()),
+                )
+                return stats_from_counters(counters)
+
+            return await session.execute_write(write_tx)
+    
+    async def close(self):
+        """Close connection"""
+        if self.driver:
+            await self.driver.close()
+            logger.info("Neo4j connection closed")
+
+
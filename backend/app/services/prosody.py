@@ -0,0 +1,114 @@
+"""
+Inline prosody tags in the LLM stream.
+The character prompt asks the model to prefix sentences with a lightweight tag
+such as [calm] or [soft]; the parser strips the tags from the displayed text
+and splits the reply into sentences carrying the tag in effect, each mapped to
+its own GPT-SoVITS speed and fragment interval.
+"""
+import re
+from typing import List, Tuple
+
+from app.models.chat import ProsodySegment
+
+# tag -> (speed multiplier, fragment interval multiplier)
+PROSODY_TAGS = {
+    "neutral": (1.0, 1.0),
+    "calm": (0.95, 1.10),
+    "soft": (0.92, 1.15),
+    "cheerful": (1.05, 0.95),
+    "excited": (1.10, 0.85),
+    "sad": (0.90, 1.20),
+    "serious": (0.98, 1.00),
+}
+
+PROSODY_PROMPT = """
+
+## 语气标签
+你的回复会被朗读。请在语气变化的句子开头加一个语气标签，标签只能是：""" + "、".join(
+    f"[{tag}]" for tag in PROSODY_TAGS
+) + """。
+标签只影响朗读，不会显示给用户；标签持续生效直到下一个标签。不要使用列表以外的标签，不要解释标签。"""
+
+_SENTENCE_END = "。！？!?…\n"
+_MAX_TAG_LEN = max(len(tag) for tag in PROSODY_TAGS) + 2
+_TAG_RE = re.compile(r"\[([a-z]+)\]")
+
+
+class ProsodyTagParser:
+    """
+    Streaming tag parser.
+    feed() returns the display text for the chunk (tags removed) and buffers
+    a possible tag split across chunks; sentences closed so far accumulate in
+    segments, and finish() flushes the rest. tagged tells whether the reply
+    carried any tag at all; untagged replies are all "neutral".
+    """
+
+    def __init__(self):
+        self.tag = "neutral"
+        self.tagged = False
+        self.segments: List[ProsodySegment] = []
+        self._pending = ""
+        self._sentence = ""
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        self._pending = ""
+        # Hold back an unterminated "[..." that could still become a tag
+        start = text.rfind("[")
+        if start != -1 and "]" not in text[start:] and len(text) - start <= _MAX_TAG_LEN:
+            self._pending = text[start:]
+            text = text[:start]
+        return self._consume(text)
+
+    def finish(self) -> str:
+        display = self._consume(self._pending)
+        self._pending = ""
+        self._close_sentence()
+        return display
+
+    def _consume(self, text: str) -> str:
+        display = []
+        pos = 0
+        for match in _TAG_RE.finditer(text):
+            if match.group(1) not in PROSODY_TAGS:
+                continue
+            display.append(self._append(text[pos:match.start()]))
+            self._close_sentence()
+            self.tag = match.group(1)
+            self.tagged = True
+            pos = match.end()
+            if text[pos:pos + 1] == " ":
+                pos += 1
+        display.append(self._append(text[pos:]))
+        return "".join(display)
+
+    def _append(self, text: str) -> str:
+        for ch in text:
+            self._sentence += ch
+            if ch in _SENTENCE_END:
+                self._close_sentence()
+        return text
+
+    def _close_sentence(self) -> None:
+        if self._sentence.strip():
+            self.segments.append(ProsodySegment(text=self._sentence, tag=self.tag))
+        self._sentence = ""
+
+
+def group_segments(segments: List[ProsodySegment]) -> List[ProsodySegment]:
+    """Merge consecutive sentences with the same tag so each TTS call covers a run."""
+    grouped: List[ProsodySegment] = []
+    for segment in segments:
+        if grouped and grouped[-1].tag == segment.tag:
+            grouped[-1] = ProsodySegment(text=grouped[-1].text + segment.text, tag=segment.tag)
+        else:
+            grouped.append(segment)
+    return grouped
+
+
+def tts_params_for_tag(tag: str, speed_factor: float, fragment_interval: float) -> Tuple[float, float]:
+    """Apply a tag's modulation to the configured TTS speed and interval."""
+    speed_mult, interval_mult = PROSODY_TAGS.get(tag, PROSODY_TAGS["neutral"])
+    speed = max(0.75, min(1.25, speed_factor * speed_mult))
+    interval = max(0.15, min(0.60, fragment_interval * interval_mult))
+    return speed, interval
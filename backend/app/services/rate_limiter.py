@@ -0,0 +1,223 @@
+"""
+Client-side rate limiting primitives for upstream LLM calls.
+"""
+import asyncio
+import hashlib
+import heapq
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute.
+
+    acquire() waits (FIFO) until the requested amount is available, so bursts
+    turn into added latency instead of upstream 429s. A rate of 0 disables the
+    bucket. Requests larger than the capacity are clamped to it so they can
+    still proceed once the bucket is full.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_minute > 0
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, amount: float) -> float:
+        """Take amount tokens, waiting as needed. Returns seconds waited."""
+        if not self.enabled:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                delay = self.delay_for(amount)
+                if delay <= 0:
+                    self.take(amount)
+                    return waited
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if available now)."""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        deficit = min(amount, self.capacity) - self._tokens
+        return deficit / (self.rate_per_minute / 60.0) if deficit > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        if self.enabled:
+            self._refill()
+            self._tokens -= min(amount, self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_minute / 60.0)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parse comma-separated "provider[:model]=rpm/tpm" items.
+    A missing or zero value leaves that dimension unlimited.
+    """
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        target, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        try:
+            limits[target.strip()] = (int(rpm or 0), int(tpm or 0))
+        except ValueError:
+            logger.warning(f"Ignoring malformed rate limit '{item}', expected provider[:model]=rpm/tpm")
+    return limits
+
+
+class _Lane:
+    """Request and token buckets plus the priority queue for one provider/model/key."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # (priority, seq, tokens, label, enqueued_at, future)
+        self.queue: List[tuple] = []
+        self.wake = asyncio.Event()
+        self.pump: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def delay_for(self, tokens: int) -> float:
+        return max(self.requests.delay_for(1), self.tokens.delay_for(tokens))
+
+    def take(self, tokens: int) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+
+class RateLimitScheduler:
+    """
+    Client-side RPM/TPM limiter keyed by provider, model and API key.
+
+    Callers wait in a priority queue (lower value first, FIFO within a
+    priority) until both the request and token buckets of their lane allow
+    the call, so interactive turns overtake queued background work and
+    throughput stays at the configured quota instead of bouncing off 429s.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.limits = limits or {}
+        self._lanes: Dict[Tuple[str, str, str], _Lane] = {}
+        self._seq = 0
+
+    def limits_for(self, provider: str, model: str) -> Tuple[int, int]:
+        return self.limits.get(f"{provider}:{model}") or self.limits.get(provider) or (0, 0)
+
+    def is_limited(self, provider: str, model: str) -> bool:
+        return any(self.limits_for(provider, model))
+
+    def counts_tokens(self, provider: str, model: str) -> bool:
+        return self.limits_for(provider, model)[1] > 0
+
+    async def acquire(
+        self,
+        provider: str,
+        model: str,
+        api_key: Optional[str],
+        tokens: int = 0,
+        priority: int = 0,
+        label: str = "default",
+    ) -> float:
+        """Wait for a slot on the lane. Returns seconds waited."""
+        if not self.is_limited(provider, model):
+            return 0.0
+        key = (provider, model, _fingerprint(api_key))
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(*self.limits_for(provider, model))
+
+        if not lane.queue and lane.delay_for(tokens) <= 0:
+            lane.take(tokens)
+            self._record(lane, label, 0.0)
+            return 0.0
+
+        self._seq += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.queue, (priority, self._seq, tokens, label, time.monotonic(), future))
+        lane.wake.set()
+        if lane.pump is None:
+            lane.pump = asyncio.ensure_future(self._pump(lane))
+        return await future
+
+    def metrics(self) -> Dict[str, dict]:
+        result = {}
+        for (provider, model, key), lane in self._lanes.items():
+            result[f"{provider}:{model}#{key}"] = {
+                "rpm": lane.requests.rate_per_minute,
+                "tpm": lane.tokens.rate_per_minute,
+                "queued": sum(1 for entry in lane.queue if not entry[-1].done()),
+                "tokens_available": round(lane.tokens.available()) if lane.tokens.enabled else None,
+                "wait": {
+                    label: {
+                        "requests": int(stats["requests"]),
+                        "avg_wait_ms": round(stats["total_wait"] / stats["requests"] * 1000, 1),
+                        "max_wait_ms": round(stats["max_wait"] * 1000, 1),
+                    }
+                    for label, stats in lane.stats.items()
+                },
+            }
+        return result
+
+    async def _pump(self, lane: _Lane) -> None:
+        """Release queued callers in priority order as the buckets refill."""
+        try:
+            while lane.queue:
+                _, _, tokens, label, enqueued_at, future = lane.queue[0]
+                if future.done():
+                    # Caller gave up (cancelled) while queued
+                    heapq.heappop(lane.queue)
+                    continue
+                delay = lane.delay_for(tokens)
+                if delay <= 0:
+                    heapq.heappop(lane.queue)
+                    lane.take(tokens)
+                    waited = time.monotonic() - enqueued_at
+                    self._record(lane, label, waited)
+                    future.set_result(waited)
+                    continue
+                # Sleep until the head fits, or until a new (maybe higher priority) caller arrives
+                lane.wake.clear()
+                try:
+                    await asyncio.wait_for(lane.wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            lane.pump = None
+
+    @staticmethod
+    def _record(lane: _Lane, label: str, waited: float) -> None:
+        stats = lane.stats.setdefault(label, {"requests": 0, "total_wait": 0.0, "max_wait": 0.0})
+        stats["requests"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+
+def _fingerprint(api_key: Optional[str]) -> str:
+    """Short stable id for an API key so lanes never expose the key itself."""
+    if not api_key:
+        return "nokey"
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
@@ -0,0 +1,255 @@
+"""
+Semantic response cache for repeated questions.
+Caches assistant replies per character, keyed by a normalized user message and a
+fingerprint of the inputs the reply was generated under that stay the same
+across sessions (user, model, character prompt, memory and character state,
+prosody tags), and replays hits as a paced text stream. Only turns without
+history are cached, so a session's own context never needs to match.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+from app.models.cache import (
+    CachedResponse,
+    CacheLookup,
+    CachePolicy,
+    CachePolicyUpdate,
+    CacheStats,
+)
+from app.services.llm_service import llm_service
+
+logger = logging.getLogger(__name__)
+
+_TRAILING_PUNCT = "?？!！。.~～,，、…"
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of assistant replies.
+
+    Lookup order:
+      1. Exact match on (character, context fingerprint, normalized message)
+      2. Embedding similarity against entries with the same fingerprint,
+         if the character's similarity_threshold is below 1.0
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: int = 24 * 3600,
+        max_entries: int = 200,
+        replay_chars_per_second: float = 80.0,
+    ):
+        self.default_policy = CachePolicy(
+            enabled=enabled,
+            similarity_threshold=similarity_threshold,
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+        )
+        self.replay_chars_per_second = replay_chars_per_second
+        self._policies: Dict[str, CachePolicy] = {}
+        self._entries: Dict[str, "OrderedDict[str, CachedResponse]"] = {}
+        self._stats: Dict[str, CacheStats] = {}
+
+    def get_policy(self, character_id: str) -> CachePolicy:
+        return self._policies.get(character_id, self.default_policy)
+
+    def set_policy(self, character_id: str, update: CachePolicyUpdate) -> CachePolicy:
+        """Merge a partial update into the character's policy."""
+        current = self.get_policy(character_id)
+        policy = current.model_copy(update=update.model_dump(exclude_none=True))
+        self._policies[character_id] = policy
+        if not policy.enabled:
+            self.clear(character_id)
+        else:
+            self._evict(character_id, policy)
+        return policy
+
+    @staticmethod
+    def normalize_message(text: str) -> str:
+        """NFKC-fold, lowercase, collapse whitespace and drop trailing punctuation."""
+        text = unicodedata.normalize("NFKC", text or "").lower()
+        text = re.sub(r"\s+", " ", text).strip()
+        return text.rstrip(_TRAILING_PUNCT + " ")
+
+    @staticmethod
+    def context_fingerprint(*parts: Optional[str]) -> str:
+        """Stable hash of the personalized context a reply was generated under."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update((part or "").encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def turn_fingerprint(
+        cls,
+        user_id: str,
+        provider: str,
+        model: str,
+        system_prompt: str,
+        memory_context: Optional[str],
+        state_context: str,
+        prosody_tags: bool,
+    ) -> str:
+        """
+        Fingerprint of an opening turn. state_context must leave out anything
+        that changes every session (the conversation count). Replies cached
+        with prosody tags keep them, so the tag setting is part of it too.
+        """
+        return cls.context_fingerprint(
+            user_id,
+            f"{provider}/{model}",
+            "prosody" if prosody_tags else "plain",
+            system_prompt,
+            memory_context,
+            state_context,
+        )
+
+    async def lookup(
+        self,
+        character_id: str,
+        message: str,
+        fingerprint: str,
+    ) -> Optional[CacheLookup]:
+        """Return a CacheLookup (with entry set on hit), or None if caching is off."""
+        policy = self.get_policy(character_id)
+        if not policy.enabled:
+            return None
+
+        normalized = self.normalize_message(message)
+        if not normalized:
+            return None
+
+        stats = self._stats.setdefault(character_id, CacheStats())
+        result = CacheLookup(
+            character_id=character_id,
+            fingerprint=fingerprint,
+            normalized_message=normalized,
+        )
+        entries = self._entries.get(character_id)
+        self._expire(character_id, policy)
+
+        key = self._key(fingerprint, normalized)
+        if entries and key in entries:
+            entry = entries[key]
+            entries.move_to_end(key)
+            entry.hit_count += 1
+            stats.hits += 1
+            result.entry = entry
+            return result
+
+        if policy.similarity_threshold < 1.0 and entries:
+            candidates = [e for e in entries.values() if e.fingerprint == fingerprint and e.embedding]
+            if candidates:
+                result.embedding = await llm_service.get_embedding(normalized)
+            if result.embedding:
+                best, best_score = None, 0.0
+                for candidate in candidates:
+                    score = self._cosine(result.embedding, candidate.embedding)
+                    if score > best_score:
+                        best, best_score = candidate, score
+                if best is not None and best_score >= policy.similarity_threshold:
+                    entries.move_to_end(self._key(best.fingerprint, best.normalized_message))
+                    best.hit_count += 1
+                    stats.hits += 1
+                    stats.semantic_hits += 1
+                    result.entry = best
+                    logger.info(
+                        "Semantic cache hit for %s (score=%.3f)", character_id, best_score
+                    )
+                    return result
+
+        stats.misses += 1
+        return result
+
+    async def store(self, lookup: CacheLookup, chunks: List[str]) -> None:
+        """Store a freshly generated reply for a previous cache miss."""
+        if lookup.entry is not None or not "".join(chunks).strip():
+            return
+        policy = self.get_policy(lookup.character_id)
+        if not policy.enabled:
+            return
+
+        embedding = lookup.embedding
+        if not embedding and policy.similarity_threshold < 1.0:
+            embedding = await llm_service.get_embedding(lookup.normalized_message)
+
+        entries = self._entries.setdefault(lookup.character_id, OrderedDict())
+        key = self._key(lookup.fingerprint, lookup.normalized_message)
+        entries[key] = CachedResponse(
+            character_id=lookup.character_id,
+            fingerprint=lookup.fingerprint,
+            normalized_message=lookup.normalized_message,
+            chunks=list(chunks),
+            embedding=embedding,
+            created_at=time.time(),
+        )
+        entries.move_to_end(key)
+        self._stats.setdefault(lookup.character_id, CacheStats()).stores += 1
+        self._evict(lookup.character_id, policy)
+
+    async def replay(self, entry: CachedResponse) -> AsyncIterator[str]:
+        """Replay cached chunks, pacing them like a live generation."""
+        for index, chunk in enumerate(entry.chunks):
+            if index > 0 and self.replay_chars_per_second > 0:
+                await asyncio.sleep(len(chunk) / self.replay_chars_per_second)
+            yield chunk
+
+    def stats(self) -> Dict[str, CacheStats]:
+        """Per-character counters, including characters that only have a policy."""
+        result = {}
+        for character_id in set(self._stats) | set(self._policies):
+            stats = self._stats.get(character_id, CacheStats()).model_copy()
+            stats.entries = len(self._entries.get(character_id, {}))
+            result[character_id] = stats
+        return result
+
+    def clear(self, character_id: Optional[str] = None) -> None:
+        if character_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(character_id, None)
+
+    @staticmethod
+    def _key(fingerprint: str, normalized: str) -> str:
+        return f"{fingerprint}:{normalized}"
+
+    def _expire(self, character_id: str, policy: CachePolicy) -> None:
+        entries = self._entries.get(character_id)
+        if not entries or policy.ttl_seconds <= 0:
+            return
+        cutoff = time.time() - policy.ttl_seconds
+        for key in [k for k, e in entries.items() if e.created_at < cutoff]:
+            del entries[key]
+
+    def _evict(self, character_id: str, policy: CachePolicy) -> None:
+        entries = self._entries.get(character_id)
+        while entries and len(entries) > policy.max_entries:
+            entries.popitem(last=False)
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        if len(a) != len(b):
+            return 0.0
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+
+response_cache = ResponseCache(
+    enabled=settings.response_cache_enabled,
+    similarity_threshold=settings.response_cache_similarity_threshold,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    max_entries=settings.response_cache_max_entries,
+    replay_chars_per_second=settings.response_cache_replay_chars_per_second,
+)
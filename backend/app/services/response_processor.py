@@ -1,17 +1,28 @@
 """
 Post-response signal extraction and state update pipeline.
+
+process_turn only does the cheap per-turn updates inline. Segment extraction
+runs in the background (on the memory pipeline when graph memory is on), and
+its preferences, observation and tone are applied when it finishes, so the
+chat stream never waits on extraction or pipeline admission.
 """
-import json
+import asyncio
+import logging
 import re
-from typing import Optional
 
 from sqlalchemy.orm import Session as DBSession
 
+from app.database import SessionLocal
+from app.models.memory import TurnExtraction
 from app.models.session import ProcessedResponse
 from app.services.character_state import CharacterStateService
 from app.services.session_service import SessionService
-from app.services.llm_service import llm_service
+from app.services.memory_pipeline import MemoryJob
 from app.services.memory_service import get_memory_service
+from app.services.extraction_scheduler import extraction_scheduler
+from app.services.turn_extractor import ExtractionError
+
+logger = logging.getLogger(__name__)
 
 
 class ResponseProcessor:
@@ -22,10 +33,14 @@ class ResponseProcessor:
         session_service: SessionService,
         character_state_service: CharacterStateService,
         deep_analysis_interval: int = 6,
+        session_factory=SessionLocal,
     ):
         self.session_service = session_service
         self.character_state_service = character_state_service
         self.deep_analysis_interval = deep_analysis_interval
+        self._session_factory = session_factory
+        self._background: set = set()
+        self._listening = None
 
     async def process_turn(
         self,
@@ -44,31 +59,71 @@ class ResponseProcessor:
         self.session_service.update_tone(conversation_id, emotion)
 
         state = self.character_state_service.record_message(db, user_id, character_id)
+        turn_messages = [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_text},
+        ]
 
-        memory_signals = None
-        if state.total_messages % self.deep_analysis_interval == 0:
-            memory_signals = await self._deep_extract_signals(
-                history_messages=history_messages,
-                user_message=user_message,
-                assistant_text=assistant_text,
+        # One extraction call per segment. With graph memory on, the memory buffer
+        # sets the cadence and the pipeline's extract stage does the work (it acks
+        # the segment once written); otherwise every deep_analysis_interval messages.
+        memory_service = get_memory_service()
+        if memory_service:
+            if self._listening is not memory_service:
+                memory_service.add_job_listener(self._apply_job_signals)
+                self._listening = memory_service
+            buffered = memory_service.buffer_messages(conversation_id, turn_messages, user_id, character_id)
+            if buffered:
+                await memory_service.schedule_segment(buffered)
+        elif state.total_messages % self.deep_analysis_interval == 0:
+            segment = (history_messages[-8:] if history_messages else []) + turn_messages
+            task = asyncio.ensure_future(
+                self._extract_signals(self._segment_text(segment), user_id, character_id, conversation_id)
             )
-            if memory_signals:
-                self.character_state_service.apply_deep_signals(
-                    db,
-                    state,
-                    preferences=memory_signals.get("preferences"),
-                    observation=memory_signals.get("observation"),
-                )
-
-        await self._write_memory(user_id, conversation_id, character_id, user_message, assistant_text, memory_signals)
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
         return ProcessedResponse(
             text=assistant_text,
             emotion=emotion,
             topics=topics,
-            memory_signals=memory_signals,
+            memory_signals=None,
             actions=None,
         )
 
+    async def join(self) -> None:
+        """Wait for the background extractions started so far"""
+        await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    async def _extract_signals(self, text: str, user_id: str, character_id: str, conversation_id: str) -> None:
+        try:
+            extraction = await extraction_scheduler.submit(text, user_id, conversation_id)
+        except ExtractionError as e:
+            logger.warning(f"Segment extraction for conversation {conversation_id} failed: {str(e)}")
+            return
+        self._apply_signals(user_id, character_id, conversation_id, extraction)
+
+    def _apply_job_signals(self, job: MemoryJob) -> None:
+        self._apply_signals(job.user_id, job.character_id, job.conversation_id, job.extraction)
+
+    def _apply_signals(
+        self, user_id: str, character_id: str, conversation_id: str, extraction: TurnExtraction
+    ) -> None:
+        self.session_service.update_tone(conversation_id, extraction.tone)
+        if not (extraction.preferences or extraction.observation):
+            return
+        db = self._session_factory()
+        try:
+            state = self.character_state_service.get_or_create(db, user_id, character_id)
+            self.character_state_service.apply_deep_signals(
+                db,
+                state,
+                preferences=extraction.preferences,
+                observation=extraction.observation,
+            )
+        finally:
+            db.close()
+
     @staticmethod
     def _extract_topics(text: str) -> list[str]:
         terms = re.findall(r"[A-Za-z][A-Za-z0-9_+-]{2,}", text.lower())
@@ -94,73 +149,8 @@ class ResponseProcessor:
             return "focused"
         return "neutral"
 
-    async def _deep_extract_signals(
-        self,
-        history_messages: list[dict],
-        user_message: str,
-        assistant_text: str,
-    ) -> Optional[dict]:
-        segment = history_messages[-8:] if history_messages else []
-        segment_text = "\n".join(
-            [f"{m.get('role', 'unknown')}: {m.get('content', '')}" for m in segment]
-        )
-        segment_text += f"\nuser: {user_message}\nassistant: {assistant_text}"
-
-        prompt = (
-            "Extract user preference and one character observation as JSON.\n"
-            "Return format:\n"
-            "{\"preferences\": {\"key\": \"value\"}, \"observation\": \"...\"}\n"
-            "Only include confident signals.\n\n"
-            f"Conversation:\n{segment_text}"
+    @staticmethod
+    def _segment_text(messages: list[dict]) -> str:
+        return "\n".join(
+            [f"{m.get('role', 'unknown')}: {m.get('content', '')}" for m in messages]
         )
-        try:
-            raw = await llm_service.chat(
-                message=prompt,
-                history=[],
-                system_prompt="You are an information extraction assistant.",
-            )
-            match = re.search(r"\{.*\}", raw, re.DOTALL)
-            if not match:
-                return None
-            data = json.loads(match.group(0))
-            if not isinstance(data, dict):
-                return None
-            return {
-                "preferences": data.get("preferences", {}),
-                "observation": data.get("observation", ""),
-            }
-        except Exception:
-            return None
-
-    async def _write_memory(
-        self,
-        user_id: str,
-        conversation_id: str,
-        character_id: str,
-        user_message: str,
-        assistant_text: str,
-        memory_signals: Optional[dict],
-    ) -> None:
-        memory_service = get_memory_service()
-        if not memory_service:
-            return
-        try:
-            await memory_service.write_conversation(
-                user_id=user_id,
-                conversation_id=conversation_id,
-                messages=[
-                    {"role": "user", "content": user_message},
-                    {"role": "assistant", "content": assistant_text},
-                ],
-                character_id=character_id,
-            )
-            if memory_signals:
-                await memory_service.write_relational_signals(
-                    user_id=user_id,
-                    character_id=character_id,
-                    conversation_id=conversation_id,
-                    preferences=memory_signals.get("preferences", {}),
-                    observation=memory_signals.get("observation", ""),
-                )
-        except Exception:
-            return
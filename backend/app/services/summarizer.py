@@ -13,7 +13,7 @@ from sqlalchemy.orm import Session as DBSession
 
 from app.models.session import ConversationSummaryData
 from app.models.db_session import ConversationSummaryDB
-from app.services.llm_service import llm_service
+from app.services.llm_service import llm_service, TASK_SUMMARIZATION
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +66,7 @@ class Summarizer:
                 message=f"{context}Conversation segment to summarize:\n{old_text}",
                 history=[],
                 system_prompt=ROLLING_SUMMARY_PROMPT,
+                task=TASK_SUMMARIZATION,
             )
             summary = summary.strip()
             logger.info(
@@ -95,6 +96,7 @@ class Summarizer:
                 message=f"Conversation to summarize:\n{conversation_text}",
                 history=[],
                 system_prompt=END_OF_SESSION_PROMPT,
+                task=TASK_SUMMARIZATION,
             )
 
             data = self._parse_summary_json(raw)
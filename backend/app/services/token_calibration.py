@@ -0,0 +1,251 @@
+"""
+Online calibration of the char-based token estimator.
+
+Provider-reported prompt/completion token usage is regressed on the CJK and
+other character counts of the text that produced it, giving per-model
+tokens-per-character rates. Fitted rates are installed into TokenCounter,
+persisted to SQLite from a worker thread (coalescing models that change
+while a write is running), and the estimate-versus-actual error is tracked
+so the calibration can be checked.
+"""
+import asyncio
+import json
+import logging
+import math
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.db_session import TokenCalibrationDB
+from app.services.model_registry import model_registry
+from app.services.token_counter import (
+    DEFAULT_CJK_RATE,
+    DEFAULT_LATIN_RATE,
+    char_classes,
+    set_calibration,
+)
+
+logger = logging.getLogger(__name__)
+
+# The default rates act as a prior worth about this many characters of each class
+PRIOR_CHARS = 1000
+RATE_BOUNDS = (0.05, 2.0)
+
+
+class _ModelFit:
+    """Exponentially decayed least squares of tokens ~ a*cjk + b*other, with a prior."""
+
+    def __init__(self, decay: float):
+        self.decay = decay
+        self.xx = [0.0, 0.0, 0.0]  # sum cjk^2, cjk*other, other^2
+        self.xy = [0.0, 0.0]       # sum cjk*tokens, other*tokens
+        self.samples = 0
+        self.errors: Deque[float] = deque(maxlen=500)
+
+    def add(self, cjk: int, other: int, tokens: int) -> None:
+        self.xx = [v * self.decay for v in self.xx]
+        self.xy = [v * self.decay for v in self.xy]
+        self.xx[0] += cjk * cjk
+        self.xx[1] += cjk * other
+        self.xx[2] += other * other
+        self.xy[0] += cjk * tokens
+        self.xy[1] += other * tokens
+        self.samples += 1
+
+    def rates(self) -> Tuple[float, float]:
+        prior = PRIOR_CHARS * PRIOR_CHARS
+        a11 = self.xx[0] + prior
+        a12 = self.xx[1]
+        a22 = self.xx[2] + prior
+        y1 = self.xy[0] + prior * DEFAULT_CJK_RATE
+        y2 = self.xy[1] + prior * DEFAULT_LATIN_RATE
+        det = a11 * a22 - a12 * a12
+        cjk_rate = (a22 * y1 - a12 * y2) / det
+        latin_rate = (a11 * y2 - a12 * y1) / det
+        low, high = RATE_BOUNDS
+        return min(high, max(low, cjk_rate)), min(high, max(low, latin_rate))
+
+    def stats(self) -> dict:
+        return {"xx": self.xx, "xy": self.xy}
+
+
+class TokenCalibrator:
+    """Fits per-model char-based rates from provider usage and tracks estimate error."""
+
+    def __init__(self, min_samples: int = 20, decay: float = 0.995, persist_every: int = 10):
+        self.min_samples = min_samples
+        self.decay = decay
+        self.persist_every = persist_every
+        self._fits: Dict[Tuple[str, str], _ModelFit] = {}
+        self._loaded = False
+        # Rows waiting to be written, latest values per model
+        self._dirty: Dict[Tuple[str, str], dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        messages: List[dict],
+        completion: str,
+        input_tokens: int,
+        output_tokens: int,
+    ) -> None:
+        """Add one call's reported usage. Call with the messages as sent."""
+        self.load()
+        key = (provider.lower(), model)
+        fit = self._fits.get(key)
+        if fit is None:
+            fit = self._fits[key] = _ModelFit(self.decay)
+
+        counter = model_registry.token_counter(provider, model)
+        if input_tokens > 0:
+            estimate = counter.count_messages(messages)
+            fit.errors.append((estimate - input_tokens) / input_tokens)
+
+            cjk = other = 0
+            for msg in messages:
+                for text in (msg.get("role", ""), msg.get("content", "")):
+                    c, o = char_classes(text)
+                    cjk += c
+                    other += o
+            overhead = counter.OVERHEAD_BASE + counter.OVERHEAD_PER_MESSAGE * len(messages)
+            fit.add(cjk, other, max(0, input_tokens - overhead))
+
+        if output_tokens > 0 and completion:
+            fit.add(*char_classes(completion), output_tokens)
+
+        if fit.samples >= self.min_samples:
+            set_calibration(provider, model, *fit.rates())
+        if fit.samples % self.persist_every == 0:
+            self._persist(key, fit)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Fitted rates and prompt estimate error distribution per model."""
+        self.load()
+        result = {}
+        for (provider, model), fit in self._fits.items():
+            errors = sorted(abs(e) for e in fit.errors)
+            cjk_rate, latin_rate = fit.rates()
+            result[f"{provider}:{model}"] = {
+                "samples": fit.samples,
+                "active": fit.samples >= self.min_samples,
+                "cjk_tokens_per_char": round(cjk_rate, 4),
+                "latin_tokens_per_char": round(latin_rate, 4),
+                "error_samples": len(errors),
+                "mean_error_pct": _pct(sum(fit.errors) / len(fit.errors)) if errors else None,
+                "p50_abs_error_pct": _pct(_nearest_rank(errors, 0.5)),
+                "p90_abs_error_pct": _pct(_nearest_rank(errors, 0.9)),
+                "p99_abs_error_pct": _pct(_nearest_rank(errors, 0.99)),
+            }
+        return result
+
+    def load(self) -> None:
+        """Load persisted fits once and install their rates."""
+        if self._loaded:
+            return
+        self._loaded = True
+        db = SessionLocal()
+        try:
+            for row in db.query(TokenCalibrationDB).all():
+                fit = _ModelFit(self.decay)
+                stats = json.loads(row.stats or "{}")
+                fit.xx = stats.get("xx", fit.xx)
+                fit.xy = stats.get("xy", fit.xy)
+                fit.samples = row.samples or 0
+                self._fits[(row.provider, row.model)] = fit
+                if fit.samples >= self.min_samples:
+                    set_calibration(row.provider, row.model, row.cjk_rate, row.latin_rate)
+            if self._fits:
+                logger.info(f"Loaded token calibration for {len(self._fits)} models")
+        except Exception as e:
+            logger.warning(f"Could not load token calibration: {str(e)}")
+        finally:
+            db.close()
+
+    async def flush(self) -> None:
+        """Wait for pending calibration writes (e.g. at shutdown)."""
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._dirty:
+            await self._write_pending()
+
+    def _persist(self, key: Tuple[str, str], fit: _ModelFit) -> None:
+        """Queue the fit for writing; on the event loop the write runs in a thread."""
+        cjk_rate, latin_rate = fit.rates()
+        self._dirty[key] = {
+            "cjk_rate": cjk_rate,
+            "latin_rate": latin_rate,
+            "samples": fit.samples,
+            "stats": json.dumps(fit.stats()),
+        }
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._take_dirty())
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        while self._dirty:
+            await asyncio.to_thread(self._write, self._take_dirty())
+
+    def _take_dirty(self) -> Dict[Tuple[str, str], dict]:
+        rows, self._dirty = self._dirty, {}
+        return rows
+
+    @staticmethod
+    def _write(rows: Dict[Tuple[str, str], dict]) -> None:
+        db = SessionLocal()
+        try:
+            for (provider, model), values in rows.items():
+                row = db.get(TokenCalibrationDB, f"{provider}:{model}")
+                if row is None:
+                    row = TokenCalibrationDB(id=f"{provider}:{model}", provider=provider, model=model)
+                    db.add(row)
+                for name, value in values.items():
+                    setattr(row, name, value)
+                row.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not persist token calibration for {len(rows)} models: {str(e)}")
+        finally:
+            db.close()
+
+
+def usage_from_message(message: Any) -> Optional[Tuple[int, int]]:
+    """
+    (input_tokens, output_tokens) reported on a LangChain message or chunk, if any.
+    Newer LangChain exposes usage_metadata; older clients put provider usage in
+    response_metadata.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        reasoning = (usage.get("output_token_details") or {}).get("reasoning", 0)
+        return int(usage.get("input_tokens") or 0), int(usage.get("output_tokens") or 0) - int(reasoning or 0)
+    metadata = getattr(message, "response_metadata", None) or {}
+    usage = metadata.get("token_usage")
+    if usage:
+        return int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0)
+    usage = metadata.get("usage_metadata")
+    if usage:
+        return int(usage.get("prompt_token_count") or 0), int(usage.get("candidates_token_count") or 0)
+    return None
+
+
+def _nearest_rank(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _pct(value: Optional[float]) -> Optional[float]:
+    return round(value * 100, 1) if value is not None else None
+
+
+token_calibrator = TokenCalibrator(min_samples=settings.token_calibration_min_samples)
@@ -3,42 +3,76 @@ Token counting abstraction.
 Uses tiktoken for OpenAI models, character-based approximation for others.
 """
 import logging
+import math
+from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 _tiktoken_cache: dict = {}
 
+# Encoding used when the installed tiktoken does not know the requested one
+FALLBACK_ENCODING = "cl100k_base"
 
-def _get_tiktoken_encoding(model: str):
-    """Get or create a cached tiktoken encoding for the given model."""
-    if model not in _tiktoken_cache:
+# Tokens per character for the char-based approximation
+DEFAULT_CJK_RATE = 0.5
+DEFAULT_LATIN_RATE = 0.25
+
+# (provider, model) -> (cjk_rate, latin_rate) fitted from provider-reported usage
+_calibrations: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+
+def set_calibration(provider: str, model: str, cjk_rate: float, latin_rate: float) -> None:
+    """Install fitted char-based rates for provider/model (used by all TokenCounters)."""
+    _calibrations[(provider.lower(), model)] = (cjk_rate, latin_rate)
+
+
+def get_calibration(provider: str, model: str) -> Tuple[float, float]:
+    return _calibrations.get((provider.lower(), model), (DEFAULT_CJK_RATE, DEFAULT_LATIN_RATE))
+
+
+def _get_tiktoken_encoding(model: str, encoding_name: Optional[str] = None):
+    """Get or create a cached tiktoken encoding for the given model (or named encoding)."""
+    key = encoding_name or model
+    if key not in _tiktoken_cache:
         try:
             import tiktoken
-            try:
-                _tiktoken_cache[model] = tiktoken.encoding_for_model(model)
-            except KeyError:
-                _tiktoken_cache[model] = tiktoken.get_encoding("cl100k_base")
         except ImportError:
             logger.warning("tiktoken not installed, falling back to char-based counting")
             return None
-    return _tiktoken_cache[model]
+        try:
+            if encoding_name:
+                _tiktoken_cache[key] = tiktoken.get_encoding(encoding_name)
+            else:
+                _tiktoken_cache[key] = tiktoken.encoding_for_model(model)
+        except (KeyError, ValueError) as e:
+            # Older tiktoken releases lack newer encodings (o200k_base) and models
+            logger.warning(f"tiktoken cannot resolve {key} ({e}), falling back to {FALLBACK_ENCODING}")
+            _tiktoken_cache[key] = tiktoken.get_encoding(FALLBACK_ENCODING)
+    return _tiktoken_cache[key]
 
 
 class TokenCounter:
     """
     Counts tokens for different LLM providers.
     - OpenAI: uses tiktoken (accurate)
-    - Gemini/others: character-based approximation (~2 CJK chars or ~4 Latin chars per token)
+    - Gemini/others: character-based approximation (~2 CJK chars or ~4 Latin chars per token),
+      corrected by per-model rates fitted from provider usage when available
     """
 
     OVERHEAD_PER_MESSAGE = 4
     OVERHEAD_BASE = 3
 
-    def __init__(self, provider: str = "openai", model: str = "gpt-4o"):
+    def __init__(self, provider: str = "openai", model: str = "gpt-4o", tokenizer: Optional[str] = None):
+        """
+        tokenizer: tiktoken encoding name, or "chars" to force the char-based
+        estimate; None picks by provider (tiktoken for OpenAI).
+        """
         self.provider = provider.lower()
         self.model = model
         self._encoding = None
-        if self.provider == "openai":
+        if tokenizer and tokenizer != "chars":
+            self._encoding = _get_tiktoken_encoding(model, tokenizer)
+        elif tokenizer is None and self.provider == "openai":
             self._encoding = _get_tiktoken_encoding(model)
 
     def count_text(self, text: str) -> int:
@@ -49,7 +83,7 @@ class TokenCounter:
         if self._encoding is not None:
             return len(self._encoding.encode(text))
 
-        return self._char_based_count(text)
+        return self._char_based_count(text, *get_calibration(self.provider, self.model))
 
     def count_messages(self, messages: list[dict]) -> int:
         """
@@ -64,27 +98,38 @@ class TokenCounter:
         return total
 
     @staticmethod
-    def _char_based_count(text: str) -> int:
+    def _char_based_count(
+        text: str,
+        cjk_rate: float = DEFAULT_CJK_RATE,
+        latin_rate: float = DEFAULT_LATIN_RATE,
+    ) -> int:
         """
         Approximate token count using character heuristics.
-        CJK characters: ~1 token per 2 chars.
-        Latin characters: ~1 token per 4 chars.
+        Defaults: CJK ~1 token per 2 chars, Latin ~1 token per 4 chars;
+        calibrated per-model rates replace these once available.
         """
-        cjk_count = 0
-        latin_count = 0
-        for ch in text:
-            cp = ord(ch)
-            if (
-                0x4E00 <= cp <= 0x9FFF
-                or 0x3400 <= cp <= 0x4DBF
-                or 0xF900 <= cp <= 0xFAFF
-                or 0x3000 <= cp <= 0x303F
-                or 0x3040 <= cp <= 0x309F
-                or 0x30A0 <= cp <= 0x30FF
-                or 0xAC00 <= cp <= 0xD7AF
-            ):
-                cjk_count += 1
-            else:
-                latin_count += 1
+        if not text:
+            return 0
+        cjk_count, latin_count = char_classes(text)
+        return max(1, math.ceil(cjk_count * cjk_rate) + math.ceil(latin_count * latin_rate))
+
 
-        return max(1, (cjk_count + 1) // 2 + (latin_count + 3) // 4) if text else 0
+def char_classes(text: str) -> Tuple[int, int]:
+    """Return (CJK character count, other character count)."""
+    cjk_count = 0
+    latin_count = 0
+    for ch in text:
+        cp = ord(ch)
+        if (
+            0x4E00 <= cp <= 0x9FFF
+            or 0x3400 <= cp <= 0x4DBF
+            or 0xF900 <= cp <= 0xFAFF
+            or 0x3000 <= cp <= 0x303F
+            or 0x3040 <= cp <= 0x309F
+            or 0x30A0 <= cp <= 0x30FF
+            or 0xAC00 <= cp <= 0xD7AF
+        ):
+            cjk_count += 1
+        else:
+            latin_count += 1
+    return cjk_count, latin_count
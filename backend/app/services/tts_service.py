@@ -8,6 +8,7 @@ import logging
 from typing import Optional, List, AsyncIterator
 import aiohttp
 from app.config import settings
+from app.services.cassette import cassette
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +80,19 @@ class TTSService:
             "aux_ref_audio_paths": aux_ref_audio_paths or []
         }
         
+        # Cassette key excludes base_url so recordings replay against any host
+        return await cassette.call(
+            "tts", payload, lambda: self._request_tts(url, payload, max_retries)
+        )
+    
+    async def _request_tts(self, url: str, payload: dict, max_retries: int) -> Optional[str]:
+        """POST a non-streaming TTS request with retries; returns base64 audio or None"""
+        text = payload["text"]
+        text_lang = payload["text_lang"]
+        prompt_lang = payload["prompt_lang"]
+        prompt_text = payload["prompt_text"]
+        ref_audio_path = payload["ref_audio_path"]
+        
         # Retry logic with exponential backoff
         for attempt in range(max_retries):
             try:
@@ -198,6 +212,13 @@ class TTSService:
             "aux_ref_audio_paths": aux_ref_audio_paths or []
         }
         
+        async for chunk in cassette.stream(
+            "tts_stream", payload, lambda: self._stream_tts(url, payload, max_retries)
+        ):
+            yield chunk
+    
+    async def _stream_tts(self, url: str, payload: dict, max_retries: int) -> AsyncIterator[bytes]:
+        """POST a streaming TTS request with retries, yielding raw audio chunks"""
         for attempt in range(max_retries):
             try:
                 async with aiohttp.ClientSession(timeout=self.timeout) as session:
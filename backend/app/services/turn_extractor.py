@@ -0,0 +1,346 @@
+"""
+Unified structured extraction for a conversation segment.
+One LLM call returns entities, relations, user preferences, a character
+observation and the emotional tone, validated against TurnExtraction.
+"""
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models.memory import Entity, Relation, TurnExtraction
+from app.services.llm_service import llm_service, TASK_EXTRACTION
+
+logger = logging.getLogger(__name__)
+
+# Placeholder the model uses for the user node; mapped back to the real user_id.
+USER_PLACEHOLDER = "USER"
+
+TONES = {"energetic", "empathetic", "focused", "neutral"}
+
+EXTRACTION_PROMPT = """你是一个信息抽取助手。请从对话中一次性抽取以下全部信息，并以一个JSON对象返回。
+
+1. entities：实体列表。类型包括 Topic（话题/领域）、Project（项目）、Skill（技能）、Resource（资源：文档、课程、论文、工具等）。
+   为每个实体评估重要性评分 score（1-10，10分为核心事实如职业、长期项目，1分为琐事），仅保留 score >= {threshold} 的实体。
+2. relations：关系列表。用户本人用 "USER" 表示。关系类型：
+   INTERESTED_IN（用户对话题感兴趣）、WORKING_ON（用户正在做的项目）、HAS_SKILL（用户拥有的技能）、
+   LEARNED_FROM（用户从资源中学习）、USES（项目使用的技能）、RELATED_TO（实体之间的关联）
+3. preferences：有把握的用户偏好，键值均为字符串，如 {{"explanation_style": "detailed"}}
+4. observation：角色对用户的一句观察（没有则为空字符串）
+5. tone：本段对话的情绪基调，只能是 energetic、empathetic、focused、neutral 之一
+
+返回格式：
+{{
+    "entities": [
+        {{"id": "topic_python", "type": "Topic", "name": "Python", "score": 8, "properties": {{}}}}
+    ],
+    "relations": [
+        {{"source": "USER", "target": "topic_python", "type": "INTERESTED_IN", "properties": {{"confidence": 0.8}}}}
+    ],
+    "preferences": {{"explanation_style": "detailed"}},
+    "observation": "",
+    "tone": "neutral"
+}}
+
+只返回JSON，不要其他文字说明。只包含有把握的信息。"""
+
+# Appended to EXTRACTION_PROMPT when several independent segments share one call.
+BATCH_EXTRACTION_SUFFIX = """
+
+本次输入包含多段相互独立的对话，每段以 <doc id="..."> 开头、</doc> 结尾，分别属于不同用户。
+请对每段单独抽取，互不混用信息，每段中的用户本人都用 "USER" 表示。返回格式：
+{"documents": [{"doc_id": "d1", "entities": [], "relations": [], "preferences": {}, "observation": "", "tone": "neutral"}]}
+每段对话都必须在 documents 中出现一次。"""
+
+
+class ExtractionError(Exception):
+    """The extraction call failed or returned no usable JSON"""
+
+
+class TurnExtractor:
+    """Runs the single per-segment extraction call and validates its output."""
+
+    async def extract(self, conversation_text: str, user_id: str) -> Optional[TurnExtraction]:
+        """Extract all memory signals from a conversation segment, or None on failure."""
+        try:
+            raw = await llm_service.chat(
+                message=f"对话内容：\n{conversation_text}",
+                history=[],
+                system_prompt=self.system_prompt(),
+                task=TASK_EXTRACTION,
+                json_mode=True,
+            )
+        except Exception as e:
+            logger.error(f"Turn extraction failed: {str(e)}")
+            return None
+
+        data = parse_json_object(raw)
+        if data is None:
+            logger.warning(f"Failed to parse extraction JSON from LLM output: {raw[:200]}")
+            return None
+
+        extraction = self.validate(data, user_id)
+        logger.info(
+            f"Extracted {len(extraction.entities)} entities, {len(extraction.relations)} relations, "
+            f"{len(extraction.preferences)} preferences"
+        )
+        return extraction
+
+    async def extract_streaming(
+        self,
+        conversation_text: str,
+        user_id: str,
+        on_entity: Callable[[Entity], None],
+    ) -> Optional[TurnExtraction]:
+        """
+        Stream the extraction call and hand each entity to on_entity as soon as
+        its JSON object closes, so downstream work (embeddings) overlaps with
+        generation. Returns the full validated extraction, or None on failure.
+        """
+        messages = [
+            {"role": "system", "content": self.system_prompt()},
+            {"role": "user", "content": f"对话内容：\n{conversation_text}"},
+        ]
+        parser = EntityStreamParser()
+        parts = []
+        try:
+            async for chunk in llm_service.astream_from_messages(messages, task=TASK_EXTRACTION):
+                parts.append(chunk)
+                for item in parser.feed(chunk):
+                    try:
+                        entity = Entity.model_validate(item)
+                    except ValidationError:
+                        continue
+                    if entity.score >= settings.memory_threshold_score:
+                        on_entity(entity)
+        except Exception as e:
+            logger.error(f"Streaming turn extraction failed: {str(e)}")
+            return None
+
+        raw = "".join(parts)
+        data = parse_json_object(raw)
+        if data is None:
+            logger.warning(f"Failed to parse extraction JSON from LLM output: {raw[:200]}")
+            return None
+        extraction = self.validate(data, user_id)
+        logger.info(
+            f"Streamed extraction: {len(extraction.entities)} entities "
+            f"({parser.emitted} emitted early), {len(extraction.relations)} relations"
+        )
+        return extraction
+
+    async def extract_batch(
+        self, documents: List[Tuple[str, str, str]]
+    ) -> Dict[str, TurnExtraction]:
+        """
+        Extract several independent segments in one call.
+
+        documents is a list of (doc_id, conversation_text, user_id). Returns
+        extractions keyed by doc_id; documents missing from the response are
+        absent from the result. Raises ExtractionError when the call fails or
+        its reply cannot be parsed.
+        """
+        body = "\n\n".join(
+            f'<doc id="{doc_id}">\n{text}\n</doc>' for doc_id, text, _ in documents
+        )
+        try:
+            raw = await llm_service.chat(
+                message=f"对话内容：\n{body}",
+                history=[],
+                system_prompt=self.batch_system_prompt(),
+                task=TASK_EXTRACTION,
+                json_mode=True,
+            )
+        except Exception as e:
+            raise ExtractionError(f"Batch turn extraction failed: {str(e)}") from e
+
+        data = parse_json_object(raw)
+        sections = data.get("documents") if data else None
+        if not isinstance(sections, list):
+            raise ExtractionError(f"Failed to parse batch extraction JSON from LLM output: {raw[:200]}")
+
+        users = {doc_id: user_id for doc_id, _, user_id in documents}
+        results = {}
+        for section in sections:
+            if not isinstance(section, dict):
+                continue
+            doc_id = str(section.get("doc_id") or "")
+            if doc_id in users and doc_id not in results:
+                results[doc_id] = self.validate(section, users[doc_id])
+
+        missing = len(documents) - len(results)
+        logger.info(f"Batch extraction covered {len(results)}/{len(documents)} documents")
+        if missing:
+            logger.warning(f"Batch extraction response omitted {missing} documents")
+        return results
+
+    @staticmethod
+    def system_prompt() -> str:
+        return EXTRACTION_PROMPT.format(threshold=settings.memory_threshold_score)
+
+    @classmethod
+    def batch_system_prompt(cls) -> str:
+        return cls.system_prompt() + BATCH_EXTRACTION_SUFFIX
+
+    @staticmethod
+    def validate(data: Any, user_id: str) -> TurnExtraction:
+        """Validate item by item so one malformed entity does not drop the rest."""
+        if not isinstance(data, dict):
+            return TurnExtraction()
+
+        entities = []
+        for item in data.get("entities") or []:
+            try:
+                entities.append(Entity.model_validate(item))
+            except ValidationError:
+                continue
+
+        relations = []
+        for item in data.get("relations") or []:
+            if isinstance(item, dict):
+                item = dict(item)
+                item.setdefault("source", item.get("source_id"))
+                item.setdefault("target", item.get("target_id"))
+            try:
+                relation = Relation.model_validate(item)
+            except ValidationError:
+                continue
+            if relation.source in (USER_PLACEHOLDER, USER_PLACEHOLDER.lower()):
+                relation.source = user_id
+            relations.append(relation)
+
+        preferences = data.get("preferences")
+        if not isinstance(preferences, dict):
+            preferences = {}
+        observation = data.get("observation")
+        tone = str(data.get("tone") or "neutral").lower()
+
+        return TurnExtraction(
+            entities=entities,
+            relations=relations,
+            preferences={str(k): str(v) for k, v in preferences.items() if v not in (None, "")},
+            observation=observation if isinstance(observation, str) else "",
+            tone=tone if tone in TONES else "neutral",
+        )
+
+
+def parse_json_object(raw: str) -> Optional[dict]:
+    """
+    Parse the first JSON object in an LLM response.
+    Handles markdown code fences and surrounding prose by scanning for the first
+    balanced top-level object instead of a greedy regex.
+    """
+    if not raw:
+        return None
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw.strip())
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, dict) else None
+    except json.JSONDecodeError:
+        pass
+
+    start = text.find("{")
+    while start != -1:
+        end = _matching_brace(text, start)
+        if end == -1:
+            return None
+        try:
+            data = json.loads(text[start:end + 1])
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+class EntityStreamParser:
+    """
+    Incremental scanner for streamed extraction JSON.
+    feed() returns the objects of the top-level "entities" array that closed
+    within the fed text; everything else is only tracked for nesting.
+    """
+
+    def __init__(self, key: str = "entities"):
+        self.key = key
+        self.emitted = 0
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = -1
+        self._last_string = None
+        self._in_array = False
+        self._object_start = -1
+
+    def feed(self, chunk: str) -> List[dict]:
+        self._text += chunk
+        found = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._last_string == self.key:
+                    self._in_array = True
+                elif ch == "{" and self._depth == 2 and self._in_array:
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._depth == 2 and self._object_start >= 0:
+                    try:
+                        item = json.loads(text[self._object_start:i + 1])
+                        if isinstance(item, dict):
+                            found.append(item)
+                            self.emitted += 1
+                    except json.JSONDecodeError:
+                        pass
+                    self._object_start = -1
+                elif ch == "]" and self._depth == 1:
+                    self._in_array = False
+        self._pos = len(text)
+        return found
+
+
+def _matching_brace(text: str, start: int) -> int:
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+turn_extractor = TurnExtractor()
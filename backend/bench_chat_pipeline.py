@@ -0,0 +1,181 @@
+"""
+Benchmark the full /api/chat pipeline (context build, LLM stream, TTS stream,
+response processing, memory writes and end-of-session summaries).
+
+Record once against live upstreams, then replay offline:
+
+    CASSETTE_MODE=record python bench_chat_pipeline.py --turns 12
+    CASSETTE_MODE=replay CASSETTE_REPLAY_SPEED=0 python bench_chat_pipeline.py --turns 12
+
+Each run starts from empty state: a fresh SQLite database and local graph
+store under --state-dir (a new temporary directory by default), with token
+calibration off, so the record and replay passes build identical prompts and
+every upstream request matches its recording. Background extraction is
+awaited between turns (outside the timings) for the same reason. Replays are
+deterministic as long as the same messages, user id and TTS config are used.
+OpenAI token counting needs the tiktoken encoding cached locally
+(TIKTOKEN_CACHE_DIR) on machines without network access.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.api.chat import generate_chat_stream, _cleanup_stale_sessions, _response_processor
+from app.config import settings
+from app.database import Base, SessionLocal
+from app.models.chat import ChatConfig, ChatRequest, Message
+from app.services.memory_service import get_memory_service, initialize_memory_service
+import app.models.db  # noqa: F401
+import app.models.db_session  # noqa: F401
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MESSAGES = [
+    "你好，你是谁？",
+    "我最近在用 Python 做一个语音助手项目。",
+    "它用 FastAPI 做后端，GPT-SoVITS 做语音合成。",
+    "你觉得我应该怎么组织记忆模块？",
+    "我比较喜欢简洁直接的解释。",
+    "Neo4j 的向量索引适合这个场景吗？",
+]
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def isolate_state(state_dir: Path) -> None:
+    """Point the app's SQLite sessions and local graph store at state_dir."""
+    state_dir.mkdir(parents=True, exist_ok=True)
+    bench_engine = create_engine(
+        f"sqlite:///{state_dir / 'epsilon.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=bench_engine)
+    # Every service opens sessions through this sessionmaker
+    SessionLocal.configure(bind=bench_engine)
+    settings.graph_memory_backend = "local"
+    settings.local_graph_path = str(state_dir / "graph_memory.db")
+    settings.token_calibration_enabled = False
+
+
+async def settle() -> None:
+    """Wait for background extraction and memory writes started by the last turn."""
+    await _response_processor.join()
+    memory_service = get_memory_service()
+    if memory_service:
+        await memory_service.join()
+
+
+async def run_turn(db, request: ChatRequest) -> dict:
+    started = time.perf_counter()
+    timings = {"first_text": None, "complete": None, "first_audio": None, "done": None}
+    errors = []
+    full_text = ""
+    async for event in generate_chat_stream(request, db):
+        payload = json.loads(event[len("data: "):])
+        elapsed = time.perf_counter() - started
+        if payload["type"] == "text" and timings["first_text"] is None:
+            timings["first_text"] = elapsed
+        elif payload["type"] == "complete":
+            timings["complete"] = elapsed
+            full_text = payload["text"]
+        elif payload["type"] == "audio_chunk" and timings["first_audio"] is None:
+            timings["first_audio"] = elapsed
+        elif payload["type"] == "error":
+            logger.warning(f"Pipeline error: {payload['error']}")
+            errors.append(payload["error"])
+    timings["done"] = time.perf_counter() - started
+    return {"timings": timings, "text": full_text, "errors": errors}
+
+
+async def main(args) -> dict:
+    isolate_state(Path(args.state_dir or tempfile.mkdtemp(prefix="bench_chat_")))
+    memory_service = await initialize_memory_service()
+    messages = DEFAULT_MESSAGES
+    if args.messages:
+        messages = [m for m in Path(args.messages).read_text(encoding="utf-8").splitlines() if m.strip()]
+
+    config = ChatConfig(
+        ref_audio_path=args.ref_audio,
+        prompt_text=args.prompt_text,
+        prompt_lang=args.prompt_lang,
+        text_lang=args.text_lang,
+    )
+    history = []
+    results = []
+    errors = []
+    db = SessionLocal()
+    try:
+        for turn in range(args.turns):
+            text = messages[turn % len(messages)]
+            request = ChatRequest(
+                message=text,
+                history=list(history),
+                config=config,
+                user_id=args.user_id,
+                conversation_id=args.conversation_id,
+            )
+            result = await run_turn(db, request)
+            await settle()
+            errors.extend(result["errors"])
+            history.append(Message(role="user", content=text))
+            history.append(Message(role="assistant", content=result["text"]))
+            results.append(result["timings"])
+            print(f"turn {turn + 1:>3}: " + ", ".join(
+                f"{k}={v * 1000:.1f}ms" for k, v in result["timings"].items() if v is not None
+            ))
+
+        summary_started = time.perf_counter()
+        await _cleanup_stale_sessions(db, max_idle_seconds=-1)
+        summary_ms = (time.perf_counter() - summary_started) * 1000
+        await settle()
+    finally:
+        db.close()
+        if memory_service:
+            await memory_service.close()
+
+    print(
+        f"\nmode={settings.cassette_mode} replay_speed={settings.cassette_replay_speed} "
+        f"turns={len(results)} errors={len(errors)}"
+    )
+    for key in ("first_text", "complete", "first_audio", "done"):
+        values = [r[key] * 1000 for r in results if r[key] is not None]
+        if values:
+            print(
+                f"{key:>12}: p50={statistics.median(values):.1f}ms "
+                f"p95={_percentile(values, 0.95):.1f}ms max={max(values):.1f}ms"
+            )
+    print(f"end-of-session summary: {summary_ms:.1f}ms")
+    return {"turns": results, "errors": errors, "summary_ms": summary_ms}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=len(DEFAULT_MESSAGES))
+    parser.add_argument("--messages", help="File with one user message per line")
+    parser.add_argument("--user-id", default="bench_user")
+    parser.add_argument("--conversation-id", default="bench_conv")
+    parser.add_argument("--ref-audio", default="refs/bench.wav")
+    parser.add_argument("--prompt-text", default="")
+    parser.add_argument("--prompt-lang", default="zh")
+    parser.add_argument("--text-lang", default="zh")
+    parser.add_argument("--state-dir", help="Directory for the run's database and graph store (default: new temp dir)")
+    asyncio.run(main(parser.parse_args()))
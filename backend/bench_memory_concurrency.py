@@ -0,0 +1,111 @@
+"""
+Benchmark event-loop responsiveness while a slow Neo4j query is running.
+
+Simulates several SSE streams that each emit a chunk every --tick-ms and
+records the gap between consecutive chunks. A deliberately slow Cypher query
+runs through MemoryService's async driver; with --compare-sync the same query
+also runs through a synchronous driver on the event loop, which is how graph
+I/O behaved before the async port.
+
+    python bench_memory_concurrency.py --streams 20 --rows 5000000 --compare-sync
+
+Needs a reachable Neo4j (NEO4J_URI / NEO4J_USER / NEO4J_PASSWORD, and
+GRAPH_MEMORY_ENABLED=true).
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent))
+
+from neo4j import GraphDatabase
+
+from app.config import settings
+from app.services.memory_service import initialize_memory_service
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+SLOW_QUERY = "UNWIND range(1, $rows) AS x RETURN sum(x % 7) AS s"
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _stream(tick: float, stop: asyncio.Event, gaps: list):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(tick)
+        now = time.perf_counter()
+        gaps.append((now - last - tick) * 1000)
+        last = now
+
+
+async def _run_scenario(name: str, args, query) -> None:
+    stop = asyncio.Event()
+    gaps: list = []
+    streams = [asyncio.create_task(_stream(args.tick_ms / 1000, stop, gaps)) for _ in range(args.streams)]
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    if query is not None:
+        await query()
+    else:
+        await asyncio.sleep(args.idle_seconds)
+    query_ms = (time.perf_counter() - started) * 1000
+    stop.set()
+    await asyncio.gather(*streams)
+    print(
+        f"{name:>10}: query={query_ms:.0f}ms  extra chunk delay p50={statistics.median(gaps):.1f}ms "
+        f"p99={_percentile(gaps, 0.99):.1f}ms max={max(gaps):.1f}ms ({len(gaps)} chunks)"
+    )
+
+
+async def main(args):
+    memory_service = await initialize_memory_service()
+    if memory_service is None:
+        print("Memory service unavailable; check GRAPH_MEMORY_ENABLED and Neo4j settings")
+        return
+
+    async def async_query():
+        async with memory_service.store.driver.session(database=memory_service.store.database) as session:
+            result = await session.run(SLOW_QUERY, rows=args.rows)
+            await result.consume()
+
+    await _run_scenario("idle", args, None)
+    await _run_scenario("async", args, async_query)
+
+    if args.compare_sync:
+        driver = GraphDatabase.driver(settings.neo4j_uri, auth=(settings.neo4j_user, settings.neo4j_password))
+
+        async def sync_query():
+            # Blocks the event loop for the whole round trip, like the old sync driver usage
+            with driver.session(database=memory_service.store.database) as session:
+                session.run(SLOW_QUERY, rows=args.rows).consume()
+
+        try:
+            await _run_scenario("sync", args, sync_query)
+        finally:
+            driver.close()
+
+    await memory_service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tick-ms", type=float, default=20.0)
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Rows the slow query unwinds")
+    parser.add_argument("--idle-seconds", type=float, default=1.0)
+    parser.add_argument("--compare-sync", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,154 @@
+"""
+Benchmark context expansion latency on a synthetic memory graph.
+
+Seeds --entities synthetic entities (default 50K) with --degree outgoing
+relations each, plus user relations to a fraction of them, then times the
+1-hop expansion of --limit recalled nodes: the single UNWIND query used by
+query_related_context against the previous per-node traversal queries.
+
+    python bench_memory_context.py --entities 50000 --limit 10 --repeat 20
+
+Seeded nodes are kept for later runs unless --cleanup is given. Needs a
+reachable Neo4j (NEO4J_URI / NEO4J_USER / NEO4J_PASSWORD, and
+GRAPH_MEMORY_ENABLED=true).
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.memory_service import initialize_memory_service
+from app.services.neo4j_graph_store import _expand_context
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+PREFIX = "bench_ctx_"
+USER_ID = "bench_ctx_user"
+TYPES = ["Topic", "Project", "Skill", "Resource"]
+
+# Traversal run once per recalled node before the single-query expansion
+LEGACY_TRAVERSAL = """
+MATCH (e:Entity {id: $node_id})
+OPTIONAL MATCH (u:User {id: $user_id})-[r1]->(e)
+OPTIONAL MATCH (e)-[r2]->(related)
+RETURN e.name as entity_name, e.type as entity_type, type(r1) as user_rel,
+       type(r2) as out_rel, related.name as related_name, related.type as related_type
+LIMIT 5
+"""
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _seed(memory_service, args) -> None:
+    async with memory_service.store.driver.session(database=memory_service.store.database) as session:
+        result = await session.run(
+            "MATCH (e:Entity) WHERE e.id STARTS WITH $prefix RETURN count(e) AS n", prefix=PREFIX
+        )
+        existing = (await result.single())["n"]
+    if existing >= args.entities:
+        print(f"Using {existing} seeded entities")
+        return
+
+    print(f"Seeding {args.entities} entities ...")
+    started = time.perf_counter()
+    for offset in range(0, args.entities, args.batch):
+        ids = range(offset, min(offset + args.batch, args.entities))
+        entities = [
+            {
+                "id": f"{PREFIX}{i}",
+                "type": TYPES[i % len(TYPES)],
+                "name": f"entity {i}",
+                "score": random.randint(5, 10),
+                "properties": {},
+            }
+            for i in ids
+        ]
+        relations = [
+            {
+                "source": f"{PREFIX}{i}",
+                "target": f"{PREFIX}{random.randrange(args.entities)}",
+                "type": random.choice(["RELATED_TO", "PART_OF", "USES"]),
+                "properties": {},
+            }
+            for i in ids
+            for _ in range(args.degree)
+        ]
+        relations += [
+            {"source": USER_ID, "target": f"{PREFIX}{i}", "type": "INTERESTED_IN", "properties": {}}
+            for i in ids
+            if i % 10 == 0
+        ]
+        # Relations may point at entities of a later batch; seed entities first, then all relations
+        await memory_service.write_graph(USER_ID, f"{PREFIX}conv", "bench", 0, entities, [])
+        await memory_service.write_graph(USER_ID, f"{PREFIX}conv", "bench", 0, [], relations)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+
+async def _timed(memory_service, fn, args):
+    timings = []
+    for _ in range(args.repeat):
+        node_ids = [f"{PREFIX}{random.randrange(args.entities)}" for _ in range(args.limit)]
+        async with memory_service.store.driver.session(database=memory_service.store.database) as session:
+            started = time.perf_counter()
+            await session.execute_read(fn, node_ids)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(args):
+    memory_service = await initialize_memory_service()
+    if memory_service is None:
+        print("Memory service unavailable; check GRAPH_MEMORY_ENABLED and Neo4j settings")
+        return
+
+    async def single_query(tx, node_ids):
+        return await _expand_context(tx, USER_ID, node_ids)
+
+    async def per_node(tx, node_ids):
+        lines = []
+        for node_id in node_ids:
+            result = await tx.run(LEGACY_TRAVERSAL, node_id=node_id, user_id=USER_ID)
+            lines.extend([record async for record in result])
+        return lines
+
+    try:
+        await _seed(memory_service, args)
+        for name, fn in (("single", single_query), ("per-node", per_node)):
+            timings = await _timed(memory_service, fn, args)
+            print(
+                f"{name:>8}: p50={statistics.median(timings):.1f}ms p95={_percentile(timings, 0.95):.1f}ms "
+                f"max={max(timings):.1f}ms ({args.repeat} runs, {args.limit} nodes)"
+            )
+    finally:
+        if args.cleanup:
+            async with memory_service.store.driver.session(database=memory_service.store.database) as session:
+                for label in ("Entity", "Conversation", "User"):
+                    await session.run(
+                        f"MATCH (n:{label}) WHERE n.id STARTS WITH $prefix CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS",
+                        prefix=PREFIX,
+                    )
+        await memory_service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=50_000)
+    parser.add_argument("--degree", type=int, default=4, help="Outgoing relations per entity")
+    parser.add_argument("--limit", type=int, default=10, help="Recalled nodes to expand")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--cleanup", action="store_true", help="Delete the seeded graph afterwards")
+    asyncio.run(main(parser.parse_args()))
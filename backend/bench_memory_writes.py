@@ -0,0 +1,105 @@
+"""
+Benchmark graph memory write transactions against a live Neo4j.
+
+Writes synthetic extractions of each --sizes entity count (with one relation
+per entity and optional random embeddings) through MemoryService.write_graph
+and reports the write transaction time. Bench nodes are removed afterwards.
+
+    python bench_memory_writes.py --sizes 10 100 1000 --repeat 5
+
+Needs GRAPH_MEMORY_ENABLED=true and a reachable Neo4j (NEO4J_URI /
+NEO4J_USER / NEO4J_PASSWORD), or GRAPH_MEMORY_BACKEND=local with a throwaway
+LOCAL_GRAPH_PATH to time the embedded store.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.memory_service import initialize_memory_service
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+TYPES = ["Topic", "Project", "Skill", "Resource"]
+RELATION_TYPES = ["INTERESTED_IN", "WORKING_ON", "HAS_SKILL", "LEARNED_FROM"]
+
+
+def _extraction(size: int, prefix: str, user_id: str, embedding_dim: int):
+    entities = []
+    relations = []
+    for i in range(size):
+        entity = {
+            "id": f"{prefix}_{i}",
+            "type": TYPES[i % len(TYPES)],
+            "name": f"bench entity {i}",
+            "score": 5 + i % 5,
+            "properties": {"source": "bench"},
+        }
+        if embedding_dim:
+            entity["embedding"] = [random.random() for _ in range(embedding_dim)]
+        entities.append(entity)
+        relations.append({
+            "source": user_id,
+            "target": entity["id"],
+            "type": RELATION_TYPES[i % len(RELATION_TYPES)],
+            "properties": {"confidence": 0.8},
+        })
+    return entities, relations
+
+
+async def _cleanup(memory_service, user_id: str) -> None:
+    if memory_service.store.name != "neo4j":
+        return
+    async with memory_service.store.driver.session(database=memory_service.store.database) as session:
+        for label in ("Entity", "Conversation"):
+            await session.run(f"MATCH (n:{label}) WHERE n.id STARTS WITH 'bench_' DETACH DELETE n")
+        await session.run("MATCH (u:User {id: $user_id}) DETACH DELETE u", user_id=user_id)
+
+
+async def main(args):
+    memory_service = await initialize_memory_service()
+    if memory_service is None:
+        print("Memory service unavailable; check GRAPH_MEMORY_ENABLED and graph store settings")
+        return
+
+    try:
+        for size in args.sizes:
+            timings = []
+            for run in range(args.repeat):
+                entities, relations = _extraction(size, f"bench_{size}_{run}", args.user_id, args.embedding_dim)
+                started = time.perf_counter()
+                await memory_service.write_graph(
+                    user_id=args.user_id,
+                    conversation_id=f"bench_conv_{size}",
+                    character_id="bench",
+                    message_count=size,
+                    entities=entities,
+                    relations=relations,
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{size:>5} entities: p50={statistics.median(timings):.1f}ms "
+                f"min={min(timings):.1f}ms max={max(timings):.1f}ms ({args.repeat} runs)"
+            )
+    finally:
+        await _cleanup(memory_service, args.user_id)
+        await memory_service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--user-id", default="bench_user")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="0 to skip embeddings")
+    asyncio.run(main(parser.parse_args()))
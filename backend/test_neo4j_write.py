@@ -87,7 +87,8 @@ async def test_basic_write():
             user_id=test_user_id,
             conversation_id=test_conversation_id,
             messages=test_messages,
-            character_id="epsilon"
+            character_id="epsilon",
+            wait=True
         )
         
         logger.info("=" * 50)
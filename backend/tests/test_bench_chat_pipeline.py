@@ -0,0 +1,80 @@
+"""Tests for the record/replay chat pipeline benchmark."""
+import argparse
+import json
+
+import pytest
+
+import bench_chat_pipeline
+from app.config import settings
+from app.database import SessionLocal
+from app.services.cassette import cassette
+from app.services.llm_service import llm_service
+from app.services.tts_service import tts_service
+
+
+def _args(state_dir, turns):
+    return argparse.Namespace(
+        turns=turns, messages=None, user_id="bench_user", conversation_id="bench_conv",
+        ref_audio="refs/bench.wav", prompt_text="", prompt_lang="zh", text_lang="zh",
+        state_dir=str(state_dir),
+    )
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay_has_no_misses(tmp_path, monkeypatch):
+    # isolate_state rebinds sessions and settings; restore them after the test
+    monkeypatch.setattr(SessionLocal, "kw", dict(SessionLocal.kw))
+    for name in ("graph_memory_backend", "local_graph_path", "token_calibration_enabled"):
+        monkeypatch.setattr(settings, name, getattr(settings, name))
+    monkeypatch.setattr(llm_service, "current_provider", "gemini")
+    monkeypatch.setattr(llm_service, "current_model", "gemini-2.5-flash")
+    monkeypatch.setattr(llm_service, "_initialized", True)
+    monkeypatch.setattr(cassette, "directory", tmp_path / "cassettes")
+    monkeypatch.setattr(cassette, "replay_speed", 0)
+    monkeypatch.setattr(cassette, "_replay_index", {})
+
+    async def _stream_live(provider, model, messages, task="interactive"):
+        yield f"[{len(messages)}] "
+        yield f"reply to {messages[-1]['content']}"
+
+    async def _invoke_live(provider, model, messages, json_mode=False):
+        return json.dumps({"preferences": {"style": "concise"}, "observation": "", "tone": "focused"})
+
+    async def _stream_tts(url, payload, max_retries):
+        yield payload["text"].encode("utf-8")[:8]
+
+    monkeypatch.setattr(llm_service, "_stream_live", _stream_live)
+    monkeypatch.setattr(llm_service, "_invoke_live", _invoke_live)
+    monkeypatch.setattr(tts_service, "_stream_tts", _stream_tts)
+    monkeypatch.setattr(cassette, "mode", "record")
+    recorded = await bench_chat_pipeline.main(_args(tmp_path / "record", turns=8))
+    assert recorded["errors"] == []
+
+    async def _no_stream(*args, **kwargs):
+        raise AssertionError("replay must not call upstream")
+        yield
+
+    async def _no_call(*args, **kwargs):
+        raise AssertionError("replay must not call upstream")
+
+    misses = []
+    next_recording = cassette._next_recording
+
+    def _tracking(kind, request):
+        try:
+            return next_recording(kind, request)
+        except Exception:
+            misses.append(kind)
+            raise
+
+    monkeypatch.setattr(llm_service, "_stream_live", _no_stream)
+    monkeypatch.setattr(llm_service, "_invoke_live", _no_call)
+    monkeypatch.setattr(tts_service, "_stream_tts", _no_stream)
+    monkeypatch.setattr(cassette, "_next_recording", _tracking)
+    monkeypatch.setattr(cassette, "mode", "replay")
+    replayed = await bench_chat_pipeline.main(_args(tmp_path / "replay", turns=8))
+
+    assert misses == []
+    assert replayed["errors"] == []
+    assert len(replayed["turns"]) == 8
+    assert all(turn["first_audio"] is not None for turn in replayed["turns"])
@@ -0,0 +1,71 @@
+"""Tests for CassetteRecorder record/replay."""
+import pytest
+
+from app.services.cassette import CassetteMissError, CassetteRecorder
+
+
+async def _live_stream():
+    yield "Hello"
+    yield b"\x00\x01audio"
+    yield " world"
+
+
+@pytest.mark.asyncio
+async def test_stream_record_then_replay(tmp_path):
+    request = {"provider": "openai", "model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+    recorder = CassetteRecorder(mode="record", directory=str(tmp_path))
+    recorded = [c async for c in recorder.stream("llm_stream", request, _live_stream)]
+
+    def _no_network():
+        raise AssertionError("replay must not call upstream")
+
+    player = CassetteRecorder(mode="replay", directory=str(tmp_path), replay_speed=0)
+    replayed = [c async for c in player.stream("llm_stream", request, _no_network)]
+    assert replayed == recorded == ["Hello", b"\x00\x01audio", " world"]
+
+
+@pytest.mark.asyncio
+async def test_call_replays_in_recorded_order(tmp_path):
+    recorder = CassetteRecorder(mode="record", directory=str(tmp_path))
+    results = iter(["first", "second"])
+
+    async def _live():
+        return next(results)
+
+    await recorder.call("llm_chat", {"q": 1}, _live)
+    await recorder.call("llm_chat", {"q": 1}, _live)
+
+    player = CassetteRecorder(mode="replay", directory=str(tmp_path), replay_speed=0)
+    assert await player.call("llm_chat", {"q": 1}, None) == "first"
+    assert await player.call("llm_chat", {"q": 1}, None) == "second"
+    assert await player.call("llm_chat", {"q": 1}, None) == "first"
+
+
+@pytest.mark.asyncio
+async def test_replay_miss_raises(tmp_path):
+    player = CassetteRecorder(mode="replay", directory=str(tmp_path))
+    with pytest.raises(CassetteMissError):
+        await player.call("embedding", {"text": "unknown"}, None)
+
+
+@pytest.mark.asyncio
+async def test_recorded_error_is_replayed(tmp_path):
+    async def _failing():
+        yield "partial"
+        raise RuntimeError("upstream 500")
+
+    recorder = CassetteRecorder(mode="record", directory=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        [c async for c in recorder.stream("tts_stream", {"text": "x"}, _failing)]
+
+    player = CassetteRecorder(mode="replay", directory=str(tmp_path), replay_speed=0)
+    chunks = []
+    with pytest.raises(RuntimeError, match="upstream 500"):
+        async for chunk in player.stream("tts_stream", {"text": "x"}, None):
+            chunks.append(chunk)
+    assert chunks == ["partial"]
+
+
+def test_invalid_mode_rejected():
+    with pytest.raises(ValueError):
+        CassetteRecorder(mode="sometimes")
@@ -0,0 +1,62 @@
+"""Tests for entity canonicalization."""
+from app.services.entity_canonicalizer import canonicalize, find_duplicates, normalize_name
+
+EXISTING = [
+    {"id": "topic_python", "name": "Python", "type": "Topic", "importance": 8,
+     "embedding": [1.0, 0.0, 0.0], "aliases": ["py"]},
+    {"id": "project_bot", "name": "chat bot", "type": "Project", "importance": 7, "embedding": [0.0, 1.0, 0.0]},
+]
+
+
+def test_normalize_name_ignores_case_width_and_punctuation():
+    assert normalize_name("Python 3") == normalize_name("python_3") == normalize_name("ＰＹＴＨＯＮ-3") == "python3"
+    assert normalize_name("机器 学习") == "机器学习"
+    assert normalize_name(None) == ""
+
+
+def test_new_entities_fold_into_existing_by_name_then_embedding():
+    entities = [
+        {"id": "skill_python", "name": "python", "type": "Skill", "score": 9, "embedding": [0.9, 0.1, 0.0]},
+        {"id": "topic_python3", "name": "Python3", "type": "Topic", "score": 7, "embedding": [0.99, 0.02, 0.0]},
+        {"id": "skill_rust", "name": "Rust", "type": "Skill", "score": 7, "embedding": [0.0, 0.0, 1.0]},
+        {"id": "skill_rustlang", "name": "rust-lang", "type": "Skill", "score": 6, "embedding": [0.0, 0.05, 1.0]},
+    ]
+    relations = [
+        {"source": "user_1", "target": "skill_python", "type": "USES"},
+        {"source": "topic_python3", "target": "skill_python", "type": "RELATED_TO"},
+        {"source": "skill_rustlang", "target": "project_bot", "type": "PART_OF"},
+    ]
+
+    written, remapped, mapping = canonicalize(entities, relations, EXISTING, 0.96)
+
+    assert mapping == {
+        "skill_python": "topic_python", "topic_python3": "topic_python", "skill_rustlang": "skill_rust",
+    }
+    by_id = {e["id"]: e for e in written}
+    assert set(by_id) == {"topic_python", "skill_rust"}
+    python = by_id["topic_python"]
+    assert (python["name"], python["type"], python["score"]) == ("Python", "Topic", 9)
+    assert python["properties"]["aliases"] == ["py", "skill_python", "Python3", "topic_python3"]
+    assert "embedding" not in python  # the canonical node keeps its own
+    assert by_id["skill_rust"]["properties"] == {"name_key": "rust", "aliases": ["rust-lang", "skill_rustlang"]}
+    # The Python3 -> python relation became a self-loop and is dropped
+    assert remapped == [
+        {"source": "user_1", "target": "topic_python", "type": "USES"},
+        {"source": "skill_rust", "target": "project_bot", "type": "PART_OF"},
+    ]
+
+
+def test_find_duplicates_keeps_the_most_important_entity():
+    rows = EXISTING + [
+        {"id": "topic_python3", "name": "Python 3", "type": "Topic", "importance": 6,
+         "embedding": [0.99, 0.05, 0.0], "aliases": ["cpython"]},
+        {"id": "topic_py", "name": "PY", "type": "Topic", "importance": 9, "embedding": [0.0, 0.0, 1.0]},
+    ]
+
+    merges, name_keys = find_duplicates(rows, 0.96)
+
+    assert merges == [{
+        "dup": "topic_python3", "keep": "topic_python", "aliases": ["py", "Python 3", "topic_python3", "cpython"],
+        "name_key": "python",
+    }]
+    assert name_keys == {"topic_py": "py", "topic_python": "python", "project_bot": "chatbot"}
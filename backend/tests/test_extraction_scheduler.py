@@ -0,0 +1,99 @@
+"""Tests for cross-conversation extraction batching."""
+import asyncio
+import json
+
+import pytest
+
+from app.services.extraction_scheduler import ExtractionScheduler, OUTPUT_TOKENS_PER_DOC, _Job
+from app.services.rate_limiter import TokenBucket
+from app.services.turn_extractor import ExtractionError, turn_extractor
+
+
+class _Counter:
+    def count_text(self, text):
+        return len(text)
+
+
+@pytest.mark.asyncio
+async def test_jobs_in_window_share_one_call(monkeypatch):
+    calls = []
+
+    async def _fake_chat(*args, **kwargs):
+        calls.append(kwargs["message"])
+        return json.dumps({"documents": [
+            {"doc_id": "d2", "relations": [{"source": "USER", "target": "topic_go", "type": "INTERESTED_IN"}]},
+            {"doc_id": "d1", "relations": [{"source": "USER", "target": "topic_rust", "type": "INTERESTED_IN"}]},
+        ]})
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _fake_chat)
+    scheduler = ExtractionScheduler(window_ms=20, max_docs=8)
+    first, second = await asyncio.gather(
+        scheduler.submit("user: I like rust", "alice", "conv_a"),
+        scheduler.submit("user: I like go", "bob", "conv_b"),
+    )
+    assert len(calls) == 1
+    assert '<doc id="d1">' in calls[0] and '<doc id="d2">' in calls[0]
+    assert (first.relations[0].source, first.relations[0].target) == ("alice", "topic_rust")
+    assert (second.relations[0].source, second.relations[0].target) == ("bob", "topic_go")
+
+
+@pytest.mark.asyncio
+async def test_missing_document_is_retried_alone(monkeypatch):
+    calls = []
+
+    async def _fake_chat(*args, **kwargs):
+        calls.append(kwargs["message"])
+        if "<doc" in kwargs["message"]:
+            return '{"documents": [{"doc_id": "d1", "tone": "focused"}]}'
+        return '{"tone": "empathetic"}'
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _fake_chat)
+    scheduler = ExtractionScheduler(window_ms=10_000, max_docs=2)
+    first, second = await asyncio.wait_for(
+        asyncio.gather(scheduler.submit("a", "u1", "c1"), scheduler.submit("b", "u2", "c2")),
+        timeout=1,
+    )
+    assert len(calls) == 2
+    assert calls[1] == "对话内容：\nb"
+    assert first.tone == "focused"
+    assert second.tone == "empathetic"
+    assert scheduler.metrics()["retried_documents"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_extraction_raises(monkeypatch):
+    async def _fake_chat(*args, **kwargs):
+        if "<doc" in kwargs["message"]:
+            return "not json"
+        return '{"tone": "neutral"}'
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _fake_chat)
+    scheduler = ExtractionScheduler(window_ms=10_000, max_docs=2)
+    results = await asyncio.wait_for(
+        asyncio.gather(scheduler.submit("a", "u1", "c1"), scheduler.submit("b", "u2", "c2"), return_exceptions=True),
+        timeout=1,
+    )
+    assert all(isinstance(result, ExtractionError) for result in results)
+    assert scheduler.metrics()["failed_documents"] == 2
+
+    async def _failing_chat(*args, **kwargs):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _failing_chat)
+    with pytest.raises(ExtractionError):
+        await ExtractionScheduler(window_ms=0).submit("c", "u3", "c3")
+
+
+@pytest.mark.asyncio
+async def test_token_budget_delays_instead_of_failing():
+    bucket = TokenBucket(rate_per_minute=6000)  # 100 tokens/s
+    assert await bucket.acquire(6000) == 0.0
+    waited = await bucket.acquire(5)
+    assert 0.0 < waited < 0.5
+
+
+def test_estimate_counts_prompt_and_documents():
+    scheduler = ExtractionScheduler(tokens_per_minute=1000, token_counter=_Counter())
+    jobs = [_Job("d1", "u", "c", "x" * 10, None), _Job("d2", "u", "c", "y" * 20, None)]
+    expected = len(turn_extractor.batch_system_prompt()) + 30 + 2 * OUTPUT_TOKENS_PER_DOC
+    assert scheduler._estimate_tokens(jobs) == expected
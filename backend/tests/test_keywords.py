@@ -0,0 +1,22 @@
+"""Tests for keyword extraction."""
+from app.services.keywords import extract_keywords, name_terms, terms
+
+
+def test_latin_words_are_kept_whole_without_stop_words():
+    assert terms("How do I use the Python asyncio loop?") == ["use", "python", "asyncio", "loop"]
+    assert terms("ＰＹＴＨＯＮ 3.11") == ["python", "11"]
+
+
+def test_cjk_runs_become_bigrams_split_at_stop_characters():
+    assert terms("我在学习机器学习") == ["学习", "习机", "机器", "器学", "学习"]
+    assert terms("我的猫") == ["猫"]
+    assert terms("用Python写爬虫") == ["用", "python", "写爬", "爬虫"]
+
+
+def test_extract_keywords_is_distinct_and_limited():
+    assert extract_keywords("学习机器学习 python python", limit=3) == ["学习", "习机", "机器"]
+    assert extract_keywords("") == []
+
+
+def test_name_terms_cover_aliases():
+    assert name_terms("机器学习", ["Machine Learning", None]) == {"机器", "器学", "学习", "machine", "learning"}
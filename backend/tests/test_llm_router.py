@@ -0,0 +1,117 @@
+"""Tests for LLMRouter hedging and failover."""
+import asyncio
+
+import pytest
+
+from app.services.llm_router import LLMError, LLMRouter, TTFTTracker
+
+
+def _route(name, chunks, delay=0.0, fail=False, log=None):
+    async def _stream():
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError(f"{name} down")
+            for chunk in chunks:
+                yield chunk
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append(name)
+            raise
+
+    return name, _stream
+
+
+async def _collect(router, routes):
+    return [chunk async for chunk in router.stream(routes)]
+
+
+@pytest.mark.asyncio
+async def test_primary_only_when_fast():
+    router = LLMRouter(hedge_enabled=True, hedge_budget_ms=200, hedge_min_budget_ms=0)
+    chunks = await _collect(router, [_route("a", ["hi", " there"]), _route("b", ["other"])])
+    assert chunks == ["hi", " there"]
+    assert router.tracker.snapshot()["a"]["samples"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_loser_is_cancelled():
+    cancelled = []
+    router = LLMRouter(hedge_enabled=True, hedge_budget_ms=20, hedge_min_budget_ms=0)
+    chunks = await _collect(
+        router,
+        [_route("slow", ["late"], delay=1.0, log=cancelled), _route("fast", ["quick"])],
+    )
+    assert chunks == ["quick"]
+    assert cancelled == ["slow"]
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_when_disabled():
+    router = LLMRouter(hedge_enabled=False, hedge_budget_ms=1, hedge_min_budget_ms=0)
+    chunks = await _collect(router, [_route("slow", ["late"], delay=0.05), _route("fast", ["quick"])])
+    assert chunks == ["late"]
+
+
+@pytest.mark.asyncio
+async def test_failover_on_error():
+    router = LLMRouter()
+    chunks = await _collect(router, [_route("a", [], fail=True), _route("b", ["ok"])])
+    assert chunks == ["ok"]
+    assert router.tracker.snapshot()["a"]["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_all_routes_failing_raises():
+    router = LLMRouter()
+    with pytest.raises(LLMError):
+        await _collect(router, [_route("a", [], fail=True), _route("b", [])])
+
+
+def test_hedge_budget_follows_ttft_percentile():
+    tracker = TTFTTracker()
+    router = LLMRouter(
+        hedge_budget_ms=3000, hedge_min_budget_ms=100, hedge_percentile=0.9,
+        hedge_min_samples=10, tracker=tracker,
+    )
+    assert router.hedge_budget("a") == 3.0
+    for i in range(10):
+        tracker.record("a", 0.2 + i * 0.1)
+    assert router.hedge_budget("a") == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_losing_primary_keeps_its_hedge_budget():
+    tracker = TTFTTracker(window=10)
+    router = LLMRouter(
+        hedge_enabled=True, hedge_budget_ms=3000, hedge_min_budget_ms=1,
+        hedge_percentile=0.9, hedge_min_samples=5, tracker=tracker,
+    )
+    for _ in range(5):
+        tracker.record("primary", 0.005)
+    assert router.hedge_budget("primary") == pytest.approx(0.005)
+
+    for _ in range(5):
+        chunks = await _collect(
+            router, [_route("primary", ["late"], delay=1.0), _route("hedge", ["quick"], delay=0.03)]
+        )
+        assert chunks == ["quick"]
+
+    # The primary never won, but its cancelled attempts still count as lower bounds
+    assert tracker.snapshot()["primary"]["censored"] == 5
+    assert router.hedge_budget("primary") >= 0.03
+
+
+@pytest.mark.asyncio
+async def test_admission_wait_is_not_ttft():
+    router = LLMRouter()
+
+    async def admit(name):
+        await asyncio.sleep(0.1)
+        return 0.1
+
+    chunks = [chunk async for chunk in router.stream([_route("a", ["hi"], delay=0.01)], admit=admit)]
+    assert chunks == ["hi"]
+    stats = router.tracker.snapshot()["a"]
+    assert stats["p50_ms"] < 80
+    assert stats["queue_p50_ms"] == 100.0
@@ -0,0 +1,93 @@
+"""Tests for LLM task-class model tiering."""
+import asyncio
+
+import pytest
+
+from app.models.llm import LLMTaskPolicy
+from app.services.llm_router import LLMError
+from app.services.llm_service import (
+    LLMService,
+    TASK_EXTRACTION,
+    TASK_INTERACTIVE,
+    TASK_SUMMARIZATION,
+)
+
+
+@pytest.fixture
+def svc(monkeypatch):
+    service = LLMService()
+    service.current_provider = "openai"
+    service.current_model = "gpt-4o"
+    service._initialized = True
+    service.task_policies[TASK_EXTRACTION] = LLMTaskPolicy(
+        provider="gemini", model="gemini-2.5-flash", concurrency=1, timeout=5
+    )
+    service._task_semaphores[TASK_EXTRACTION] = asyncio.Semaphore(1)
+    return service
+
+
+def test_background_task_routes_to_tier_model_first(svc):
+    assert svc._routes(TASK_EXTRACTION)[:2] == [("gemini", "gemini-2.5-flash"), ("openai", "gpt-4o")]
+    assert svc._routes(TASK_INTERACTIVE)[0] == ("openai", "gpt-4o")
+    assert svc._routes(TASK_SUMMARIZATION)[0] == ("openai", "gpt-4o")
+
+
+@pytest.mark.asyncio
+async def test_chat_uses_task_model(svc, monkeypatch):
+    calls = []
+
+    async def _fake_invoke(provider, model, messages, json_mode=False):
+        calls.append(model)
+        return "ok"
+
+    monkeypatch.setattr(svc, "_invoke_live", _fake_invoke)
+    assert await svc.chat("extract", task=TASK_EXTRACTION) == "ok"
+    assert await svc.chat("hello") == "ok"
+    assert calls == ["gemini-2.5-flash", "gpt-4o"]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_per_task(svc, monkeypatch):
+    active = []
+    peak = []
+
+    async def _fake_invoke(provider, model, messages, json_mode=False):
+        active.append(model)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.pop()
+        return "ok"
+
+    monkeypatch.setattr(svc, "_invoke_live", _fake_invoke)
+    await asyncio.gather(*[svc.chat("x", task=TASK_EXTRACTION) for _ in range(4)])
+    assert max(peak) == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_raises_llm_error(svc, monkeypatch):
+    svc.task_policies[TASK_EXTRACTION] = LLMTaskPolicy(model="slow", concurrency=1, timeout=0.01)
+
+    async def _slow_invoke(provider, model, messages, json_mode=False):
+        await asyncio.sleep(1)
+        return "late"
+
+    monkeypatch.setattr(svc, "_invoke_live", _slow_invoke)
+    with pytest.raises(LLMError):
+        await svc.chat("x", task=TASK_EXTRACTION)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_wait_is_outside_the_timeout(svc, monkeypatch):
+    svc.task_policies[TASK_EXTRACTION] = LLMTaskPolicy(model="queued", concurrency=1, timeout=0.05)
+
+    async def _slow_admission(provider, model, messages, task):
+        await asyncio.sleep(0.1)
+        return 0.1
+
+    async def _fake_invoke(provider, model, messages, json_mode=False):
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    monkeypatch.setattr(svc, "_wait_for_rate_limit", _slow_admission)
+    monkeypatch.setattr(svc, "_invoke_live", _fake_invoke)
+    assert await svc.chat("x", task=TASK_EXTRACTION) == "ok"
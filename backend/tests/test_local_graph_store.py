@@ -0,0 +1,329 @@
+"""Tests for the embedded SQLite graph store."""
+import sqlite3
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+import app.models.db_session  # noqa: F401
+from app.services import memory_service as memory_module
+from app.services.keywords import extract_keywords
+from app.services.local_graph_store import LocalGraphStore, VectorIndex
+from app.services.memory_archive import MemoryArchive
+from app.services.memory_service import MemoryService
+from app.services.token_counter import TokenCounter
+
+ENTITIES = [
+    {"id": "topic_python", "name": "Python", "type": "Topic", "score": 8, "embedding": [1.0, 0.0, 0.0]},
+    {"id": "project_bot", "name": "chat bot", "type": "Project", "score": 7, "embedding": [0.0, 1.0, 0.0]},
+    {"id": "skill_async", "name": "asyncio", "type": "Skill", "score": 6, "embedding": [0.0, 0.0, 1.0]},
+    {"id": "resource_docs", "name": "python docs", "type": "Resource", "score": 9},
+]
+RELATIONS = [
+    {"source": "user_1", "target": "topic_python", "type": "INTERESTED_IN"},
+    {"source": "topic_python", "target": "skill_async", "type": "USES"},
+    {"source": "topic_python", "target": "resource_docs", "type": "LEARNED_FROM"},
+    {"source": "topic_python", "target": "project_bot", "type": "PART_OF"},
+    {"source": "topic_python", "target": "topic_missing", "type": "RELATED_TO"},
+]
+
+
+async def _store(tmp_path, **kwargs):
+    store = LocalGraphStore(str(tmp_path / "graph.db"), **kwargs)
+    await store.initialize()
+    await store.write_graph("user_1", "conv_1", "epsilon", 4, ENTITIES, RELATIONS)
+    # Repeat mentions raise the relation count, which ranks neighbors first
+    await store.write_graph("user_1", "conv_1", "epsilon", 6, [], RELATIONS[3:4] * 2)
+    return store
+
+
+@pytest.mark.asyncio
+async def test_related_context_matches_snapshot_ranking(tmp_path):
+    store = await _store(tmp_path)
+
+    lines = await store.related_context("user_1", [0.9, 0.1, 0.0], ["unrelated"], 10, False)
+    snapshot = await store.load_snapshot("user_1", 100)
+
+    assert lines == [
+        "用户与 Topic 'Python' 的关系: INTERESTED_IN",
+        "Topic 'Python' PART_OF chat bot",
+        "Topic 'Python' LEARNED_FROM python docs",
+        "Topic 'Python' USES asyncio",
+    ]
+    assert snapshot.context([0.9, 0.1, 0.0], ["unrelated"], 10, include_relational=False) == lines
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_keyword_fallback_and_relational_signals(tmp_path):
+    store = await _store(tmp_path)
+    await store.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "casual"}, "", "2026-01-01T00:00:00")
+    await store.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "formal"}, "likes puns", "2026-02-01T00:00:00")
+
+    lines = await store.related_context("user_1", None, ["docs"], 10, True)
+
+    assert lines == [
+        "user preference: tone = formal",
+        "character observation: likes puns",
+    ]
+    details = await store.get_node_details("pref_user_1_epsilon_tone")
+    assert details["type"] == "UserPreference"
+    assert [r["source"] for r in details["incoming_relations"]] == ["user_1"]
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_graph_views(tmp_path):
+    store = await _store(tmp_path)
+
+    graph = await store.query_graph("user_1", ["Topic", "Skill"], None, 2, 100)
+    stats = await store.get_graph_stats("user_1")
+    details = await store.get_node_details("topic_python")
+
+    assert {n["id"] for n in graph["nodes"]} == {"topic_python", "skill_async"}
+    assert graph["links"] == [{"source": "topic_python", "target": "skill_async", "type": "USES"}]
+    assert stats["node_types"] == {"Conversation": 1, "Topic": 1, "Project": 1, "Skill": 1, "Resource": 1}
+    assert stats["relation_types"] == {"HAS_CONVERSATION": 1, "RELATION": 4}
+    part_of = [r for r in details["outgoing_relations"] if r["target"] == "project_bot"]
+    assert part_of[0]["properties"]["count"] == 3
+    assert await store.get_node_details("topic_missing") is None
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_stats_counters_follow_writes_and_reconcile_drift(tmp_path):
+    store = await _store(tmp_path)
+    await store.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "casual"}, "", "2026-01-01T00:00:00")
+    counted = await store.get_graph_stats("user_1")
+
+    assert counted == await store.reconcile_graph_stats("user_1")
+    assert counted["node_types"]["UserPreference"] == 1
+    assert await store.stale_stats_users() == []
+
+    # Linking an entity that already exists is not seen by the counters
+    await store.write_graph("user_2", "conv_2", "epsilon", 2, [], [RELATIONS[0] | {"source": "user_2"}])
+    drifted = await store.get_graph_stats("user_2")
+    assert "Topic" not in drifted["node_types"]
+    assert await store.stale_stats_users() == ["user_2"]
+
+    reconciled = await store.reconcile_graph_stats("user_2")
+    assert reconciled["node_types"]["Topic"] == 1
+    assert await store.get_graph_stats("user_2") == reconciled
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_reopen_reloads_embeddings(tmp_path):
+    store = await _store(tmp_path)
+    await store.close()
+
+    reopened = LocalGraphStore(str(tmp_path / "graph.db"))
+    await reopened.initialize()
+
+    assert len(reopened.index) == 3
+    assert reopened.index.search([0.0, 0.0, 1.0], 1)[0][0] == "skill_async"
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_service_on_local_store(tmp_path, monkeypatch):
+    async def fake_embedding(text):
+        return [1.0, 0.0, 0.0]
+
+    monkeypatch.setattr(memory_module.llm_service, "get_embedding", fake_embedding)
+    monkeypatch.setattr(memory_module.settings, "memory_snapshot_enabled", False)
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    await service.initialize()
+
+    await service.write_graph("user_1", "conv_1", "epsilon", 2, ENTITIES, RELATIONS)
+    context = await service.query_related_context("user_1", "what should I learn next in python")
+
+    assert context.splitlines()[0] == "用户与 Topic 'Python' 的关系: INTERESTED_IN"
+    # A budget keeps the best ranked lines that fit: 11 tokens, then 10 (too many) and 8
+    counter = TokenCounter(tokenizer="chars")
+    packed = await service.query_related_context(
+        "user_1", "what should I learn next in python", token_counter=counter, token_budget=20
+    )
+    assert packed.splitlines() == [context.splitlines()[0], "Topic 'Python' PART_OF chat bot"]
+    assert await service.verify_connectivity()
+    assert await service.reconcile_graph_stats() == 1
+    assert await service.reconcile_graph_stats() == 0
+    await service.close()
+
+
+def test_ivf_search_agrees_with_brute_force():
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(16, 32))
+    vectors = centers[rng.integers(0, 16, 2000)] + rng.normal(scale=0.05, size=(2000, 32))
+    brute, ivf = VectorIndex(ivf_threshold=10**9), VectorIndex(ivf_threshold=500)
+    for i, vector in enumerate(vectors):
+        brute.upsert(f"n{i}", vector)
+        ivf.upsert(f"n{i}", vector)
+
+    queries = centers + rng.normal(scale=0.05, size=centers.shape)
+    hits = [
+        len({i for i, _ in brute.search(q, 10)} & {i for i, _ in ivf.search(q, 10)})
+        for q in queries
+    ]
+
+    assert ivf._centroids is not None
+    assert sum(hits) / (10 * len(queries)) >= 0.9
+
+
+@pytest.mark.asyncio
+async def test_graph_view_pages_cover_graph_once(tmp_path):
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    await service.initialize()
+    entities = [
+        {"id": f"n{i}", "name": f"node {i}", "type": "Topic", "score": i % 7, "embedding": [1.0, float(i)]}
+        for i in range(40)
+    ]
+    relations = [{"source": "user_1", "target": "n0", "type": "INTERESTED_IN"}]
+    relations += [{"source": f"n{i}", "target": f"n{(i * 7 + 3) % 40}", "type": "RELATED_TO"} for i in range(40)]
+    await service.write_graph("user_1", "conv_1", "epsilon", 2, entities, relations)
+
+    pages, cursor = [], None
+    while True:
+        view = await service.graph_view("user_1", depth=4, limit=7, cursor=cursor, properties=["importance", "embedding"])
+        pages.append(view)
+        cursor = view["next_cursor"]
+        if cursor is None:
+            break
+
+    ids = [node_id for page in pages for node_id in page["nodes"]["id"]]
+    links = [link for page in pages for link in zip(page["links"]["source"], page["links"]["target"])]
+    degrees = [degree for page in pages for degree in page["nodes"]["degree"]]
+    reached = set(ids)
+    expected = {(r["source"], r["target"]) for r in relations if {r["source"], r["target"]} <= reached}
+
+    assert len(ids) == len(reached) == pages[0]["total_nodes"]
+    assert degrees == sorted(degrees, reverse=True)
+    assert sorted(links) == sorted(expected)
+    assert list(pages[0]["nodes"]["properties"]) == ["importance"]
+    with pytest.raises(ValueError):
+        await service.graph_view("user_1", cursor="not-a-cursor")
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_canonicalization_on_write_and_offline_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module.settings, "memory_snapshot_enabled", False)
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    await service.initialize()
+    await service.write_graph("user_1", "conv_1", "epsilon", 2, *await service.canonicalize("user_1", ENTITIES, RELATIONS))
+
+    # The name match wins over the embedding, which is closest to "chat bot"
+    entities, relations = await service.canonicalize("user_1", [
+        {"id": "skill_python", "name": "python", "type": "Skill", "score": 9, "embedding": [0.2, 0.9, 0.0]},
+        {"id": "topic_asyncio", "name": "AsyncIO", "type": "Topic", "score": 6, "embedding": [0.0, 0.0, 1.0]},
+    ], [{"source": "skill_python", "target": "topic_asyncio", "type": "USES"}])
+    await service.write_graph("user_1", "conv_1", "epsilon", 4, entities, relations)
+
+    details = await service.get_node_details("topic_python")
+    assert [e["id"] for e in entities] == ["topic_python", "skill_async"]
+    assert details["properties"]["aliases"] == ["skill_python"]
+    assert [r["properties"]["count"] for r in details["outgoing_relations"] if r["target"] == "skill_async"] == [2]
+    assert await service.get_node_details("skill_python") is None
+
+    # Written around canonicalization, as entities were before it existed
+    await service.store.write_graph("user_1", "conv_2", "epsilon", 2, [
+        {"id": "topic_python3", "name": "Python 3", "type": "Topic", "score": 5, "embedding": [0.99, 0.05, 0.0]},
+    ], [
+        {"source": "user_1", "target": "topic_python3", "type": "INTERESTED_IN"},
+        {"source": "topic_python3", "target": "resource_docs", "type": "LEARNED_FROM"},
+        {"source": "topic_python3", "target": "topic_python", "type": "RELATED_TO"},
+    ])
+
+    assert await service.merge_duplicate_entities("user_1") == 1
+    details = await service.get_node_details("topic_python")
+    outgoing = {(r["target"], r["properties"]["type"]): r["properties"]["count"] for r in details["outgoing_relations"]}
+    assert details["properties"]["aliases"] == ["skill_python", "Python 3", "topic_python3"]
+    assert outgoing[("resource_docs", "LEARNED_FROM")] == 2
+    assert ("topic_python", "RELATED_TO") not in outgoing
+    assert "topic_python3" not in service.store.index._pos
+    # The merged-away id stays findable through the aliases
+    lines = await service.store.related_context("user_1", None, ["python3"], 10, False)
+    assert lines[0] == "用户与 Topic 'Python' 的关系: INTERESTED_IN"
+    assert (await service.get_graph_stats("user_1"))["node_types"]["Topic"] == 1
+    assert await service.merge_duplicate_entities("user_1") == 0
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_compaction_archives_cold_nodes_and_restores_them(tmp_path, monkeypatch):
+    async def fake_embedding(text):
+        return [1.0, 0.0, 0.0]
+
+    monkeypatch.setattr(memory_module.llm_service, "get_embedding", fake_embedding)
+    monkeypatch.setattr(memory_module.settings, "memory_snapshot_enabled", False)
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    engine = create_engine(f"sqlite:///{tmp_path / 'archive.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    service.archive = MemoryArchive(session_factory=sessionmaker(bind=engine))
+    await service.initialize()
+    await service.write_graph("user_1", "conv_1", "epsilon", 2, ENTITIES, RELATIONS)
+    await service.write_graph("user_2", "conv_2", "epsilon", 2, [], [
+        {"source": "user_2", "target": "project_bot", "type": "WORKING_ON"},
+    ])
+    await service.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "casual"}, "likes puns")
+    # Everything was last written months ago
+    service.store._conn.execute("UPDATE nodes SET updated_at = '2020-01-01T00:00:00'")
+
+    await service.query_related_context("user_1", "python", include_relational=False)
+    result = await service.compact_user("user_1")
+
+    # Python and python docs were just recalled, and project_bot is also user_2's
+    archived = sorted(node["id"] for node in service.list_archived("user_1")["nodes"])
+    assert result["archived"] == 3 and result["scanned"] == 5
+    assert archived[0].startswith("obs_user_1_epsilon_")
+    assert archived[1:] == ["pref_user_1_epsilon_tone", "skill_async"]
+    assert await service.get_node_details("skill_async") is None
+    assert "skill_async" not in service.store.index._pos
+    assert (await service.get_graph_stats("user_1"))["node_types"] == {
+        "Conversation": 1, "Topic": 1, "Project": 1, "Resource": 1,
+    }
+    python = await service.get_node_details("topic_python")
+    assert python["properties"]["access_count"] == 1
+
+    assert await service.restore_archived("user_1", ["skill_async"]) == 1
+    details = await service.get_node_details("skill_async")
+    assert [(r["source"], r["properties"]["type"]) for r in details["incoming_relations"]] == [("topic_python", "USES")]
+    assert "skill_async" in service.store.index._pos
+    assert service.list_archived("user_1")["total"] == 2
+
+    # Restoring counts as a recall, so the next run leaves it alone
+    assert (await service.compact_user("user_1"))["archived"] == 0
+    monkeypatch.setattr(memory_module.settings, "memory_compaction_mode", "prune")
+    monkeypatch.setattr(memory_module.settings, "memory_decay_min_age_days", 0)
+    monkeypatch.setattr(memory_module.settings, "memory_decay_min_importance", 100)
+    assert (await service.compact_user("user_1"))["pruned"] == 3
+    assert service.list_archived("user_1")["total"] == 2
+    assert await service.get_node_details("project_bot") is not None
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_keyword_recall_on_cjk_names_and_aliases(tmp_path):
+    store = await _store(tmp_path)
+    await store.write_graph("user_1", "conv_2", "epsilon", 2, [
+        {"id": "topic_ml", "name": "机器学习", "type": "Topic", "score": 7,
+         "properties": {"aliases": ["Machine Learning"]}},
+    ], [{"source": "user_1", "target": "topic_ml", "type": "INTERESTED_IN"}])
+    expected = ["用户与 Topic '机器学习' 的关系: INTERESTED_IN"]
+
+    assert await store.related_context("user_1", None, extract_keywords("我最近在学机器学习"), 10, False) == expected
+    assert await store.related_context("user_1", None, extract_keywords("machine learning?"), 10, False) == expected
+    await store.close()
+
+    # A database from before the term table is backfilled when opened
+    conn = sqlite3.connect(tmp_path / "graph.db")
+    conn.execute("DELETE FROM entity_terms")
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+    store = LocalGraphStore(str(tmp_path / "graph.db"))
+    await store.initialize()
+    assert await store.related_context("user_1", None, ["学习"], 10, False) == expected
+    await store.close()
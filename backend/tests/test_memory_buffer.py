@@ -0,0 +1,131 @@
+"""Tests for the durable memory write buffer."""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+import app.models.db_session  # noqa: F401
+from app.models.db_session import MemoryBufferDB
+from app.models.memory import Entity, Relation, TurnExtraction
+from app.services.local_graph_store import LocalGraphStore
+from app.services.memory_buffer import MemoryBuffer
+from app.services.memory_service import MemoryService
+
+
+def _factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'buffer.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def _turn(n):
+    return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+
+def _journal_size(factory):
+    db = factory()
+    try:
+        return db.query(MemoryBufferDB).count()
+    finally:
+        db.close()
+
+
+def test_size_trigger_and_ack_clear_the_journal(tmp_path):
+    factory = _factory(tmp_path)
+    buffer = MemoryBuffer(max_messages=4, session_factory=factory)
+
+    assert buffer.append("conv_1", "user_1", "epsilon", _turn(1)) is None
+    segment = buffer.append("conv_1", "user_1", "epsilon", _turn(2))
+
+    assert [m["content"] for m in segment.messages] == ["question 1", "answer 1", "question 2", "answer 2"]
+    assert segment.reason == "size" and buffer.bytes == 0
+    assert _journal_size(factory) == 4
+    buffer.ack(segment)
+    assert _journal_size(factory) == 0
+
+
+def test_restart_replays_unacknowledged_messages(tmp_path):
+    factory = _factory(tmp_path)
+    buffer = MemoryBuffer(max_messages=4, session_factory=factory)
+    buffer.append("conv_1", "user_1", "epsilon", _turn(1))
+    buffer.append("conv_2", "user_2", "epsilon", _turn(1))
+    buffer.append("conv_2", "user_2", "epsilon", _turn(2))  # taken, crash before ack
+
+    restarted = MemoryBuffer(max_messages=4, session_factory=factory)
+
+    assert restarted.load() == 6
+    segments = {s.conversation_id: s for s in restarted.take_all("shutdown")}
+    assert len(segments["conv_1"].messages) == 2
+    assert segments["conv_2"].user_id == "user_2" and len(segments["conv_2"].messages) == 4
+
+
+def test_requeued_segment_is_handed_out_again_ahead_of_newer_messages(tmp_path):
+    factory = _factory(tmp_path)
+    buffer = MemoryBuffer(max_messages=2, idle_seconds=0, session_factory=factory)
+    segment = buffer.append("conv_1", "user_1", "epsilon", _turn(1))
+    buffer.requeue(segment)
+
+    assert buffer.append("conv_1", "user_1", "epsilon", _turn(2)) is None
+    assert buffer.due() == [] and buffer.evict() == []
+    assert buffer.ready(0) == []
+    [retry] = buffer.ready(5)
+
+    assert [m["content"] for m in retry.messages] == ["question 1", "answer 1", "question 2", "answer 2"]
+    assert retry.reason == "size" and len(retry.row_ids) == 4
+    assert buffer.bytes == 0 and not buffer.has_ready()
+    assert buffer.metrics()["requeued"] == 1 and buffer.flushes["size"] == 1
+    buffer.ack(retry)
+    assert _journal_size(factory) == 0
+
+
+def test_idle_age_and_memory_cap_triggers(tmp_path):
+    buffer = MemoryBuffer(max_messages=100, idle_seconds=60, max_age_seconds=300, max_bytes=60,
+                          session_factory=_factory(tmp_path))
+    buffer.append("quiet", "user_1", "epsilon", _turn(1))
+    buffer.append("chatty", "user_2", "epsilon", _turn(1))
+    quiet, chatty = buffer._pending["quiet"], buffer._pending["chatty"]
+    quiet.last_at -= 61
+    chatty.first_at -= 301
+
+    assert {(s.conversation_id, s.reason) for s in buffer.due()} == {("quiet", "idle"), ("chatty", "age")}
+
+    for n in range(3):
+        buffer.append("old", "user_1", "epsilon", _turn(n))
+    buffer.append("new", "user_2", "epsilon", _turn(1))
+    evicted = buffer.evict()
+
+    assert [s.conversation_id for s in evicted] == ["old"]
+    assert buffer.bytes <= 60
+    assert buffer.metrics()["flushes"] == {
+        "size": 0, "idle": 1, "age": 1, "evicted": 1, "session_end": 0, "shutdown": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_shutdown_flush_writes_partial_buffers(tmp_path, monkeypatch):
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    service.buffer = MemoryBuffer(max_messages=10, session_factory=_factory(tmp_path))
+    await service.initialize()
+    seen = []
+
+    async def fake_extract(text, user_id, conversation_id):
+        seen.append((user_id, conversation_id, text))
+        return TurnExtraction(
+            entities=[Entity(id="topic_rust", type="Topic", name="Rust", score=8)],
+            relations=[Relation(source=user_id, target="topic_rust", type="INTERESTED_IN")],
+        ), None
+
+    async def no_embedding(text):
+        return None
+
+    monkeypatch.setattr(service, "extract_segment", fake_extract)
+    monkeypatch.setattr("app.services.memory_service.llm_service.get_embedding", no_embedding)
+
+    assert service.buffer_messages("conv_1", _turn(1), "user_1", "epsilon") is None
+    assert await service.flush_all() == 1
+
+    assert seen == [("user_1", "conv_1", "user: question 1\nassistant: answer 1")]
+    assert (await service.store.get_node_details("topic_rust"))["incoming_relations"][0]["source"] == "user_1"
+    assert service.buffer.metrics()["messages"] == 0
+    assert _journal_size(service.buffer._session_factory) == 0
+    await service.close()
@@ -0,0 +1,52 @@
+"""Tests for memory decay scoring and access counting."""
+from datetime import datetime
+
+import pytest
+
+from app.services.memory_decay import DAY_SECONDS, AccessLog, decayed_importance, select_cold
+
+NOW = datetime(2026, 6, 1).timestamp()
+
+
+def _iso(days_ago):
+    return datetime.fromtimestamp(NOW - days_ago * DAY_SECONDS).isoformat()
+
+
+def test_decayed_importance_halves_per_half_life_and_rewards_access():
+    assert decayed_importance(8, NOW, 0, NOW, 30) == 8
+    assert decayed_importance(8, NOW - 30 * DAY_SECONDS, 0, NOW, 30) == pytest.approx(4)
+    assert decayed_importance(8, NOW - 60 * DAY_SECONDS, 3, NOW, 30) == pytest.approx(2.5)
+    assert decayed_importance(8, None, 0, NOW, 30) == 8
+
+
+def test_select_cold_ranks_by_decay_within_budget():
+    rows = [
+        {"id": "topic_old", "label": "Entity", "importance": 6, "updated_at": _iso(120)},
+        {"id": "topic_recalled", "label": "Entity", "importance": 6, "updated_at": _iso(120),
+         "last_accessed_at": _iso(1), "access_count": 4},
+        {"id": "topic_fresh_but_dull", "label": "Entity", "importance": 0, "updated_at": _iso(3)},
+        {"id": "obs_1", "label": "CharacterObservation", "importance": None, "updated_at": _iso(200)},
+        {"id": "pref_tone", "label": "UserPreference", "importance": None, "updated_at": _iso(60)},
+    ]
+
+    cold = select_cold(rows, NOW, 30, 1.0, 14, budget=5)
+
+    # Observations default to a score of 5; the preference (8) is still warm at 60 days
+    assert [row["id"] for row in cold] == ["obs_1", "topic_old"]
+    assert cold[1]["decayed"] == pytest.approx(6 * 0.5 ** 4)
+    assert [row["id"] for row in select_cold(rows, NOW, 30, 1.0, 14, budget=1)] == ["obs_1"]
+
+
+def test_access_log_aggregates_until_drained():
+    log = AccessLog()
+    log.record(["topic_python", "skill_async"], at=NOW - 10)
+    log.record(["topic_python"], at=NOW)
+
+    rows = {row["id"]: row for row in log.drain()}
+    assert rows["topic_python"]["count"] == 2
+    assert rows["topic_python"]["last_accessed_at"] == datetime.fromtimestamp(NOW).isoformat()
+    assert len(log) == 0
+
+    log.record(["topic_python"], at=NOW - 100)
+    log.restore([rows["topic_python"]])
+    assert log.drain() == [dict(rows["topic_python"], count=3)]
@@ -0,0 +1,267 @@
+"""Tests for the staged memory write pipeline."""
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+import app.models.db_session  # noqa: F401
+from app.models.db_session import MemoryBufferDB
+from app.models.memory import Entity, Relation, TurnExtraction
+from app.services.local_graph_store import LocalGraphStore
+from app.services.memory_buffer import BufferedSegment, MemoryBuffer
+from app.services.memory_pipeline import MemoryJob, MemoryPipeline
+from app.services.memory_service import MemoryService
+
+
+def _turn(n):
+    return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+
+def _segment(conversation_id, user_id="user_1", n=1):
+    return BufferedSegment(conversation_id, user_id, "epsilon", _turn(n), [], "size")
+
+
+class _Stages:
+    """Fake stage callables; writes block until `release` is set"""
+
+    def __init__(self, failures=0):
+        self.release = asyncio.Event()
+        self.writes = []
+        self.extracted = []
+        self.finished = []
+        self.failures = failures
+
+    async def extract(self, job):
+        self.extracted.append((job.conversation_id, job.segment.messages[0]["content"]))
+        return TurnExtraction(), None
+
+    async def embed(self, job):
+        job.entities = [{"id": job.conversation_id}]
+
+    async def write(self, user_id, jobs):
+        await self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("leader switched")
+        self.writes.append((user_id, [job.conversation_id for job in jobs]))
+
+    def finish(self, job):
+        self.finished.append(job.id)
+
+    def pipeline(self, **kwargs):
+        return MemoryPipeline(self.extract, self.embed, self.write, self.finish, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_conversation_jobs_run_in_order_and_user_writes_coalesce():
+    stages = _Stages()
+    pipeline = stages.pipeline(coalesce_max=8)
+    pipeline.start()
+
+    jobs = [
+        await pipeline.submit(MemoryJob(_segment("conv_a", n=1))),
+        await pipeline.submit(MemoryJob(_segment("conv_a", n=2))),
+        await pipeline.submit(MemoryJob(_segment("conv_b"))),
+        await pipeline.submit(MemoryJob(_segment("conv_c", user_id="user_2"))),
+        await pipeline.submit(MemoryJob(_segment("conv_d"))),
+    ]
+    await asyncio.sleep(0.05)
+
+    # The second conv_a segment waits behind the first instead of being extracted
+    assert ("conv_a", "question 2") not in stages.extracted
+    assert pipeline.metrics()["waiting_conversations"] == 1
+
+    stages.release.set()
+    await pipeline.join()
+
+    written = [conversation_id for _, ids in stages.writes for conversation_id in ids]
+    assert [job.status for job in jobs] == ["done"] * 5
+    assert sorted(written) == ["conv_a", "conv_a", "conv_b", "conv_c", "conv_d"]
+    assert stages.extracted.index(("conv_a", "question 1")) < stages.extracted.index(("conv_a", "question 2"))
+    assert all(user == "user_2" for user, ids in stages.writes if "conv_c" in ids)
+    # Three user_1 jobs were ready while the first write was blocked; they share write rounds
+    assert pipeline.metrics()["coalesced_jobs"] >= 1
+    assert sorted(stages.finished) == sorted(job.id for job in jobs)
+    await pipeline.stop()
+
+
+@pytest.mark.asyncio
+async def test_transient_write_errors_are_retried_then_fail():
+    stages = _Stages(failures=2)
+    stages.release.set()
+    pipeline = stages.pipeline(max_retries=3, retry_base_seconds=0, transient_errors=(ConnectionError,))
+    pipeline.start()
+
+    job = await pipeline.submit(MemoryJob(_segment("conv_a")))
+    await job.done
+
+    assert job.status == "done" and job.attempts == 3
+    assert pipeline.metrics()["retries"] == 2
+
+    stages.failures = 5
+    failed = await pipeline.submit(MemoryJob(_segment("conv_a", n=2)))
+    await failed.done
+
+    assert failed.status == "failed" and failed.attempts == 4
+    assert failed.result()["error"] == "leader switched"
+    await pipeline.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_pipeline_makes_submitters_wait():
+    stages = _Stages()
+    pipeline = stages.pipeline(capacity=2)
+    pipeline.start()
+    await pipeline.submit(MemoryJob(_segment("conv_a")))
+    await pipeline.submit(MemoryJob(_segment("conv_b")))
+
+    third = asyncio.ensure_future(pipeline.submit(MemoryJob(_segment("conv_c"))))
+    await asyncio.sleep(0.05)
+
+    assert not third.done()
+    assert pipeline.metrics()["in_flight"] == 2 and pipeline.metrics()["backpressure_waits"] == 1
+
+    stages.release.set()
+    job = await asyncio.wait_for(third, 1)
+    await pipeline.join()
+    assert job.status == "done" and pipeline.metrics()["in_flight"] == 0
+    await pipeline.stop()
+
+
+@pytest.mark.asyncio
+async def test_write_conversation_returns_a_pollable_job(tmp_path, monkeypatch):
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    engine = create_engine(f"sqlite:///{tmp_path / 'buffer.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    service.buffer = MemoryBuffer(max_messages=2, session_factory=sessionmaker(bind=engine))
+    await service.initialize()
+
+    async def fake_extract(text, user_id, conversation_id):
+        return TurnExtraction(
+            entities=[Entity(id="topic_rust", type="Topic", name="Rust", score=8)],
+            relations=[Relation(source=user_id, target="topic_rust", type="INTERESTED_IN")],
+            preferences={"tone": "casual"},
+        ), None
+
+    async def no_embedding(text):
+        return None
+
+    monkeypatch.setattr(service, "extract_segment", fake_extract)
+    monkeypatch.setattr("app.services.memory_service.llm_service.get_embedding", no_embedding)
+
+    result = await service.write_conversation("user_1", "conv_1", _turn(1))
+    await service.pipeline.join()
+    job = service.get_job(result["job_id"])
+
+    assert result["status"] == "queued"
+    assert job["status"] == "done" and job["entities_count"] == 1 and job["relations_count"] == 1
+    assert (await service.get_graph_stats("user_1"))["node_types"] == {
+        "Conversation": 1, "Topic": 1, "UserPreference": 1,
+    }
+    db = service.buffer._session_factory()
+    assert db.query(MemoryBufferDB).count() == 0
+    db.close()
+    assert service.get_job("missing") is None
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_retried_write_does_not_repeat_committed_signals(tmp_path):
+    store = LocalGraphStore(str(tmp_path / "graph.db"))
+    service = MemoryService(store)
+    await service.initialize()
+    service.pipeline.retry_base_seconds = 0
+    jobs = [
+        MemoryJob(_segment(conversation_id), TurnExtraction(observation=f"likes {conversation_id}"))
+        for conversation_id in ("conv_a", "conv_b")
+    ]
+    signals = []
+    write_signals = store.write_relational_signals
+
+    async def flaky_signals(user_id, character_id, conversation_id, *args):
+        signals.append(conversation_id)
+        if signals == ["conv_a", "conv_b"]:
+            raise sqlite3.OperationalError("database is locked")
+        await write_signals(user_id, character_id, conversation_id, *args)
+
+    store.write_relational_signals = flaky_signals
+    await service.pipeline._write_with_retries("user_1", jobs)
+
+    assert signals == ["conv_a", "conv_b", "conv_b"]
+    assert service.pipeline.retries == 1
+    assert all(job.signals_written for job in jobs)
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_scheduled_segment_notifies_listeners_after_write(tmp_path, monkeypatch):
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    engine = create_engine(f"sqlite:///{tmp_path / 'buffer.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    service.buffer = MemoryBuffer(max_messages=2, session_factory=sessionmaker(bind=engine))
+    await service.initialize()
+    finished = []
+    service.add_job_listener(finished.append)
+
+    async def fake_extract(text, user_id, conversation_id):
+        return TurnExtraction(preferences={"tone": "casual"}), None
+
+    monkeypatch.setattr(service, "extract_segment", fake_extract)
+
+    segment = service.buffer_messages("conv_1", _turn(1), "user_1", "epsilon")
+    assert await service.schedule_segment(segment)
+    assert finished == []
+    await service.join()
+
+    assert [(job.conversation_id, job.extraction.preferences) for job in finished] == [("conv_1", {"tone": "casual"})]
+    db = service.buffer._session_factory()
+    assert db.query(MemoryBufferDB).count() == 0
+    db.close()
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_saturated_pipeline_requeues_segments_instead_of_piling_up_tasks(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.memory_service.settings.memory_pipeline_capacity", 2)
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    engine = create_engine(f"sqlite:///{tmp_path / 'buffer.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    service.buffer = MemoryBuffer(max_messages=2, session_factory=sessionmaker(bind=engine))
+    await service.initialize()
+    release = asyncio.Event()
+    written = []
+
+    async def blocked_extract(text, user_id, conversation_id):
+        await release.wait()
+        return TurnExtraction(), None
+
+    monkeypatch.setattr(service, "extract_segment", blocked_extract)
+    service.add_job_listener(lambda job: written.append(job.conversation_id))
+
+    for n in range(50):
+        segment = service.buffer_messages(f"conv_{n}", _turn(n), "user_1", "epsilon")
+        service._spawn_flush(segment)
+        await asyncio.sleep(0)
+        assert len(service._flushing) <= 1
+    # The same conversation keeps its order: newer messages queue behind the requeued segment
+    service.buffer_messages("conv_49", _turn(99), "user_1", "epsilon")
+
+    assert service.pipeline.in_flight == 2
+    assert service.pipeline.metrics()["deferred"] == 48
+    assert service.buffer.metrics()["ready"] == 48
+    db = service.buffer._session_factory()
+    assert db.query(MemoryBufferDB).count() == 102
+    db.close()
+
+    release.set()
+    await service.join()
+
+    assert sorted(written) == sorted(f"conv_{n}" for n in range(50))
+    assert service.buffer.metrics()["messages"] == 0
+    db = service.buffer._session_factory()
+    assert db.query(MemoryBufferDB).count() == 0
+    db.close()
+    await service.close()
@@ -0,0 +1,64 @@
+"""Tests for memory reranking and token packing."""
+from datetime import datetime
+
+from app.services.memory_decay import DAY_SECONDS
+from app.services.memory_rerank import pack_lines, rank
+from app.services.token_counter import TokenCounter
+
+NOW = datetime(2026, 6, 1).timestamp()
+
+
+def _iso(days_ago):
+    return datetime.fromtimestamp(NOW - days_ago * DAY_SECONDS).isoformat()
+
+
+def _candidate(node_id, embedding, importance=5, days_ago=None, degree=0, name=None):
+    return {
+        "id": node_id, "name": name or node_id, "aliases": None, "importance": importance,
+        "updated_at": _iso(days_ago) if days_ago is not None else None, "degree": degree, "embedding": embedding,
+    }
+
+
+def test_rank_weighs_relevance_importance_recency_and_degree():
+    stale = _candidate("stale", [1.0, 0.0], importance=6, days_ago=180)
+    fresh = _candidate("fresh", [1.0, 0.0], importance=6, days_ago=1)
+    hub = _candidate("hub", [1.0, 0.0], importance=6, days_ago=180, degree=20)
+    important = _candidate("important", [1.0, 0.0], importance=9, days_ago=180)
+    distant = _candidate("distant", [0.6, 0.8], importance=9, days_ago=1)
+
+    for better, worse in [(fresh, stale), (hub, stale), (important, stale), (stale, distant)]:
+        assert rank([1.0, 0.0], [], [worse, better], 1, now=NOW) == [better["id"]]
+    # Equal features tie-break on id, whatever order the store returned them in
+    twins = [_candidate("y", [1.0, 0.0]), _candidate("x", [1.0, 0.0])]
+    assert rank([1.0, 0.0], [], twins, 2, now=NOW) == rank([1.0, 0.0], [], twins[::-1], 2, now=NOW) == ["x", "y"]
+
+
+def test_mmr_prefers_a_different_entity_over_a_near_duplicate():
+    candidates = [
+        _candidate("python", [1.0, 0.0, 0.0], importance=9, days_ago=1),
+        _candidate("python3", [0.99, 0.14, 0.0], importance=9, days_ago=1),
+        _candidate("rust", [0.0, 1.0, 0.0], importance=9, days_ago=1),
+    ]
+
+    # python and rust are equally relevant to the query; python adds little next to python3
+    assert rank([0.7, 0.7, 0.0], [], candidates, 3, now=NOW) == ["python3", "rust", "python"]
+
+
+def test_keyword_only_candidates_rank_by_name_coverage():
+    candidates = [
+        _candidate("resource_docs", None, importance=9, name="python docs"),
+        _candidate("topic_python", None, importance=8, name="Python"),
+        _candidate("topic_ml", None, name="机器学习"),
+    ]
+
+    assert rank(None, ["python"], candidates, 10, now=NOW)[:2] == ["topic_python", "resource_docs"]
+    assert rank(None, ["学机", "机器", "器学", "学习"], candidates, 1, now=NOW) == ["topic_ml"]
+
+
+def test_pack_lines_fills_the_budget_in_order():
+    counter = TokenCounter(tokenizer="chars")
+    lines = ["a" * 40, "b" * 400, "c" * 40, "d" * 40]  # 10, 100, 10 and 10 tokens
+
+    assert pack_lines(lines, counter, 25) == ["a" * 40, "c" * 40]
+    assert pack_lines(lines, counter, 1000) == lines
+    assert pack_lines(lines, counter, 5) == []
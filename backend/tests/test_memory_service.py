@@ -0,0 +1,396 @@
+"""Tests for MemoryService graph I/O and schema against a fake async driver."""
+import asyncio
+import os
+import re
+import time
+
+import pytest
+
+from app.services.memory_schema import CONSTRAINTS, ensure_schema, entity_label
+from app.services.memory_service import MemoryService
+from app.services.neo4j_graph_store import Neo4jGraphStore
+
+
+class _Result:
+    def __init__(self, records):
+        self._records = records
+
+    def __aiter__(self):
+        self._iter = iter(self._records)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def single(self):
+        return self._records[0] if self._records else None
+
+
+class _SlowTx:
+    async def run(self, query, **params):
+        await asyncio.sleep(0.2)  # stands in for an Aura round trip
+        return _Result([{"keys": ["node:Topic"], "counts": [3]}])
+
+
+class _RecordingTx:
+    def __init__(self):
+        self.queries = []
+
+    async def run(self, query, **params):
+        self.queries.append((query, params))
+        return _Result([])
+
+
+class _Session:
+    def __init__(self, tx=None):
+        self.tx = tx
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute_read(self, fn, *args):
+        return await fn(self.tx or _SlowTx(), *args)
+
+    async def execute_write(self, fn, *args):
+        return await fn(self.tx, *args)
+
+
+class _Driver:
+    def __init__(self, tx=None):
+        self.tx = tx
+
+    def session(self, database=None):
+        return _Session(self.tx)
+
+
+def _service(driver):
+    store = Neo4jGraphStore("neo4j://test", "neo4j", "pw")
+    store.driver = driver
+    service = MemoryService(store)
+    service._initialized = True
+    return service
+
+
+@pytest.mark.asyncio
+async def test_slow_graph_query_leaves_other_streams_running():
+    service = _service(_Driver())
+
+    ticks = []
+
+    async def _stream():
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            ticks.append(time.perf_counter())
+
+    stats, _ = await asyncio.gather(service.get_graph_stats("user_1"), _stream())
+
+    assert stats["node_types"] == {"Topic": 3}
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert max(gaps) < 0.1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [10, 100, 1000])
+async def test_write_graph_round_trips_do_not_grow_with_extraction(size):
+    tx = _RecordingTx()
+    service = _service(_Driver(tx))
+
+    entities = [
+        {"id": f"e{i}", "type": "Topic" if i % 2 else "Skill", "name": f"n{i}", "score": 7, "properties": {}}
+        for i in range(size)
+    ]
+    relations = [{"source": "user_1", "target": f"e{i}", "type": "INTERESTED_IN", "properties": {}} for i in range(size)]
+
+    counts = await service.write_graph("user_1", "conv_1", "epsilon", 5, entities, relations)
+
+    assert counts == (size, size)
+    # user/conversation + one statement per label + one for relations
+    assert len(tx.queries) == 4
+    entity_rows = [params["rows"] for query, params in tx.queries if "MERGE (e:" in query]
+    assert sum(len(rows) for rows in entity_rows) == size
+
+
+class _CreatingTx(_RecordingTx):
+    """Reports every MERGE as a creation"""
+
+    async def run(self, query, **params):
+        self.queries.append((query, params))
+        return _Result([{"created": len(params.get("rows", [])) or 1}])
+
+
+@pytest.mark.asyncio
+async def test_writes_add_created_counts_to_user_stats():
+    tx = _CreatingTx()
+    service = _service(_Driver(tx))
+
+    await service.write_graph(
+        "user_1", "conv_1", "epsilon", 5,
+        [{"id": "e1", "type": "Topic", "name": "python", "score": 7}, {"id": "e2", "type": "Skill", "name": "asyncio", "score": 6}],
+        [{"source": "user_1", "target": "e1", "type": "INTERESTED_IN"}],
+    )
+    await service.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "casual"})
+
+    updates = [params for query, params in tx.queries if "u.stats_counts" in query]
+    assert [{d["key"]: d["count"] for d in params["deltas"]} for params in updates] == [
+        {"node:Conversation": 1, "rel:HAS_CONVERSATION": 1, "node:Topic": 1, "node:Skill": 1, "rel:RELATION": 1},
+        {"node:UserPreference": 1, "rel:HAS_PREFERENCE": 1},
+    ]
+
+
+def test_entity_label_rejects_injection():
+    assert entity_label("Topic") == "Topic"
+    assert entity_label("Topic`) DETACH DELETE (x") == "Entity"
+
+
+class _Record(dict):
+    def __missing__(self, key):
+        return None
+
+    def data(self):
+        return self
+
+
+class _CapturingTx:
+    """Records every query and answers with one record so follow-up queries run too."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def run(self, query, **params):
+        self.queries.append((query, params))
+        if "UNION" in query:  # node details: no match
+            return _Result([])
+        return _Result([_Record(
+            id="e1", name="python", type="Topic", key="k", value="v", content="c", count=1,
+            entity_name="python", entity_type="Topic", user_rels=["INTERESTED_IN"],
+            neighbors=[{"rel": "USES", "name": "asyncio"}], total=1, properties={"id": "e1", "embedding": None},
+            page=[{"eid": "4:db:1", "id": "e1", "label": "python", "type": "Topic", "degree": 2, "score": 7, "props": []}],
+        )])
+
+
+async def _service_queries(monkeypatch):
+    async def _no_embedding(text):
+        return None
+
+    monkeypatch.setattr("app.services.memory_service.llm_service.get_embedding", _no_embedding)
+    tx = _CapturingTx()
+    service = _service(_Driver(tx))
+
+    await service.write_graph(
+        "user_1", "conv_1", "epsilon", 5,
+        [{"id": "topic_python", "type": "Topic", "name": "Python", "score": 7, "properties": {}}],
+        [{"source": "user_1", "target": "topic_python", "type": "INTERESTED_IN", "properties": {}}],
+    )
+    await service.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "casual"}, "likes puns")
+    await service.query_related_context("user_1", "python projects")
+    await service.get_node_details("topic_python")
+    await service.query_graph("user_1", entity_types=["Topic"], relation_types=["INTERESTED_IN"])
+    await service.graph_view("user_1", entity_types=["Topic"], limit=1)
+    await service.get_graph_stats("user_1")
+    await service.canonicalize("user_1", [{"id": "topic_py", "name": "py", "type": "Topic", "score": 7}], [])
+    await service.merge_duplicate_entities("user_1")
+    return tx.queries
+
+
+# A node pattern with a property map but no label, e.g. "(a {id: $id})"
+_UNLABELED_LOOKUP = re.compile(r"\(\s*[a-z_]\w*\s*\{")
+
+
+@pytest.mark.asyncio
+async def test_id_lookups_are_label_anchored(monkeypatch):
+    queries = await _service_queries(monkeypatch)
+
+    assert len(queries) >= 10
+    for query, _ in queries:
+        assert not _UNLABELED_LOOKUP.search(query), query
+
+
+@pytest.mark.asyncio
+async def test_graph_queries_do_not_enumerate_paths_or_ship_embeddings(monkeypatch):
+    tx = _CapturingTx()
+    service = _service(_Driver(tx))
+
+    legacy = await service.query_graph("user_1", entity_types=["Topic') OR true //"])
+    view = await service.graph_view("user_1", limit=1, properties=["name", "embedding"])
+
+    queries = [query for query, _ in tx.queries]
+    assert not any("relationships(path)" in query for query in queries)
+    assert not any("Topic')" in query for query in queries)  # filters are parameters
+    assert "embedding" not in legacy["nodes"][0]["properties"]
+    assert view["nodes"]["id"] == ["e1"] and view["next_cursor"] is None
+    assert list(view["nodes"]["properties"]) == ["name"]
+    assert len(queries) == 4  # two per call
+
+
+def _operators(plan):
+    yield plan["operatorType"]
+    for child in plan.get("children", []):
+        yield from _operators(child)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.getenv("NEO4J_TEST_URI"), reason="NEO4J_TEST_URI not set")
+async def test_explain_plans_have_no_all_nodes_scan(monkeypatch):
+    from neo4j import AsyncGraphDatabase
+
+    queries = await _service_queries(monkeypatch)
+    driver = AsyncGraphDatabase.driver(
+        os.environ["NEO4J_TEST_URI"],
+        auth=(os.getenv("NEO4J_TEST_USER", "neo4j"), os.getenv("NEO4J_TEST_PASSWORD", "")),
+    )
+    try:
+        await ensure_schema(driver, "neo4j")
+        async with driver.session() as session:
+            for query, params in queries:
+                result = await session.run("EXPLAIN " + query, **params)
+                summary = await result.consume()
+                operators = list(_operators(summary.plan))
+                assert not any(op.startswith("AllNodesScan") for op in operators), (query, operators)
+    finally:
+        await driver.close()
+
+
+class _SchemaSession(_Session):
+    def __init__(self, constraints):
+        super().__init__()
+        self.constraints = constraints
+        self.queries = []
+
+    async def run(self, query, **params):
+        self.queries.append(query)
+        if query.startswith("SHOW CONSTRAINTS"):
+            return _Result([{"name": name} for name in self.constraints])
+        return _Result([_Record(count=0)])
+
+
+class _SchemaDriver:
+    def __init__(self, session):
+        self._session = session
+
+    def session(self, database=None):
+        return self._session
+
+
+@pytest.mark.asyncio
+async def test_ensure_schema_migrates_before_creating_missing_constraints():
+    session = _SchemaSession(constraints=["user_id_unique"])
+
+    await ensure_schema(_SchemaDriver(session), "neo4j")
+
+    created = [q for q in session.queries if q.startswith("CREATE CONSTRAINT")]
+    assert len(created) == len(CONSTRAINTS) - 1
+    first_constraint = session.queries.index(created[0])
+    assert any("SET n:Entity" in q for q in session.queries[:first_constraint])
+    assert any("DETACH DELETE d" in q for q in session.queries[:first_constraint])
+    assert any(q.startswith("DROP INDEX entity_id_index") for q in session.queries[:first_constraint])
+
+
+@pytest.mark.asyncio
+async def test_ensure_schema_skips_migration_when_constraints_exist():
+    session = _SchemaSession(constraints=list(CONSTRAINTS))
+
+    await ensure_schema(_SchemaDriver(session), "neo4j")
+
+    assert not any("DETACH DELETE" in q or q.startswith("CREATE CONSTRAINT") for q in session.queries)
+    assert any("entity_embedding_index" in q for q in session.queries)
+
+
+@pytest.mark.asyncio
+async def test_context_expansion_is_one_query_for_all_recalled_nodes(monkeypatch):
+    async def _no_embedding(text):
+        return None
+
+    monkeypatch.setattr("app.services.memory_service.llm_service.get_embedding", _no_embedding)
+    tx = _CapturingTx()
+    service = _service(_Driver(tx))
+
+    context = await service.query_related_context("user_1", "python projects", include_relational=False)
+
+    expansions = [params for query, params in tx.queries if "UNWIND range(0, size($ids) - 1)" in query]
+    assert len(expansions) == 1
+    assert expansions[0]["ids"] == ["e1"]
+    lexical = [params for query, params in tx.queries if "entity_name_fulltext" in query]
+    assert lexical[0]["terms"] == '"python" OR "projects"'
+    assert context.splitlines() == [
+        "用户与 Topic 'python' 的关系: INTERESTED_IN",
+        "Topic 'python' USES asyncio",
+    ]
+
+
+class _SnapshotTx:
+    """Answers the snapshot load queries with a two-entity subgraph."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def run(self, query, **params):
+        self.queries.append(query)
+        if "[*1..2]" in query:
+            return _Result([
+                _Record(id="topic_python", name="Python", type="Topic", importance=8, embedding=[1.0, 0.0]),
+                _Record(id="skill_async", name="asyncio", type="Skill", importance=6, embedding=[0.0, 1.0]),
+            ])
+        if "UNWIND $ids" in query:
+            return _Result([_Record(source="topic_python", type="USES", count=2, target="skill_async",
+                                    name="asyncio", target_type="Skill", importance=6)])
+        if "(:User {id: $user_id})-[r]->(e:Entity)" in query:
+            return _Result([_Record(target="topic_python", type="INTERESTED_IN")])
+        return _Result([])
+
+
+def _snapshot_service(monkeypatch, tx):
+    async def _embedding(text):
+        return [1.0, 0.0]
+
+    monkeypatch.setattr("app.services.memory_service.llm_service.get_embedding", _embedding)
+    monkeypatch.setattr("app.services.memory_service.settings.memory_snapshot_enabled", True)
+    service = _service(_Driver(tx))
+    return service
+
+
+@pytest.mark.asyncio
+async def test_snapshot_loads_once_then_retrieves_locally(monkeypatch):
+    tx = _SnapshotTx()
+    service = _snapshot_service(monkeypatch, tx)
+
+    first = await service.query_related_context("user_1", "python")
+    loaded = len(tx.queries)
+    second = await service.query_related_context("user_1", "python")
+
+    assert loaded == 5
+    assert len(tx.queries) == loaded
+    assert first == second
+    assert first.splitlines() == [
+        "用户与 Topic 'Python' 的关系: INTERESTED_IN",
+        "Topic 'Python' USES asyncio",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_committed_writes_patch_or_invalidate_the_snapshot(monkeypatch):
+    tx = _SnapshotTx()
+    service = _snapshot_service(monkeypatch, tx)
+    await service.query_related_context("user_1", "python")
+
+    await service.write_graph(
+        "user_1", "conv_1", "epsilon", 5,
+        [{"id": "project_bot", "type": "Project", "name": "bot", "score": 9, "properties": {}}],
+        [{"source": "topic_python", "target": "project_bot", "type": "PART_OF", "properties": {}}],
+    )
+    await service.write_relational_signals("user_1", "epsilon", "conv_1", {"tone": "casual"}, "")
+    context = await service.query_related_context("user_1", "python")
+
+    assert "Topic 'Python' PART_OF bot" in context
+    assert "user preference: tone = casual" in context
+
+    await service.write_graph(
+        "user_1", "conv_1", "epsilon", 5, [],
+        [{"source": "topic_python", "target": "topic_unknown", "type": "RELATED_TO", "properties": {}}],
+    )
+    assert "user_1" not in service._snapshots
@@ -0,0 +1,112 @@
+"""Tests for in-process memory subgraph retrieval."""
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.services import memory_service as memory_module
+from app.services.keywords import extract_keywords
+from app.services.local_graph_store import LocalGraphStore
+from app.services.memory_service import MemoryService
+from app.services.memory_snapshot import MemorySnapshot
+
+
+def _snapshot():
+    snapshot = MemorySnapshot("user_1")
+    snapshot.add_node("topic_python", "Python", "Topic", 8, [1.0, 0.0, 0.0])
+    snapshot.add_node("project_bot", "chat bot", "Project", 7, [0.0, 1.0, 0.0])
+    snapshot.add_node("skill_async", "asyncio", "Skill", 6, [0.0, 0.0, 1.0])
+    snapshot.add_node("resource_docs", "python docs", "Resource", 9)
+    snapshot.add_edge("user_1", "INTERESTED_IN", "topic_python")
+    snapshot.add_edge("topic_python", "USES", "skill_async", count=1)
+    snapshot.add_edge("topic_python", "LEARNED_FROM", "resource_docs", count=1)
+    snapshot.add_edge("topic_python", "PART_OF", "project_bot", count=3)
+    return snapshot
+
+
+def test_vector_recall_expands_neighbors_in_ranking_order():
+    lines = _snapshot().context([0.9, 0.1, 0.0], ["unrelated"], limit=10, include_relational=False)
+
+    assert lines == [
+        "用户与 Topic 'Python' 的关系: INTERESTED_IN",
+        # count first, then neighbor importance
+        "Topic 'Python' PART_OF chat bot",
+        "Topic 'Python' LEARNED_FROM python docs",
+        "Topic 'Python' USES asyncio",
+    ]
+
+
+def test_keyword_fallback_matches_name_and_alias_terms():
+    snapshot = _snapshot()
+    snapshot.add_node("topic_ml", "机器学习", "Topic", 6, aliases=["machine learning"])
+
+    def recall(text):
+        return [snapshot.ids[i] for i in snapshot.recall(None, extract_keywords(text), limit=10)]
+
+    # A full name match outranks a partial one despite lower importance
+    assert recall("Python") == ["topic_python", "resource_docs"]
+    assert recall("docs") == ["resource_docs"]
+    assert recall("我想学机器学习") == recall("any machine learning tips?") == ["topic_ml"]
+    assert recall("Topic") == []
+
+
+def test_apply_write_patches_and_rejects_unknown_endpoints():
+    snapshot = _snapshot()
+    snapshot.context(None, ["x"], limit=10)  # compile before patching
+
+    assert snapshot.apply_write(
+        [{"id": "skill_numpy", "name": "numpy", "type": "Skill", "score": 7, "embedding": [0.0, 0.0, 1.0]}],
+        [{"source": "user_1", "target": "skill_numpy", "type": "HAS_SKILL"}],
+    )
+    assert "用户与 Skill 'numpy' 的关系: HAS_SKILL" in snapshot.context([0.0, 0.0, 1.0], [], limit=10)
+
+    assert not snapshot.apply_write([], [{"source": "topic_python", "target": "topic_rust", "type": "RELATED_TO"}])
+
+
+def test_relational_signals_are_newest_first():
+    snapshot = _snapshot()
+    snapshot.apply_signals({"tone": "casual"}, "", "epsilon", "2026-01-01T00:00:00")
+    snapshot.apply_signals({"tone": "formal", "lang": "zh"}, "likes puns", "epsilon", "2026-02-01T00:00:00")
+
+    lines = snapshot.context(None, [], limit=10)
+
+    assert lines == [
+        "user preference: tone = formal",
+        "user preference: lang = zh",
+        "character observation: likes puns",
+    ]
+
+
+class _NoStore:
+    """Stands in for the graph store; any use fails the test"""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"retrieval touched the graph store ({name})")
+
+
+@pytest.mark.asyncio
+async def test_retrieval_from_a_loaded_snapshot_makes_no_store_or_db_calls(tmp_path, monkeypatch):
+    async def fake_embedding(text):
+        return [1.0, 0.0, 0.0]
+
+    monkeypatch.setattr(memory_module.llm_service, "get_embedding", fake_embedding)
+    monkeypatch.setattr(memory_module.settings, "memory_snapshot_enabled", True)
+    service = MemoryService(LocalGraphStore(str(tmp_path / "graph.db")))
+    await service.initialize()
+    await service.write_graph("user_1", "conv_1", "epsilon", 2, [
+        {"id": "topic_python", "name": "Python", "type": "Topic", "score": 8, "embedding": [1.0, 0.0, 0.0]},
+    ], [{"source": "user_1", "target": "topic_python", "type": "INTERESTED_IN"}])
+    first = await service.query_related_context("user_1", "python")  # loads the snapshot
+
+    store = service.store
+    service.store = _NoStore()
+
+    def no_session(*args, **kwargs):
+        raise AssertionError("retrieval opened a database session")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(sessionmaker, "__call__", no_session)
+        for _ in range(3):
+            assert await service.query_related_context("user_1", "python") == first
+
+    assert first == "用户与 Topic 'Python' 的关系: INTERESTED_IN"
+    service.store = store
+    await service.close()
@@ -0,0 +1,51 @@
+"""Tests for the model capability registry."""
+from app.config import settings
+from app.services.model_registry import model_registry
+
+
+def test_budget_follows_model_window():
+    small_max, small_reserved = model_registry.context_budget("openai", "gpt-3.5-turbo")
+    large_max, _ = model_registry.context_budget("gemini", "gemini-2.5-flash")
+    assert small_max == 16385
+    assert small_reserved <= 4096
+    assert large_max == min(1048576, settings.context_window_ceiling)
+    assert large_max > small_max
+
+
+def test_unknown_model_uses_configured_defaults():
+    capability = model_registry.get("gemini", "gemini-experimental")
+    assert capability.context_window == settings.context_max_tokens
+    assert capability.tokenizer == "chars"
+    max_tokens, reserved = model_registry.context_budget("gemini", "gemini-experimental")
+    assert reserved <= max_tokens // 2
+
+
+def test_gemini_counter_is_char_based_and_cached():
+    counter = model_registry.token_counter("gemini", "gemini-2.5-flash")
+    assert counter._encoding is None
+    assert counter.count_text("你好世界") == 2
+    assert model_registry.token_counter("gemini", "gemini-2.5-flash") is counter
+
+
+def test_estimate_cost():
+    assert model_registry.estimate_cost("openai", "gpt-4o", 1_000_000, 100_000) == 2.5 + 1.0
+    assert model_registry.estimate_cost("gemini", "gemini-experimental", 10, 10) is None
+
+
+def test_every_registry_tokenizer_resolves_on_older_tiktoken(monkeypatch):
+    import tiktoken
+    from app.services import token_counter
+
+    known = {"cl100k_base": object()}
+
+    def get_encoding(name):
+        if name not in known:
+            raise ValueError(f"Unknown encoding {name}")  # as tiktoken 0.5 does for o200k_base
+        return known[name]
+
+    monkeypatch.setattr(tiktoken, "get_encoding", get_encoding)
+    monkeypatch.setattr(token_counter, "_tiktoken_cache", {})
+    for capability in model_registry.list():
+        counter = token_counter.TokenCounter(capability.provider, capability.id, capability.tokenizer)
+        expected = None if capability.tokenizer == "chars" else known["cl100k_base"]
+        assert counter._encoding is expected, capability.id
@@ -0,0 +1,53 @@
+"""Tests for inline prosody tag parsing."""
+from app.services.prosody import ProsodyTagParser, group_segments, tts_params_for_tag
+
+
+def _run(chunks):
+    parser = ProsodyTagParser()
+    display = "".join(parser.feed(chunk) for chunk in chunks) + parser.finish()
+    return display, parser.segments
+
+
+def test_tags_are_stripped_and_split_across_chunks():
+    display, segments = _run(["[ca", "lm] 你好。[so", "ft]别担心，", "慢慢来！结束"])
+    assert display == "你好。别担心，慢慢来！结束"
+    assert [(s.text, s.tag) for s in segments] == [
+        ("你好。", "calm"),
+        ("别担心，慢慢来！", "soft"),
+        ("结束", "soft"),
+    ]
+
+
+def test_unknown_brackets_pass_through():
+    display, segments = _run(["See [1] and [note]. [", "sad] bye"])
+    assert display == "See [1] and [note]. bye"
+    assert segments[-1].tag == "sad"
+
+
+def test_untagged_reply_is_not_marked_tagged():
+    parser = ProsodyTagParser()
+    parser.feed("See [note]. 没有标签。")
+    parser.finish()
+    assert not parser.tagged
+    assert [s.tag for s in parser.segments] == ["neutral"]
+
+    parser = ProsodyTagParser()
+    parser.feed("[soft]有标签。")
+    parser.finish()
+    assert parser.tagged
+
+
+def test_unterminated_bracket_is_flushed_at_end():
+    display, _ = _run(["array[i"])
+    assert display == "array[i"
+
+
+def test_grouping_and_params():
+    _, segments = _run(["[calm]一。二。[excited]三！"])
+    grouped = group_segments(segments)
+    assert [(s.text, s.tag) for s in grouped] == [("一。二。", "calm"), ("三！", "excited")]
+    calm_speed, calm_interval = tts_params_for_tag("calm", 1.0, 0.3)
+    fast_speed, _ = tts_params_for_tag("excited", 1.2, 0.3)
+    assert calm_speed < 1.0 and calm_interval > 0.3
+    assert fast_speed == 1.25
+    assert tts_params_for_tag("unknown", 1.0, 0.3) == (1.0, 0.3)
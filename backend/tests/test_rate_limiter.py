@@ -0,0 +1,54 @@
+"""Tests for the client-side LLM rate limiter."""
+import asyncio
+
+import pytest
+
+from app.services.rate_limiter import RateLimitScheduler, parse_rate_limits
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits("openai=500/200000, gemini:gemini-2.5-flash=/1000000, bad=x/y")
+    assert limits == {"openai": (500, 200000), "gemini:gemini-2.5-flash": (0, 1000000)}
+    scheduler = RateLimitScheduler(limits)
+    assert scheduler.limits_for("openai", "gpt-4o") == (500, 200000)
+    assert scheduler.limits_for("gemini", "gemini-2.5-flash") == (0, 1000000)
+    assert not scheduler.is_limited("gemini", "gemini-1.5-pro")
+
+
+@pytest.mark.asyncio
+async def test_unlimited_route_does_not_wait():
+    scheduler = RateLimitScheduler({})
+    assert await scheduler.acquire("openai", "gpt-4o", "sk-test", tokens=10_000) == 0.0
+    assert scheduler.metrics() == {}
+
+
+@pytest.mark.asyncio
+async def test_interactive_overtakes_queued_background_work():
+    # 6000 tokens/min = 100 tokens/s; the first call drains the bucket
+    scheduler = RateLimitScheduler({"openai": (0, 6000)})
+    await scheduler.acquire("openai", "gpt-4o", "sk-test", tokens=6000)
+
+    order = []
+
+    async def _call(priority, label):
+        await scheduler.acquire("openai", "gpt-4o", "sk-test", tokens=5, priority=priority, label=label)
+        order.append(label)
+
+    background = asyncio.create_task(_call(2, "extraction"))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(_call(0, "interactive"))
+    await asyncio.wait_for(asyncio.gather(background, interactive), timeout=2)
+
+    assert order == ["interactive", "extraction"]
+    lane = next(iter(scheduler.metrics().values()))
+    assert lane["queued"] == 0
+    assert lane["wait"]["extraction"]["max_wait_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_lanes_are_separate_per_api_key():
+    scheduler = RateLimitScheduler({"openai": (1, 0)})
+    await scheduler.acquire("openai", "gpt-4o", "key-a")
+    assert await scheduler.acquire("openai", "gpt-4o", "key-b") == 0.0
+    assert len(scheduler.metrics()) == 2
+    assert not any("key-a" in name for name in scheduler.metrics())
@@ -0,0 +1,131 @@
+"""Tests for ResponseCache."""
+import uuid
+
+import pytest
+
+from app.database import Base, SessionLocal, engine
+import app.models.db_session  # noqa: F401
+from app.models.cache import CachePolicyUpdate
+from app.services.character_state import CharacterStateService
+from app.services.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    vectors = {
+        "你是谁": [1.0, 0.0, 0.0],
+        "你是谁呀": [0.99, 0.05, 0.0],
+        "what can you do": [0.0, 1.0, 0.0],
+    }
+
+    async def _fake_embedding(text):
+        return vectors.get(text, [0.0, 0.0, 1.0])
+
+    monkeypatch.setattr("app.services.response_cache.llm_service.get_embedding", _fake_embedding)
+    return ResponseCache(enabled=True, similarity_threshold=0.95, replay_chars_per_second=0)
+
+
+def test_normalize_message():
+    assert ResponseCache.normalize_message("  What  can you DO?? ") == "what can you do"
+    assert ResponseCache.normalize_message("你是谁？") == "你是谁"
+
+
+@pytest.mark.asyncio
+async def test_disabled_policy_skips_lookup():
+    cache = ResponseCache(enabled=False)
+    assert await cache.lookup("epsilon", "你是谁", "fp") is None
+
+
+@pytest.mark.asyncio
+async def test_exact_hit_after_store(cache):
+    miss = await cache.lookup("epsilon", "你是谁？", "fp")
+    assert miss.entry is None
+    await cache.store(miss, ["我是", "Epsilon。"])
+
+    hit = await cache.lookup("epsilon", "你是谁", "fp")
+    assert hit.entry is not None
+    assert [c async for c in cache.replay(hit.entry)] == ["我是", "Epsilon。"]
+
+    stats = cache.stats()["epsilon"]
+    assert stats.hits == 1 and stats.misses == 1
+    assert stats.hit_ratio == 0.5
+
+
+@pytest.mark.asyncio
+async def test_semantic_hit_respects_threshold(cache):
+    miss = await cache.lookup("epsilon", "你是谁", "fp")
+    await cache.store(miss, ["我是Epsilon。"])
+
+    hit = await cache.lookup("epsilon", "你是谁呀", "fp")
+    assert hit.entry is not None
+    assert cache.stats()["epsilon"].semantic_hits == 1
+
+    unrelated = await cache.lookup("epsilon", "what can you do", "fp")
+    assert unrelated.entry is None
+
+
+@pytest.mark.asyncio
+async def test_fingerprint_isolates_personalized_context(cache):
+    fp_a = ResponseCache.context_fingerprint("user A likes rust", "phase: close")
+    fp_b = ResponseCache.context_fingerprint("user B likes go", "phase: new")
+    miss = await cache.lookup("epsilon", "你是谁", fp_a)
+    await cache.store(miss, ["personalized for A"])
+
+    other = await cache.lookup("epsilon", "你是谁", fp_b)
+    assert other.entry is None
+
+
+@pytest.mark.asyncio
+async def test_per_character_policy_and_eviction(cache):
+    cache.set_policy("other", CachePolicyUpdate(enabled=False))
+    assert await cache.lookup("other", "你是谁", "fp") is None
+
+    cache.set_policy("epsilon", CachePolicyUpdate(max_entries=1, similarity_threshold=1.0))
+    first = await cache.lookup("epsilon", "question one", "fp")
+    await cache.store(first, ["one"])
+    second = await cache.lookup("epsilon", "question two", "fp")
+    await cache.store(second, ["two"])
+
+    assert cache.stats()["epsilon"].entries == 1
+    assert (await cache.lookup("epsilon", "question one", "fp")).entry is None
+
+
+@pytest.mark.asyncio
+async def test_turn_fingerprint_separates_users_models_and_prosody(cache):
+    # A new user's context is the same for everyone: no memory, default state
+    context = ("You are Epsilon.", "", "Relationship phase: new.")
+    fp_a = ResponseCache.turn_fingerprint("user_a", "openai", "gpt-4o", *context, False)
+    miss = await cache.lookup("epsilon", "你是谁", fp_a)
+    await cache.store(miss, ["reply generated for user_a"])
+
+    assert (await cache.lookup("epsilon", "你是谁", fp_a)).entry is not None
+    for fingerprint in [
+        ResponseCache.turn_fingerprint("user_b", "openai", "gpt-4o", *context, False),
+        ResponseCache.turn_fingerprint("user_a", "gemini", "gemini-2.5-flash", *context, False),
+        ResponseCache.turn_fingerprint("user_a", "openai", "gpt-4o", *context, True),
+        ResponseCache.turn_fingerprint("user_a", "openai", "gpt-4o", "You are Epsilon.", "likes rust", context[2], False),
+    ]:
+        assert (await cache.lookup("epsilon", "你是谁", fingerprint)).entry is None
+
+
+@pytest.mark.asyncio
+async def test_opening_question_hits_across_sessions(cache):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    states = CharacterStateService()
+    user_id = f"user_rc_{uuid.uuid4().hex[:8]}"
+
+    def _session_fingerprint():
+        state = states.mark_conversation_start(db, user_id, "epsilon")
+        return ResponseCache.turn_fingerprint(
+            user_id, "openai", "gpt-4o", "You are Epsilon.", "",
+            states.build_prompt_context(state, include_count=False), False,
+        )
+
+    first = await cache.lookup("epsilon", "你是谁", _session_fingerprint())
+    assert first.entry is None
+    await cache.store(first, ["我是Epsilon。"])
+
+    second = await cache.lookup("epsilon", "你是谁？", _session_fingerprint())
+    assert second.entry is not None and second.entry.chunks == ["我是Epsilon。"]
+    db.close()
@@ -1,4 +1,7 @@
 """Tests for ResponseProcessor."""
+import asyncio
+import uuid
+
 import pytest
 
 from app.database import SessionLocal, Base, engine
@@ -21,7 +24,7 @@ async def test_process_turn_basic_updates(monkeypatch):
     async def _fake_chat(*args, **kwargs):
         return '{"preferences":{"tone":"casual_ok"},"observation":"user likes architecture"}'
 
-    monkeypatch.setattr("app.services.response_processor.llm_service.chat", _fake_chat)
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _fake_chat)
 
     processor = ResponseProcessor(
         session_service=SessionService(),
@@ -41,4 +44,48 @@ async def test_process_turn_basic_updates(monkeypatch):
 
     assert result.emotion in {"energetic", "focused", "neutral", "empathetic"}
     assert len(result.topics) >= 1
+
+    # Extraction runs after the turn returns and applies its signals on completion
+    await processor.join()
+    state = processor.character_state_service.get_or_create(db, "user_rp_1", "epsilon")
+    assert state.preferences["tone"] == "casual_ok"
+    assert "user likes architecture" in state.observations
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_process_turn_does_not_wait_for_extraction(monkeypatch):
+    db = _db()
+    user_id = f"user_rp_{uuid.uuid4().hex[:8]}"
+    release = asyncio.Event()
+
+    async def _slow_chat(*args, **kwargs):
+        await release.wait()
+        return '{"preferences":{"pace":"slow"}}'
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _slow_chat)
+    processor = ResponseProcessor(
+        session_service=SessionService(),
+        character_state_service=CharacterStateService(),
+        deep_analysis_interval=1,
+    )
+
+    await asyncio.wait_for(
+        processor.process_turn(
+            db=db,
+            conversation_id="conv_rp_2",
+            user_id=user_id,
+            character_id="epsilon",
+            user_message="hello",
+            assistant_text="hi",
+            history_messages=[],
+        ),
+        timeout=0.2,
+    )
+    assert "pace" not in processor.character_state_service.get_or_create(db, user_id, "epsilon").preferences
+
+    release.set()
+    await processor.join()
+    db.expire_all()
+    assert processor.character_state_service.get_or_create(db, user_id, "epsilon").preferences["pace"] == "slow"
     db.close()
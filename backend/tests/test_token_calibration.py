@@ -0,0 +1,71 @@
+"""Tests for online token estimator calibration."""
+import threading
+import types
+
+import pytest
+
+from app.services import token_counter
+from app.services.token_calibration import TokenCalibrator, usage_from_message
+from app.services.token_counter import TokenCounter
+
+
+@pytest.fixture
+def calibrator(monkeypatch):
+    monkeypatch.setattr(token_counter, "_calibrations", {})
+    cal = TokenCalibrator(min_samples=5, persist_every=1000)
+    cal._loaded = True
+    return cal
+
+
+def test_fit_moves_estimate_toward_reported_usage(calibrator):
+    counter = TokenCounter(provider="gemini", model="gemini-2.5-flash")
+    text = "你好世界" * 50  # 200 CJK chars, default estimate 100 tokens
+    messages = [{"role": "user", "content": text}]
+    actual = 200 + counter.OVERHEAD_BASE + counter.OVERHEAD_PER_MESSAGE  # ~1 token per CJK char
+
+    before = counter.count_messages(messages)
+    for _ in range(30):
+        calibrator.record("gemini", "gemini-2.5-flash", messages, "", actual, 0)
+    after = counter.count_messages(messages)
+
+    assert abs(after - actual) < abs(before - actual)
+    stats = calibrator.snapshot()["gemini:gemini-2.5-flash"]
+    assert stats["active"] is True
+    assert stats["cjk_tokens_per_char"] > 0.5
+    assert stats["p90_abs_error_pct"] is not None
+
+
+def test_calibration_is_per_model(calibrator):
+    for _ in range(10):
+        calibrator.record("gemini", "gemini-2.5-flash", [], "hello world " * 40, 0, 480)
+    other = TokenCounter(provider="gemini", model="gemini-1.5-pro")
+    assert other.count_text("abcd" * 10) == 10
+
+
+def test_usage_from_message_variants():
+    assert usage_from_message(types.SimpleNamespace(usage_metadata={"input_tokens": 10, "output_tokens": 5})) == (10, 5)
+    legacy = types.SimpleNamespace(response_metadata={"token_usage": {"prompt_tokens": 7, "completion_tokens": 3}})
+    assert usage_from_message(legacy) == (7, 3)
+    gemini = types.SimpleNamespace(response_metadata={"usage_metadata": {"prompt_token_count": 4, "candidates_token_count": 2}})
+    assert usage_from_message(gemini) == (4, 2)
+    assert usage_from_message(types.SimpleNamespace(content="x")) is None
+
+
+@pytest.mark.asyncio
+async def test_persist_runs_off_the_event_loop(calibrator, monkeypatch):
+    written = []
+
+    def _fake_write(rows):
+        written.append((threading.current_thread() is threading.main_thread(), dict(rows)))
+
+    monkeypatch.setattr(calibrator, "_write", _fake_write)
+    calibrator.persist_every = 1
+    for _ in range(3):
+        calibrator.record("gemini", "gemini-2.5-flash", [], "hello world " * 40, 0, 480)
+    assert written == []
+
+    await calibrator.flush()
+    assert all(not on_main for on_main, _ in written)
+    # Records made while a write was pending coalesce into the latest row
+    assert sum(len(rows) for _, rows in written) < 3
+    assert written[-1][1][("gemini", "gemini-2.5-flash")]["samples"] == 3
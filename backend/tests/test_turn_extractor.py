@@ -0,0 +1,94 @@
+"""Tests for the unified TurnExtractor."""
+import pytest
+
+from app.services.turn_extractor import EntityStreamParser, TurnExtractor, parse_json_object
+
+
+def test_parse_json_object_handles_fences_and_prose():
+    assert parse_json_object('```json\n{"a": 1}\n```') == {"a": 1}
+    assert parse_json_object('Sure! {"a": {"b": "}"}} trailing {"c": 2}') == {"a": {"b": "}"}}
+    assert parse_json_object("no json here") is None
+
+
+def test_validate_keeps_good_items_and_maps_user():
+    data = {
+        "entities": [
+            {"id": "topic_python", "type": "Topic", "name": "Python", "score": 8},
+            {"type": "Topic"},
+        ],
+        "relations": [
+            {"source": "USER", "target": "topic_python", "type": "INTERESTED_IN"},
+            {"source_id": "topic_python", "target_id": "skill_async", "type": "RELATED_TO"},
+            {"target": "x"},
+        ],
+        "preferences": {"explanation_style": "detailed", "empty": ""},
+        "observation": "user likes concrete examples",
+        "tone": "Focused",
+    }
+    result = TurnExtractor.validate(data, "user_42")
+    assert [e.id for e in result.entities] == ["topic_python"]
+    assert result.relations[0].source == "user_42"
+    assert result.relations[1].source == "topic_python"
+    assert len(result.relations) == 2
+    assert result.preferences == {"explanation_style": "detailed"}
+    assert result.tone == "focused"
+
+
+def test_validate_unknown_tone_falls_back():
+    assert TurnExtractor.validate({"tone": "ecstatic"}, "u").tone == "neutral"
+
+
+@pytest.mark.asyncio
+async def test_extract_single_call(monkeypatch):
+    calls = []
+
+    async def _fake_chat(*args, **kwargs):
+        calls.append(kwargs)
+        return '{"entities": [], "relations": [], "preferences": {"tone": "casual"}, "observation": "", "tone": "neutral"}'
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.chat", _fake_chat)
+    result = await TurnExtractor().extract("user: hi\nassistant: hello", "user_1")
+    assert result.preferences == {"tone": "casual"}
+    assert len(calls) == 1
+    assert calls[0]["json_mode"] is True
+
+
+def test_entity_stream_parser_emits_objects_as_they_close():
+    parser = EntityStreamParser()
+    text = (
+        '```json\n{"entities": [{"id": "a", "type": "Topic", "name": "A {x}", "score": 8},'
+        ' {"id": "b", "type": "Skill", "name": "B\\"q", "score": 9}],'
+        ' "relations": [{"source": "USER", "target": "a", "type": "INTERESTED_IN"}]}'
+    )
+    first_close = text.index("},") + 1
+    assert parser.feed(text[:first_close - 1]) == []
+    assert [item["id"] for item in parser.feed(text[first_close - 1:first_close])] == ["a"]
+    emitted = []
+    rest = text[first_close:]
+    for i in range(0, len(rest), 7):
+        emitted.extend(item["id"] for item in parser.feed(rest[i:i + 7]))
+    assert emitted == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_extract_streaming_hands_entities_over_before_stream_ends(monkeypatch):
+    chunks = [
+        '{"entities": [{"id": "topic_go", "type": "Topic", "name": "Go", "score": 9}',
+        ', {"id": "tiny", "type": "Topic", "name": "x", "score": 1}], "relations": [',
+        '{"source": "USER", "target": "topic_go", "type": "INTERESTED_IN"}], "tone": "focused"}',
+    ]
+    seen = []
+
+    async def _fake_stream(messages, task):
+        for i, chunk in enumerate(chunks):
+            seen.append(("chunk", i))
+            yield chunk
+
+    monkeypatch.setattr("app.services.turn_extractor.llm_service.astream_from_messages", _fake_stream)
+    result = await TurnExtractor().extract_streaming(
+        "user: go", "user_1", lambda entity: seen.append(("entity", entity.id))
+    )
+    assert seen.index(("entity", "topic_go")) < seen.index(("chunk", 1))
+    assert ("entity", "tiny") not in seen
+    assert result.relations[0].source == "user_1"
+    assert result.tone == "focused"
@@ -147,7 +147,8 @@ async def write_detailed_memory():
                 user_id=conv["user_id"],
                 conversation_id=conv["conversation_id"],
                 messages=conv["messages"],
-                character_id="epsilon"
+                character_id="epsilon",
+                wait=True
             )
             
             entities_count = result.get('entities_count', 0)
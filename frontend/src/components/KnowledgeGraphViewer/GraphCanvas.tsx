@@ -56,6 +56,13 @@ export default function GraphCanvas({
 
   // Convert GraphData to NVL format
   const nvlNodes = useMemo<Node[]>(() => {
+    // Degree per node in one pass over the links
+    const degrees = new Map<string, number>()
+    for (const link of data.links) {
+      degrees.set(link.source, (degrees.get(link.source) || 0) + 1)
+      degrees.set(link.target, (degrees.get(link.target) || 0) + 1)
+    }
+
     return data.nodes.map((node) => {
       // Calculate node size based on importance score or connections
       let size = 20 // Base size
@@ -69,10 +76,8 @@ export default function GraphCanvas({
         }
       } else {
         // Fallback: Size by connections
-        const links = data.links.filter(
-          (l) => l.source === node.id || l.target === node.id
-        )
-        size = Math.sqrt(links.length) * 5 + 20
+        const degree = Number(node.properties?.degree ?? degrees.get(node.id) ?? 0)
+        size = Math.sqrt(degree) * 5 + 20
       }
 
       return {
@@ -6,11 +6,14 @@ import GraphCanvas from './GraphCanvas'
 import GraphControls from './GraphControls'
 import NodeDetailPanel from './NodeDetailPanel'
 import GraphLegend from './GraphLegend'
-import { fetchGraphData, fetchGraphStats, fetchNodeDetails } from '../../services/graph'
+import { fetchGraphView, fetchGraphStats, fetchNodeDetails } from '../../services/graph'
 import type { GraphData, GraphNode, NodeDetails } from '../../types'
 import { useTheme } from '../../contexts/ThemeContext'
 import { getThemeClasses } from '../../utils/theme'
 
+// Nodes per graph view page
+const PAGE_SIZE = 500
+
 export default function KnowledgeGraphViewer() {
   const { theme } = useTheme()
   const themeClasses = getThemeClasses(theme)
@@ -21,6 +24,9 @@ export default function KnowledgeGraphViewer() {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
   const [highlightedNodeId, setHighlightedNodeId] = useState<string | null>(null)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [totalNodes, setTotalNodes] = useState(0)
+  const [loadingMore, setLoadingMore] = useState(false)
   
   // Initialize with empty arrays (meaning select all)
   const [selectedEntityTypes, setSelectedEntityTypes] = useState<string[]>([])
@@ -31,13 +37,14 @@ export default function KnowledgeGraphViewer() {
     try {
       setLoading(true)
       setError(null)
-      const userId = 'zhu_jinghua_001'
-      // Fetch data WITHOUT filters to get everything
-      const data = await fetchGraphData({
-        user_id: userId,
+      // First page holds the most connected nodes; more detail is loaded on demand
+      const data = await fetchGraphView({
+        user_id: 'zhu_jinghua_001',
         depth: 2,
-        limit: 100, // Reasonable limit for client-side filtering
+        limit: PAGE_SIZE,
       })
+      setNextCursor(data.next_cursor)
+      setTotalNodes(data.total_nodes)
       setBaseGraphData(data)
       
       // Initial filtered data is same as base data
@@ -62,6 +69,32 @@ export default function KnowledgeGraphViewer() {
     }
   }, [])
 
+  const loadMore = useCallback(async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const page = await fetchGraphView({
+        user_id: 'zhu_jinghua_001',
+        depth: 2,
+        limit: PAGE_SIZE,
+        cursor: nextCursor,
+      })
+      setBaseGraphData(prev => ({
+        nodes: [...prev.nodes, ...page.nodes],
+        links: [...prev.links, ...page.links],
+      }))
+      // Types first seen on this page start out visible
+      setSelectedEntityTypes(prev => Array.from(new Set([...prev, ...page.nodes.map(n => n.type)])))
+      setSelectedRelationTypes(prev => Array.from(new Set([...prev, ...page.links.map(l => l.type)])))
+      setNextCursor(page.next_cursor)
+      setTotalNodes(page.total_nodes)
+    } catch (err) {
+      console.error('Failed to load more graph data:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }, [nextCursor])
+
   const loadStats = useCallback(async () => {
     try {
       const statsData = await fetchGraphStats('zhu_jinghua_001')
@@ -191,6 +224,17 @@ export default function KnowledgeGraphViewer() {
             onNodeHover={handleNodeHover}
             highlightedNodeId={highlightedNodeId}
           />
+          {nextCursor && (
+            <div className="absolute bottom-4 left-4 z-10">
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="px-3 py-2 rounded-lg shadow-lg bg-white/90 border border-gray-200 text-sm text-gray-700 hover:bg-gray-100 disabled:opacity-50"
+              >
+                {loadingMore ? '加载中...' : `加载更多 (${baseGraphData.nodes.length}/${totalNodes})`}
+              </button>
+            </div>
+          )}
           {/* Legend */}
           <div className="absolute top-4 right-4 z-10">
             <GraphLegend />
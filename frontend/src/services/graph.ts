@@ -1,7 +1,7 @@
 /**
  * Graph API service for knowledge graph visualization
  */
-import type { GraphData, GraphStats, NodeDetails } from '../types'
+import type { GraphData, GraphStats, GraphViewPage, NodeDetails } from '../types'
 
 const API_BASE_URL = '/api'
 
@@ -50,6 +50,60 @@ export async function fetchGraphData(params?: {
   return response.json()
 }
 
+/**
+ * Fetch one page of the graph view: most connected nodes first, plus the
+ * relations to nodes delivered on earlier pages. Columns are unpacked into
+ * GraphData; degree and score are exposed as node properties.
+ */
+export async function fetchGraphView(params: {
+  user_id?: string
+  depth?: number
+  limit?: number
+  order?: 'degree' | 'score'
+  cursor?: string | null
+}): Promise<GraphData & { total_nodes: number; next_cursor: string | null }> {
+  const queryParams = new URLSearchParams()
+  queryParams.append('user_id', params.user_id || 'zhu_jinghua_001')
+  if (params.depth) {
+    queryParams.append('depth', params.depth.toString())
+  }
+  if (params.limit) {
+    queryParams.append('limit', params.limit.toString())
+  }
+  if (params.order) {
+    queryParams.append('order', params.order)
+  }
+  if (params.cursor) {
+    queryParams.append('cursor', params.cursor)
+  }
+
+  const response = await fetch(`${API_BASE_URL}/graph/view?${queryParams.toString()}`)
+
+  if (!response.ok) {
+    const errorText = await response.text()
+    throw new Error(`Graph view failed: ${response.status}, ${errorText}`)
+  }
+
+  const page: GraphViewPage = await response.json()
+  const { nodes, links } = page
+  return {
+    nodes: nodes.id.map((id, i) => ({
+      id,
+      label: nodes.label[i],
+      type: nodes.type[i],
+      properties: { importance: nodes.score[i], degree: nodes.degree[i] },
+    })),
+    links: links.source.map((source, i) => ({
+      source,
+      target: links.target[i],
+      type: links.type[i],
+      properties: { count: links.count[i] },
+    })),
+    total_nodes: page.total_nodes,
+    next_cursor: page.next_cursor,
+  }
+}
+
 /**
  * Get graph statistics
  */
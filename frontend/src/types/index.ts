@@ -152,6 +152,28 @@ export interface GraphData {
   links: GraphLink[]
 }
 
+/**
+ * One page of the paged graph view, as parallel arrays
+ */
+export interface GraphViewPage {
+  nodes: {
+    id: string[]
+    label: string[]
+    type: string[]
+    degree: number[]
+    score: number[]
+    properties: Record<string, any[]>
+  }
+  links: {
+    source: string[]
+    target: string[]
+    type: string[]
+    count: number[]
+  }
+  total_nodes: number
+  next_cursor: string | null
+}
+
 export interface GraphStats {
   total_nodes: number
   total_relations: number